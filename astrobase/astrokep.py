@@ -57,7 +57,8 @@ from numpy import (
     zeros_like as npzeros_like, full_like as npfull_like,
     ones as npones,
     column_stack as npcolumn_stack, in1d as npin1d, append as npappend,
-    unique as npunique, concatenate as npconcatenate
+    unique as npunique, concatenate as npconcatenate,
+    cumsum as npcumsum, empty as npempty
 )
 
 from numpy.polynomial.legendre import Legendre
@@ -68,6 +69,12 @@ from sklearn.ensemble import RandomForestRegressor
 SKLEARN = True
 
 from .lcmath import sigclip_magseries, find_lc_timegroups
+from .varbase.trends import (
+    smooth_magseries_ndimage_medfilt,
+    rfepd_train_field_model,
+    rfepd_apply_field_model
+)
+from .lcarchive import write_lcarchive
 
 
 ###########################################
@@ -232,6 +239,131 @@ LCTOPKEYS = ['CHANNEL','SKYGROUP','MODULE','OUTPUT',
 LCAPERTUREKEYS = ['NPIXSAP','NPIXMISS','CDELT1','CDELT2']
 
 
+def _read_fitslc_columns(lchdu, keys):
+    '''This copies the requested columns out of a FITS LC table HDU.
+
+    The FITS file should be opened with `memmap=True` so only these columns are
+    read and decoded. They're returned as native byte order arrays that don't
+    hold on to the memory map of the FITS file.
+
+    Parameters
+    ----------
+
+    lchdu : astropy.io.fits.BinTableHDU
+        The light curve table HDU.
+
+    keys : list of str
+        The FITS column names to get.
+
+    Returns
+    -------
+
+    dict
+        A dict with the column names as keys and np.arrays as values.
+
+    '''
+
+    lcdata = {}
+
+    for key in keys:
+        if key not in lcdata:
+            col = lchdu.data.field(key)
+            lcdata[key] = col.astype(col.dtype.newbyteorder('='))
+
+    return lcdata
+
+
+def _get_lcdict_column_refs(lcdict, columns):
+    '''This returns the (dict, key) pairs that hold each of the `columns`.
+
+    Column names of the form 'sap.sap_flux' refer to
+    `lcdict['sap']['sap_flux']`.
+
+    '''
+
+    refs = []
+
+    for col in columns:
+        if '.' in col:
+            key, subkey = col.split('.')
+            refs.append((lcdict[key], subkey))
+        else:
+            refs.append((lcdict, col))
+
+    return refs
+
+
+def _read_fitslc_hdus(lcfits,
+                      headerkeys,
+                      datakeys,
+                      sapkeys,
+                      pdckeys,
+                      topkeys):
+    '''This reads the header info and the LC columns from a Kepler/K2 LC FITS
+    file.
+
+    See `read_kepler_fitslc` for the args.
+
+    Returns
+    -------
+
+    tuple
+        Returns `(hdrinfo, ndet, lcaperturedata, lcdata)`, where `hdrinfo` has
+        the lowercased header keys from the LC, top, and aperture HDUs, `ndet`
+        is the number of rows in the LC table, `lcaperturedata` is the
+        aperture pixel mask, and `lcdata` is the dict of LC columns from
+        `_read_fitslc_columns`.
+
+    '''
+
+    # read the fits file. this is memory-mapped so only the columns we need are
+    # read from it
+    with pyfits.open(lcfits, memmap=True) as hdulist:
+
+        lchdr = hdulist[1].header
+        lctophdr, lcaperturehdr = hdulist[0].header, hdulist[2].header
+
+        lcaperturedata = hdulist[2].data
+        if lcaperturedata is not None:
+            lcaperturedata = np.array(lcaperturedata)
+
+        # TIME and the flux columns are used for appending and normalizing
+        lcdata = _read_fitslc_columns(
+            hdulist[1],
+            (['TIME'] + list(datakeys) +
+             (['SAP_FLUX'] + list(sapkeys) if sapkeys else []) +
+             (['PDCSAP_FLUX'] + list(pdckeys) if pdckeys else []))
+        )
+
+    hdrinfo = {}
+
+    # now get the values we want from the header
+    for key in headerkeys:
+        if key in lchdr and lchdr[key] is not None:
+            hdrinfo[key.lower()] = lchdr[key]
+        else:
+            hdrinfo[key.lower()] = None
+
+    # get the number of detections
+    ndet = lchdr['NAXIS2']
+
+    # get the info from the topheader
+    for key in topkeys:
+        if key in lctophdr and lctophdr[key] is not None:
+            hdrinfo[key.lower()] = lctophdr[key]
+        else:
+            hdrinfo[key.lower()] = None
+
+    # get the info from the lcaperturehdr
+    for key in lcaperturehdr:
+        if key in lcaperturehdr and lcaperturehdr[key] is not None:
+            hdrinfo[key.lower()] = lcaperturehdr[key]
+        else:
+            hdrinfo[key.lower()] = None
+
+    return hdrinfo, ndet, lcaperturedata, lcdata
+
+
 def read_kepler_fitslc(
         lcfits,
         headerkeys=LCHEADERKEYS,
@@ -302,39 +434,15 @@ def read_kepler_fitslc(
 
     '''
 
-    # read the fits file
-    hdulist = pyfits.open(lcfits)
-    lchdr, lcdata = hdulist[1].header, hdulist[1].data
-    lctophdr, lcaperturehdr, lcaperturedata = (hdulist[0].header,
-                                               hdulist[2].header,
-                                               hdulist[2].data)
-    hdulist.close()
-
-    hdrinfo = {}
-
-    # now get the values we want from the header
-    for key in headerkeys:
-        if key in lchdr and lchdr[key] is not None:
-            hdrinfo[key.lower()] = lchdr[key]
-        else:
-            hdrinfo[key.lower()] = None
-
-    # get the number of detections
-    ndet = lchdr['NAXIS2']
-
-    # get the info from the topheader
-    for key in topkeys:
-        if key in lctophdr and lctophdr[key] is not None:
-            hdrinfo[key.lower()] = lctophdr[key]
-        else:
-            hdrinfo[key.lower()] = None
-
-    # get the info from the lcaperturehdr
-    for key in lcaperturehdr:
-        if key in lcaperturehdr and lcaperturehdr[key] is not None:
-            hdrinfo[key.lower()] = lcaperturehdr[key]
-        else:
-            hdrinfo[key.lower()] = None
+    # read the fits file and get the header info and the columns we need
+    hdrinfo, ndet, lcaperturedata, lcdata = _read_fitslc_hdus(
+        lcfits,
+        headerkeys,
+        datakeys,
+        sapkeys,
+        pdckeys,
+        topkeys
+    )
 
     # if we're appending to another lcdict
     if appendto and isinstance(appendto, dict):
@@ -615,6 +723,11 @@ def consolidate_kepler_fitslc(keplerid,
     `lcdict`. This is meant to be used to consolidate light curves for a single
     object across Kepler quarters.
 
+    The number of measurements in each file is read from its header first, so
+    the final column arrays are made only once. The files are then read one at
+    a time with only the requested columns taken from their memory-mapped
+    tables and copied into place.
+
     NOTE: `keplerid` is an integer (without the leading zeros). This is usually
     the KIC ID.
 
@@ -684,27 +797,64 @@ def consolidate_kepler_fitslc(keplerid,
 
         LOGINFO('consolidating...')
 
-        # the first file
-        consolidated = read_kepler_fitslc(matching[0],
-                                          headerkeys=headerkeys,
-                                          datakeys=datakeys,
-                                          sapkeys=sapkeys,
-                                          pdckeys=pdckeys,
-                                          topkeys=topkeys,
-                                          apkeys=apkeys,
-                                          normalize=normalize)
-
-        # get the rest of the files
-        for lcf in matching:
-            consolidated = read_kepler_fitslc(lcf,
-                                              appendto=consolidated,
-                                              headerkeys=headerkeys,
-                                              datakeys=datakeys,
-                                              sapkeys=sapkeys,
-                                              pdckeys=pdckeys,
-                                              topkeys=topkeys,
-                                              apkeys=apkeys,
-                                              normalize=normalize)
+        # get the number of rows in each file from its header so the final
+        # column arrays are only made once
+        ndets = [pyfits.getval(x, 'NAXIS2', ext=1) for x in matching]
+        rowstarts = npconcatenate(([0], npcumsum(ndets)))
+
+        consolidated = None
+
+        for lcf, rowstart, rowend in zip(matching,
+                                         rowstarts[:-1],
+                                         rowstarts[1:]):
+
+            lcdict = read_kepler_fitslc(lcf,
+                                        headerkeys=headerkeys,
+                                        datakeys=datakeys,
+                                        sapkeys=sapkeys,
+                                        pdckeys=pdckeys,
+                                        topkeys=topkeys,
+                                        apkeys=apkeys,
+                                        normalize=normalize)
+
+            colrefs = _get_lcdict_column_refs(
+                lcdict,
+                lcdict['columns'] + ['lc_campaign']
+            )
+
+            # the first file sets up the lcdict and the final column arrays
+            if consolidated is None:
+
+                consolidated = lcdict
+                colarrays = []
+
+                for coldict, colkey in colrefs:
+                    colarrays.append(coldict[colkey])
+                    coldict[colkey] = npempty(rowstarts[-1],
+                                              dtype=coldict[colkey].dtype)
+
+                outrefs = colrefs
+
+            # the rest of the files add on their header info
+            else:
+
+                for key in ('quarter', 'season', 'datarelease',
+                            'obsmode', 'campaign'):
+                    consolidated[key].extend(lcdict[key])
+
+                for key in consolidated['lcinfo']:
+                    consolidated['lcinfo'][key].extend(lcdict['lcinfo'][key])
+
+                for key in consolidated['varinfo']:
+                    consolidated['varinfo'][key].extend(
+                        lcdict['varinfo'][key]
+                    )
+
+                colarrays = [coldict[colkey] for coldict, colkey in colrefs]
+
+            # copy the columns into their place in the final arrays
+            for (coldict, colkey), colarr in zip(outrefs, colarrays):
+                coldict[colkey][rowstart:rowend] = colarr
 
         # get the sort indices
         # we use time for the columns and quarters for the headers
@@ -721,36 +871,31 @@ def consolidate_kepler_fitslc(keplerid,
         column_sort_ind = npargsort(consolidated['time'])
 
         # sort the columns by time
-        for col in consolidated['columns']:
-            if '.' in col:
-                key, subkey = col.split('.')
-                consolidated[key][subkey] = (
-                    consolidated[key][subkey][column_sort_ind]
-                )
-            else:
-                consolidated[col] = consolidated[col][column_sort_ind]
+        for coldict, colkey in outrefs:
+            coldict[colkey] = coldict[colkey][column_sort_ind]
 
         # now sort the headers by quarters
         header_sort_ind = npargsort(consolidated['quarter']).tolist()
 
-        # this is a bit convoluted, but whatever: list -> array -> list
+        # the lists are indexed directly because the lcaperture arrays can have
+        # different shapes for different quarters
 
         for key in ('quarter', 'season', 'datarelease', 'obsmode'):
             consolidated[key] = (
-                nparray(consolidated[key])[header_sort_ind].tolist()
+                [consolidated[key][x] for x in header_sort_ind]
             )
 
         for key in ('timesys','bjdoffset','exptime','lcaperture',
                     'aperpixused','aperpixunused','pixarcsec',
                     'channel','skygroup','module','output','ndet'):
             consolidated['lcinfo'][key] = (
-                nparray(consolidated['lcinfo'][key])[header_sort_ind].tolist()
+                [consolidated['lcinfo'][key][x] for x in header_sort_ind]
             )
 
         for key in ('cdpp3_0','cdpp6_0','cdpp12_0','pdcvar','pdcmethod',
                     'aper_target_total_ratio','aper_target_frac'):
             consolidated['varinfo'][key] = (
-                nparray(consolidated['varinfo'][key])[header_sort_ind].tolist()
+                [consolidated['varinfo'][key][x] for x in header_sort_ind]
             )
 
         # finally, return the consolidated lcdict
@@ -984,6 +1129,61 @@ def read_kepler_pklc(picklefile):
     return lcdict
 
 
+def _read_kepler_lcfile(lcfile):
+    '''
+    This reads an lcdict from a Kepler/K2 LC FITS file or pickle.
+
+    '''
+
+    if lcfile.endswith(('.fits', '.fits.gz')):
+        return read_kepler_fitslc(lcfile)
+    else:
+        return read_kepler_pklc(lcfile)
+
+
+def kepler_lcdicts_to_archive(lcdicts,
+                              outfile,
+                              archiveinfo=None):
+    '''This writes the `lcdicts` of many objects to a single LC archive.
+
+    An archive holds all of the light curves for a campaign or quarter in one
+    file, with their columns concatenated into arrays and an index of each
+    object's offset and length in these arrays. Use
+    `astrobase.lcarchive.read_lcarchive` to read a single object's lcdict from
+    it, or `astrobase.lcarchive.list_lcarchive` to get the references to all of
+    its light curves for use with the `kep-lca` LC format in
+    `astrobase.lcproc`. See `astrobase.lcarchive.write_lcarchive` for details.
+
+    Parameters
+    ----------
+
+    lcdicts : list of lcdicts or str
+        The input `lcdicts` to write to the archive. These can also be paths
+        to Kepler/K2 LC FITS files, which will be read with
+        `read_kepler_fitslc`, or to LC pickles, which will be read with
+        `read_kepler_pklc`.
+
+    outfile : str
+        The path of the output archive. Use a filename ending in `-keplc.lca`
+        to match the `fileglob` of the `kep-lca` LC format.
+
+    archiveinfo : dict or None
+        Any JSON-able information about the archive to store in its header.
+
+    Returns
+    -------
+
+    str
+        The absolute path to the written archive file.
+
+    '''
+
+    return write_lcarchive(lcdicts,
+                           outfile,
+                           readerfunc=_read_kepler_lcfile,
+                           archiveinfo=archiveinfo)
+
+
 ##########################
 ## KEPLER LC PROCESSING ##
 ##########################
@@ -1420,83 +1620,15 @@ def epd_kepler_lightcurve(lcdict,
         return None, None, None, None
 
 
-def rfepd_kepler_lightcurve(
-        lcdict,
-        xccol='mom_centr1',
-        yccol='mom_centr2',
-        timestoignore=None,
-        filterflags=True,
-        writetodict=True,
-        epdsmooth=23,
-        decorr='xcc,ycc',
-        nrftrees=200
-):
-    '''This uses a `RandomForestRegressor` to fit and decorrelate Kepler light
-    curves.
-
-    Fits the X and Y positions, the background, and background error.
-
-    By default, this function removes points in the Kepler LC that have ANY
-    quality flags set.
+def _rfepd_kepler_inputs(lcdict,
+                         xccol='mom_centr1',
+                         yccol='mom_centr2',
+                         timestoignore=None,
+                         filterflags=True):
+    '''This gets the filtered time-series used for RF EPD of a Kepler LC.
 
-    Parameters
-    ----------
-
-    lcdict : lcdict
-        An `lcdict` produced by `consolidate_kepler_fitslc` or
-        `read_kepler_fitslc`.
-
-    xcol,ycol : str
-        Indicates the x and y coordinate column names to use from the Kepler LC
-        in the EPD fit.
-
-    timestoignore : list of tuples
-        This is of the form::
-
-            [(time1_start, time1_end), (time2_start, time2_end), ...]
-
-        and indicates the start and end times to mask out of the final
-        lcdict. Use this to remove anything that wasn't caught by the quality
-        flags.
-
-    filterflags : bool
-        If True, will remove any measurements that have non-zero quality flags
-        present. This usually indicates an issue with the instrument or
-        spacecraft.
-
-    writetodict : bool
-        If writetodict is True, adds the following columns to the lcdict::
-
-            rfepd_time = time array
-            rfepd_sapflux = uncorrected flux before EPD
-            rfepd_epdsapflux = corrected flux after EPD
-            rfepd_epdsapcorr = EPD flux corrections
-            rfepd_bkg = background array
-            rfepd_bkg_err = background errors array
-            rfepd_xcc = xcoord array
-            rfepd_ycc = ycoord array
-            rfepd_quality = quality flag array
-
-        and updates the 'columns' list in the lcdict as well.
-
-    epdsmooth : int
-        Sets the number of light curve points to smooth over when generating the
-        EPD fit function.
-
-    decorr : {'xcc,ycc','bgv,bge','xcc,ycc,bgv,bge'}
-        Indicates whether to use the x,y coords alone; background value and
-        error alone; or x,y coords and background value, error in combination as
-        the features to training the `RandomForestRegressor` on and perform the
-        fit.
-
-    nrftrees : int
-        The number of trees to use in the `RandomForestRegressor`.
-
-    Returns
-    -------
-
-    tuple
-        Returns a tuple of the form: (times, corrected_fluxes, flux_corrections)
+    Returns a tuple of the form: (times, fluxes, background, background_err,
+    xcc, ycc, flags).
 
     '''
 
@@ -1577,21 +1709,152 @@ def rfepd_kepler_lightcurve(
         LOGINFO('removed timestoignore, ndet before = %s, ndet after = %s'
                 % (nbefore, nafter))
 
-    # now that we're all done, we can do EPD
+    return times, fluxes, background, background_err, xcc, ycc, flags
 
-    # set up the regressor
-    RFR = RandomForestRegressor(n_estimators=nrftrees)
+
+def _rfepd_kepler_features(decorr, xcc, ycc, background, background_err):
+    '''This collects the RF EPD features for a Kepler LC.
+
+    Returns None if `decorr` isn't recognized.
+
+    '''
 
     if decorr == 'xcc,ycc,bgv,bge':
-        # collect the features and target variable
-        features = npcolumn_stack((xcc,ycc,background,background_err))
+        return npcolumn_stack((xcc,ycc,background,background_err))
     elif decorr == 'xcc,ycc':
-        # collect the features and target variable
-        features = npcolumn_stack((xcc,ycc))
+        return npcolumn_stack((xcc,ycc))
     elif decorr == 'bgv,bge':
-        # collect the features and target variable
-        features = npcolumn_stack((background,background_err))
+        return npcolumn_stack((background,background_err))
     else:
+        return None
+
+
+def _rfepd_kepler_writetodict(lcdict, times, fluxes,
+                              corrected_fluxes, flux_corrections,
+                              background, background_err,
+                              xcc, ycc, flags):
+    '''This adds the RF EPD columns to a Kepler lcdict.
+
+    '''
+
+    lcdict['rfepd'] = {}
+    lcdict['rfepd']['time'] = times
+    lcdict['rfepd']['sapflux'] = fluxes
+    lcdict['rfepd']['epdsapflux'] = corrected_fluxes
+    lcdict['rfepd']['epdsapcorr'] = flux_corrections
+    lcdict['rfepd']['bkg'] = background
+    lcdict['rfepd']['bkg_err'] = background_err
+    lcdict['rfepd']['xcc'] = xcc
+    lcdict['rfepd']['ycc'] = ycc
+    lcdict['rfepd']['quality'] = flags
+
+    for newcol in ['rfepd.time','rfepd.sapflux',
+                   'rfepd.epdsapflux','rfepd.epdsapcorr',
+                   'rfepd.bkg','rfepd.bkg.err',
+                   'rfepd.xcc','rfepd.ycc',
+                   'rfepd.quality']:
+
+        if newcol not in lcdict['columns']:
+            lcdict['columns'].append(newcol)
+
+
+def rfepd_kepler_lightcurve(
+        lcdict,
+        xccol='mom_centr1',
+        yccol='mom_centr2',
+        timestoignore=None,
+        filterflags=True,
+        writetodict=True,
+        epdsmooth=23,
+        decorr='xcc,ycc',
+        nrftrees=200
+):
+    '''This uses a `RandomForestRegressor` to fit and decorrelate Kepler light
+    curves.
+
+    Fits the X and Y positions, the background, and background error.
+
+    By default, this function removes points in the Kepler LC that have ANY
+    quality flags set.
+
+    Parameters
+    ----------
+
+    lcdict : lcdict
+        An `lcdict` produced by `consolidate_kepler_fitslc` or
+        `read_kepler_fitslc`.
+
+    xcol,ycol : str
+        Indicates the x and y coordinate column names to use from the Kepler LC
+        in the EPD fit.
+
+    timestoignore : list of tuples
+        This is of the form::
+
+            [(time1_start, time1_end), (time2_start, time2_end), ...]
+
+        and indicates the start and end times to mask out of the final
+        lcdict. Use this to remove anything that wasn't caught by the quality
+        flags.
+
+    filterflags : bool
+        If True, will remove any measurements that have non-zero quality flags
+        present. This usually indicates an issue with the instrument or
+        spacecraft.
+
+    writetodict : bool
+        If writetodict is True, adds the following columns to the lcdict::
+
+            rfepd_time = time array
+            rfepd_sapflux = uncorrected flux before EPD
+            rfepd_epdsapflux = corrected flux after EPD
+            rfepd_epdsapcorr = EPD flux corrections
+            rfepd_bkg = background array
+            rfepd_bkg_err = background errors array
+            rfepd_xcc = xcoord array
+            rfepd_ycc = ycoord array
+            rfepd_quality = quality flag array
+
+        and updates the 'columns' list in the lcdict as well.
+
+    epdsmooth : int
+        Sets the number of light curve points to smooth over when generating the
+        EPD fit function.
+
+    decorr : {'xcc,ycc','bgv,bge','xcc,ycc,bgv,bge'}
+        Indicates whether to use the x,y coords alone; background value and
+        error alone; or x,y coords and background value, error in combination as
+        the features to training the `RandomForestRegressor` on and perform the
+        fit.
+
+    nrftrees : int
+        The number of trees to use in the `RandomForestRegressor`.
+
+    Returns
+    -------
+
+    tuple
+        Returns a tuple of the form: (times, corrected_fluxes, flux_corrections)
+
+    '''
+
+    times, fluxes, background, background_err, xcc, ycc, flags = (
+        _rfepd_kepler_inputs(lcdict,
+                             xccol=xccol,
+                             yccol=yccol,
+                             timestoignore=timestoignore,
+                             filterflags=filterflags)
+    )
+
+    # now that we're all done, we can do EPD
+
+    # set up the regressor
+    RFR = RandomForestRegressor(n_estimators=nrftrees)
+
+    # collect the features and target variable
+    features = _rfepd_kepler_features(decorr, xcc, ycc,
+                                      background, background_err)
+    if features is None:
         LOGERROR("couldn't understand decorr, not decorrelating...")
         return None
 
@@ -1611,30 +1874,179 @@ def rfepd_kepler_lightcurve(
 
     # write these to the dictionary if requested
     if writetodict:
-
-        lcdict['rfepd'] = {}
-        lcdict['rfepd']['time'] = times
-        lcdict['rfepd']['sapflux'] = fluxes
-        lcdict['rfepd']['epdsapflux'] = corrected_fluxes
-        lcdict['rfepd']['epdsapcorr'] = flux_corrections
-        lcdict['rfepd']['bkg'] = background
-        lcdict['rfepd']['bkg_err'] = background_err
-        lcdict['rfepd']['xcc'] = xcc
-        lcdict['rfepd']['ycc'] = ycc
-        lcdict['rfepd']['quality'] = flags
-
-        for newcol in ['rfepd.time','rfepd.sapflux',
-                       'rfepd.epdsapflux','rfepd.epdsapcorr',
-                       'rfepd.bkg','rfepd.bkg.err',
-                       'rfepd.xcc','rfepd.ycc',
-                       'rfepd.quality']:
-
-            if newcol not in lcdict['columns']:
-                lcdict['columns'].append(newcol)
+        _rfepd_kepler_writetodict(lcdict, times, fluxes,
+                                  corrected_fluxes, flux_corrections,
+                                  background, background_err,
+                                  xcc, ycc, flags)
 
     return times, corrected_fluxes, flux_corrections
 
 
+def rfepd_kepler_lightcurves(
+        lcdicts,
+        xccol='mom_centr1',
+        yccol='mom_centr2',
+        timestoignore=None,
+        filterflags=True,
+        writetodict=True,
+        epdsmooth=23,
+        decorr='xcc,ycc',
+        nrftrees=200,
+        rf_subsample=0.2,
+        rf_maxsamples=500000,
+        nworkers=-1,
+        random_seed=None
+):
+    '''This uses a single `RandomForestRegressor` to fit and decorrelate many
+    Kepler light curves.
+
+    This trains one random forest on the pooled light curves of all objects
+    in `lcdicts` with
+    :py:func:`astrobase.varbase.trends.rfepd_train_field_model` instead of
+    training one for each light curve like
+    :py:func:`.rfepd_kepler_lightcurve`. Use this with the light curves for
+    objects on the same CCD channel and quarter, so the systematics are
+    shared. The training target is the median-filtered flux relative to its
+    median, and the corrected fluxes are the fluxes divided by the predicted
+    relative systematics.
+
+    Parameters
+    ----------
+
+    lcdicts : list of lcdicts
+        The `lcdicts` produced by `consolidate_kepler_fitslc` or
+        `read_kepler_fitslc`.
+
+    xcol,ycol : str
+        Indicates the x and y coordinate column names to use from the Kepler LC
+        in the EPD fit.
+
+    timestoignore : list of tuples
+        The start and end times to mask out of each lcdict. See
+        :py:func:`.rfepd_kepler_lightcurve`.
+
+    filterflags : bool
+        If True, will remove any measurements that have non-zero quality flags
+        present.
+
+    writetodict : bool
+        If writetodict is True, adds the 'rfepd' columns to each lcdict like
+        :py:func:`.rfepd_kepler_lightcurve` does.
+
+    epdsmooth : int
+        Sets the number of light curve points to median filter over when
+        generating the training light curves.
+
+    decorr : {'xcc,ycc','bgv,bge','xcc,ycc,bgv,bge'}
+        Indicates the features to train the `RandomForestRegressor` on. See
+        :py:func:`.rfepd_kepler_lightcurve`.
+
+    nrftrees : int
+        The number of trees to use in the `RandomForestRegressor`.
+
+    rf_subsample : float
+        The fraction of the points in each light curve to use for training.
+
+    rf_maxsamples : int or None
+        The maximum number of pooled points to train on.
+
+    nworkers : int
+        The number of cores to use for training and prediction. This is passed
+        to the `n_jobs` kwarg of the `RandomForestRegressor`.
+
+    random_seed : int or None
+        The random seed used to pick the training points and for the
+        `RandomForestRegressor`.
+
+    Returns
+    -------
+
+    list of tuples
+        Returns a tuple of the form: (times, corrected_fluxes,
+        flux_corrections) for each lcdict. None is returned in place of the
+        tuple for lcdicts with no usable points. Returns None if `decorr`
+        isn't recognized or there are no usable light curves.
+
+    '''
+
+    inputs = []
+
+    for lcdict in lcdicts:
+
+        times, fluxes, background, background_err, xcc, ycc, flags = (
+            _rfepd_kepler_inputs(lcdict,
+                                 xccol=xccol,
+                                 yccol=yccol,
+                                 timestoignore=timestoignore,
+                                 filterflags=filterflags)
+        )
+
+        features = _rfepd_kepler_features(decorr, xcc, ycc,
+                                          background, background_err)
+        if features is None:
+            LOGERROR("couldn't understand decorr, not decorrelating...")
+            return None
+
+        inputs.append((times, fluxes, background, background_err,
+                       xcc, ycc, flags, features))
+
+    timeslist = [x[0] for x in inputs]
+    fluxeslist = [x[1] for x in inputs]
+    errslist = [npones(x[0].size) for x in inputs]
+    featureslist = [list(x[7].T) for x in inputs]
+
+    fieldmodel = rfepd_train_field_model(
+        timeslist, fluxeslist, errslist, featureslist,
+        magsarefluxes=True,
+        epdsmooth=epdsmooth is not None and epdsmooth > 0,
+        epdsmooth_sigclip=None,
+        epdsmooth_windowsize=epdsmooth,
+        epdsmooth_func=smooth_magseries_ndimage_medfilt,
+        rf_subsample=rf_subsample,
+        rf_maxsamples=rf_maxsamples,
+        rf_ntrees=nrftrees,
+        rf_extraparams={'n_jobs':nworkers},
+        random_seed=random_seed
+    )
+
+    if fieldmodel is None:
+        return None
+
+    LOGINFO('trained RF EPD model with %s points from %s light curves' %
+            (fieldmodel['ntraining'], fieldmodel['nobjects']))
+
+    epdlist = rfepd_apply_field_model(fieldmodel,
+                                      timeslist, fluxeslist, errslist,
+                                      featureslist)
+
+    # remove the random forest to save RAM
+    del fieldmodel
+
+    results = []
+
+    for lcdict, lcinputs, epd in zip(lcdicts, inputs, epdlist):
+
+        if epd is None:
+            results.append(None)
+            continue
+
+        (times, fluxes, background, background_err,
+         xcc, ycc, flags, features) = lcinputs
+
+        corrected_fluxes = epd['mags']
+        flux_corrections = npmedian(fluxes)*(1.0 + epd['mags_corrections'])
+
+        if writetodict:
+            _rfepd_kepler_writetodict(lcdict, times, fluxes,
+                                      corrected_fluxes, flux_corrections,
+                                      background, background_err,
+                                      xcc, ycc, flags)
+
+        results.append((times, corrected_fluxes, flux_corrections))
+
+    return results
+
+
 #######################
 ## CENTROID ANALYSIS ##
 #######################
@@ -47,6 +47,8 @@ import glob
 import numpy as np
 from astropy.io import fits as pyfits
 
+from .lcarchive import write_lcarchive
+
 
 #######################################
 ## UTILITY FUNCTIONS FOR FLUXES/MAGS ##
@@ -218,6 +220,115 @@ LCAPERTUREKEYS = ['NPIXSAP','NPIXMISS',
                   'CDELT1','CDELT2']
 
 
+def _read_fitslc_columns(lchdu, keys):
+    '''This copies the requested columns out of a FITS LC table HDU.
+
+    The FITS file should be opened with `memmap=True` so only these columns are
+    read and decoded. They're returned as native byte order arrays that don't
+    hold on to the memory map of the FITS file.
+
+    '''
+
+    lcdata = {}
+
+    for key in keys:
+        if key not in lcdata:
+            col = lchdu.data.field(key)
+            lcdata[key] = col.astype(col.dtype.newbyteorder('='))
+
+    return lcdata
+
+
+def _get_lcdict_column_refs(lcdict, columns):
+    '''This returns the (dict, key) pairs that hold each of the `columns`.
+
+    Column names of the form 'sap.sap_flux' refer to
+    `lcdict['sap']['sap_flux']`.
+
+    '''
+
+    refs = []
+
+    for col in columns:
+        if '.' in col:
+            key, subkey = col.split('.')
+            refs.append((lcdict[key], subkey))
+        else:
+            refs.append((lcdict, col))
+
+    return refs
+
+
+def _read_fitslc_hdus(lcfits,
+                      headerkeys,
+                      datakeys,
+                      sapkeys,
+                      pdckeys,
+                      topkeys):
+    '''This reads the header info and the LC columns from a TESS LC FITS file.
+
+    See `read_tess_fitslc` for the args.
+
+    Returns
+    -------
+
+    tuple
+        Returns `(hdrinfo, ndet, lcaperturedata, lcdata)`, where `hdrinfo` has
+        the lowercased header keys from the LC, top, and aperture HDUs, `ndet`
+        is the number of rows in the LC table, `lcaperturedata` is the
+        aperture pixel mask, and `lcdata` is the dict of LC columns from
+        `_read_fitslc_columns`.
+
+    '''
+
+    # read the fits file. this is memory-mapped so only the columns we need are
+    # read from it
+    with pyfits.open(lcfits, memmap=True) as hdulist:
+
+        lchdr = hdulist[1].header
+        lctophdr, lcaperturehdr = hdulist[0].header, hdulist[2].header
+
+        lcaperturedata = hdulist[2].data
+        if lcaperturedata is not None:
+            lcaperturedata = np.array(lcaperturedata)
+
+        # TIME and the flux columns are used for appending and normalizing
+        lcdata = _read_fitslc_columns(
+            hdulist[1],
+            (['TIME'] + list(datakeys) +
+             (['SAP_FLUX'] + list(sapkeys) if sapkeys else []) +
+             (['PDCSAP_FLUX'] + list(pdckeys) if pdckeys else []))
+        )
+
+    hdrinfo = {}
+
+    # now get the values we want from the header
+    for key in headerkeys:
+        if key in lchdr and lchdr[key] is not None:
+            hdrinfo[key.lower()] = lchdr[key]
+        else:
+            hdrinfo[key.lower()] = None
+
+    # get the number of detections
+    ndet = lchdr['NAXIS2']
+
+    # get the info from the topheader
+    for key in topkeys:
+        if key in lctophdr and lctophdr[key] is not None:
+            hdrinfo[key.lower()] = lctophdr[key]
+        else:
+            hdrinfo[key.lower()] = None
+
+    # get the info from the lcaperturehdr
+    for key in lcaperturehdr:
+        if key in lcaperturehdr and lcaperturehdr[key] is not None:
+            hdrinfo[key.lower()] = lcaperturehdr[key]
+        else:
+            hdrinfo[key.lower()] = None
+
+    return hdrinfo, ndet, lcaperturedata, lcdata
+
+
 def read_tess_fitslc(lcfits,
                      headerkeys=LCHEADERKEYS,
                      datakeys=LCDATAKEYS,
@@ -310,39 +421,15 @@ def read_tess_fitslc(lcfits,
 
     '''
 
-    # read the fits file
-    hdulist = pyfits.open(lcfits)
-    lchdr, lcdata = hdulist[1].header, hdulist[1].data
-    lctophdr, lcaperturehdr, lcaperturedata = (hdulist[0].header,
-                                               hdulist[2].header,
-                                               hdulist[2].data)
-    hdulist.close()
-
-    hdrinfo = {}
-
-    # now get the values we want from the header
-    for key in headerkeys:
-        if key in lchdr and lchdr[key] is not None:
-            hdrinfo[key.lower()] = lchdr[key]
-        else:
-            hdrinfo[key.lower()] = None
-
-    # get the number of detections
-    ndet = lchdr['NAXIS2']
-
-    # get the info from the topheader
-    for key in topkeys:
-        if key in lctophdr and lctophdr[key] is not None:
-            hdrinfo[key.lower()] = lctophdr[key]
-        else:
-            hdrinfo[key.lower()] = None
-
-    # get the info from the lcaperturehdr
-    for key in lcaperturehdr:
-        if key in lcaperturehdr and lcaperturehdr[key] is not None:
-            hdrinfo[key.lower()] = lcaperturehdr[key]
-        else:
-            hdrinfo[key.lower()] = None
+    # read the fits file and get the header info and the columns we need
+    hdrinfo, ndet, lcaperturedata, lcdata = _read_fitslc_hdus(
+        lcfits,
+        headerkeys,
+        datakeys,
+        sapkeys,
+        pdckeys,
+        topkeys
+    )
 
     # if we're appending to another lcdict
     if appendto and isinstance(appendto, dict):
@@ -692,6 +779,11 @@ def consolidate_tess_fitslc(lclist,
                             apkeys=LCAPERTUREKEYS):
     '''This consolidates a list of LCs for a single TIC object.
 
+    The number of measurements in each file is read from its header first, so
+    the final column arrays are made only once. The files are then read one at
+    a time with only the requested columns taken from their memory-mapped
+    tables and copied into place.
+
     NOTE: if light curve time arrays contain nans, these and their associated
     measurements will be sorted to the end of the final combined arrays.
 
@@ -778,30 +870,56 @@ def consolidate_tess_fitslc(lclist,
 
         matching = lclist
 
-    # get the first file
-    consolidated = read_tess_fitslc(matching[0],
-                                    normalize=normalize,
-                                    headerkeys=LCHEADERKEYS,
-                                    datakeys=LCDATAKEYS,
-                                    sapkeys=LCSAPKEYS,
-                                    pdckeys=LCPDCKEYS,
-                                    topkeys=LCTOPKEYS,
-                                    apkeys=LCAPERTUREKEYS)
-
-    # get the rest of the files
-    if len(matching) > 1:
-
-        for lcf in matching[1:]:
-
-            consolidated = read_tess_fitslc(lcf,
-                                            appendto=consolidated,
-                                            normalize=normalize,
-                                            headerkeys=LCHEADERKEYS,
-                                            datakeys=LCDATAKEYS,
-                                            sapkeys=LCSAPKEYS,
-                                            pdckeys=LCPDCKEYS,
-                                            topkeys=LCTOPKEYS,
-                                            apkeys=LCAPERTUREKEYS)
+    # get the number of rows in each file from its header so the final column
+    # arrays are only made once
+    ndets = [pyfits.getval(x, 'NAXIS2', ext=1) for x in matching]
+    rowstarts = np.concatenate(([0], np.cumsum(ndets)))
+
+    consolidated = None
+
+    for lcf, rowstart, rowend in zip(matching, rowstarts[:-1], rowstarts[1:]):
+
+        lcdict = read_tess_fitslc(lcf,
+                                  normalize=normalize,
+                                  headerkeys=headerkeys,
+                                  datakeys=datakeys,
+                                  sapkeys=sapkeys,
+                                  pdckeys=pdckeys,
+                                  topkeys=topkeys,
+                                  apkeys=apkeys)
+
+        colrefs = _get_lcdict_column_refs(lcdict, lcdict['columns'])
+
+        # the first file sets up the lcdict and the final column arrays
+        if consolidated is None:
+
+            consolidated = lcdict
+            colarrays = []
+
+            for coldict, colkey in colrefs:
+                colarrays.append(coldict[colkey])
+                coldict[colkey] = np.empty(rowstarts[-1],
+                                           dtype=coldict[colkey].dtype)
+
+            outrefs = colrefs
+
+        # the rest of the files add on their lcinfo and varinfo
+        else:
+
+            for key in consolidated['lcinfo']:
+                consolidated['lcinfo'][key].extend(lcdict['lcinfo'][key])
+
+            for key in consolidated['varinfo']:
+                consolidated['varinfo'][key].extend(lcdict['varinfo'][key])
+
+            colarrays = [coldict[colkey] for coldict, colkey in colrefs]
+
+        # copy the columns into their place in the final arrays
+        for (coldict, colkey), colarr in zip(outrefs, colarrays):
+            coldict[colkey][rowstart:rowend] = colarr
+
+    # update the ndet key in the objectinfo with the sum of all observations
+    consolidated['objectinfo']['ndet'] = sum(consolidated['lcinfo']['ndet'])
 
     # get the sort indices. we use time for the columns and sectors for the
     # bits in lcinfo and varinfo
@@ -818,27 +936,23 @@ def consolidate_tess_fitslc(lclist,
     column_sort_ind = np.argsort(consolidated['time'])
 
     # sort the columns by time
-    for col in consolidated['columns']:
-        if '.' in col:
-            key, subkey = col.split('.')
-            consolidated[key][subkey] = (
-                consolidated[key][subkey][column_sort_ind]
-            )
-        else:
-            consolidated[col] = consolidated[col][column_sort_ind]
+    for coldict, colkey in outrefs:
+        coldict[colkey] = coldict[colkey][column_sort_ind]
 
+    # the lists are indexed directly because the lcaperture arrays can have
+    # different shapes for different sectors
     info_sort_ind = np.argsort(consolidated['lcinfo']['sector'])
 
     # sort the keys in lcinfo
     for key in consolidated['lcinfo']:
         consolidated['lcinfo'][key] = (
-            np.array(consolidated['lcinfo'][key])[info_sort_ind].tolist()
+            [consolidated['lcinfo'][key][x] for x in info_sort_ind]
         )
 
     # sort the keys in varinfo
     for key in consolidated['varinfo']:
         consolidated['varinfo'][key] = (
-            np.array(consolidated['varinfo'][key])[info_sort_ind].tolist()
+            [consolidated['varinfo'][key][x] for x in info_sort_ind]
         )
 
     # filter the LC dict if requested
@@ -933,6 +1047,60 @@ def read_tess_pklc(picklefile):
     return lcdict
 
 
+def _read_tess_lcfile(lcfile):
+    '''
+    This reads an lcdict from a TESS LC FITS file or pickle.
+
+    '''
+
+    if lcfile.endswith(('.fits', '.fits.gz')):
+        return read_tess_fitslc(lcfile)
+    else:
+        return read_tess_pklc(lcfile)
+
+
+def tess_lcdicts_to_archive(lcdicts,
+                            outfile,
+                            archiveinfo=None):
+    '''This writes the `lcdicts` of many objects to a single LC archive.
+
+    An archive holds all of the light curves for a sector in one file, with
+    their columns concatenated into arrays and an index of each object's offset
+    and length in these arrays. Use `astrobase.lcarchive.read_lcarchive` to
+    read a single object's lcdict from it, or
+    `astrobase.lcarchive.list_lcarchive` to get the references to all of its
+    light curves for use with the `tess-lca` LC format in
+    `astrobase.lcproc`. See `astrobase.lcarchive.write_lcarchive` for details.
+
+    Parameters
+    ----------
+
+    lcdicts : list of lcdicts or str
+        The input `lcdicts` to write to the archive. These can also be paths
+        to TESS LC FITS files, which will be read with `read_tess_fitslc`, or to
+        LC pickles, which will be read with `read_tess_pklc`.
+
+    outfile : str
+        The path of the output archive. Use a filename ending in `-tesslc.lca`
+        to match the `fileglob` of the `tess-lca` LC format.
+
+    archiveinfo : dict or None
+        Any JSON-able information about the archive to store in its header.
+
+    Returns
+    -------
+
+    str
+        The absolute path to the written archive file.
+
+    '''
+
+    return write_lcarchive(lcdicts,
+                           outfile,
+                           readerfunc=_read_tess_lcfile,
+                           archiveinfo=archiveinfo)
+
+
 ################################
 ## TESS LIGHTCURVE PROCESSING ##
 ################################
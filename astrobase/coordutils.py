@@ -39,6 +39,9 @@ LOGEXCEPTION = LOGGER.exception
 ## IMPORTS ##
 #############
 
+import os
+import os.path
+import json
 from math import trunc, fabs, pi as pi_value
 
 import numpy as np
@@ -589,8 +592,9 @@ def conesearch_kdtree(kdtree,
     Parameters
     ----------
 
-    kdtree : scipy.spatial.CKDTree
-        This is a kdtree object generated by the `make_kdtree` function.
+    kdtree : scipy.spatial.CKDTree or ZoneIndex
+        This is a kdtree object generated by the `make_kdtree` function or a
+        zone index generated by the `make_zoneindex` function.
 
     racenter,declcenter : float or array-like
         This is the center coordinate to run the cone-search around in decimal
@@ -623,12 +627,20 @@ def conesearch_kdtree(kdtree,
     # this is the search distance in xyz unit vectors
     xyzdist = 2.0 * np.sin(np.radians(searchradiusdeg)/2.0)
 
-    # look up the coordinates
-    kdtindices = kdtree.query_ball_point([cosra*cosdecl,
-                                          sinra*cosdecl,
-                                          sindecl],
-                                         xyzdist,
-                                         n_jobs=conesearchworkers)
+    # look up the coordinates. newer scipy versions call the n_jobs kwarg
+    # 'workers' instead
+    try:
+        kdtindices = kdtree.query_ball_point([cosra*cosdecl,
+                                              sinra*cosdecl,
+                                              sindecl],
+                                             xyzdist,
+                                             workers=conesearchworkers)
+    except TypeError:
+        kdtindices = kdtree.query_ball_point([cosra*cosdecl,
+                                              sinra*cosdecl,
+                                              sindecl],
+                                             xyzdist,
+                                             n_jobs=conesearchworkers)
 
     return kdtindices
 
@@ -645,8 +657,9 @@ def xmatch_kdtree(kdtree,
     Parameters
     ----------
 
-    kdtree : scipy.spatial.CKDTree
-        This is a kdtree object generated by the `make_kdtree` function.
+    kdtree : scipy.spatial.CKDTree or ZoneIndex
+        This is a kdtree object generated by the `make_kdtree` function or a
+        zone index generated by the `make_zoneindex` function.
 
     extra,extdecl : array-like
         These are np.arrays of 'external' coordinates in decimal degrees that
@@ -691,7 +704,10 @@ def xmatch_kdtree(kdtree,
     ext_kdt = sps.cKDTree(ext_xyz)
 
     # do a query_ball_tree
-    extkd_matchinds = our_kdt.query_ball_tree(ext_kdt, ext_xyzdist)
+    if isinstance(our_kdt, ZoneIndex):
+        extkd_matchinds = ext_kdt.query_ball_point(our_kdt.data, ext_xyzdist)
+    else:
+        extkd_matchinds = our_kdt.query_ball_tree(ext_kdt, ext_xyzdist)
 
     ext_matchinds = []
     kdt_matchinds = []
@@ -710,6 +726,388 @@ def xmatch_kdtree(kdtree,
     return kdt_matchinds, ext_matchinds
 
 
+##########################
+## ZONE INDEX FUNCTIONS ##
+##########################
+
+class ZoneIndex(object):
+    '''This is a memory-mappable spatial index for objects on the sky.
+
+    Objects are binned into declination zones of constant height and sorted by
+    right ascension within each zone (the 'zones' algorithm of Gray et
+    al. 2006). A cone-search only needs to look at the handful of zones that
+    overlap the search cone and bisect the RA range in each, so the index is
+    just a few flat arrays. Unlike a `scipy.spatial.cKDTree`, these can be
+    written to disk with `ZoneIndex.save` and memory-mapped back in by any
+    number of processes with `load_zoneindex`.
+
+    The query methods mirror the subset of the `cKDTree` interface used by
+    astrobase (`query_ball_point` and `query`), taking Cartesian unit vectors
+    and chord distances, so a `ZoneIndex` can be used anywhere a light curve
+    catalog `kdtree` is expected.
+
+    Attributes
+    ----------
+
+    zone_height : float
+        The height of each declination zone in decimal degrees.
+
+    zone_offsets : np.array
+        The index into the sorted arrays where each zone starts. This has
+        `nzones + 1` elements.
+
+    order : np.array
+        The original object index for each element of the sorted arrays.
+
+    ra : np.array
+        The right ascensions of the objects in sorted order.
+
+    xyz : np.array
+        The Cartesian unit vectors of the objects in sorted order.
+
+    indexdir : str or None
+        If this index was saved to or loaded from disk, this is the directory
+        it lives in. Pickling an index with an `indexdir` only pickles this
+        path, so it's cheap to pass to parallel workers.
+
+    '''
+
+    def __init__(self,
+                 zone_height,
+                 zone_offsets,
+                 order,
+                 ra,
+                 xyz,
+                 indexdir=None):
+        '''Constructor for this class.
+
+        Use `make_zoneindex` or `load_zoneindex` to get a `ZoneIndex` instead
+        of calling this directly.
+
+        '''
+
+        self.zone_height = float(zone_height)
+        self.zone_offsets = zone_offsets
+        self.order = order
+        self.ra = ra
+        self.xyz = xyz
+        self.indexdir = indexdir
+        self.n = order.size
+        self.m = 3
+        self.nzones = zone_offsets.size - 1
+
+    def __reduce__(self):
+        '''This pickles an on-disk index as a reference to its directory.
+
+        '''
+
+        if self.indexdir is not None:
+            return (load_zoneindex, (self.indexdir,))
+        else:
+            return (ZoneIndex, (self.zone_height,
+                                np.asarray(self.zone_offsets),
+                                np.asarray(self.order),
+                                np.asarray(self.ra),
+                                np.asarray(self.xyz)))
+
+    @property
+    def data(self):
+        '''The Cartesian unit vectors of the objects in their original order.
+
+        '''
+
+        data = np.empty_like(self.xyz)
+        data[self.order] = self.xyz
+        return data
+
+    def _sorted_candidates(self, ra, decl, radius_deg):
+        '''This returns sorted-array indices of objects that may lie in a cone.
+
+        '''
+
+        zlo = int(np.floor((decl - radius_deg + 90.0)/self.zone_height))
+        zhi = int(np.floor((decl + radius_deg + 90.0)/self.zone_height))
+        zlo = min(max(zlo, 0), self.nzones - 1)
+        zhi = min(max(zhi, 0), self.nzones - 1)
+
+        # the half-width in RA of the cone, widened to cover the whole zone if
+        # we're close enough to a pole
+        if (abs(decl) + radius_deg) >= 90.0:
+            rahalfwidth = 180.0
+        else:
+            rahalfwidth = np.degrees(
+                np.arctan(
+                    np.sin(np.radians(radius_deg)) /
+                    np.sqrt(np.abs(np.cos(np.radians(decl - radius_deg)) *
+                                   np.cos(np.radians(decl + radius_deg))))
+                )
+            )
+
+        if rahalfwidth >= 180.0:
+            raranges = [(0.0, 360.0)]
+        else:
+            ralo, rahi = ra - rahalfwidth, ra + rahalfwidth
+            if ralo < 0.0:
+                raranges = [(ralo + 360.0, 360.0), (0.0, rahi)]
+            elif rahi >= 360.0:
+                raranges = [(ralo, 360.0), (0.0, rahi - 360.0)]
+            else:
+                raranges = [(ralo, rahi)]
+
+        candidates = []
+
+        for zone in range(zlo, zhi + 1):
+
+            zstart, zend = self.zone_offsets[zone], self.zone_offsets[zone+1]
+            if zend <= zstart:
+                continue
+
+            zra = self.ra[zstart:zend]
+
+            for ralo, rahi in raranges:
+                ilo = np.searchsorted(zra, ralo, side='left')
+                ihi = np.searchsorted(zra, rahi, side='right')
+                if ihi > ilo:
+                    candidates.append(np.arange(zstart + ilo, zstart + ihi))
+
+        if len(candidates) > 0:
+            return np.concatenate(candidates)
+        else:
+            return np.array([], dtype=np.int64)
+
+    def _point_neighbors(self, point, xyzdist):
+        '''This returns (chord distances, sorted-array indices) within xyzdist.
+
+        '''
+
+        point = np.asarray(point, dtype=np.float64)
+        decl = np.degrees(np.arcsin(np.clip(point[2], -1.0, 1.0)))
+        ra = np.degrees(np.arctan2(point[1], point[0])) % 360.0
+
+        if np.isfinite(xyzdist) and xyzdist < 2.0:
+            radius_deg = np.degrees(2.0*np.arcsin(xyzdist/2.0))
+            candidates = self._sorted_candidates(ra, decl, radius_deg)
+        else:
+            candidates = np.arange(self.n)
+
+        dists = np.sqrt(
+            np.sum((np.asarray(self.xyz[candidates]) - point)**2.0, axis=1)
+        )
+        within = dists <= xyzdist
+
+        return dists[within], candidates[within]
+
+    def query_ball_point(self, x, r, return_sorted=None, **kwargs):
+        '''This finds all objects within chord distance `r` of the point(s) `x`.
+
+        Parameters
+        ----------
+
+        x : array-like
+            A single Cartesian unit vector of shape (3,) or an array of them
+            with shape (npoints, 3).
+
+        r : float
+            The search radius as a chord distance between unit vectors,
+            i.e. `2.0*sin(radians(radius_deg)/2.0)`.
+
+        return_sorted : bool or None
+            If True, sorts the returned indices. If None, sorts them only for
+            multi-point queries, like `cKDTree.query_ball_point`.
+
+        kwargs : extra keyword args
+            Any other `cKDTree.query_ball_point` kwargs (e.g. `n_jobs`) are
+            accepted and ignored.
+
+        Returns
+        -------
+
+        list or np.array of lists
+            For a single point, the list of matching object indices. For
+            multiple points, an object array of such lists.
+
+        '''
+
+        x = np.asarray(x, dtype=np.float64)
+
+        if x.ndim == 1:
+            _, sinds = self._point_neighbors(x, r)
+            matches = np.asarray(self.order[sinds])
+            if return_sorted:
+                matches = np.sort(matches)
+            return matches.tolist()
+
+        results = np.empty(x.shape[0], dtype=object)
+        for ind, point in enumerate(x):
+            _, sinds = self._point_neighbors(point, r)
+            matches = np.asarray(self.order[sinds])
+            if return_sorted is None or return_sorted:
+                matches = np.sort(matches)
+            results[ind] = matches.tolist()
+
+        return results
+
+    def query(self, x, k=1, distance_upper_bound=np.inf, **kwargs):
+        '''This finds the `k` nearest objects to the point(s) `x`.
+
+        Parameters
+        ----------
+
+        x : array-like
+            A single Cartesian unit vector of shape (3,) or an array of them
+            with shape (npoints, 3).
+
+        k : int
+            The number of nearest neighbors to return.
+
+        distance_upper_bound : float
+            Only return neighbors within this chord distance. Set this to
+            something sensible, otherwise the entire index is scanned.
+
+        kwargs : extra keyword args
+            Any other `cKDTree.query` kwargs are accepted and ignored.
+
+        Returns
+        -------
+
+        tuple
+            Returns `(distances, indices)` like `cKDTree.query`: missing
+            neighbors have distance `np.inf` and index `self.n`. For a single
+            point and `k = 1`, these are scalars.
+
+        '''
+
+        x = np.asarray(x, dtype=np.float64)
+        single = x.ndim == 1
+        points = np.atleast_2d(x)
+
+        alldists = np.full((points.shape[0], k), np.inf)
+        allinds = np.full((points.shape[0], k), self.n, dtype=np.int64)
+
+        for ind, point in enumerate(points):
+
+            dists, sinds = self._point_neighbors(point, distance_upper_bound)
+            nearest = np.argsort(dists, kind='stable')[:k]
+            alldists[ind, :nearest.size] = dists[nearest]
+            allinds[ind, :nearest.size] = self.order[sinds[nearest]]
+
+        if k == 1:
+            alldists, allinds = alldists[:,0], allinds[:,0]
+        if single:
+            alldists, allinds = alldists[0], allinds[0]
+
+        return alldists, allinds
+
+    def save(self, outdir):
+        '''This writes the index arrays to `outdir` as .npy files.
+
+        Parameters
+        ----------
+
+        outdir : str
+            The directory to write the index to. It will be created if it
+            doesn't exist.
+
+        Returns
+        -------
+
+        str
+            The path to the output directory.
+
+        '''
+
+        if not os.path.exists(outdir):
+            os.makedirs(outdir)
+
+        for key in ('zone_offsets', 'order', 'ra', 'xyz'):
+            np.save(os.path.join(outdir, '%s.npy' % key),
+                    np.asarray(getattr(self, key)),
+                    allow_pickle=False)
+
+        with open(os.path.join(outdir, 'zoneindex.json'), 'w') as outfd:
+            json.dump({'zone_height':self.zone_height,
+                       'nobjects':int(self.n)}, outfd)
+
+        self.indexdir = os.path.abspath(outdir)
+        return self.indexdir
+
+
+def make_zoneindex(ra, decl, zone_height=0.05):
+    '''This makes a `ZoneIndex` on (`ra`, `decl`).
+
+    Parameters
+    ----------
+
+    ra,decl : array-like
+        The right ascension and declination coordinate pairs in decimal degrees.
+
+    zone_height : float
+        The height of each declination zone in decimal degrees. This should be
+        of the order of the typical search radius you'll use.
+
+    Returns
+    -------
+
+    ZoneIndex
+        The `ZoneIndex` object generated by this function.
+
+    '''
+
+    ra = np.asarray(ra, dtype=np.float64) % 360.0
+    decl = np.asarray(decl, dtype=np.float64)
+
+    nzones = int(np.ceil(180.0/zone_height))
+    zones = np.clip(np.floor((decl + 90.0)/zone_height).astype(np.int64),
+                    0, nzones - 1)
+
+    order = np.lexsort((ra, zones))
+    zone_offsets = np.searchsorted(zones[order], np.arange(nzones + 1))
+
+    cosdecl = np.cos(np.radians(decl[order]))
+    sindecl = np.sin(np.radians(decl[order]))
+    cosra = np.cos(np.radians(ra[order]))
+    sinra = np.sin(np.radians(ra[order]))
+    xyz = np.column_stack((cosra*cosdecl, sinra*cosdecl, sindecl))
+
+    return ZoneIndex(zone_height, zone_offsets, order, ra[order], xyz)
+
+
+def load_zoneindex(indexdir, mmap=True):
+    '''This loads a `ZoneIndex` written by `ZoneIndex.save`.
+
+    Parameters
+    ----------
+
+    indexdir : str
+        The directory containing the index.
+
+    mmap : bool
+        If True, the index arrays are memory-mapped read-only instead of being
+        read into memory, so they're shared between all processes using this
+        index.
+
+    Returns
+    -------
+
+    ZoneIndex
+        The loaded `ZoneIndex` object.
+
+    '''
+
+    with open(os.path.join(indexdir, 'zoneindex.json'), 'r') as infd:
+        indexinfo = json.load(infd)
+
+    mmap_mode = 'r' if mmap else None
+    arrays = [np.load(os.path.join(indexdir, '%s.npy' % key),
+                      mmap_mode=mmap_mode,
+                      allow_pickle=False)
+              for key in ('zone_offsets', 'order', 'ra', 'xyz')]
+
+    return ZoneIndex(indexinfo['zone_height'],
+                     *arrays,
+                     indexdir=os.path.abspath(indexdir))
+
+
 ###################
 ## PROPER MOTION ##
 ###################
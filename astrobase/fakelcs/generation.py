@@ -97,6 +97,8 @@ import os
 import os.path
 import pickle
 import shutil
+import multiprocessing as mp
+from inspect import signature
 
 from hashlib import md5, sha512
 
@@ -136,6 +138,50 @@ from ..magnitudes import jhk_to_sdssr
 from ..lcproc import get_lcformat, _read_pklc
 
 
+###########################
+## RANDOM NUMBER STREAMS ##
+###########################
+
+# these are the keys of the independent random number streams derived from a
+# simulation seed by get_fakelc_rng
+COLLECTION_STREAM = 0
+FAKELC_STREAM = 1
+VARPARAM_STREAM = 2
+NOISE_STREAM = 3
+
+
+def get_fakelc_rng(seed, *streamkey):
+    '''This returns a random number generator for one part of a simulation.
+
+    Each combination of `seed` and `streamkey` gives an independent stream of
+    random numbers. For example, `get_fakelc_rng(seed, NOISE_STREAM, 42)` is the
+    stream used for the noise of object 42 in a collection. Since the stream
+    only depends on these values, the random numbers for each object are the
+    same no matter which process makes them or in which order.
+
+    Parameters
+    ----------
+
+    seed : int
+        The seed of the simulation.
+
+    streamkey : ints
+        These identify the stream, e.g. one of the `*_STREAM` constants in this
+        module followed by an object index.
+
+    Returns
+    -------
+
+    np.random.Generator
+        A random number generator for this stream.
+
+    '''
+
+    return np.random.Generator(
+        np.random.PCG64(np.random.SeedSequence(seed, spawn_key=streamkey))
+    )
+
+
 #############################################
 ## FUNCTIONS TO GENERATE FAKE LIGHT CURVES ##
 #############################################
@@ -248,16 +294,16 @@ def generate_transit_lightcurve(
     # return a dict with everything
     modeldict = {
         'vartype':'planet',
-        'params':{x:np.asscalar(y) for x,y in zip(['transitperiod',
-                                                   'transitepoch',
-                                                   'transitdepth',
-                                                   'transitduration',
-                                                   'ingressduration'],
-                                                  [period,
-                                                   epoch,
-                                                   depth,
-                                                   duration,
-                                                   ingduration])},
+        'params':{x:float(np.squeeze(y)) for x,y in zip(['transitperiod',
+                                                         'transitepoch',
+                                                         'transitdepth',
+                                                         'transitduration',
+                                                         'ingressduration'],
+                                                        [period,
+                                                         epoch,
+                                                         depth,
+                                                         duration,
+                                                         ingduration])},
         'times':mtimes,
         'mags':mmags,
         'errs':merrs,
@@ -377,16 +423,16 @@ def generate_eb_lightcurve(
     # return a dict with everything
     modeldict = {
         'vartype':'EB',
-        'params':{x:np.asscalar(y) for x,y in zip(['period',
-                                                   'epoch',
-                                                   'pdepth',
-                                                   'pduration',
-                                                   'depthratio'],
-                                                  [period,
-                                                   epoch,
-                                                   pdepth,
-                                                   pduration,
-                                                   depthratio])},
+        'params':{x:float(np.squeeze(y)) for x,y in zip(['period',
+                                                         'epoch',
+                                                         'pdepth',
+                                                         'pduration',
+                                                         'depthratio'],
+                                                        [period,
+                                                         epoch,
+                                                         pdepth,
+                                                         pduration,
+                                                         depthratio])},
         'times':mtimes,
         'mags':mmags,
         'errs':merrs,
@@ -1171,131 +1217,21 @@ VARTYPE_LCGEN_MAP = {
 ## FUNCTIONS TO COLLECT LIGHT CURVES FOR SIM ##
 ###############################################
 
-def make_fakelc(lcfile,
-                outdir,
-                magrms=None,
-                randomizemags=True,
-                randomizecoords=False,
-                lcformat='hat-sql',
-                lcformatdir=None,
-                timecols=None,
-                magcols=None,
-                errcols=None):
-    '''This preprocesses an input real LC and sets it up to be a fake LC.
-
-    Parameters
-    ----------
-
-    lcfile : str
-        This is an input light curve file that will be used to copy over the
-        time-base. This will be used to generate the time-base for fake light
-        curves to provide a realistic simulation of the observing window
-        function.
-
-    outdir : str
-        The output directory where the the fake light curve will be written.
-
-    magrms : dict
-        This is a dict containing the SDSS r mag-RMS (SDSS rmag-MAD preferably)
-        relation based on all light curves that the input lcfile is from. This
-        will be used to generate the median mag and noise corresponding to the
-        magnitude chosen for this fake LC.
-
-    randomizemags : bool
-        If this is True, then a random mag between the first and last magbin in
-        magrms will be chosen as the median mag for this light curve. This
-        choice will be weighted by the mag bin probability obtained from the
-        magrms kwarg. Otherwise, the median mag will be taken from the input
-        lcfile's lcdict['objectinfo']['sdssr'] key or a transformed SDSS r mag
-        generated from the input lcfile's lcdict['objectinfo']['jmag'],
-        ['hmag'], and ['kmag'] keys. The magrms relation for each magcol will be
-        used to generate Gaussian noise at the correct level for the magbin this
-        light curve's median mag falls into.
-
-    randomizecoords : bool
-        If this is True, will randomize the RA, DEC of the output fake object
-        and not copy over the RA/DEC from the real input object.
-
-    lcformat : str
-        This is the `formatkey` associated with your input real light curve
-        format, which you previously passed in to the `lcproc.register_lcformat`
-        function. This will be used to look up how to find and read the light
-        curve specified in `lcfile`.
-
-    lcformatdir : str or None
-        If this is provided, gives the path to a directory when you've stored
-        your lcformat description JSONs, other than the usual directories lcproc
-        knows to search for them in. Use this along with `lcformat` to specify
-        an LC format JSON file that's not currently registered with lcproc.
-
-    timecols : list of str or None
-        The timecol keys to use from the input lcdict in generating the fake
-        light curve. Fake LCs will be generated for each each
-        timecol/magcol/errcol combination in the input light curve.
-
-    magcols : list of str or None
-        The magcol keys to use from the input lcdict in generating the fake
-        light curve. Fake LCs will be generated for each each
-        timecol/magcol/errcol combination in the input light curve.
-
-    errcols : list of str or None
-        The errcol keys to use from the input lcdict in generating the fake
-        light curve. Fake LCs will be generated for each each
-        timecol/magcol/errcol combination in the input light curve.
-
-    Returns
-    -------
-
-    tuple
-        A tuple of the following form is returned::
+def _fakelc_objectinfo(lcdict,
+                       lcfile,
+                       fakeobjectinfo,
+                       magrms,
+                       magcols,
+                       randomizemags,
+                       randomizecoords,
+                       rng):
+    '''This fills in the RA, Dec, and SDSS r mag of a fake LC's objectinfo.
 
-            (fakelc_fpath,
-             fakelc_lcdict['columns'],
-             fakelc_lcdict['objectinfo'],
-             fakelc_lcdict['moments'])
+    `fakeobjectinfo` is updated in place. See `make_fakelc` for the other
+    args.
 
     '''
 
-    try:
-        formatinfo = get_lcformat(lcformat,
-                                  use_lcformat_dir=lcformatdir)
-        if formatinfo:
-            (fileglob, readerfunc,
-             dtimecols, dmagcols, derrcols,
-             magsarefluxes, normfunc) = formatinfo
-        else:
-            LOGERROR("can't figure out the light curve format")
-            return None
-    except Exception:
-        LOGEXCEPTION("can't figure out the light curve format")
-        return None
-
-    # override the default timecols, magcols, and errcols
-    # using the ones provided to the function
-    if timecols is None:
-        timecols = dtimecols
-    if magcols is None:
-        magcols = dmagcols
-    if errcols is None:
-        errcols = derrcols
-
-    # read in the light curve
-    lcdict = readerfunc(lcfile)
-    if isinstance(lcdict, tuple) and isinstance(lcdict[0],dict):
-        lcdict = lcdict[0]
-
-    # set up the fakelcdict with a randomly assigned objectid
-    fakeobjectid = sha512(npr.bytes(12)).hexdigest()[-8:]
-    fakelcdict = {
-        'objectid':fakeobjectid,
-        'objectinfo':{'objectid':fakeobjectid},
-        'columns':[],
-        'moments':{},
-        'origformat':lcformat,
-    }
-
-    # now, get the actual mag of this object and other info and use that to
-    # populate the corresponding entries of the fakelcdict objectinfo
     if ('objectinfo' in lcdict and
         isinstance(lcdict['objectinfo'], dict)):
 
@@ -1306,28 +1242,28 @@ def make_fakelc(lcfile,
             objectinfo['ra'] is not None and
             np.isfinite(objectinfo['ra'])):
 
-            fakelcdict['objectinfo']['ra'] = objectinfo['ra']
+            fakeobjectinfo['ra'] = objectinfo['ra']
 
         else:
 
             # if there's no RA available, we'll assign a random one between 0
             # and 360.0
             LOGWARNING('%s: assigning a random right ascension' % lcfile)
-            fakelcdict['objectinfo']['ra'] = npr.random()*360.0
+            fakeobjectinfo['ra'] = rng.random()*360.0
 
         # get the DEC
         if (not randomizecoords and 'decl' in objectinfo and
             objectinfo['decl'] is not None and
             np.isfinite(objectinfo['decl'])):
 
-            fakelcdict['objectinfo']['decl'] = objectinfo['decl']
+            fakeobjectinfo['decl'] = objectinfo['decl']
 
         else:
 
             # if there's no DECL available, we'll assign a random one between
             # -90.0 and +90.0
             LOGWARNING(' %s: assigning a random declination' % lcfile)
-            fakelcdict['objectinfo']['decl'] = npr.random()*180.0 - 90.0
+            fakeobjectinfo['decl'] = rng.random()*180.0 - 90.0
 
         # get the SDSS r mag for this object
         # this will be used for getting the eventual mag-RMS relation later
@@ -1335,7 +1271,7 @@ def make_fakelc(lcfile,
             objectinfo['sdssr'] is not None and
             np.isfinite(objectinfo['sdssr'])):
 
-            fakelcdict['objectinfo']['sdssr'] = objectinfo['sdssr']
+            fakeobjectinfo['sdssr'] = objectinfo['sdssr']
 
         # if the SDSS r is unavailable, but we have J, H, K: use those to get
         # the SDSS r by using transformations
@@ -1351,7 +1287,7 @@ def make_fakelc(lcfile,
 
             LOGWARNING('used JHK mags to generate an SDSS r mag for %s' %
                        lcfile)
-            fakelcdict['objectinfo']['sdssr'] = jhk_to_sdssr(
+            fakeobjectinfo['sdssr'] = jhk_to_sdssr(
                 objectinfo['jmag'],
                 objectinfo['hmag'],
                 objectinfo['kmag']
@@ -1368,15 +1304,15 @@ def make_fakelc(lcfile,
             binprobs = magrms[magcols[0]]['magbin_probabilities']
 
             # this is the center of the magbin chosen
-            magbincenter = npr.choice(magbins,size=1,p=binprobs)
+            magbincenter = rng.choice(magbins,size=1,p=binprobs)
 
             # in this magbin, choose between center and -+ 0.25 mag
             chosenmag = (
-                npr.random()*((magbincenter+0.25) - (magbincenter-0.25)) +
+                rng.random()*((magbincenter+0.25) - (magbincenter-0.25)) +
                 (magbincenter-0.25)
             )
 
-            fakelcdict['objectinfo']['sdssr'] = np.asscalar(chosenmag)
+            fakeobjectinfo['sdssr'] = float(np.squeeze(chosenmag))
 
         # if there are no mags available at all, generate a random mag
         # between 8 and 16.0
@@ -1385,7 +1321,7 @@ def make_fakelc(lcfile,
             LOGWARNING(' %s: assigning a random mag from '
                        'uniform distribution between 8.0 and 16.0' % lcfile)
 
-            fakelcdict['objectinfo']['sdssr'] = npr.random()*8.0 + 8.0
+            fakeobjectinfo['sdssr'] = rng.random()*8.0 + 8.0
 
     # if there's no info available, generate fake info
     else:
@@ -1393,247 +1329,455 @@ def make_fakelc(lcfile,
         LOGWARNING('no object information found in %s, '
                    'generating random ra, decl, sdssr' %
                    lcfile)
-        fakelcdict['objectinfo']['ra'] = npr.random()*360.0
-        fakelcdict['objectinfo']['decl'] = npr.random()*180.0 - 90.0
-        fakelcdict['objectinfo']['sdssr'] = npr.random()*8.0 + 8.0
+        fakeobjectinfo['ra'] = rng.random()*360.0
+        fakeobjectinfo['decl'] = rng.random()*180.0 - 90.0
+        fakeobjectinfo['sdssr'] = rng.random()*8.0 + 8.0
 
-    #
-    # NOW FILL IN THE TIMES, MAGS, ERRS
-    #
 
-    # get the time columns
-    for tcind, tcol in enumerate(timecols):
+def _fakelc_mag_moments(measuredmags,
+                        mcol,
+                        sdssr,
+                        magrms,
+                        randomizemags,
+                        lcfile,
+                        rng):
+    '''This gets the median and MAD to use for a fake LC's mag column.
 
-        if '.' in tcol:
-            tcolget = tcol.split('.')
-        else:
-            tcolget = [tcol]
+    `measuredmags` are the finite mags in the input LC's `mcol` and `sdssr` is
+    the fake LC's SDSS r mag. See `make_fakelc` for the other args.
 
-        if tcol not in fakelcdict:
-            fakelcdict[tcol] = _dict_get(lcdict, tcolget)
-            fakelcdict['columns'].append(tcol)
+    '''
 
-            # update the ndet with the first time column's size. it's possible
-            # that different time columns have different lengths, but that would
-            # be weird and we won't deal with it for now
-            if tcind == 0:
-                fakelcdict['objectinfo']['ndet'] = fakelcdict[tcol].size
+    # if we're randomizing, get the mags from the interpolated mag-RMS
+    # relation
+    if (randomizemags and magrms and mcol in magrms and
+        'interpolated_magmad' in magrms[mcol] and
+        magrms[mcol]['interpolated_magmad'] is not None):
 
-    # get the mag columns
-    for mcol in magcols:
+        interpfunc = magrms[mcol]['interpolated_magmad']
+        lcmad = interpfunc(sdssr)
 
-        if '.' in mcol:
-            mcolget = mcol.split('.')
-        else:
-            mcolget = [mcol]
+        moments = {
+            'median': sdssr,
+            'mad': lcmad
+        }
 
-        # put the mcol in only once
-        if mcol not in fakelcdict:
+    # if we're not randomizing, get the median and MAD from the light
+    # curve itself
+    else:
 
-            measuredmags = _dict_get(lcdict, mcolget)
-            measuredmags = measuredmags[np.isfinite(measuredmags)]
+        # we require at least 10 finite measurements
+        if measuredmags.size > 9:
+
+            measuredmedian = np.median(measuredmags)
+            measuredmad = np.median(
+                np.abs(measuredmags - measuredmedian)
+            )
+            moments = {'median':measuredmedian,
+                       'mad':measuredmad}
+
+        # if there aren't enough measurements in this LC, try to get the
+        # median and RMS from the interpolated mag-RMS relation first
+        else:
 
-            # if we're randomizing, get the mags from the interpolated mag-RMS
-            # relation
-            if (randomizemags and magrms and mcol in magrms and
+            if (magrms and mcol in magrms and
                 'interpolated_magmad' in magrms[mcol] and
                 magrms[mcol]['interpolated_magmad'] is not None):
 
+                LOGWARNING(
+                    'input LC %s does not have enough '
+                    'finite measurements, '
+                    'generating mag moments from '
+                    'fakelc sdssr and the mag-RMS relation' % lcfile
+                )
+
                 interpfunc = magrms[mcol]['interpolated_magmad']
-                lcmad = interpfunc(fakelcdict['objectinfo']['sdssr'])
+                lcmad = interpfunc(sdssr)
 
-                fakelcdict['moments'][mcol] = {
-                    'median': fakelcdict['objectinfo']['sdssr'],
+                moments = {
+                    'median': sdssr,
                     'mad': lcmad
                 }
 
-            # if we're not randomizing, get the median and MAD from the light
-            # curve itself
+            # if we don't have the mag-RMS relation either, then we
+            # can't do anything for this light curve, generate a random
+            # MAD between 5e-4 and 0.1
             else:
 
-                # we require at least 10 finite measurements
-                if measuredmags.size > 9:
-
-                    measuredmedian = np.median(measuredmags)
-                    measuredmad = np.median(
-                        np.abs(measuredmags - measuredmedian)
-                    )
-                    fakelcdict['moments'][mcol] = {'median':measuredmedian,
-                                                   'mad':measuredmad}
-
-                # if there aren't enough measurements in this LC, try to get the
-                # median and RMS from the interpolated mag-RMS relation first
-                else:
-
-                    if (magrms and mcol in magrms and
-                        'interpolated_magmad' in magrms[mcol] and
-                        magrms[mcol]['interpolated_magmad'] is not None):
-
-                        LOGWARNING(
-                            'input LC %s does not have enough '
-                            'finite measurements, '
-                            'generating mag moments from '
-                            'fakelc sdssr and the mag-RMS relation' % lcfile
-                        )
-
-                        interpfunc = magrms[mcol]['interpolated_magmad']
-                        lcmad = interpfunc(fakelcdict['objectinfo']['sdssr'])
-
-                        fakelcdict['moments'][mcol] = {
-                            'median': fakelcdict['objectinfo']['sdssr'],
-                            'mad': lcmad
-                        }
-
-                    # if we don't have the mag-RMS relation either, then we
-                    # can't do anything for this light curve, generate a random
-                    # MAD between 5e-4 and 0.1
-                    else:
-
-                        LOGWARNING(
-                            'input LC %s does not have enough '
-                            'finite measurements and '
-                            'no mag-RMS relation provided '
-                            'assigning a random MAD between 5.0e-4 and 0.1'
-                            % lcfile
-                        )
-
-                        fakelcdict['moments'][mcol] = {
-                            'median':fakelcdict['objectinfo']['sdssr'],
-                            'mad':npr.random()*(0.1 - 5.0e-4) + 5.0e-4
-                        }
+                LOGWARNING(
+                    'input LC %s does not have enough '
+                    'finite measurements and '
+                    'no mag-RMS relation provided '
+                    'assigning a random MAD between 5.0e-4 and 0.1'
+                    % lcfile
+                )
+
+                moments = {
+                    'median':sdssr,
+                    'mad':rng.random()*(0.1 - 5.0e-4) + 5.0e-4
+                }
 
-            # the magnitude column is set to all zeros initially. this will be
-            # filled in by the add_fakelc_variability function below
-            fakelcdict[mcol] = np.full_like(_dict_get(lcdict, mcolget), 0.0)
-            fakelcdict['columns'].append(mcol)
+    return moments
 
-    # get the err columns
-    for mcol, ecol in zip(magcols, errcols):
 
-        if '.' in ecol:
-            ecolget = ecol.split('.')
-        else:
-            ecolget = [ecol]
+def _fakelc_err_moments(measurederrs,
+                        mcol,
+                        sdssr,
+                        magrms,
+                        randomizemags,
+                        lcfile,
+                        rng):
+    '''This gets the median and MAD to use for a fake LC's err column.
 
-        if ecol not in fakelcdict:
+    `measurederrs` are the finite errs in the input LC's err column for `mcol`
+    and `sdssr` is the fake LC's SDSS r mag. See `make_fakelc` for the other
+    args.
 
-            measurederrs = _dict_get(lcdict, ecolget)
-            measurederrs = measurederrs[np.isfinite(measurederrs)]
+    '''
+
+    # if we're randomizing, get the errs from the interpolated mag-RMS
+    # relation
+    if (randomizemags and magrms and mcol in magrms and
+        'interpolated_magmad' in magrms[mcol] and
+        magrms[mcol]['interpolated_magmad'] is not None):
+
+        interpfunc = magrms[mcol]['interpolated_magmad']
+        lcmad = interpfunc(sdssr)
+
+        # the median of the errs = lcmad
+        # the mad of the errs is 0.1 x lcmad
+        moments = {
+            'median': lcmad,
+            'mad': 0.1*lcmad
+        }
+
+    else:
+
+        # we require at least 10 finite measurements
+        # we'll calculate the median and MAD of the errs to use later on
+        if measurederrs.size > 9:
+            measuredmedian = np.median(measurederrs)
+            measuredmad = np.median(
+                np.abs(measurederrs - measuredmedian)
+            )
+            moments = {'median':measuredmedian,
+                       'mad':measuredmad}
+        else:
 
-            # if we're randomizing, get the errs from the interpolated mag-RMS
-            # relation
-            if (randomizemags and magrms and mcol in magrms and
+            if (magrms and mcol in magrms and
                 'interpolated_magmad' in magrms[mcol] and
                 magrms[mcol]['interpolated_magmad'] is not None):
 
+                LOGWARNING(
+                    'input LC %s does not have enough '
+                    'finite measurements, '
+                    'generating err moments from '
+                    'the mag-RMS relation' % lcfile
+                )
+
                 interpfunc = magrms[mcol]['interpolated_magmad']
-                lcmad = interpfunc(fakelcdict['objectinfo']['sdssr'])
+                lcmad = interpfunc(sdssr)
 
-                # the median of the errs = lcmad
-                # the mad of the errs is 0.1 x lcmad
-                fakelcdict['moments'][ecol] = {
+                moments = {
                     'median': lcmad,
                     'mad': 0.1*lcmad
                 }
 
+            # if we don't have the mag-RMS relation either, then we
+            # can't do anything for this light curve, generate a random
+            # MAD between 5e-4 and 0.1
             else:
 
-                # we require at least 10 finite measurements
-                # we'll calculate the median and MAD of the errs to use later on
-                if measurederrs.size > 9:
-                    measuredmedian = np.median(measurederrs)
-                    measuredmad = np.median(
-                        np.abs(measurederrs - measuredmedian)
-                    )
-                    fakelcdict['moments'][ecol] = {'median':measuredmedian,
-                                                   'mad':measuredmad}
-                else:
-
-                    if (magrms and mcol in magrms and
-                        'interpolated_magmad' in magrms[mcol] and
-                        magrms[mcol]['interpolated_magmad'] is not None):
-
-                        LOGWARNING(
-                            'input LC %s does not have enough '
-                            'finite measurements, '
-                            'generating err moments from '
-                            'the mag-RMS relation' % lcfile
-                        )
-
-                        interpfunc = magrms[mcol]['interpolated_magmad']
-                        lcmad = interpfunc(fakelcdict['objectinfo']['sdssr'])
-
-                        fakelcdict['moments'][ecol] = {
-                            'median': lcmad,
-                            'mad': 0.1*lcmad
-                        }
-
-                    # if we don't have the mag-RMS relation either, then we
-                    # can't do anything for this light curve, generate a random
-                    # MAD between 5e-4 and 0.1
-                    else:
-
-                        LOGWARNING(
-                            'input LC %s does not have '
-                            'enough finite measurements and '
-                            'no mag-RMS relation provided, '
-                            'generating errs randomly' % lcfile
-                        )
-                        fakelcdict['moments'][ecol] = {
-                            'median':npr.random()*(0.01 - 5.0e-4) + 5.0e-4,
-                            'mad':npr.random()*(0.01 - 5.0e-4) + 5.0e-4
-                        }
-
-            # the errors column is set to all zeros initially. this will be
-            # filled in by the add_fakelc_variability function below.
-            fakelcdict[ecol] = np.full_like(_dict_get(lcdict, ecolget), 0.0)
-            fakelcdict['columns'].append(ecol)
-
-    # add the timecols, magcols, errcols to the lcdict
-    fakelcdict['timecols'] = timecols
-    fakelcdict['magcols'] = magcols
-    fakelcdict['errcols'] = errcols
-
-    # generate an output file name
-    fakelcfname = '%s-fakelc.pkl' % fakelcdict['objectid']
-    fakelcfpath = os.path.abspath(os.path.join(outdir, fakelcfname))
-
-    # write this out to the output directory
-    with open(fakelcfpath,'wb') as outfd:
-        pickle.dump(fakelcdict, outfd, protocol=pickle.HIGHEST_PROTOCOL)
-
-    # return the fakelc path, its columns, info, and moments so we can put them
-    # into a collection DB later on
-    LOGINFO('real LC %s -> fake LC %s OK' % (lcfile, fakelcfpath))
-
-    return (fakelcfpath, fakelcdict['columns'],
-            fakelcdict['objectinfo'], fakelcdict['moments'])
+                LOGWARNING(
+                    'input LC %s does not have '
+                    'enough finite measurements and '
+                    'no mag-RMS relation provided, '
+                    'generating errs randomly' % lcfile
+                )
+                moments = {
+                    'median':rng.random()*(0.01 - 5.0e-4) + 5.0e-4,
+                    'mad':rng.random()*(0.01 - 5.0e-4) + 5.0e-4
+                }
 
+    return moments
 
-##########################
-## COLLECTION FUNCTIONS ##
-##########################
 
-def collection_worker(task):
-    '''
-    This wraps `process_fakelc` for `make_fakelc_collection` below.
+def make_fakelc(lcfile,
+                outdir,
+                magrms=None,
+                randomizemags=True,
+                randomizecoords=False,
+                lcformat='hat-sql',
+                lcformatdir=None,
+                timecols=None,
+                magcols=None,
+                errcols=None,
+                rng=None):
+    '''This preprocesses an input real LC and sets it up to be a fake LC.
 
     Parameters
     ----------
 
-    task : tuple
-        This is of the form::
+    lcfile : str
+        This is an input light curve file that will be used to copy over the
+        time-base. This will be used to generate the time-base for fake light
+        curves to provide a realistic simulation of the observing window
+        function.
 
-            task[0] = lcfile
-            task[1] = outdir
-            task[2] = magrms
-            task[3] = dict with keys: {'lcformat', 'timecols', 'magcols',
-                                       'errcols', 'randomizeinfo'}
+    outdir : str or None
+        The output directory where the the fake light curve will be written. If
+        this is None, the fake lcdict is returned instead of being written to a
+        file.
 
-    Returns
-    -------
+    magrms : dict
+        This is a dict containing the SDSS r mag-RMS (SDSS rmag-MAD preferably)
+        relation based on all light curves that the input lcfile is from. This
+        will be used to generate the median mag and noise corresponding to the
+        magnitude chosen for this fake LC.
 
-    tuple
+    randomizemags : bool
+        If this is True, then a random mag between the first and last magbin in
+        magrms will be chosen as the median mag for this light curve. This
+        choice will be weighted by the mag bin probability obtained from the
+        magrms kwarg. Otherwise, the median mag will be taken from the input
+        lcfile's lcdict['objectinfo']['sdssr'] key or a transformed SDSS r mag
+        generated from the input lcfile's lcdict['objectinfo']['jmag'],
+        ['hmag'], and ['kmag'] keys. The magrms relation for each magcol will be
+        used to generate Gaussian noise at the correct level for the magbin this
+        light curve's median mag falls into.
+
+    randomizecoords : bool
+        If this is True, will randomize the RA, DEC of the output fake object
+        and not copy over the RA/DEC from the real input object.
+
+    lcformat : str
+        This is the `formatkey` associated with your input real light curve
+        format, which you previously passed in to the `lcproc.register_lcformat`
+        function. This will be used to look up how to find and read the light
+        curve specified in `lcfile`.
+
+    lcformatdir : str or None
+        If this is provided, gives the path to a directory when you've stored
+        your lcformat description JSONs, other than the usual directories lcproc
+        knows to search for them in. Use this along with `lcformat` to specify
+        an LC format JSON file that's not currently registered with lcproc.
+
+    timecols : list of str or None
+        The timecol keys to use from the input lcdict in generating the fake
+        light curve. Fake LCs will be generated for each each
+        timecol/magcol/errcol combination in the input light curve.
+
+    magcols : list of str or None
+        The magcol keys to use from the input lcdict in generating the fake
+        light curve. Fake LCs will be generated for each each
+        timecol/magcol/errcol combination in the input light curve.
+
+    errcols : list of str or None
+        The errcol keys to use from the input lcdict in generating the fake
+        light curve. Fake LCs will be generated for each each
+        timecol/magcol/errcol combination in the input light curve.
+
+    rng : np.random.Generator or None
+        The random number generator to use for the fake object ID, coordinates,
+        mags, and moments. If None, the global `np.random` state is used. Pass
+        a Generator from :py:func:`.get_fakelc_rng` to make the fake LC
+        reproducible regardless of the order in which LCs are processed.
+
+    Returns
+    -------
+
+    tuple
+        A tuple of the following form is returned::
+
+            (fakelc_fpath,
+             fakelc_lcdict['columns'],
+             fakelc_lcdict['objectinfo'],
+             fakelc_lcdict['moments'])
+
+        If `outdir` is None, the fake lcdict is returned instead.
+
+    '''
+
+    try:
+        formatinfo = get_lcformat(lcformat,
+                                  use_lcformat_dir=lcformatdir)
+        if formatinfo:
+            (fileglob, readerfunc,
+             dtimecols, dmagcols, derrcols,
+             magsarefluxes, normfunc) = formatinfo
+        else:
+            LOGERROR("can't figure out the light curve format")
+            return None
+    except Exception:
+        LOGEXCEPTION("can't figure out the light curve format")
+        return None
+
+    # override the default timecols, magcols, and errcols
+    # using the ones provided to the function
+    if timecols is None:
+        timecols = dtimecols
+    if magcols is None:
+        magcols = dmagcols
+    if errcols is None:
+        errcols = derrcols
+
+    if rng is None:
+        rng = npr
+
+    # read in the light curve
+    lcdict = readerfunc(lcfile)
+    if isinstance(lcdict, tuple) and isinstance(lcdict[0],dict):
+        lcdict = lcdict[0]
+
+    # set up the fakelcdict with a randomly assigned objectid
+    fakeobjectid = sha512(rng.bytes(12)).hexdigest()[-8:]
+    fakelcdict = {
+        'objectid':fakeobjectid,
+        'objectinfo':{'objectid':fakeobjectid},
+        'columns':[],
+        'moments':{},
+        'origformat':lcformat,
+    }
+
+    # now, get the actual mag of this object and other info and use that to
+    # populate the corresponding entries of the fakelcdict objectinfo
+    _fakelc_objectinfo(lcdict,
+                       lcfile,
+                       fakelcdict['objectinfo'],
+                       magrms,
+                       magcols,
+                       randomizemags,
+                       randomizecoords,
+                       rng)
+
+    #
+    # NOW FILL IN THE TIMES, MAGS, ERRS
+    #
+
+    # get the time columns
+    for tcind, tcol in enumerate(timecols):
+
+        if '.' in tcol:
+            tcolget = tcol.split('.')
+        else:
+            tcolget = [tcol]
+
+        if tcol not in fakelcdict:
+            fakelcdict[tcol] = _dict_get(lcdict, tcolget)
+            fakelcdict['columns'].append(tcol)
+
+            # update the ndet with the first time column's size. it's possible
+            # that different time columns have different lengths, but that would
+            # be weird and we won't deal with it for now
+            if tcind == 0:
+                fakelcdict['objectinfo']['ndet'] = fakelcdict[tcol].size
+
+    # get the mag columns
+    for mcol in magcols:
+
+        if '.' in mcol:
+            mcolget = mcol.split('.')
+        else:
+            mcolget = [mcol]
+
+        # put the mcol in only once
+        if mcol not in fakelcdict:
+
+            measuredmags = _dict_get(lcdict, mcolget)
+            measuredmags = measuredmags[np.isfinite(measuredmags)]
+
+            fakelcdict['moments'][mcol] = _fakelc_mag_moments(
+                measuredmags,
+                mcol,
+                fakelcdict['objectinfo']['sdssr'],
+                magrms,
+                randomizemags,
+                lcfile,
+                rng
+            )
+
+            # the magnitude column is set to all zeros initially. this will be
+            # filled in by the add_fakelc_variability function below
+            fakelcdict[mcol] = np.full_like(_dict_get(lcdict, mcolget), 0.0)
+            fakelcdict['columns'].append(mcol)
+
+    # get the err columns
+    for mcol, ecol in zip(magcols, errcols):
+
+        if '.' in ecol:
+            ecolget = ecol.split('.')
+        else:
+            ecolget = [ecol]
+
+        if ecol not in fakelcdict:
+
+            measurederrs = _dict_get(lcdict, ecolget)
+            measurederrs = measurederrs[np.isfinite(measurederrs)]
+
+            fakelcdict['moments'][ecol] = _fakelc_err_moments(
+                measurederrs,
+                mcol,
+                fakelcdict['objectinfo']['sdssr'],
+                magrms,
+                randomizemags,
+                lcfile,
+                rng
+            )
+
+            # the errors column is set to all zeros initially. this will be
+            # filled in by the add_fakelc_variability function below.
+            fakelcdict[ecol] = np.full_like(_dict_get(lcdict, ecolget), 0.0)
+            fakelcdict['columns'].append(ecol)
+
+    # add the timecols, magcols, errcols to the lcdict
+    fakelcdict['timecols'] = timecols
+    fakelcdict['magcols'] = magcols
+    fakelcdict['errcols'] = errcols
+
+    # return the fakelcdict directly if we're not writing it out
+    if outdir is None:
+        return fakelcdict
+
+    # generate an output file name
+    fakelcfname = '%s-fakelc.pkl' % fakelcdict['objectid']
+    fakelcfpath = os.path.abspath(os.path.join(outdir, fakelcfname))
+
+    # write this out to the output directory
+    with open(fakelcfpath,'wb') as outfd:
+        pickle.dump(fakelcdict, outfd, protocol=pickle.HIGHEST_PROTOCOL)
+
+    # return the fakelc path, its columns, info, and moments so we can put them
+    # into a collection DB later on
+    LOGINFO('real LC %s -> fake LC %s OK' % (lcfile, fakelcfpath))
+
+    return (fakelcfpath, fakelcdict['columns'],
+            fakelcdict['objectinfo'], fakelcdict['moments'])
+
+
+##########################
+## COLLECTION FUNCTIONS ##
+##########################
+
+def collection_worker(task):
+    '''
+    This wraps `process_fakelc` for `make_fakelc_collection` below.
+
+    Parameters
+    ----------
+
+    task : tuple
+        This is of the form::
+
+            task[0] = lcfile
+            task[1] = outdir
+            task[2] = magrms
+            task[3] = dict with keys: {'lcformat', 'timecols', 'magcols',
+                                       'errcols', 'randomizeinfo'}
+
+    Returns
+    -------
+
+    tuple
         This returns a tuple of the form::
 
             (fakelc_fpath,
@@ -1660,6 +1804,76 @@ def collection_worker(task):
         return None
 
 
+def _get_collection_magrms(magrmsfrom,
+                           magcols,
+                           magrms_interpolate='quadratic',
+                           magrms_fillvalue='extrapolate'):
+    '''This gets the interpolated mag-RMS relation for each magcol.
+
+    See `make_fakelc_collection` for the form of `magrmsfrom`.
+
+    '''
+
+    # get the magrms relation needed from the pickle or input dict
+    if isinstance(magrmsfrom, str) and os.path.exists(magrmsfrom):
+        with open(magrmsfrom,'rb') as infd:
+            xmagrms = pickle.load(infd)
+    elif isinstance(magrmsfrom, dict):
+        xmagrms = magrmsfrom
+
+    magrms = {}
+
+    # get the required items from the magrms dict. interpolate the mag-rms
+    # relation for the magcol so the make_fake_lc function can use it directly.
+    for magcol in magcols:
+
+        if (magcol in xmagrms and
+            'binned_sdssr_median' in xmagrms[magcol] and
+            'binned_lcmad_median' in xmagrms[magcol]):
+
+            magrms[magcol] = {
+                'binned_sdssr_median':np.array(
+                    xmagrms[magcol]['binned_sdssr_median']
+                ),
+                'binned_lcmad_median':np.array(
+                    xmagrms[magcol]['binned_lcmad_median']
+                ),
+            }
+
+            # interpolate the mag-MAD relation
+            interpolated_magmad = spi.interp1d(
+                xmagrms[magcol]['binned_sdssr_median'],
+                xmagrms[magcol]['binned_lcmad_median'],
+                kind=magrms_interpolate,
+                fill_value=magrms_fillvalue,
+            )
+
+            # save the magrms
+            magrms[magcol]['interpolated_magmad'] = interpolated_magmad
+
+            # generate the probability distribution in magbins. this is needed
+            # to correctly sample the objects in this population
+            bincounts = np.array(xmagrms[magcol]['binned_count'])
+            binprobs = bincounts/np.sum(bincounts)
+
+            # save the bin probabilities as well
+            magrms[magcol]['magbin_probabilities'] = binprobs
+
+        else:
+
+            LOGWARNING('input magrms dict does not have '
+                       'required info for magcol: %s' % magcol)
+
+            magrms[magcol] = {
+                'binned_sdssr_median':None,
+                'binned_lcmad_median':None,
+                'interpolated_magmad':None,
+                'magbin_probabilities':None,
+            }
+
+    return magrms
+
+
 def make_fakelc_collection(lclist,
                            simbasedir,
                            magrmsfrom,
@@ -1676,7 +1890,9 @@ def make_fakelc_collection(lclist,
                            lcformatdir=None,
                            timecols=None,
                            magcols=None,
-                           errcols=None):
+                           errcols=None,
+                           seed=None,
+                           nworkers=None):
 
     '''This prepares light curves for the recovery sim.
 
@@ -1780,6 +1996,17 @@ def make_fakelc_collection(lclist,
         light curve. Fake LCs will be generated for each each
         timecol/magcol/errcol combination in the input light curves.
 
+    seed : int or None
+        If this is None, the global `np.random` state is used and the fake LCs
+        are made one after the other. If this is an int, the LC choice and each
+        fake LC get their own random number streams derived from this seed
+        using :py:func:`.get_fakelc_rng`. The fake LCs are then made in
+        parallel and the collection is the same for any number of workers.
+
+    nworkers : int or None
+        The number of parallel workers to use if `seed` is not None. If None,
+        uses all CPUs.
+
     Returns
     -------
 
@@ -1812,73 +2039,28 @@ def make_fakelc_collection(lclist,
     if errcols is None:
         errcols = derrcols
 
-    if not isinstance(lclist, np.ndarray):
-        lclist = np.array(lclist)
-
-    chosenlcs = npr.choice(lclist, maxlcs, replace=False)
-
-    fakelcdir = os.path.join(simbasedir, 'lightcurves')
-    if not os.path.exists(fakelcdir):
-        os.makedirs(fakelcdir)
-
-    # get the magrms relation needed from the pickle or input dict
-    if isinstance(magrmsfrom, str) and os.path.exists(magrmsfrom):
-        with open(magrmsfrom,'rb') as infd:
-            xmagrms = pickle.load(infd)
-    elif isinstance(magrmsfrom, dict):
-        xmagrms = magrmsfrom
-
-    magrms = {}
-
-    # get the required items from the magrms dict. interpolate the mag-rms
-    # relation for the magcol so the make_fake_lc function can use it directly.
-    for magcol in magcols:
-
-        if (magcol in xmagrms and
-            'binned_sdssr_median' in xmagrms[magcol] and
-            'binned_lcmad_median' in xmagrms[magcol]):
-
-            magrms[magcol] = {
-                'binned_sdssr_median':np.array(
-                    xmagrms[magcol]['binned_sdssr_median']
-                ),
-                'binned_lcmad_median':np.array(
-                    xmagrms[magcol]['binned_lcmad_median']
-                ),
-            }
-
-            # interpolate the mag-MAD relation
-            interpolated_magmad = spi.interp1d(
-                xmagrms[magcol]['binned_sdssr_median'],
-                xmagrms[magcol]['binned_lcmad_median'],
-                kind=magrms_interpolate,
-                fill_value=magrms_fillvalue,
-            )
-
-            # save the magrms
-            magrms[magcol]['interpolated_magmad'] = interpolated_magmad
-
-            # generate the probability distribution in magbins. this is needed
-            # to correctly sample the objects in this population
-            bincounts = np.array(xmagrms[magcol]['binned_count'])
-            binprobs = bincounts/np.sum(bincounts)
-
-            # save the bin probabilities as well
-            magrms[magcol]['magbin_probabilities'] = binprobs
+    if not isinstance(lclist, np.ndarray):
+        lclist = np.array(lclist)
 
-        else:
+    if seed is None:
+        rng = npr
+    else:
+        rng = get_fakelc_rng(seed, COLLECTION_STREAM)
 
-            LOGWARNING('input magrms dict does not have '
-                       'required info for magcol: %s' % magcol)
+    chosenlcs = rng.choice(lclist, maxlcs, replace=False)
 
-            magrms[magcol] = {
-                'binned_sdssr_median':None,
-                'binned_lcmad_median':None,
-                'interpolated_magmad':None,
-                'magbin_probabilities':None,
-            }
+    fakelcdir = os.path.join(simbasedir, 'lightcurves')
+    if not os.path.exists(fakelcdir):
+        os.makedirs(fakelcdir)
+
+    # get the magrms relation needed from the pickle or input dict
+    magrms = _get_collection_magrms(magrmsfrom,
+                                    magcols,
+                                    magrms_interpolate=magrms_interpolate,
+                                    magrms_fillvalue=magrms_fillvalue)
 
     tasks = [(x, fakelcdir, {'lcformat':lcformat,
+                             'lcformatdir':lcformatdir,
                              'timecols':timecols,
                              'magcols':magcols,
                              'errcols':errcols,
@@ -1887,10 +2069,23 @@ def make_fakelc_collection(lclist,
                              'randomizecoords':randomizecoords})
              for x in chosenlcs]
 
-    # we can't parallelize because it messes up the random number generation,
-    # causing all the IDs to clash. FIXME: figure out a way around this
-    # (probably initial a seed in each worker process?)
-    fakeresults = [collection_worker(task) for task in tasks]
+    if seed is None:
+
+        # we can't parallelize because it messes up the random number
+        # generation, causing all the IDs to clash
+        fakeresults = [collection_worker(task) for task in tasks]
+
+    else:
+
+        # each fake LC has its own random number stream, so these can be made
+        # in any order
+        for lcind, task in enumerate(tasks):
+            task[2]['rng'] = get_fakelc_rng(seed, FAKELC_STREAM, lcind)
+
+        pool = mp.Pool(nworkers)
+        fakeresults = pool.map(collection_worker, tasks)
+        pool.close()
+        pool.join()
 
     fakedb = {'simbasedir':simbasedir,
               'lcformat':lcformat,
@@ -1906,15 +2101,21 @@ def make_fakelc_collection(lclist,
     ferrmeds, ferrmads = [], []
 
     # these are the indices for the variable objects chosen randomly
-    isvariableind = npr.randint(0,high=len(fakeresults), size=maxvars)
-    isvariable = np.full(len(fakeresults), False, dtype=np.bool)
+    if seed is None:
+        isvariableind = npr.randint(0,high=len(fakeresults), size=maxvars)
+    else:
+        isvariableind = rng.integers(0, high=len(fakeresults), size=maxvars)
+    isvariable = np.full(len(fakeresults), False, dtype=bool)
     isvariable[isvariableind] = True
     fakedb['isvariable'] = isvariable
 
     LOGINFO('added %s variable stars' % maxvars)
 
     # these are the variable types for each variable object
-    vartypeind = npr.randint(0,high=len(vartypes), size=maxvars)
+    if seed is None:
+        vartypeind = npr.randint(0,high=len(vartypes), size=maxvars)
+    else:
+        vartypeind = rng.integers(0, high=len(vartypes), size=maxvars)
     vartypearr = np.array([vartypes[x] for x in vartypeind])
     fakedb['vartype'] = vartypearr
 
@@ -2295,3 +2496,772 @@ def add_variability_to_fakelc_collection(simbasedir,
         raise
 
     return lcinfo
+
+
+######################################
+## BATCH SIMULATION OF VARIABLE LCS ##
+######################################
+
+# this maps the vartypes in VARTYPE_LCGEN_MAP to their model family
+VARTYPE_MODEL_MAP = {
+    'EB':'eclipses',
+    'RRab':'sinusoidal',
+    'RRc':'sinusoidal',
+    'rotator':'sinusoidal',
+    'flare':'flares',
+    'HADS':'sinusoidal',
+    'planet':'transits',
+    'LPV':'sinusoidal',
+    'cepheid':'sinusoidal',
+}
+
+
+def _get_vartype_paramdists(vartype, override_paramdists=None):
+    '''This returns the parameter distributions to use for a vartype.
+
+    These are the default `paramdists` of the `generate_XX_lightcurve` function
+    for the vartype, updated with any `override_paramdists`.
+
+    '''
+
+    paramdists = signature(
+        VARTYPE_LCGEN_MAP[vartype]
+    ).parameters['paramdists'].default.copy()
+
+    if override_paramdists is not None:
+        paramdists.update(override_paramdists)
+
+    return paramdists
+
+
+def _fix_amplitude_sign(amplitudes, magsarefluxes):
+    '''This makes the amplitudes positive for fluxes and negative for mags.
+
+    '''
+
+    if magsarefluxes:
+        return np.abs(amplitudes)
+    else:
+        return -np.abs(amplitudes)
+
+
+def draw_variability_params(vartype,
+                            nobjects,
+                            timemin=0.0,
+                            timemax=1.0,
+                            override_paramdists=None,
+                            magsarefluxes=False,
+                            seed=RANDSEED):
+    '''This draws the variability params for many objects of a single vartype.
+
+    Each parameter distribution is sampled once for all objects, instead of once
+    per object as in the `generate_XX_lightcurve` functions. The parameter
+    distributions and the way the epochs, ingress durations, flare peak times,
+    and Fourier components are chosen are the same as in those functions.
+
+    Parameters
+    ----------
+
+    vartype : str
+        The vartype of the objects. This is one of the keys of
+        `VARTYPE_LCGEN_MAP`.
+
+    nobjects : int
+        The number of objects to draw params for.
+
+    timemin,timemax : float or np.array
+        The start and end of the time-range of each object. The epochs and
+        flare peak times are drawn uniformly from this range. These can be
+        arrays of size `nobjects`. The default is to draw these in units of the
+        time-range, i.e. from 0.0 to 1.0.
+
+    override_paramdists : dict or None
+        A parameter distribution dict as in the `generate_XX_lightcurve`
+        functions. Keys in this dict override the default distributions for the
+        vartype.
+
+    magsarefluxes : bool
+        Sets if the variability amplitude is in fluxes and not magnitudes.
+
+    seed : int
+        The seed of the simulation. The params are drawn from the stream
+        `get_fakelc_rng(seed, VARPARAM_STREAM, <vartype index>)`, so different
+        vartypes get independent params.
+
+    Returns
+    -------
+
+    dict
+        This returns a dict with the vartype, the model family (one of
+        'transits', 'eclipses', 'flares', 'sinusoidal') and arrays of size
+        `nobjects` for each param. For flares, the per-flare params are arrays
+        of shape (`nobjects`, max number of flares) and a 'flaremask' array
+        marks the flares that are actually present. For the sinusoidal
+        vartypes, the Fourier amplitudes and phases are arrays of shape
+        (`nobjects`, max Fourier order) with zero amplitudes for the unused
+        orders.
+
+    '''
+
+    if vartype not in VARTYPE_LCGEN_MAP:
+        LOGERROR('unknown variability type: %s, choose from: %s' %
+                 (vartype, repr(list(VARTYPE_LCGEN_MAP.keys()))))
+        return None
+
+    paramdists = _get_vartype_paramdists(
+        vartype,
+        override_paramdists=override_paramdists
+    )
+    rng = get_fakelc_rng(seed,
+                         VARPARAM_STREAM,
+                         list(VARTYPE_LCGEN_MAP.keys()).index(vartype))
+
+    timemin = np.broadcast_to(np.asarray(timemin, dtype=np.float64),
+                              (nobjects,))
+    timemax = np.broadcast_to(np.asarray(timemax, dtype=np.float64),
+                              (nobjects,))
+
+    modeltype = VARTYPE_MODEL_MAP[vartype]
+    varparams = {'vartype':vartype,
+                 'modeltype':modeltype,
+                 'nobjects':nobjects}
+
+    if modeltype == 'transits':
+
+        epoch = rng.random(nobjects)*(timemax - timemin) + timemin
+        period = paramdists['transitperiod'].rvs(size=nobjects,
+                                                 random_state=rng)
+        depth = paramdists['transitdepth'].rvs(size=nobjects,
+                                               random_state=rng)
+        duration = paramdists['transitduration'].rvs(size=nobjects,
+                                                     random_state=rng)
+        ingduration = (rng.random(nobjects)*(0.5*duration - 0.05*duration) +
+                       0.05*duration)
+
+        varparams.update({
+            'transitperiod':period,
+            'transitepoch':epoch,
+            'transitdepth':_fix_amplitude_sign(depth, magsarefluxes),
+            'transitduration':duration,
+            'ingressduration':ingduration,
+        })
+
+    elif modeltype == 'eclipses':
+
+        epoch = rng.random(nobjects)*(timemax - timemin) + timemin
+        period = paramdists['period'].rvs(size=nobjects, random_state=rng)
+        pdepth = paramdists['pdepth'].rvs(size=nobjects, random_state=rng)
+        pduration = paramdists['pduration'].rvs(size=nobjects,
+                                                random_state=rng)
+        depthratio = paramdists['depthratio'].rvs(size=nobjects,
+                                                  random_state=rng)
+        secphase = paramdists['secphase'].rvs(size=nobjects,
+                                              random_state=rng)
+
+        varparams.update({
+            'period':period,
+            'epoch':epoch,
+            'pdepth':_fix_amplitude_sign(pdepth, magsarefluxes),
+            'pduration':pduration,
+            'depthratio':depthratio,
+            'secphase':secphase,
+        })
+
+    elif modeltype == 'flares':
+
+        minflares, maxflares = paramdists['nflares']
+        nflares = rng.integers(minflares, high=maxflares, size=nobjects)
+
+        # the per-flare params are drawn for the max number of flares so the
+        # shapes don't depend on the draws
+        flareshape = (nobjects, maxflares - 1)
+
+        peaktime = (rng.random(flareshape)*(timemax - timemin)[:,None] +
+                    timemin[:,None])
+        amplitude = paramdists['amplitude'].rvs(size=flareshape,
+                                                random_state=rng)
+        risestdev = paramdists['risestdev'].rvs(size=flareshape,
+                                                random_state=rng)
+        decayconst = paramdists['decayconst'].rvs(size=flareshape,
+                                                  random_state=rng)
+
+        varparams.update({
+            'nflares':nflares,
+            'flaremask':np.arange(flareshape[1])[None,:] < nflares[:,None],
+            'peaktime':peaktime,
+            'amplitude':_fix_amplitude_sign(amplitude, magsarefluxes),
+            'risestdev':risestdev,
+            'decayconst':decayconst,
+        })
+
+    elif modeltype == 'sinusoidal':
+
+        epoch = rng.random(nobjects)*(timemax - timemin) + timemin
+        period = paramdists['period'].rvs(size=nobjects, random_state=rng)
+        minorder, maxorder = paramdists['fourierorder']
+        fourierorder = rng.integers(minorder, high=maxorder, size=nobjects)
+        amplitude = _fix_amplitude_sign(
+            paramdists['amplitude'].rvs(size=nobjects, random_state=rng),
+            magsarefluxes
+        )
+
+        # the Fourier components are the same as in
+        # generate_sinusoidal_lightcurve, with zeros for the unused orders
+        harmonics = np.arange(1, maxorder, dtype=np.float64)
+        fourieramps = np.abs(amplitude/2.0)[:,None]/harmonics[None,:]
+        fourieramps[harmonics[None,:] > fourierorder[:,None]] = 0.0
+        fourierphases = np.broadcast_to(paramdists['phioffset']*harmonics,
+                                        fourieramps.shape).copy()
+
+        varparams.update({
+            'period':period,
+            'epoch':epoch,
+            'amplitude':amplitude,
+            'fourierorder':fourierorder,
+            'fourieramps':fourieramps,
+            'fourierphases':fourierphases,
+        })
+
+    return varparams
+
+
+def _slice_variability_params(varparams, objectinds):
+    '''This returns the variability params for some of the objects.
+
+    '''
+
+    sliced = {}
+
+    for key, val in varparams.items():
+        if isinstance(val, np.ndarray):
+            sliced[key] = val[objectinds]
+        else:
+            sliced[key] = val
+
+    sliced['nobjects'] = np.asarray(objectinds).size
+    return sliced
+
+
+def _rescale_variability_times(varparams, timemin, timemax):
+    '''This moves epochs and flare peak times to the objects' time-ranges.
+
+    This is used for params drawn by `draw_variability_params` with the default
+    `timemin = 0.0` and `timemax = 1.0`, i.e. in units of the time-range.
+
+    '''
+
+    rescaled = varparams.copy()
+    timemin = np.asarray(timemin, dtype=np.float64)
+    timerange = np.asarray(timemax, dtype=np.float64) - timemin
+
+    for key in ('transitepoch', 'epoch'):
+        if key in rescaled:
+            rescaled[key] = rescaled[key]*timerange + timemin
+
+    if 'peaktime' in rescaled:
+        rescaled['peaktime'] = (rescaled['peaktime']*timerange[:,None] +
+                                timemin[:,None])
+
+    return rescaled
+
+
+def variability_model_batch(times, varparams):
+    '''This evaluates the variability models for many objects at once.
+
+    The models are the same as those in the `generate_XX_lightcurve` functions,
+    centered around 0.0.
+
+    Parameters
+    ----------
+
+    times : np.array
+        The time base of the objects. This is either a 1D array shared by all
+        objects or a 2D array of shape (nobjects, ntimes) with one time base per
+        row. Rows of different lengths can be padded with np.nan; the model is
+        0.0 at these times.
+
+    varparams : dict
+        The variability params for the objects, as returned by
+        `draw_variability_params`.
+
+    Returns
+    -------
+
+    np.array
+        An array of shape (nobjects, ntimes) with the model mags or fluxes of
+        each object.
+
+    '''
+
+    nobjects = varparams['nobjects']
+    times = np.asarray(times, dtype=np.float64)
+    if times.ndim == 1:
+        times = np.broadcast_to(times, (nobjects, times.size))
+
+    modeltype = varparams['modeltype']
+    models = np.zeros(times.shape, dtype=np.float64)
+
+    def _phase(period, epoch):
+        iphase = (times - epoch[:,None])/period[:,None]
+        return iphase - np.floor(iphase)
+
+    if modeltype == 'transits':
+
+        phase = _phase(varparams['transitperiod'], varparams['transitepoch'])
+        depth = varparams['transitdepth'][:,None]
+        ingduration = varparams['ingressduration'][:,None]
+        slope = depth/ingduration
+
+        (firstcontact, thirdcontact, fourthcontact,
+         ingressind, bottomind, egressind) = (
+             transits._trapezoid_transit_indices(
+                 phase,
+                 varparams['transitduration'][:,None],
+                 ingduration
+             )
+        )
+
+        models = np.where(ingressind, -slope*(phase - firstcontact), models)
+        models = np.where(bottomind, -depth, models)
+        models = np.where(egressind,
+                          -depth + slope*(phase - thirdcontact),
+                          models)
+
+    elif modeltype == 'eclipses':
+
+        phase = _phase(varparams['period'], varparams['epoch'])
+        pdepth = varparams['pdepth'][:,None]
+        eclstd = varparams['pduration'][:,None]/5.0
+        secphase = varparams['secphase'][:,None]
+
+        for eclind, eclloc, secondary in eclipses._invgauss_eclipses_windows(
+                phase,
+                varparams['pduration'][:,None],
+                secphase
+        ):
+            if secondary:
+                eclamp = -pdepth*varparams['depthratio'][:,None]
+            else:
+                eclamp = -pdepth
+
+            models = np.where(
+                eclind,
+                eclipses._gaussian(phase, eclamp, eclloc, eclstd),
+                models
+            )
+
+    elif modeltype == 'flares':
+
+        # loop over the flares to keep the memory use at (nobjects, ntimes)
+        for flareind in range(varparams['peaktime'].shape[1]):
+
+            amp = np.where(varparams['flaremask'][:,flareind],
+                           varparams['amplitude'][:,flareind],
+                           0.0)[:,None]
+            dt = times - varparams['peaktime'][:,flareind,None]
+            risestdev = varparams['risestdev'][:,flareind,None]
+            decayconst = varparams['decayconst'][:,flareind,None]
+
+            with np.errstate(over='ignore'):
+                models = models + np.where(
+                    dt < 0.0,
+                    amp*np.exp(-(dt*dt)/(2.0*risestdev*risestdev)),
+                    np.where(dt > 0.0, amp*np.exp(-dt/decayconst), 0.0)
+                )
+
+    elif modeltype == 'sinusoidal':
+
+        # this is the same as lcmodels.sinusoidal.sine_series_sum, where the
+        # x-th component has the x-th harmonic, starting from zero
+        phase = _phase(varparams['period'], varparams['epoch'])
+        fourieramps = varparams['fourieramps']
+        fourierphases = varparams['fourierphases']
+
+        for x in range(fourieramps.shape[1]):
+            models = models + fourieramps[:,x,None]*np.sin(
+                2.0*np.pi*x*phase + fourierphases[:,x,None]
+            )
+
+    # the model is zero at the padded times
+    models[np.isnan(times)] = 0.0
+
+    return models
+
+
+def _get_object_variability_params(varparams, objectind):
+    '''This returns the variability params for one object.
+
+    The params dict is in the same format as the 'params' key of the dicts
+    returned by the `generate_XX_lightcurve` functions.
+
+    Returns
+    -------
+
+    (params, varperiod, varamplitude) : tuple
+
+    '''
+
+    modeltype = varparams['modeltype']
+
+    if modeltype == 'transits':
+
+        params = {x:float(varparams[x][objectind])
+                  for x in ('transitperiod',
+                            'transitepoch',
+                            'transitdepth',
+                            'transitduration',
+                            'ingressduration')}
+        return params, params['transitperiod'], params['transitdepth']
+
+    elif modeltype == 'eclipses':
+
+        params = {x:float(varparams[x][objectind])
+                  for x in ('period',
+                            'epoch',
+                            'pdepth',
+                            'pduration',
+                            'depthratio',
+                            'secphase')}
+        return params, params['period'], params['pdepth']
+
+    elif modeltype == 'flares':
+
+        nflares = int(varparams['nflares'][objectind])
+        params = {'nflares':nflares}
+        for flareind in range(nflares):
+            params[flareind] = {
+                x:float(varparams[x][objectind, flareind])
+                for x in ('peaktime', 'amplitude', 'risestdev', 'decayconst')
+            }
+
+        return params, None, [params[x]['amplitude'] for x in range(nflares)]
+
+    elif modeltype == 'sinusoidal':
+
+        fourierorder = int(varparams['fourierorder'][objectind])
+        params = {
+            'period':float(varparams['period'][objectind]),
+            'epoch':float(varparams['epoch'][objectind]),
+            'amplitude':float(varparams['amplitude'][objectind]),
+            'fourierorder':fourierorder,
+            'fourieramps':(
+                varparams['fourieramps'][objectind,:fourierorder].tolist()
+            ),
+            'fourierphases':(
+                varparams['fourierphases'][objectind,:fourierorder].tolist()
+            ),
+        }
+        return params, params['period'], params['amplitude']
+
+
+def _apply_fakelc_variability(lcdict,
+                              model,
+                              vartype,
+                              varparams,
+                              rowind,
+                              seed,
+                              objectind):
+    '''This adds a model, the median levels, and noise to a fake lcdict.
+
+    The noise comes from the stream `get_fakelc_rng(seed, NOISE_STREAM,
+    objectind)`. The variability info is taken from row `rowind` of
+    `varparams` and added to the lcdict in the same way as
+    `add_fakelc_variability`. Returns the variability params for the object.
+
+    '''
+
+    noiserng = get_fakelc_rng(seed, NOISE_STREAM, objectind)
+
+    for mcol, ecol in zip(lcdict['magcols'], lcdict['errcols']):
+
+        mag_rms = lcdict['moments'][mcol]['mad']*1.483
+        err_rms = lcdict['moments'][ecol]['mad']*1.483
+
+        magnoise = noiserng.normal(size=model.size)*mag_rms
+        errnoise = noiserng.normal(size=model.size)*err_rms
+
+        lcdict[mcol] = lcdict['moments'][mcol]['median'] + model + magnoise
+        lcdict[ecol] = lcdict['moments'][ecol]['median'] + errnoise
+
+    if vartype is not None:
+        params, varperiod, varamplitude = (
+            _get_object_variability_params(varparams, rowind)
+        )
+        lcdict['actual_vartype'] = vartype
+        lcdict['actual_varparams'] = params
+        lcdict['actual_varperiod'] = varperiod
+        lcdict['actual_varamplitude'] = varamplitude
+    else:
+        params = None
+        lcdict['actual_vartype'] = None
+        lcdict['actual_varparams'] = None
+        lcdict['actual_varperiod'] = np.nan
+        lcdict['actual_varamplitude'] = np.nan
+
+    return params
+
+
+def _write_fakelc_safely(lcdict, fakelcfile):
+    '''This writes a fake LC pickle to a temporary file and then moves it.
+
+    '''
+
+    tempoutf = '%s.tmp-%s' % (fakelcfile, os.getpid())
+    with open(tempoutf, 'wb') as outfd:
+        pickle.dump(lcdict, outfd, pickle.HIGHEST_PROTOCOL)
+    os.replace(tempoutf, fakelcfile)
+
+
+def variability_batch_worker(task):
+    '''This adds variability and noise to a batch of fake LCs.
+
+    task[0] = list of (vartype, objectinds, fakelcfiles, varparams) tuples,
+              one for each vartype in the batch
+    task[1] = seed
+    task[2] = overwrite
+
+    Returns a list of (objectind, objectid, vartype, params) tuples for the
+    objects that were processed.
+
+    '''
+
+    groups, seed, overwrite = task
+    results = []
+
+    for vartype, objectinds, fakelcfiles, varparams in groups:
+
+        lcdicts = []
+        for objectind, fakelcfile in zip(objectinds, fakelcfiles):
+
+            lcdict = _read_pklc(fakelcfile)
+
+            if ('actual_vartype' in lcdict and
+                'actual_varparams' in lcdict and
+                not overwrite):
+                LOGERROR('%s has existing variability type: %s '
+                         'and params: %s and overwrite = False, '
+                         'skipping this file...' %
+                         (fakelcfile, lcdict['actual_vartype'],
+                          repr(lcdict['actual_varparams'])))
+                lcdict = None
+
+            lcdicts.append(lcdict)
+
+        # put the time bases of this group into a NaN-padded matrix
+        timebases = [np.asarray(x[x['timecols'][0]], dtype=np.float64)
+                     if x is not None else np.array([])
+                     for x in lcdicts]
+        ntimes = max([x.size for x in timebases] + [1])
+        timematrix = np.full((len(timebases), ntimes), np.nan)
+        for rowind, tb in enumerate(timebases):
+            timematrix[rowind, :tb.size] = tb
+
+        if vartype is not None:
+
+            with np.errstate(invalid='ignore'):
+                timemin = np.array([x.min() if x.size > 0 else 0.0
+                                    for x in timebases])
+                timemax = np.array([x.max() if x.size > 0 else 1.0
+                                    for x in timebases])
+
+            varparams = _rescale_variability_times(varparams, timemin, timemax)
+            models = variability_model_batch(timematrix, varparams)
+
+        else:
+            models = np.zeros_like(timematrix)
+
+        for rowind, (objectind, fakelcfile, lcdict) in enumerate(
+                zip(objectinds, fakelcfiles, lcdicts)
+        ):
+
+            if lcdict is None:
+                continue
+
+            params = _apply_fakelc_variability(
+                lcdict,
+                models[rowind, :timebases[rowind].size],
+                vartype,
+                varparams,
+                rowind,
+                seed,
+                objectind
+            )
+            _write_fakelc_safely(lcdict, fakelcfile)
+            results.append((objectind, lcdict['objectid'], vartype, params))
+
+    return results
+
+
+def _draw_collection_variability_params(objectvartypes,
+                                        override_paramdists=None,
+                                        magsarefluxes=False,
+                                        seed=RANDSEED):
+    '''This draws the variability params for all objects in a collection.
+
+    `objectvartypes` is an object array with the vartype of each object or None
+    for non-variable objects. The params of each vartype are drawn at once in
+    units of the time-range. Returns a dict of `draw_variability_params`
+    results keyed by vartype and the row of each object in its vartype's
+    params.
+
+    '''
+
+    varparams = {}
+    varparamrows = np.zeros(len(objectvartypes), dtype=np.int64)
+
+    for vartype in sorted(set(x for x in objectvartypes if x is not None)):
+
+        thisvarind = np.where(objectvartypes == vartype)[0]
+
+        if (override_paramdists and
+            isinstance(override_paramdists, dict) and
+            vartype in override_paramdists and
+            isinstance(override_paramdists[vartype], dict)):
+            thisoverride_paramdists = override_paramdists[vartype]
+        else:
+            thisoverride_paramdists = None
+
+        varparams[vartype] = draw_variability_params(
+            vartype,
+            thisvarind.size,
+            override_paramdists=thisoverride_paramdists,
+            magsarefluxes=magsarefluxes,
+            seed=seed
+        )
+        varparamrows[thisvarind] = np.arange(thisvarind.size)
+
+    return varparams, varparamrows
+
+
+def add_variability_to_fakelc_collection_batch(simbasedir,
+                                               override_paramdists=None,
+                                               overwrite_existingvar=False,
+                                               magsarefluxes=False,
+                                               seed=RANDSEED,
+                                               batchsize=250,
+                                               nworkers=None):
+    '''This adds variability and noise to all fake LCs in batches.
+
+    This does the same thing as `add_variability_to_fakelc_collection`, but:
+
+    - the variability params for all objects of each vartype are drawn at once
+      using `draw_variability_params`
+
+    - the models for each batch of objects are evaluated at once on a
+      NaN-padded matrix of their time bases using `variability_model_batch`
+
+    - the batches are processed in parallel by `nworkers` processes
+
+    - the noise of each object comes from its own random number stream
+      `get_fakelc_rng(seed, NOISE_STREAM, objectind)`
+
+    For a given `seed`, the output light curves are the same for any
+    `batchsize` and `nworkers`.
+
+    Parameters
+    ----------
+
+    simbasedir : str
+        The directory containing the fake LCs to process.
+
+    override_paramdists : dict
+        This can be used to override the parameter distributions of some
+        vartypes. It should be a dict with vartypes as keys and dicts of the
+        form taken by the `paramdists` kwarg of the `generate_XX_lightcurve`
+        functions as values. Unlike `add_variability_to_fakelc_collection`,
+        only the params given here are overridden.
+
+    overwrite_existingvar : bool
+        If this is True, then will overwrite any existing variability in the
+        input fake LCs in `simbasedir`.
+
+    magsarefluxes : bool
+        Sets if the variability amplitude is in fluxes and not magnitudes.
+
+    seed : int
+        The seed of the simulation.
+
+    batchsize : int
+        The number of fake LCs processed together by each worker task.
+
+    nworkers : int or None
+        The number of parallel workers to use. If None, uses all CPUs.
+
+    Returns
+    -------
+
+    dict
+        This returns the updated contents of the `fakelcs-info.pkl` file in
+        `simbasedir`, with a 'varinfo' key containing the variability info for
+        each object.
+
+    '''
+
+    # open the fakelcs-info.pkl
+    infof = os.path.join(simbasedir,'fakelcs-info.pkl')
+    with open(infof, 'rb') as infd:
+        lcinfo = pickle.load(infd)
+
+    lclist = lcinfo['lcfpath']
+    varflag = np.asarray(lcinfo['isvariable'], dtype=bool)
+    vartypes = lcinfo['vartype']
+
+    # the vartype of each object, in the same order as
+    # add_variability_to_fakelc_collection
+    objectvartypes = np.full(len(lclist), None, dtype=object)
+    objectvartypes[varflag] = vartypes[:varflag.sum()]
+
+    varparams, varparamrows = _draw_collection_variability_params(
+        objectvartypes,
+        override_paramdists=override_paramdists,
+        magsarefluxes=magsarefluxes,
+        seed=seed
+    )
+
+    # make the batch tasks
+    tasks = []
+    for batchstart in range(0, len(lclist), batchsize):
+
+        batchinds = np.arange(batchstart,
+                              min(batchstart + batchsize, len(lclist)))
+        groups = []
+
+        for vartype in [None] + sorted(varparams.keys()):
+
+            groupinds = batchinds[objectvartypes[batchinds] == vartype]
+            if groupinds.size == 0:
+                continue
+
+            if vartype is None:
+                groupparams = None
+            else:
+                groupparams = _slice_variability_params(
+                    varparams[vartype], varparamrows[groupinds]
+                )
+
+            groups.append((vartype,
+                           groupinds.tolist(),
+                           [lclist[x] for x in groupinds],
+                           groupparams))
+
+        tasks.append((groups, seed, overwrite_existingvar))
+
+    LOGINFO('adding variability to %s fake LCs in %s batches' %
+            (len(lclist), len(tasks)))
+
+    pool = mp.Pool(nworkers)
+    results = pool.map(variability_batch_worker, tasks)
+    pool.close()
+    pool.join()
+
+    varinfo = {}
+    for batchresults in results:
+        for objectind, objectid, vartype, params in batchresults:
+            varinfo[objectid] = {'params':params,
+                                 'vartype':vartype}
+
+    # write the varinfo back to the dict and fakelcs-info.pkl
+    lcinfo['varinfo'] = varinfo
+    _write_fakelc_safely(lcinfo, infof)
+
+    return lcinfo
@@ -47,6 +47,7 @@ import gzip
 import glob
 
 import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from math import sqrt as msqrt
 
@@ -78,6 +79,9 @@ import matplotlib.pyplot as plt
 
 from .. import lcproc
 from ..lcproc import lcvfeatures, varthreshold, periodsearch
+from ..lcmath import normalize_magseries
+from ..varclass import varfeatures
+from . import generation
 
 
 #######################
@@ -438,7 +442,7 @@ def get_recovered_variables_for_magbin(simbasedir,
             np.array(varthresh[magcol]['binned_sdssr_median']) == magbinmedian
         )
 
-        magbinind = np.asscalar(magbinind[0])
+        magbinind = magbinind[0].item()
 
         # get the objectids, actual vars and actual notvars in this magbin
         thisbin_objectids = binned_objectids[magbinind]
@@ -648,6 +652,350 @@ def get_recovered_variables_for_magbin(simbasedir,
     return recdict
 
 
+def load_varind_gridsearch_features(simbasedir):
+    '''This loads the variability indices of all fake LCs for a grid search.
+
+    The simulation info pickle and the varfeatures pickles in `simbasedir` are
+    read once. Each varfeatures pickle is read only once for all magcols.
+
+    Parameters
+    ----------
+
+    simbasedir : str
+        The directory where the fake LCs are located. This should have the
+        `fakelcs-info.pkl` and the `varfeatures` directory made by
+        :py:func:`.get_varfeatures`.
+
+    Returns
+    -------
+
+    dict
+        This returns a dict of the form::
+
+            {'simbasedir': the simbasedir,
+             'magcols': the magcols of the fake LCs,
+             'objectid': the object IDs of all of the fake LCs,
+             'isvariable': bool array indicating the actual variables,
+             'sdssr': the SDSS r mags of all of the fake LCs,
+             'magrms': the magrms dict from the simulation info,
+             'features': {magcol: {'objectid': the object IDs with features,
+                                   'sdssr': their mags from the features,
+                                   'lcmad': their LC MADs,
+                                   'varindices': array of shape (nobjects, 3)
+                                                 with the Stetson J, 1/eta,
+                                                 and IQR values},
+                          ...}}
+
+        The features are the same ones used by
+        :py:func:`astrobase.lcproc.varthreshold.variability_threshold`.
+
+    '''
+
+    with open(os.path.join(simbasedir, 'fakelcs-info.pkl'),'rb') as infd:
+        siminfo = pickle.load(infd)
+
+    magcols = siminfo['magcols']
+
+    pklist = glob.glob(os.path.join(simbasedir,
+                                    'varfeatures',
+                                    'varfeatures-*.pkl'))
+
+    objectids = []
+    features = {x:[] for x in magcols}
+
+    for pkl in pklist:
+
+        with open(pkl,'rb') as infd:
+            thisfeatures = pickle.load(infd)
+
+        objectids.append(thisfeatures['objectid'])
+
+        for magcol in magcols:
+            features[magcol].append(
+                varthreshold._get_varthreshold_features(thisfeatures, magcol)
+            )
+
+    objectids = np.array(objectids)
+
+    featuredict = {
+        'simbasedir':os.path.abspath(simbasedir),
+        'magcols':magcols,
+        'objectid':siminfo['objectid'],
+        'isvariable':siminfo['isvariable'],
+        'sdssr':siminfo['sdssr'],
+        'magrms':siminfo['magrms'],
+        'features':{}
+    }
+
+    for magcol in magcols:
+
+        magcol_features = np.array(features[magcol],
+                                   dtype=np.float64).reshape(-1, 5)
+        sdssr, lcmad, stetsonj, iqr, eta = magcol_features.T
+
+        featuredict['features'][magcol] = {
+            'objectid':objectids,
+            'sdssr':sdssr,
+            'lcmad':lcmad,
+            'varindices':np.column_stack((stetsonj, 1.0/eta, iqr)),
+        }
+
+    return featuredict
+
+
+def _count_above_thresholds(values, thresholds):
+    '''This counts the number of values above each of the thresholds.
+
+    The values are sorted once and the thresholds are located in them with a
+    binary search, so this is a cumulative count over all of the thresholds at
+    once.
+
+    '''
+
+    return values.size - np.searchsorted(np.sort(values),
+                                         thresholds,
+                                         side='right')
+
+
+def _recovery_stats_arrays(ntp, ntn, nfp, nfn):
+    '''This calculates precision, recall, and MCC for arrays of counts.
+
+    These are the same as :py:func:`.precision`, :py:func:`.recall`, and
+    :py:func:`.matthews_correl_coeff`, and are np.nan where those are np.nan.
+
+    '''
+
+    ntp, ntn, nfp, nfn = (np.asarray(x, dtype=np.float64)
+                          for x in (ntp, ntn, nfp, nfn))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+
+        precision_vals = np.where((ntp + nfp) > 0, ntp/(ntp + nfp), np.nan)
+        recall_vals = np.where((ntp + nfn) > 0, ntp/(ntp + nfn), np.nan)
+
+        mcc_top = ntp*ntn - nfp*nfn
+        mcc_bot = np.sqrt((ntp + nfp)*(ntp + nfn)*(ntn + nfp)*(ntn + nfn))
+        mcc_vals = np.where(mcc_bot > 0, mcc_top/mcc_bot, np.nan)
+
+    return precision_vals, recall_vals, mcc_vals
+
+
+def _magbin_occupied_bins(sdssr, magbins):
+    '''This bins objects by magnitude the same way as `variability_threshold`.
+
+    Returns a list of `(indices of objects in the bin, bin median mag)` for
+    each occupied bin.
+
+    '''
+
+    magbininds = np.digitize(sdssr, magbins)
+
+    return [(np.where(magbininds == mbinind)[0],
+             (magbins[magi] + magbins[magi+1])/2.0)
+            for mbinind, magi in zip(np.unique(magbininds),
+                                     range(len(magbins)-1))]
+
+
+def varind_gridsearch_recovery(gridfeatures,
+                               stetson_grid,
+                               inveta_grid,
+                               iqr_grid,
+                               magbinmedians,
+                               magbins=varthreshold.DEFAULT_MAGBINS):
+    '''This calculates variable recovery stats for a variability index grid.
+
+    This gives the same stats as running
+    :py:func:`.get_recovered_variables_for_magbin` for each magbin and each
+    point in the Stetson J x 1/eta x IQR grid, but works on the features loaded
+    once by :py:func:`.load_varind_gridsearch_features`. Since objects are
+    selected as variable by each index separately, the TP, FP, TN, and FN
+    counts for each index only depend on that index's threshold. These are
+    calculated for all thresholds at once from sorted cumulative counts, and
+    the counts of variables found by one index but missed by another are
+    calculated for all pairs of thresholds with a single matrix product.
+
+    Parameters
+    ----------
+
+    gridfeatures : dict
+        The dict returned by :py:func:`.load_varind_gridsearch_features`.
+
+    stetson_grid,inveta_grid,iqr_grid : np.array
+        The grids of the stdev multipliers above the median to use as
+        thresholds for each variability index.
+
+    magbinmedians : sequence of floats
+        The magbins to calculate the stats for. These should match the median
+        mags of the `magbins`.
+
+    magbins : np.array
+        The magbins to use for binning the objects. This is the default used by
+        `variability_threshold`.
+
+    Returns
+    -------
+
+    dict
+        This returns a dict keyed by magcol. Each item is a dict with the same
+        keys as the `statsonly=True` output of
+        :py:func:`.get_recovered_variables_for_magbin`. The stats for each
+        index have shape (nmagbins, ngrid) for that index's grid. The counts of
+        variables missed by one index but found by another have shape
+        (nmagbins, ngrid_missed, ngrid_found), e.g. `stet_missed_inveta_found`
+        has shape (nmagbins, stetson_grid.size, inveta_grid.size). The
+        per-magbin counts have shape (nmagbins,). Magbins that can't be
+        found have np.nan stats and a `magbinind` of -1.
+
+    '''
+
+    grids = {'stet':np.asarray(stetson_grid, dtype=np.float64),
+             'inveta':np.asarray(inveta_grid, dtype=np.float64),
+             'iqr':np.asarray(iqr_grid, dtype=np.float64)}
+    indexnames = ('stet', 'inveta', 'iqr')
+    nmagbins = len(magbinmedians)
+
+    # bin all of the simulated objects by their actual mags
+    simbins = _magbin_occupied_bins(gridfeatures['sdssr'], magbins)
+    objectids = gridfeatures['objectid']
+    varflags = gridfeatures['isvariable']
+
+    recovery = {}
+
+    for magcol in gridfeatures['magcols']:
+
+        features = gridfeatures['features'][magcol]
+
+        finite = (np.isfinite(features['sdssr']) &
+                  np.isfinite(features['lcmad']) &
+                  np.all(np.isfinite(features['varindices']), axis=1))
+        featureids = features['objectid'][finite]
+        varindices = features['varindices'][finite]
+
+        # bin the objects by the mags in their features
+        featurebins = _magbin_occupied_bins(features['sdssr'][finite], magbins)
+        featurebin_medians = np.array([x[1] for x in featurebins])
+
+        magcol_rec = {}
+        for name in indexnames:
+            for stat in ('recoveredvars','truepositives','falsepositives',
+                         'truenegatives','falsenegatives'):
+                magcol_rec['%s_%s' % (name, stat)] = np.zeros(
+                    (nmagbins, grids[name].size), dtype=np.int64
+                )
+            for stat in ('precision','recall','mcc'):
+                magcol_rec['%s_%s' % (name, stat)] = np.full(
+                    (nmagbins, grids[name].size), np.nan
+                )
+            for found in indexnames:
+                if found != name:
+                    magcol_rec['%s_missed_%s_found' % (name, found)] = (
+                        np.zeros((nmagbins, grids[name].size,
+                                  grids[found].size), dtype=np.int64)
+                    )
+
+        for key in ('actual_variables','actual_nonvariables',
+                    'all_objectids'):
+            magcol_rec[key] = np.zeros(nmagbins, dtype=np.int64)
+        magcol_rec['magbinind'] = np.full(nmagbins, -1, dtype=np.int64)
+
+        for binind, magbinmedian in enumerate(magbinmedians):
+
+            matching = np.where(
+                np.isclose(featurebin_medians, magbinmedian)
+            )[0]
+
+            if matching.size == 0 or matching[0] >= len(simbins):
+                LOGWARNING('no objects in %s magbin: %.3f, skipping...' %
+                           (magcol, magbinmedian))
+                for key in magcol_rec:
+                    if magcol_rec[key].dtype == np.float64:
+                        magcol_rec[key][binind] = np.nan
+                continue
+
+            magbinind = matching[0]
+            magcol_rec['magbinind'][binind] = magbinind
+
+            # the actual variables and non-variables in this magbin
+            simbin_objectids = objectids[simbins[magbinind][0]]
+            simbin_varflags = varflags[simbins[magbinind][0]]
+            nactualvars = np.sum(simbin_varflags)
+            nactualnotvars = simbin_objectids.size - nactualvars
+
+            magcol_rec['actual_variables'][binind] = nactualvars
+            magcol_rec['actual_nonvariables'][binind] = nactualnotvars
+            magcol_rec['all_objectids'][binind] = simbin_objectids.size
+
+            # the objects with features in this magbin
+            featurebin = featurebins[magbinind][0]
+            binvarindices = varindices[featurebin]
+            binfeatureids = featureids[featurebin]
+
+            isactualvar = np.isin(binfeatureids,
+                                  simbin_objectids[simbin_varflags])
+            isactualnotvar = np.isin(binfeatureids,
+                                     simbin_objectids[~simbin_varflags])
+
+            # the thresholds for all grid points of each index
+            thresholds = {}
+            for colind, name in enumerate(indexnames):
+
+                if featurebin.size > 4:
+                    indexvals = binvarindices[:,colind]
+                    indexmedian = np.median(indexvals)
+                    indexstdev = np.median(
+                        np.abs(indexvals - indexmedian)
+                    ) * 1.483
+                    thresholds[name] = indexmedian + grids[name]*indexstdev
+                else:
+                    # nothing is selected in bins with too few objects
+                    thresholds[name] = np.full(grids[name].size, np.inf)
+
+            # the counts for each index
+            passing_vars = {}
+            for colind, name in enumerate(indexnames):
+
+                indexvals = binvarindices[:,colind]
+                nrec = _count_above_thresholds(indexvals, thresholds[name])
+                ntp = _count_above_thresholds(indexvals[isactualvar],
+                                              thresholds[name])
+                nfp = _count_above_thresholds(indexvals[isactualnotvar],
+                                              thresholds[name])
+                ntn = nactualnotvars - nfp
+                nfn = nactualvars - ntp
+
+                magcol_rec['%s_recoveredvars' % name][binind] = nrec
+                magcol_rec['%s_truepositives' % name][binind] = ntp
+                magcol_rec['%s_falsepositives' % name][binind] = nfp
+                magcol_rec['%s_truenegatives' % name][binind] = ntn
+                magcol_rec['%s_falsenegatives' % name][binind] = nfn
+
+                (magcol_rec['%s_precision' % name][binind],
+                 magcol_rec['%s_recall' % name][binind],
+                 magcol_rec['%s_mcc' % name][binind]) = (
+                     _recovery_stats_arrays(ntp, ntn, nfp, nfn)
+                )
+
+                # which actual variables are found at each threshold
+                passing_vars[name] = (
+                    indexvals[isactualvar][:,None] > thresholds[name][None,:]
+                ).astype(np.int64)
+
+            # the true positives found by one index but missed by another for
+            # all pairs of thresholds
+            for name in indexnames:
+                for found in indexnames:
+                    if found != name:
+                        magcol_rec[
+                            '%s_missed_%s_found' % (name, found)
+                        ][binind] = (1 - passing_vars[name]).T.dot(
+                            passing_vars[found]
+                        )
+
+        recovery[magcol] = magcol_rec
+
+    return recovery
+
+
 def magbin_varind_gridsearch_worker(task):
     '''
     This is a parallel grid search worker for the function below.
@@ -674,7 +1022,8 @@ def variable_index_gridsearch_magbin(simbasedir,
                                      inveta_stdev_range=(1.0,20.0),
                                      iqr_stdev_range=(1.0,20.0),
                                      ngridpoints=32,
-                                     ngridworkers=None):
+                                     ngridworkers=None,
+                                     vectorized=True):
     '''This runs a variable index grid search per magbin.
 
     For each magbin, this does a grid search using the stetson and inveta ranges
@@ -733,15 +1082,31 @@ def variable_index_gridsearch_magbin(simbasedir,
         Xeon E5-2650v3 CPUs.
 
     ngridworkers : int or None
-        The number of parallel grid search workers that will be launched.
+        The number of parallel grid search workers that will be launched. This
+        is only used if `vectorized` is False.
+
+    vectorized : bool
+        If True, the variability indices of all fake LCs are loaded once with
+        :py:func:`.load_varind_gridsearch_features` and the stats for all grid
+        points and magbins are calculated together with
+        :py:func:`.varind_gridsearch_recovery`. This takes seconds instead of
+        days. If False, each grid point for each magbin is run separately with
+        :py:func:`.get_recovered_variables_for_magbin` in a process pool.
 
     Returns
     -------
 
     dict
-        The returned dict contains a list of recovery stats for each magbin and
-        each grid point in the variability index grids that were used. This dict
-        can be passed to the plotting function below to plot the results.
+        The returned dict contains the recovery stats for each magbin and each
+        grid point in the variability index grids that were used. This dict can
+        be passed to the plotting function below to plot the results.
+
+        If `vectorized` is True, the stats are arrays in the
+        'recovery_arrays' key as returned by
+        :py:func:`.varind_gridsearch_recovery`, and the 'recovery' key is
+        None. Otherwise, the 'recovery' key contains a list of the stats dicts
+        from :py:func:`.get_recovered_variables_for_magbin` for each grid point
+        for each magbin.
 
     '''
 
@@ -794,6 +1159,29 @@ def variable_index_gridsearch_magbin(simbasedir,
                     'simbasedir':os.path.abspath(simbasedir),
                     'recovery':[]}
 
+    if vectorized:
+
+        LOGINFO('running vectorized stetson J-inveta-IQR grid-search '
+                'for %s magbins...' % len(magbinmedians))
+
+        gridfeatures = load_varind_gridsearch_features(simbasedir)
+        grid_results['recovery'] = None
+        grid_results['recovery_arrays'] = varind_gridsearch_recovery(
+            gridfeatures,
+            stetson_grid,
+            inveta_grid,
+            iqr_grid,
+            magbinmedians
+        )
+
+        LOGINFO('done.')
+        with open(os.path.join(simbasedir,
+                               'fakevar-recovery-per-magbin.pkl'),
+                  'wb') as outfd:
+            pickle.dump(grid_results,outfd,pickle.HIGHEST_PROTOCOL)
+
+        return grid_results
+
     # set up the pool
     pool = mp.Pool(ngridworkers)
 
@@ -818,6 +1206,109 @@ def variable_index_gridsearch_magbin(simbasedir,
     return grid_results
 
 
+def _varind_gridsearch_magbin_stats(gridresults, magcol, magbinind):
+    '''This collects the recovery stats of a single magbin for plotting.
+
+    Parameters
+    ----------
+
+    gridresults : dict
+        The dict produced by `variable_index_gridsearch_magbin`.
+
+    magcol : str
+        The magcol to get the recovery stats for.
+
+    magbinind : int
+        The index of the magbin to get the recovery stats for.
+
+    Returns
+    -------
+
+    tuple
+        The MCC, precision, recall, and the two missed-but-found counts for
+        each of stetson J, inveta, and IQR (in that order) along their
+        respective stdev multiplier grids.
+
+    '''
+
+    indexstats = (
+        ('stet', ('mcc', 'precision', 'recall',
+                  'missed_inveta_found', 'missed_iqr_found')),
+        ('inveta', ('mcc', 'precision', 'recall',
+                    'missed_stet_found', 'missed_iqr_found')),
+        ('iqr', ('mcc', 'precision', 'recall',
+                 'missed_stet_found', 'missed_inveta_found')),
+    )
+    statkeys = ['%s_%s' % (index, stat)
+                for index, stats in indexstats
+                for stat in stats]
+
+    if gridresults.get('recovery_arrays') is not None:
+
+        # the vectorized grid-search results have the stats for each index's
+        # grid directly. the missed/found counts are taken at the first grid
+        # point of the other index like below
+        recarr = gridresults['recovery_arrays'][magcol]
+        return tuple(
+            recarr[key][magbinind][:,0] if '_missed_' in key
+            else recarr[key][magbinind]
+            for key in statkeys
+        )
+
+    # the pool grid-search results are a flat list over the full stetson J x
+    # inveta x IQR grid, so pull out each index's axis with strided slices
+    recgrid = gridresults['recovery'][magbinind]
+    nstet = gridresults['stetson_grid'].size
+    ninveta = gridresults['inveta_grid'].size
+    niqr = gridresults['iqr_grid'].size
+
+    statarrs = []
+    for key in statkeys:
+
+        statarr = np.array([x[magcol][key] for x in recgrid])
+
+        if key.startswith('stet_'):
+            statarr = statarr[::(ninveta*nstet)]
+        elif key.startswith('inveta_'):
+            statarr = statarr[:(niqr*nstet)][::ninveta]
+        else:
+            statarr = statarr[:(niqr*nstet)][:ninveta]
+
+        statarrs.append(statarr)
+
+    return tuple(statarrs)
+
+
+def _plot_varind_gridsearch_panel(subplotind,
+                                  grid,
+                                  values,
+                                  xlabel,
+                                  ylabel,
+                                  title,
+                                  nanlabel):
+    '''This plots a single panel of the per-magbin grid-search plot.
+
+    If all of the `values` are nan, the panel gets a note saying so instead.
+
+    '''
+
+    plt.subplot(3,5,subplotind)
+
+    if np.any(np.isfinite(values)):
+        plt.plot(grid, values)
+        plt.xlabel(xlabel)
+        plt.ylabel(ylabel)
+        plt.title(title)
+    else:
+        plt.text(0.5,0.5,
+                 '%s values are all nan for this magbin' % nanlabel,
+                 transform=plt.gca().transAxes,
+                 horizontalalignment='center',
+                 verticalalignment='center')
+        plt.xticks([])
+        plt.yticks([])
+
+
 def plot_varind_gridsearch_magbin_results(gridsearch_results):
     '''This plots the gridsearch results from `variable_index_gridsearch_magbin`.
 
@@ -857,7 +1348,6 @@ def plot_varind_gridsearch_magbin_results(gridsearch_results):
 
     plotres = {'simbasedir':gridresults['simbasedir']}
 
-    recgrid = gridresults['recovery']
     simbasedir = gridresults['simbasedir']
 
     for magcol in gridresults['magcols']:
@@ -873,366 +1363,174 @@ def plot_varind_gridsearch_magbin_results(gridsearch_results):
             LOGINFO('plotting results for %s: magbin: %.3f' %
                     (magcol, magbinmedian))
 
-            stet_mcc = np.array(
-                [x[magcol]['stet_mcc']
-                 for x in recgrid[magbinind]]
-            )[::(gridresults['inveta_grid'].size *
-                 gridresults['stetson_grid'].size)]
-            stet_precision = np.array(
-                [x[magcol]['stet_precision']
-                 for x in recgrid[magbinind]]
-            )[::(gridresults['inveta_grid'].size *
-                 gridresults['stetson_grid'].size)]
-            stet_recall = np.array(
-                [x[magcol]['stet_recall']
-                 for x in recgrid[magbinind]]
-            )[::(gridresults['inveta_grid'].size *
-                 gridresults['stetson_grid'].size)]
-            stet_missed_inveta_found = np.array(
-                [x[magcol]['stet_missed_inveta_found']
-                 for x in recgrid[magbinind]]
-            )[::(gridresults['inveta_grid'].size *
-                 gridresults['stetson_grid'].size)]
-            stet_missed_iqr_found = np.array(
-                [x[magcol]['stet_missed_iqr_found']
-                 for x in recgrid[magbinind]]
-            )[::(gridresults['inveta_grid'].size *
-                 gridresults['stetson_grid'].size)]
-
-            inveta_mcc = np.array(
-                [x[magcol]['inveta_mcc']
-                 for x in recgrid[magbinind]]
-            )[:(gridresults['iqr_grid'].size *
-                gridresults['stetson_grid'].size)][
-                    ::gridresults['inveta_grid'].size
-                ]
-            inveta_precision = np.array(
-                [x[magcol]['inveta_precision']
-                 for x in recgrid[magbinind]]
-            )[:(gridresults['iqr_grid'].size *
-                gridresults['stetson_grid'].size)][
-                    ::gridresults['inveta_grid'].size
-                ]
-            inveta_recall = np.array(
-                [x[magcol]['inveta_recall']
-                 for x in recgrid[magbinind]]
-            )[:(gridresults['iqr_grid'].size *
-                gridresults['stetson_grid'].size)][
-                    ::gridresults['inveta_grid'].size
-                ]
-            inveta_missed_stet_found = np.array(
-                [x[magcol]['inveta_missed_stet_found']
-                 for x in recgrid[magbinind]]
-            )[:(gridresults['iqr_grid'].size *
-                gridresults['stetson_grid'].size)][
-                    ::gridresults['inveta_grid'].size
-                ]
-            inveta_missed_iqr_found = np.array(
-                [x[magcol]['inveta_missed_iqr_found']
-                 for x in recgrid[magbinind]]
-            )[:(gridresults['iqr_grid'].size *
-                gridresults['stetson_grid'].size)][
-                    ::gridresults['inveta_grid'].size
-                ]
-
-            iqr_mcc = np.array(
-                [x[magcol]['iqr_mcc']
-                 for x in recgrid[magbinind]]
-            )[:(gridresults['iqr_grid'].size *
-                gridresults['stetson_grid'].size)][
-                    :gridresults['inveta_grid'].size
-                ]
-            iqr_precision = np.array(
-                [x[magcol]['iqr_precision']
-                 for x in recgrid[magbinind]]
-            )[:(gridresults['iqr_grid'].size *
-                gridresults['stetson_grid'].size)][
-                    :gridresults['inveta_grid'].size
-                ]
-            iqr_recall = np.array(
-                [x[magcol]['iqr_recall']
-                 for x in recgrid[magbinind]]
-            )[:(gridresults['iqr_grid'].size *
-                gridresults['stetson_grid'].size)][
-                    :gridresults['inveta_grid'].size
-                ]
-            iqr_missed_stet_found = np.array(
-                [x[magcol]['iqr_missed_stet_found']
-                 for x in recgrid[magbinind]]
-            )[:(gridresults['iqr_grid'].size *
-                gridresults['stetson_grid'].size)][
-                    :gridresults['inveta_grid'].size
-                ]
-            iqr_missed_inveta_found = np.array(
-                [x[magcol]['iqr_missed_inveta_found']
-                 for x in recgrid[magbinind]]
-            )[:(gridresults['iqr_grid'].size *
-                gridresults['stetson_grid'].size)][
-                    :gridresults['inveta_grid'].size
-                ]
+            (stet_mcc, stet_precision, stet_recall,
+             stet_missed_inveta_found, stet_missed_iqr_found,
+             inveta_mcc, inveta_precision, inveta_recall,
+             inveta_missed_stet_found, inveta_missed_iqr_found,
+             iqr_mcc, iqr_precision, iqr_recall,
+             iqr_missed_stet_found, iqr_missed_inveta_found) = (
+                 _varind_gridsearch_magbin_stats(gridresults,
+                                                 magcol,
+                                                 magbinind)
+            )
 
             plt.figure(figsize=(6.4*5, 4.8*3))
 
             # FIRST ROW: stetson J plot
 
-            plt.subplot(3,5,1)
-            if np.any(np.isfinite(stet_mcc)):
-                plt.plot(gridresults['stetson_grid'],
-                         stet_mcc)
-                plt.xlabel('stetson J stdev multiplier threshold')
-                plt.ylabel('MCC')
-                plt.title('MCC for stetson J')
-            else:
-                plt.text(0.5,0.5,
-                         'stet MCC values are all nan '
-                         'for this magbin',
-                         transform=plt.gca().transAxes,
-                         horizontalalignment='center',
-                         verticalalignment='center')
-                plt.xticks([])
-                plt.yticks([])
-
-            plt.subplot(3,5,2)
-            if np.any(np.isfinite(stet_precision)):
-                plt.plot(gridresults['stetson_grid'],
-                         stet_precision)
-                plt.xlabel('stetson J stdev multiplier threshold')
-                plt.ylabel('precision')
-                plt.title('precision for stetson J')
-            else:
-                plt.text(0.5,0.5,
-                         'stet precision values are all nan '
-                         'for this magbin',
-                         transform=plt.gca().transAxes,
-                         horizontalalignment='center',
-                         verticalalignment='center')
-                plt.xticks([])
-                plt.yticks([])
-
-            plt.subplot(3,5,3)
-            if np.any(np.isfinite(stet_recall)):
-                plt.plot(gridresults['stetson_grid'],
-                         stet_recall)
-                plt.xlabel('stetson J stdev multiplier threshold')
-                plt.ylabel('recall')
-                plt.title('recall for stetson J')
-            else:
-                plt.text(0.5,0.5,
-                         'stet recall values are all nan '
-                         'for this magbin',
-                         transform=plt.gca().transAxes,
-                         horizontalalignment='center',
-                         verticalalignment='center')
-                plt.xticks([])
-                plt.yticks([])
-
-            plt.subplot(3,5,4)
-            if np.any(np.isfinite(stet_missed_inveta_found)):
-                plt.plot(gridresults['stetson_grid'],
-                         stet_missed_inveta_found)
-                plt.xlabel('stetson J stdev multiplier threshold')
-                plt.ylabel('# objects stetson missed but inveta found')
-                plt.title('stetson J missed, inveta found')
-            else:
-                plt.text(0.5,0.5,
-                         'stet-missed/inveta-found values are all nan '
-                         'for this magbin',
-                         transform=plt.gca().transAxes,
-                         horizontalalignment='center',
-                         verticalalignment='center')
-                plt.xticks([])
-                plt.yticks([])
-
-            plt.subplot(3,5,5)
-            if np.any(np.isfinite(stet_missed_iqr_found)):
-                plt.plot(gridresults['stetson_grid'],
-                         stet_missed_iqr_found)
-                plt.xlabel('stetson J stdev multiplier threshold')
-                plt.ylabel('# objects stetson missed but IQR found')
-                plt.title('stetson J missed, IQR found')
-            else:
-                plt.text(0.5,0.5,
-                         'stet-missed/IQR-found values are all nan '
-                         'for this magbin',
-                         transform=plt.gca().transAxes,
-                         horizontalalignment='center',
-                         verticalalignment='center')
-                plt.xticks([])
-                plt.yticks([])
+            _plot_varind_gridsearch_panel(
+                1,
+                gridresults['stetson_grid'],
+                stet_mcc,
+                'stetson J stdev multiplier threshold',
+                'MCC',
+                'MCC for stetson J',
+                'stet MCC'
+            )
+
+            _plot_varind_gridsearch_panel(
+                2,
+                gridresults['stetson_grid'],
+                stet_precision,
+                'stetson J stdev multiplier threshold',
+                'precision',
+                'precision for stetson J',
+                'stet precision'
+            )
+
+            _plot_varind_gridsearch_panel(
+                3,
+                gridresults['stetson_grid'],
+                stet_recall,
+                'stetson J stdev multiplier threshold',
+                'recall',
+                'recall for stetson J',
+                'stet recall'
+            )
+
+            _plot_varind_gridsearch_panel(
+                4,
+                gridresults['stetson_grid'],
+                stet_missed_inveta_found,
+                'stetson J stdev multiplier threshold',
+                '# objects stetson missed but inveta found',
+                'stetson J missed, inveta found',
+                'stet-missed/inveta-found'
+            )
+
+            _plot_varind_gridsearch_panel(
+                5,
+                gridresults['stetson_grid'],
+                stet_missed_iqr_found,
+                'stetson J stdev multiplier threshold',
+                '# objects stetson missed but IQR found',
+                'stetson J missed, IQR found',
+                'stet-missed/IQR-found'
+            )
 
             # SECOND ROW: inveta plots
 
-            plt.subplot(3,5,6)
-            if np.any(np.isfinite(inveta_mcc)):
-                plt.plot(gridresults['inveta_grid'],
-                         inveta_mcc)
-                plt.xlabel('inveta stdev multiplier threshold')
-                plt.ylabel('MCC')
-                plt.title('MCC for inveta')
-            else:
-                plt.text(0.5,0.5,
-                         'inveta MCC values are all nan '
-                         'for this magbin',
-                         transform=plt.gca().transAxes,
-                         horizontalalignment='center',
-                         verticalalignment='center')
-                plt.xticks([])
-                plt.yticks([])
-
-            plt.subplot(3,5,7)
-            if np.any(np.isfinite(inveta_precision)):
-                plt.plot(gridresults['inveta_grid'],
-                         inveta_precision)
-                plt.xlabel('inveta stdev multiplier threshold')
-                plt.ylabel('precision')
-                plt.title('precision for inveta')
-            else:
-                plt.text(0.5,0.5,
-                         'inveta precision values are all nan '
-                         'for this magbin',
-                         transform=plt.gca().transAxes,
-                         horizontalalignment='center',
-                         verticalalignment='center')
-                plt.xticks([])
-                plt.yticks([])
-
-            plt.subplot(3,5,8)
-            if np.any(np.isfinite(inveta_recall)):
-                plt.plot(gridresults['inveta_grid'],
-                         inveta_recall)
-                plt.xlabel('inveta stdev multiplier threshold')
-                plt.ylabel('recall')
-                plt.title('recall for inveta')
-            else:
-                plt.text(0.5,0.5,
-                         'inveta recall values are all nan '
-                         'for this magbin',
-                         transform=plt.gca().transAxes,
-                         horizontalalignment='center',
-                         verticalalignment='center')
-                plt.xticks([])
-                plt.yticks([])
-
-            plt.subplot(3,5,9)
-            if np.any(np.isfinite(inveta_missed_stet_found)):
-                plt.plot(gridresults['inveta_grid'],
-                         inveta_missed_stet_found)
-                plt.xlabel('inveta stdev multiplier threshold')
-                plt.ylabel('# objects inveta missed but stetson found')
-                plt.title('inveta missed, stetson J found')
-            else:
-                plt.text(0.5,0.5,
-                         'inveta-missed-stet-found values are all nan '
-                         'for this magbin',
-                         transform=plt.gca().transAxes,
-                         horizontalalignment='center',
-                         verticalalignment='center')
-                plt.xticks([])
-                plt.yticks([])
-
-            plt.subplot(3,5,10)
-            if np.any(np.isfinite(inveta_missed_iqr_found)):
-                plt.plot(gridresults['inveta_grid'],
-                         inveta_missed_iqr_found)
-                plt.xlabel('inveta stdev multiplier threshold')
-                plt.ylabel('# objects inveta missed but IQR found')
-                plt.title('inveta missed, IQR found')
-            else:
-                plt.text(0.5,0.5,
-                         'inveta-missed-iqr-found values are all nan '
-                         'for this magbin',
-                         transform=plt.gca().transAxes,
-                         horizontalalignment='center',
-                         verticalalignment='center')
-                plt.xticks([])
-                plt.yticks([])
+            _plot_varind_gridsearch_panel(
+                6,
+                gridresults['inveta_grid'],
+                inveta_mcc,
+                'inveta stdev multiplier threshold',
+                'MCC',
+                'MCC for inveta',
+                'inveta MCC'
+            )
+
+            _plot_varind_gridsearch_panel(
+                7,
+                gridresults['inveta_grid'],
+                inveta_precision,
+                'inveta stdev multiplier threshold',
+                'precision',
+                'precision for inveta',
+                'inveta precision'
+            )
+
+            _plot_varind_gridsearch_panel(
+                8,
+                gridresults['inveta_grid'],
+                inveta_recall,
+                'inveta stdev multiplier threshold',
+                'recall',
+                'recall for inveta',
+                'inveta recall'
+            )
+
+            _plot_varind_gridsearch_panel(
+                9,
+                gridresults['inveta_grid'],
+                inveta_missed_stet_found,
+                'inveta stdev multiplier threshold',
+                '# objects inveta missed but stetson found',
+                'inveta missed, stetson J found',
+                'inveta-missed-stet-found'
+            )
+
+            _plot_varind_gridsearch_panel(
+                10,
+                gridresults['inveta_grid'],
+                inveta_missed_iqr_found,
+                'inveta stdev multiplier threshold',
+                '# objects inveta missed but IQR found',
+                'inveta missed, IQR found',
+                'inveta-missed-iqr-found'
+            )
 
             # THIRD ROW: inveta plots
 
-            plt.subplot(3,5,11)
-            if np.any(np.isfinite(iqr_mcc)):
-                plt.plot(gridresults['iqr_grid'],
-                         iqr_mcc)
-                plt.xlabel('IQR stdev multiplier threshold')
-                plt.ylabel('MCC')
-                plt.title('MCC for IQR')
-            else:
-                plt.text(0.5,0.5,
-                         'IQR MCC values are all nan '
-                         'for this magbin',
-                         transform=plt.gca().transAxes,
-                         horizontalalignment='center',
-                         verticalalignment='center')
-                plt.xticks([])
-                plt.yticks([])
-
-            plt.subplot(3,5,12)
-            if np.any(np.isfinite(iqr_precision)):
-                plt.plot(gridresults['iqr_grid'],
-                         iqr_precision)
-                plt.xlabel('IQR stdev multiplier threshold')
-                plt.ylabel('precision')
-                plt.title('precision for IQR')
-            else:
-                plt.text(0.5,0.5,
-                         'IQR precision values are all nan '
-                         'for this magbin',
-                         transform=plt.gca().transAxes,
-                         horizontalalignment='center',
-                         verticalalignment='center')
-                plt.xticks([])
-                plt.yticks([])
-
-            plt.subplot(3,5,13)
-            if np.any(np.isfinite(iqr_recall)):
-                plt.plot(gridresults['iqr_grid'],
-                         iqr_recall)
-                plt.xlabel('IQR stdev multiplier threshold')
-                plt.ylabel('recall')
-                plt.title('recall for IQR')
-            else:
-                plt.text(0.5,0.5,
-                         'IQR recall values are all nan '
-                         'for this magbin',
-                         transform=plt.gca().transAxes,
-                         horizontalalignment='center',
-                         verticalalignment='center')
-                plt.xticks([])
-                plt.yticks([])
-
-            plt.subplot(3,5,14)
-            if np.any(np.isfinite(iqr_missed_stet_found)):
-                plt.plot(gridresults['iqr_grid'],
-                         iqr_missed_stet_found)
-                plt.xlabel('IQR stdev multiplier threshold')
-                plt.ylabel('# objects IQR missed but stetson found')
-                plt.title('IQR missed, stetson J found')
-            else:
-                plt.text(0.5,0.5,
-                         'iqr-missed-stet-found values are all nan '
-                         'for this magbin',
-                         transform=plt.gca().transAxes,
-                         horizontalalignment='center',
-                         verticalalignment='center')
-                plt.xticks([])
-                plt.yticks([])
-
-            plt.subplot(3,5,15)
-            if np.any(np.isfinite(iqr_missed_inveta_found)):
-                plt.plot(gridresults['iqr_grid'],
-                         iqr_missed_inveta_found)
-                plt.xlabel('IQR stdev multiplier threshold')
-                plt.ylabel('# objects IQR missed but inveta found')
-                plt.title('IQR missed, inveta found')
-            else:
-                plt.text(0.5,0.5,
-                         'iqr-missed-inveta-found values are all nan '
-                         'for this magbin',
-                         transform=plt.gca().transAxes,
-                         horizontalalignment='center',
-                         verticalalignment='center')
-                plt.xticks([])
-                plt.yticks([])
+            _plot_varind_gridsearch_panel(
+                11,
+                gridresults['iqr_grid'],
+                iqr_mcc,
+                'IQR stdev multiplier threshold',
+                'MCC',
+                'MCC for IQR',
+                'IQR MCC'
+            )
+
+            _plot_varind_gridsearch_panel(
+                12,
+                gridresults['iqr_grid'],
+                iqr_precision,
+                'IQR stdev multiplier threshold',
+                'precision',
+                'precision for IQR',
+                'IQR precision'
+            )
+
+            _plot_varind_gridsearch_panel(
+                13,
+                gridresults['iqr_grid'],
+                iqr_recall,
+                'IQR stdev multiplier threshold',
+                'recall',
+                'recall for IQR',
+                'IQR recall'
+            )
+
+            _plot_varind_gridsearch_panel(
+                14,
+                gridresults['iqr_grid'],
+                iqr_missed_stet_found,
+                'IQR stdev multiplier threshold',
+                '# objects IQR missed but stetson found',
+                'IQR missed, stetson J found',
+                'iqr-missed-stet-found'
+            )
+
+            _plot_varind_gridsearch_panel(
+                15,
+                gridresults['iqr_grid'],
+                iqr_missed_inveta_found,
+                'IQR stdev multiplier threshold',
+                '# objects IQR missed but inveta found',
+                'IQR missed, inveta found',
+                'iqr-missed-inveta-found'
+            )
 
             plt.subplots_adjust(hspace=0.25,wspace=0.25)
 
@@ -1646,98 +1944,176 @@ def check_periodrec_alias(actualperiod,
             return 'other'
 
 
-def periodicvar_recovery(fakepfpkl,
-                         simbasedir,
-                         period_tolerance=1.0e-3):
+def get_periodrec_alias_matches(actualperiods,
+                                recoveredperiods,
+                                tolerance=1.0e-3):
+    '''This finds the aliases matching recovered periods for arrays of periods.
 
-    '''Recovers the periodic variable status/info for the simulated PF result.
+    This is the array version of the comparison done by
+    `check_periodrec_alias`. All of the inputs are broadcast against each
+    other, so e.g. the actual periods of N objects with shape (N, 1) can be
+    compared with their `nbestperiods` in an array of shape (N, K), using a
+    single tolerance or one for each object.
+
+    Parameters
+    ----------
+
+    actualperiods : float or np.array
+        The actual periods.
+
+    recoveredperiods : float or np.array
+        The recovered periods.
+
+    tolerance : float or np.array
+        The absolute difference required between the recovered period and the
+        actual period (or its aliases) to mark them as close.
+
+    Returns
+    -------
+
+    np.array
+        A boolean array of shape (broadcast shape of the inputs, number of
+        alias types). The last axis is in the order of `ALIAS_TYPES` and is True
+        for each alias type that matches the recovered period. This is all
+        False where the actual or recovered period isn't finite.
+
+    '''
+
+    actualperiods, recoveredperiods, tolerance = np.broadcast_arrays(
+        np.asarray(actualperiods, dtype=np.float64),
+        np.asarray(recoveredperiods, dtype=np.float64),
+        np.asarray(tolerance, dtype=np.float64)
+    )
+
+    p = actualperiods[...,None]
+
+    # these are in the same order as ALIAS_TYPES
+    with np.errstate(divide='ignore', invalid='ignore'):
+        aliases = np.concatenate((
+            p,
+            p*2.0,
+            p*0.5,
+            p/(1.0 + p),
+            p/(1.0 - p),
+            p/(1.0 + 2.0*p),
+            p/(1.0 - 2.0*p),
+            p/(1.0 + 3.0*p),
+            p/(1.0 - 3.0*p),
+            p/(p - 1.0),
+            p/(2.0*p - 1.0),
+        ), axis=-1)
+
+        # this is np.isclose with the same default rtol, but with an array of
+        # absolute tolerances
+        recp = recoveredperiods[...,None]
+        matches = (
+            np.isfinite(recp) & np.isfinite(aliases) &
+            (np.abs(recp - aliases) <=
+             tolerance[...,None] + 1.0e-5*np.abs(aliases))
+        )
+
+    return matches
 
-    - Uses simbasedir and the lcfbasename stored in fakepfpkl to figure out
-      where the LC for this object is.
-    - Gets the actual_varparams, actual_varperiod, actual_vartype,
-      actual_varamplitude elements from the LC.
-    - Figures out if the current objectid is a periodic variable (using
-      actual_vartype).
-    - If it is a periodic variable, gets the canonical period assigned to it.
-    - Checks if the period was recovered in any of the five best periods
-      reported by any of the period-finders, checks if the period recovered was
-      a harmonic of the period.
-    - Returns the objectid, actual period and vartype, recovered period, and
-      recovery status.
 
+def check_periodrec_alias_array(actualperiods,
+                                recoveredperiods,
+                                tolerance=1.0e-3):
+    '''This determines the alias types for arrays of actual/recovered periods.
+
+    This gives the same results as calling `check_periodrec_alias` for each
+    element of the broadcast input arrays, but all of the comparisons are done
+    at once with `get_periodrec_alias_matches`.
 
     Parameters
     ----------
 
-    fakepfpkl : str
-        This is a periodfinding-<objectid>.pkl[.gz] file produced in the
-        `simbasedir/periodfinding` subdirectory after `run_periodfinding` above
-        is done.
+    actualperiods : float or np.array
+        The actual periods.
 
-    simbasedir : str
-        The base directory where all of the fake LCs and period-finding results
-        are.
+    recoveredperiods : float or np.array
+        The recovered periods.
 
-    period_tolerance : float
-        The maximum difference that this function will consider between an
-        actual period (or its aliases) and a recovered period to consider it as
-        as a 'recovered' period.
+    tolerance : float or np.array
+        The absolute difference required between the recovered period and the
+        actual period (or its aliases) to mark them as close.
 
     Returns
     -------
 
-    dict
-        Returns a dict of period-recovery results.
+    np.array
+        An array of str with the broadcast shape of the inputs. Each element is
+        the CSV string of matching `ALIAS_TYPES`, 'other' if there are no
+        matches, or 'unknown' if the actual or recovered period isn't finite.
 
     '''
 
-    if fakepfpkl.endswith('.gz'):
-        infd = gzip.open(fakepfpkl,'rb')
-    else:
-        infd = open(fakepfpkl,'rb')
+    matches = get_periodrec_alias_matches(actualperiods,
+                                          recoveredperiods,
+                                          tolerance=tolerance)
+    finite = (np.isfinite(np.asarray(actualperiods, dtype=np.float64)) &
+              np.isfinite(np.asarray(recoveredperiods, dtype=np.float64)))
+    finite = np.broadcast_to(finite, matches.shape[:-1])
+
+    # turn each combination of matches into a code, and make the label once
+    # for each unique code
+    codes = np.array(np.dot(matches, 1 << np.arange(len(ALIAS_TYPES))))
+    codes[~finite] = -1
+
+    uniquecodes, codeind = np.unique(codes, return_inverse=True)
+    labels = []
+
+    for code in uniquecodes:
+        if code < 0:
+            labels.append('unknown')
+        elif code == 0:
+            labels.append('other')
+        else:
+            labels.append(','.join(
+                x for xi, x in enumerate(ALIAS_TYPES) if code & (1 << xi)
+            ))
 
-    fakepf = pickle.load(infd)
-    infd.close()
+    return np.array(labels)[codeind].reshape(codes.shape)
 
-    # get info from the fakepf dict
-    objectid, lcfbasename = fakepf['objectid'], fakepf['lcfbasename']
-    lcfpath = os.path.join(simbasedir,'lightcurves',lcfbasename)
 
-    # if the LC doesn't exist, bail out
-    if not os.path.exists(lcfpath):
-        LOGERROR('light curve for %s does not exist at: %s' % (objectid,
-                                                               lcfpath))
-        return None
+def _get_periodrec_status(pfresults,
+                          magcols,
+                          actual_vartype,
+                          actual_varperiod,
+                          period_tolerance=1.0e-3):
+    '''This gets the recovered periods and their status for one object.
 
-    # now, open the fakelc
-    fakelc = lcproc._read_pklc(lcfpath)
+    Parameters
+    ----------
 
-    # get the actual_varparams, actual_varperiod, actual_varamplitude
-    actual_varparams, actual_varperiod, actual_varamplitude, actual_vartype = (
-        fakelc['actual_varparams'],
-        fakelc['actual_varperiod'],
-        fakelc['actual_varamplitude'],
-        fakelc['actual_vartype']
-    )
+    pfresults : dict
+        The period-finding results for the object in the form produced by
+        `lcproc.periodsearch.runpf`, i.e. a dict keyed by magcol, with the
+        results of each period-finder keyed by '<index>-<pfmethod>' and listed
+        in the magcol's 'pfmethods' key.
 
-    # get the moments too so we can track LC noise, etc.
-    actual_moments = fakelc['moments']
+    magcols : list of str
+        The magcols to get the recovered periods from.
 
-    # get the magcols for this LC
-    magcols = fakelc['magcols']
+    actual_vartype : str or None
+        The actual vartype of the object.
+
+    actual_varperiod : float
+        The actual period of the object.
+
+    period_tolerance : float
+        The maximum difference between the actual period (or its aliases) and
+        a recovered period to consider it as a 'recovered' period.
+
+    Returns
+    -------
+
+    dict
+        Returns a dict with the 'recovery_*' and 'best_recovered_*' keys of the
+        `periodicvar_recovery` result dict.
+
+    '''
 
-    # get the recovered info from each of the available methods
     pfres = {
-        'objectid':objectid,
-        'simbasedir':simbasedir,
-        'magcols':magcols,
-        'fakelc':os.path.abspath(lcfpath),
-        'fakepf':os.path.abspath(fakepfpkl),
-        'actual_vartype':actual_vartype,
-        'actual_varperiod':actual_varperiod,
-        'actual_varamplitude':actual_varamplitude,
-        'actual_varparams':actual_varparams,
-        'actual_moments':actual_moments,
         'recovery_periods':[],
         'recovery_lspvals':[],
         'recovery_pfmethods':[],
@@ -1749,49 +2125,52 @@ def periodicvar_recovery(fakepfpkl,
     # populate the pfres dict with the periods, pfmethods, and magcols
     for magcol in magcols:
 
-        for pfm in lcproc.PFMETHODS:
+        if not pfresults.get(magcol):
+            continue
+
+        # the period-finder results are keyed by '<index>-<pfmethod>'
+        for pfmkey in pfresults[magcol].get('pfmethods', []):
 
-            if pfm in fakepf[magcol]:
+            pfm = pfmkey.split('-')[-1]
+            thispf = pfresults[magcol][pfmkey]
 
-                # only get the unique recovered periods by using
-                # period_tolerance
-                for rpi, rp in enumerate(
-                        fakepf[magcol][pfm]['nbestperiods']
-                ):
+            # only get the unique recovered periods by using
+            # period_tolerance
+            for rpi, rp in enumerate(thispf['nbestperiods']):
 
-                    if ((not np.any(np.isclose(
-                            rp,
-                            np.array(pfres['recovery_periods']),
-                            rtol=period_tolerance
-                    ))) and np.isfinite(rp)):
+                if ((not np.any(np.isclose(
+                        rp,
+                        np.array(pfres['recovery_periods']),
+                        rtol=period_tolerance
+                ))) and np.isfinite(rp)):
 
-                        # populate the recovery periods, pfmethods, and magcols
-                        pfres['recovery_periods'].append(rp)
-                        pfres['recovery_pfmethods'].append(pfm)
-                        pfres['recovery_magcols'].append(magcol)
+                    # populate the recovery periods, pfmethods, and magcols
+                    pfres['recovery_periods'].append(rp)
+                    pfres['recovery_pfmethods'].append(pfm)
+                    pfres['recovery_magcols'].append(magcol)
 
-                        # normalize the periodogram peak value to between
-                        # 0 and 1 so we can put in the results of multiple
-                        # periodfinders on one scale
-                        if pfm == 'pdm':
+                    # normalize the periodogram peak value to between
+                    # 0 and 1 so we can put in the results of multiple
+                    # periodfinders on one scale
+                    if pfm == 'pdm':
 
-                            this_lspval = (
-                                np.max(fakepf[magcol][pfm]['lspvals']) -
-                                fakepf[magcol][pfm]['nbestlspvals'][rpi]
-                            )
+                        this_lspval = (
+                            np.max(thispf['lspvals']) -
+                            thispf['nbestlspvals'][rpi]
+                        )
 
-                        else:
+                    else:
 
-                            this_lspval = (
-                                fakepf[magcol][pfm]['nbestlspvals'][rpi] /
-                                np.max(fakepf[magcol][pfm]['lspvals'])
-                            )
+                        this_lspval = (
+                            thispf['nbestlspvals'][rpi] /
+                            np.max(thispf['lspvals'])
+                        )
 
-                        # add the normalized lspval to the outdict for
-                        # this object as well. later, we'll use this to
-                        # construct a periodogram for objects that were actually
-                        # not variables
-                        pfres['recovery_lspvals'].append(this_lspval)
+                    # add the normalized lspval to the outdict for
+                    # this object as well. later, we'll use this to
+                    # construct a periodogram for objects that were actually
+                    # not variables
+                    pfres['recovery_lspvals'].append(this_lspval)
 
     # convert the recovery_* lists to arrays
     pfres['recovery_periods'] = np.array(pfres['recovery_periods'])
@@ -1810,21 +2189,15 @@ def periodicvar_recovery(fakepfpkl,
 
         if pfres['recovery_periods'].size > 0:
 
-            for ri in range(pfres['recovery_periods'].size):
+            pfres['recovery_pdiff'] = (pfres['recovery_periods'] -
+                                       float(actual_varperiod))
 
-                pfres['recovery_pdiff'].append(pfres['recovery_periods'][ri] -
-                                               np.asscalar(actual_varperiod))
-
-                # get the alias types
-                pfres['recovery_status'].append(
-                    check_periodrec_alias(actual_varperiod,
-                                          pfres['recovery_periods'][ri],
-                                          tolerance=period_tolerance)
-                )
-
-            # turn the recovery_pdiff/status lists into arrays
-            pfres['recovery_status'] = np.array(pfres['recovery_status'])
-            pfres['recovery_pdiff'] = np.array(pfres['recovery_pdiff'])
+            # get the alias types
+            pfres['recovery_status'] = check_periodrec_alias_array(
+                float(actual_varperiod),
+                pfres['recovery_periods'],
+                tolerance=period_tolerance
+            )
 
             # find the best recovered period and its status
             rec_absdiff = np.abs(pfres['recovery_pdiff'])
@@ -1848,11 +2221,6 @@ def periodicvar_recovery(fakepfpkl,
 
         else:
 
-            LOGWARNING(
-                'no finite periods recovered from period-finding for %s' %
-                fakepfpkl
-            )
-
             pfres['recovery_status'] = np.array(['no_finite_periods_recovered'])
             pfres['recovery_pdiff'] = np.array([np.nan])
             pfres['best_recovered_period'] = np.array([np.nan])
@@ -1880,6 +2248,117 @@ def periodicvar_recovery(fakepfpkl,
     return pfres
 
 
+def periodicvar_recovery(fakepfpkl,
+                         simbasedir,
+                         period_tolerance=1.0e-3):
+
+    '''Recovers the periodic variable status/info for the simulated PF result.
+
+    - Uses simbasedir and the lcfbasename stored in fakepfpkl to figure out
+      where the LC for this object is.
+    - Gets the actual_varparams, actual_varperiod, actual_vartype,
+      actual_varamplitude elements from the LC.
+    - Figures out if the current objectid is a periodic variable (using
+      actual_vartype).
+    - If it is a periodic variable, gets the canonical period assigned to it.
+    - Checks if the period was recovered in any of the five best periods
+      reported by any of the period-finders, checks if the period recovered was
+      a harmonic of the period.
+    - Returns the objectid, actual period and vartype, recovered period, and
+      recovery status.
+
+
+    Parameters
+    ----------
+
+    fakepfpkl : str
+        This is a periodfinding-<objectid>.pkl[.gz] file produced in the
+        `simbasedir/periodfinding` subdirectory after `run_periodfinding` above
+        is done.
+
+    simbasedir : str
+        The base directory where all of the fake LCs and period-finding results
+        are.
+
+    period_tolerance : float
+        The maximum difference that this function will consider between an
+        actual period (or its aliases) and a recovered period to consider it as
+        as a 'recovered' period.
+
+    Returns
+    -------
+
+    dict
+        Returns a dict of period-recovery results.
+
+    '''
+
+    if fakepfpkl.endswith('.gz'):
+        infd = gzip.open(fakepfpkl,'rb')
+    else:
+        infd = open(fakepfpkl,'rb')
+
+    fakepf = pickle.load(infd)
+    infd.close()
+
+    # get info from the fakepf dict
+    objectid, lcfbasename = fakepf['objectid'], fakepf['lcfbasename']
+    lcfpath = os.path.join(simbasedir,'lightcurves',lcfbasename)
+
+    # if the LC doesn't exist, bail out
+    if not os.path.exists(lcfpath):
+        LOGERROR('light curve for %s does not exist at: %s' % (objectid,
+                                                               lcfpath))
+        return None
+
+    # now, open the fakelc
+    fakelc = lcproc._read_pklc(lcfpath)
+
+    # get the actual_varparams, actual_varperiod, actual_varamplitude
+    actual_varparams, actual_varperiod, actual_varamplitude, actual_vartype = (
+        fakelc['actual_varparams'],
+        fakelc['actual_varperiod'],
+        fakelc['actual_varamplitude'],
+        fakelc['actual_vartype']
+    )
+
+    # get the moments too so we can track LC noise, etc.
+    actual_moments = fakelc['moments']
+
+    # get the magcols for this LC
+    magcols = fakelc['magcols']
+
+    # get the recovered info from each of the available methods
+    pfres = {
+        'objectid':objectid,
+        'simbasedir':simbasedir,
+        'magcols':magcols,
+        'fakelc':os.path.abspath(lcfpath),
+        'fakepf':os.path.abspath(fakepfpkl),
+        'actual_vartype':actual_vartype,
+        'actual_varperiod':actual_varperiod,
+        'actual_varamplitude':actual_varamplitude,
+        'actual_varparams':actual_varparams,
+        'actual_moments':actual_moments,
+    }
+
+    # get the recovered periods and their alias status
+    pfres.update(
+        _get_periodrec_status(fakepf,
+                              magcols,
+                              actual_vartype,
+                              actual_varperiod,
+                              period_tolerance=period_tolerance)
+    )
+    if 'no_finite_periods_recovered' in pfres['recovery_status']:
+        LOGWARNING(
+            'no finite periods recovered from period-finding for %s' %
+            fakepfpkl
+        )
+
+    return pfres
+
+
 def periodrec_worker(task):
     '''This is a parallel worker for running period-recovery.
 
@@ -3625,3 +4104,467 @@ def plot_periodicvar_recovery_results(
         pickle.dump(outdict, outfd, pickle.HIGHEST_PROTOCOL)
 
     return outdict
+
+
+######################################
+## STREAMING INJECTION AND RECOVERY ##
+######################################
+
+# these are the variability features kept in the injection-recovery summary
+INJREC_VARFEATURES = ['ndet', 'median', 'mad', 'mag_iqr', 'eta_normal',
+                      'stetsonj', 'stetsonk']
+
+
+def injection_recovery_worker(task):
+    '''This runs the full injection-recovery for one object in memory.
+
+    The fake LC is made from the input LC, variability and noise are added to
+    it, its variability features are calculated, the period-finders are run,
+    and the recovered periods are checked against the actual period. None of
+    the intermediate products are written to disk.
+
+    Parameters
+    ----------
+
+    task : tuple
+        This is of the form::
+
+            task[0] = index of the object in the simulation
+            task[1] = input LC file
+            task[2] = vartype of the object or None
+            task[3] = variability params of the object (as produced by
+                      `fakelcs.generation.draw_variability_params` in units of
+                      the time-range) or None
+            task[4] = dict of options from `run_injection_recovery`
+
+    Returns
+    -------
+
+    dict
+        A summary row for the object with its actual variability info, some of
+        its variability features for each magcol, and the 'recovery_*' and
+        'best_recovered_*' keys produced by `periodicvar_recovery`. Returns None
+        if the object could not be processed.
+
+    '''
+
+    objectind, lcfile, vartype, varparams, options = task
+
+    try:
+
+        seed = options['seed']
+
+        # 1. make the fake LC
+        lcdict = generation.make_fakelc(
+            lcfile,
+            None,
+            magrms=options['magrms'],
+            randomizemags=options['randomizemags'],
+            randomizecoords=options['randomizecoords'],
+            lcformat=options['lcformat'],
+            lcformatdir=options['lcformatdir'],
+            timecols=options['timecols'],
+            magcols=options['magcols'],
+            errcols=options['errcols'],
+            rng=generation.get_fakelc_rng(seed,
+                                          generation.FAKELC_STREAM,
+                                          objectind)
+        )
+        if lcdict is None:
+            return None
+
+        # 2. add the variability and noise
+        times = np.asarray(lcdict[lcdict['timecols'][0]], dtype=np.float64)
+
+        if vartype is not None:
+            varparams = generation._rescale_variability_times(
+                varparams,
+                np.array([times.min()]),
+                np.array([times.max()])
+            )
+            model = generation.variability_model_batch(times, varparams)[0]
+        else:
+            model = np.zeros_like(times)
+
+        generation._apply_fakelc_variability(lcdict, model, vartype,
+                                             varparams, 0, seed, objectind)
+
+        # 3. get the variability features and run the period-finders
+        lcfeatures, pfresults = {}, {}
+
+        for tcol, mcol, ecol in zip(lcdict['timecols'],
+                                    lcdict['magcols'],
+                                    lcdict['errcols']):
+
+            ntimes, nmags = normalize_magseries(
+                lcdict[tcol],
+                np.array(lcdict[mcol], copy=True),
+                magsarefluxes=options['magsarefluxes']
+            )
+            nerrs = lcdict[ecol]
+
+            finind = (np.isfinite(ntimes) &
+                      np.isfinite(nmags) &
+                      np.isfinite(nerrs))
+
+            if nmags[finind].size < options['mindet']:
+
+                LOGINFO('not enough LC points: %s in normalized %s LC: %s' %
+                        (nmags[finind].size, mcol, lcdict['objectid']))
+                lcfeatures[mcol] = None
+                pfresults[mcol] = {}
+                continue
+
+            features = varfeatures.all_nonperiodic_features(ntimes,
+                                                            nmags,
+                                                            nerrs)
+            lcfeatures[mcol] = {x:features.get(x)
+                                for x in INJREC_VARFEATURES}
+
+            pfresults[mcol] = {'pfmethods':[]}
+
+            for pfmind, (pfm, pfkw) in enumerate(zip(options['pfmethods'],
+                                                     options['pfkwargs'])):
+
+                pf_kwargs = dict(pfkw)
+                pf_kwargs.update({'verbose':False,
+                                  'nworkers':options['nperiodworkers'],
+                                  'magsarefluxes':options['magsarefluxes'],
+                                  'sigclip':options['sigclip']})
+
+                pfmkey = '%s-%s' % (pfmind, pfm)
+                pfresults[mcol][pfmkey] = periodsearch.PFMETHODS[pfm](
+                    ntimes, nmags, nerrs,
+                    **pf_kwargs
+                )
+                pfresults[mcol]['pfmethods'].append(pfmkey)
+
+        # 4. check the recovered periods
+        row = {
+            'objectind':objectind,
+            'objectid':lcdict['objectid'],
+            'inputlc':lcfile,
+            'sdssr':lcdict['objectinfo']['sdssr'],
+            'ndet':lcdict['objectinfo']['ndet'],
+            'magcols':lcdict['magcols'],
+            'actual_vartype':lcdict['actual_vartype'],
+            'actual_varperiod':lcdict['actual_varperiod'],
+            'actual_varamplitude':lcdict['actual_varamplitude'],
+            'actual_varparams':lcdict['actual_varparams'],
+            'actual_moments':lcdict['moments'],
+            'varfeatures':lcfeatures,
+        }
+        row.update(
+            _get_periodrec_status(pfresults,
+                                  lcdict['magcols'],
+                                  lcdict['actual_vartype'],
+                                  lcdict['actual_varperiod'],
+                                  period_tolerance=options['period_tolerance'])
+        )
+
+        return row
+
+    except Exception:
+
+        LOGEXCEPTION('injection-recovery failed for object %s, LC: %s' %
+                     (objectind, lcfile))
+        return None
+
+
+def _write_injrec_checkpoint(checkpoint, checkpointfile):
+    '''This writes the injection-recovery checkpoint pickle safely.
+
+    '''
+
+    tempoutf = '%s.tmp-%s' % (checkpointfile, os.getpid())
+    with open(tempoutf, 'wb') as outfd:
+        pickle.dump(checkpoint, outfd, pickle.HIGHEST_PROTOCOL)
+    os.replace(tempoutf, checkpointfile)
+
+
+def _has_recovery_status(row, status):
+    '''This checks if any best recovered period of a row has the status.
+
+    '''
+
+    return any(status in x.split(',') for x in row['best_recovered_status'])
+
+
+def run_injection_recovery(lclist,
+                           outdir,
+                           magrmsfrom,
+                           magrms_interpolate='quadratic',
+                           magrms_fillvalue='extrapolate',
+                           maxlcs=25000,
+                           maxvars=2000,
+                           randomizemags=True,
+                           randomizecoords=False,
+                           vartypes=('EB','RRab','RRc','cepheid',
+                                     'rotator','flare','HADS',
+                                     'planet','LPV'),
+                           override_paramdists=None,
+                           lcformat='hat-sql',
+                           lcformatdir=None,
+                           timecols=None,
+                           magcols=None,
+                           errcols=None,
+                           mindet=1000,
+                           pfmethods=('gls','pdm','bls'),
+                           pfkwargs=({},{},{'startp':1.0,
+                                            'maxtransitduration':0.3}),
+                           sigclip=5.0,
+                           period_tolerance=1.0e-3,
+                           seed=generation.RANDSEED,
+                           checkpoint_every=100,
+                           nworkers=None,
+                           nperiodworkers=1):
+    '''This runs an injection-recovery simulation without intermediate files.
+
+    This does the same thing as running
+    `fakelcs.generation.make_fakelc_collection`,
+    `fakelcs.generation.add_variability_to_fakelc_collection_batch`,
+    `get_varfeatures`, `run_periodfinding`, and `parallel_periodicvar_recovery`
+    one after the other, but each object goes through all of these stages in
+    memory in a single worker task (`injection_recovery_worker`), and only a
+    summary row for each object is kept. For the same `seed`, the objects, their
+    variability, and their noise are the same as those made by the first two
+    functions.
+
+    The summary rows are written to a checkpoint pickle in `outdir` every
+    `checkpoint_every` objects. If this function is called again with the same
+    simulation settings, objects already in the checkpoint are skipped, so long
+    runs can be resumed after they're interrupted.
+
+    Parameters
+    ----------
+
+    lclist : list of str
+        The input LCs to use as the time bases of the fake LCs.
+
+    outdir : str
+        The directory where the checkpoint and final result pickles will be
+        written.
+
+    magrmsfrom : str or dict
+        The mag-RMS relation to use. The `magrmsfrom`, `magrms_interpolate`,
+        `magrms_fillvalue`, `maxlcs`, `maxvars`, `randomizemags`,
+        `randomizecoords`, and `vartypes` kwargs set up the fake LC collection
+        as in `fakelcs.generation.make_fakelc_collection`.
+
+    override_paramdists : dict or None
+        This overrides the variability parameter distributions. See
+        `fakelcs.generation.add_variability_to_fakelc_collection_batch`.
+
+    lcformat : str
+        The `formatkey` of the input LCs. This, `lcformatdir`, `timecols`,
+        `magcols`, and `errcols` are used as in
+        `fakelcs.generation.make_fakelc_collection`.
+
+    mindet : int
+        The minimum number of detections needed to get the variability features
+        and run the period-finders for a magcol.
+
+    pfmethods : sequence of str
+        The period-finders to run. These must be in the
+        `lcproc.periodsearch.PFMETHODS` dict. The `pfkwargs` and `sigclip`
+        kwargs are used as in `run_periodfinding`.
+
+    period_tolerance : float
+        The maximum difference between the actual period (or its aliases) and
+        a recovered period to consider it as a 'recovered' period.
+
+    seed : int
+        The seed of the simulation.
+
+    checkpoint_every : int
+        The number of objects to process between checkpoint writes.
+
+    nworkers : int or None
+        The number of parallel workers to use. If None, uses all CPUs.
+
+    nperiodworkers : int
+        The number of parallel workers each period-finder uses. The default is 1
+        because the objects themselves are processed in parallel.
+
+    Returns
+    -------
+
+    dict
+        Returns a dict of the same form as the one produced by
+        `parallel_periodicvar_recovery`, with the summary row of each object in
+        its 'details' key. This is also written to
+        `outdir/injection-recovery.pkl`.
+
+    '''
+
+    try:
+        formatinfo = lcproc.get_lcformat(lcformat,
+                                         use_lcformat_dir=lcformatdir)
+        if formatinfo:
+            (fileglob, readerfunc,
+             dtimecols, dmagcols, derrcols,
+             magsarefluxes, normfunc) = formatinfo
+        else:
+            LOGERROR("can't figure out the light curve format")
+            return None
+    except Exception:
+        LOGEXCEPTION("can't figure out the light curve format")
+        return None
+
+    if timecols is None:
+        timecols = dtimecols
+    if magcols is None:
+        magcols = dmagcols
+    if errcols is None:
+        errcols = derrcols
+
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+
+    # choose the objects and variables in the same way as
+    # make_fakelc_collection
+    rng = generation.get_fakelc_rng(seed, generation.COLLECTION_STREAM)
+    chosenlcs = rng.choice(np.array(lclist),
+                           min(maxlcs, len(lclist)),
+                           replace=False)
+    isvariableind = rng.integers(0, high=chosenlcs.size, size=maxvars)
+    vartypeind = rng.integers(0, high=len(vartypes), size=maxvars)
+
+    isvariable = np.full(chosenlcs.size, False, dtype=bool)
+    isvariable[isvariableind] = True
+    objectvartypes = np.full(chosenlcs.size, None, dtype=object)
+    objectvartypes[isvariable] = [
+        vartypes[x] for x in vartypeind[:isvariable.sum()]
+    ]
+
+    varparams, varparamrows = generation._draw_collection_variability_params(
+        objectvartypes,
+        override_paramdists=override_paramdists,
+        magsarefluxes=magsarefluxes,
+        seed=seed
+    )
+
+    # this identifies the simulation for the checkpoint
+    runinfo = {'seed':seed,
+               'lcfiles':chosenlcs.tolist(),
+               'vartypes':objectvartypes.tolist(),
+               'magcols':list(magcols),
+               'mindet':mindet,
+               'pfmethods':list(pfmethods),
+               'pfkwargs':[dict(x) for x in pfkwargs],
+               'sigclip':sigclip,
+               'period_tolerance':period_tolerance}
+
+    checkpointfile = os.path.join(outdir, 'injection-recovery-checkpoint.pkl')
+
+    if os.path.exists(checkpointfile):
+
+        with open(checkpointfile, 'rb') as infd:
+            checkpoint = pickle.load(infd)
+
+        if checkpoint['runinfo'] != runinfo:
+            LOGERROR('the checkpoint in %s is for a different simulation, '
+                     'remove it or use a different outdir' % checkpointfile)
+            return None
+
+        LOGINFO('resuming from checkpoint: %s with %s objects done' %
+                (checkpointfile, len(checkpoint['rows'])))
+
+    else:
+        checkpoint = {'runinfo':runinfo, 'rows':{}}
+
+    options = {'seed':seed,
+               'magrms':generation._get_collection_magrms(
+                   magrmsfrom,
+                   magcols,
+                   magrms_interpolate=magrms_interpolate,
+                   magrms_fillvalue=magrms_fillvalue
+               ),
+               'randomizemags':randomizemags,
+               'randomizecoords':randomizecoords,
+               'lcformat':lcformat,
+               'lcformatdir':lcformatdir,
+               'timecols':timecols,
+               'magcols':magcols,
+               'errcols':errcols,
+               'magsarefluxes':magsarefluxes,
+               'mindet':mindet,
+               'pfmethods':pfmethods,
+               'pfkwargs':pfkwargs,
+               'sigclip':sigclip,
+               'period_tolerance':period_tolerance,
+               'nperiodworkers':nperiodworkers}
+
+    tasks = []
+    for objectind, (lcf, vartype) in enumerate(zip(chosenlcs,
+                                                   objectvartypes)):
+
+        if objectind in checkpoint['rows']:
+            continue
+
+        if vartype is None:
+            objparams = None
+        else:
+            objparams = generation._slice_variability_params(
+                varparams[vartype], [varparamrows[objectind]]
+            )
+
+        tasks.append((objectind, lcf, vartype, objparams, options))
+
+    LOGINFO('running injection-recovery for %s objects, %s already done' %
+            (len(tasks), len(checkpoint['rows'])))
+
+    # the period-finders start their own worker pools, so we use a
+    # ProcessPoolExecutor like lcproc.periodsearch.parallel_pf
+    with ProcessPoolExecutor(max_workers=nworkers) as executor:
+
+        futures = [executor.submit(injection_recovery_worker, x)
+                   for x in tasks]
+
+        for ndone, future in enumerate(as_completed(futures)):
+
+            row = future.result()
+            if row is not None:
+                checkpoint['rows'][row['objectind']] = row
+
+            if (ndone + 1) % checkpoint_every == 0:
+                _write_injrec_checkpoint(checkpoint, checkpointfile)
+
+    _write_injrec_checkpoint(checkpoint, checkpointfile)
+
+    # collect the results in object order
+    rows = [checkpoint['rows'][x] for x in sorted(checkpoint['rows'])]
+
+    outdict = {
+        'outdir':os.path.abspath(outdir),
+        'checkpoint':checkpointfile,
+        'objectids':[x['objectid'] for x in rows],
+        'period_tolerance':period_tolerance,
+        'actual_periodicvars':np.array(
+            [x['objectid'] for x in rows
+             if x['actual_vartype'] in PERIODIC_VARTYPES],
+            dtype=np.unicode_
+        ),
+        'recovered_periodicvars':np.array(
+            [x['objectid'] for x in rows
+             if _has_recovery_status(x, 'actual')],
+            dtype=np.unicode_
+        ),
+        'alias_twice_periodicvars':np.array(
+            [x['objectid'] for x in rows
+             if _has_recovery_status(x, 'twice')],
+            dtype=np.unicode_
+        ),
+        'alias_half_periodicvars':np.array(
+            [x['objectid'] for x in rows
+             if _has_recovery_status(x, 'half')],
+            dtype=np.unicode_
+        ),
+        'details':{x['objectid']:x for x in rows},
+    }
+
+    outfile = os.path.join(outdir, 'injection-recovery.pkl')
+    with open(outfile, 'wb') as outfd:
+        pickle.dump(outdict, outfd, pickle.HIGHEST_PROTOCOL)
+
+    return outdict
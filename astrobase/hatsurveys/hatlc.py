@@ -172,6 +172,10 @@ import json
 from pprint import pformat
 import sys
 import textwrap
+from urllib.parse import quote
+from io import StringIO
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 from numpy import nan
@@ -543,13 +547,120 @@ def _validate_sqlitecurve_filters(filterstring, lccolumns):
         return filterstring
 
 
+def _open_sqlitecurve(lcfile, inmemory=True):
+    '''This opens a sqlitecurve for reading.
+
+    Gzipped sqlitecurves are decompressed into memory and loaded with SQLite's
+    deserialize API if `inmemory` is True and the sqlite3 module supports it
+    (Python >= 3.11). Otherwise, they're uncompressed next to the original
+    file and must be recompressed with `_compress_sqlitecurve` after
+    reading. Uncompressed sqlitecurves are opened read-only.
+
+    Parameters
+    ----------
+
+    lcfile : str
+        The path to the HAT sqlitecurve file.
+
+    inmemory : bool
+        If True, will not write an uncompressed copy of a gzipped sqlitecurve
+        to disk if possible.
+
+    Returns
+    -------
+
+    tuple : (db, lcf)
+        `db` is the sqlite3 connection to the sqlitecurve. `lcf` is the path
+        to the uncompressed sqlitecurve if one was written to disk and None
+        otherwise.
+
+    '''
+
+    if '.gz' in lcfile[-4:]:
+
+        if inmemory and hasattr(sql.Connection, 'deserialize'):
+
+            with gzip.open(lcfile,'rb') as infd:
+                lcbytes = infd.read()
+
+            db = sql.connect(':memory:')
+            db.deserialize(lcbytes)
+            db.execute('pragma query_only = 1')
+            return db, None
+
+        else:
+
+            lcf = _uncompress_sqlitecurve(lcfile)
+            return sql.connect(lcf), lcf
+
+    else:
+
+        lcuri = 'file:%s?mode=ro' % quote(os.path.abspath(lcfile))
+        return sql.connect(lcuri, uri=True), None
+
+
+def _fetch_sqlitecurve_columns(cur, query, columns):
+    '''This runs a sqlitecurve query and returns the result as column arrays.
+
+    The rows are transposed into columns once. Columns that are floats in
+    `COLUMNDEFS` are converted to float64 arrays by numpy directly, which turns
+    NULLs into nans. Other columns are only scanned for NULLs element by
+    element if they actually contain any.
+
+    Parameters
+    ----------
+
+    cur : sqlite3.Cursor
+        The cursor to use for the query.
+
+    query : str
+        The query to run. This must select the columns in `columns` in order.
+
+    columns : list of str
+        The names of the columns returned by the query.
+
+    Returns
+    -------
+
+    tuple : (coldict, nrows)
+        `coldict` is a dict with the column names as keys and np.arrays as
+        values. `nrows` is the number of rows returned by the query.
+
+    '''
+
+    cur.execute(query)
+    rows = cur.fetchall()
+    nrows = len(rows)
+
+    if nrows == 0:
+        return {x:np.array([]) for x in columns}, 0
+
+    coldict = {}
+
+    for column, col in zip(columns, zip(*rows)):
+
+        coldef = COLUMNDEFS.get(column.split('_')[0])
+
+        if coldef is not None and coldef[2] is float:
+            colarr = np.array(col, dtype=np.float64)
+        elif None in col:
+            colarr = np.array([x if x is not None else nan for x in col])
+        else:
+            colarr = np.array(col)
+
+        coldict[column] = colarr
+
+    return coldict, nrows
+
+
 def read_and_filter_sqlitecurve(lcfile,
                                 columns=None,
                                 sqlfilters=None,
                                 raiseonfail=False,
                                 returnarrays=True,
                                 forcerecompress=False,
-                                quiet=True):
+                                quiet=True,
+                                inmemory=True):
     '''This reads a HAT sqlitecurve and optionally filters it.
 
     Parameters
@@ -588,6 +699,13 @@ def read_and_filter_sqlitecurve(lcfile,
         reading fails (the only clue then will be the return value of
         None). Useful for batch processing of many many light curves.
 
+    inmemory : bool
+        If True and the sqlitecurve is gzipped, it will be decompressed into
+        memory and read from there instead of being uncompressed to disk and
+        recompressed after reading. This requires Python >= 3.11; older
+        versions fall back to uncompressing to disk. Uncompressed
+        sqlitecurves are always opened read-only.
+
     Returns
     -------
 
@@ -597,16 +715,14 @@ def read_and_filter_sqlitecurve(lcfile,
 
     '''
 
+    db, lcf = None, None
+
     # we're proceeding with reading the LC...
     try:
 
-        # if this file is a gzipped sqlite3 db, then gunzip it
-        if '.gz' in lcfile[-4:]:
-            lcf = _uncompress_sqlitecurve(lcfile)
-        else:
-            lcf = lcfile
-
-        db = sql.connect(lcf)
+        # if this file is a gzipped sqlite3 db, then gunzip it, in memory if
+        # possible
+        db, lcf = _open_sqlitecurve(lcfile, inmemory=inmemory)
         cur = db.cursor()
 
         # get the objectinfo from the sqlitecurve
@@ -654,7 +770,7 @@ def read_and_filter_sqlitecurve(lcfile,
         # bail out if there's a problem and tell the user what happened
         if not proceed:
             # recompress the lightcurve at the end
-            if '.gz' in lcfile[-4:] and lcf:
+            if lcf:
                 _compress_sqlitecurve(lcf, force=forcerecompress)
             LOGERROR('requested columns are invalid!')
             return None, "requested columns are invalid"
@@ -711,26 +827,40 @@ def read_and_filter_sqlitecurve(lcfile,
                 lcsortcol
             )
 
-        cur.execute(query)
-        lightcurve = cur.fetchall()
+        # get the columns as arrays directly if that's set
+        if returnarrays:
 
-        if lightcurve and len(lightcurve) > 0:
+            lightcurve, ndet = _fetch_sqlitecurve_columns(cur,
+                                                          query,
+                                                          columns)
 
-            lightcurve = list(zip(*lightcurve))
-            lcdict.update({x:y for (x,y) in zip(lcdict['columns'],
-                                                lightcurve)})
+        else:
+
+            cur.execute(query)
+            lightcurve = cur.fetchall()
+            ndet = len(lightcurve)
+
+            if ndet > 0:
+                lightcurve = dict(zip(columns, zip(*lightcurve)))
+
+        if ndet > 0:
+
+            lcdict.update(lightcurve)
             lcok = True
 
             # update the ndet after filtering
-            lcdict['objectinfo']['ndet'] = len(lightcurve[0])
+            lcdict['objectinfo']['ndet'] = ndet
 
         else:
             LOGWARNING('LC for %s has no detections' % lcdict['objectid'])
 
             # fill the lightcurve with empty lists to indicate that it is empty
-            lcdict.update({x:y for (x,y) in
-                           zip(lcdict['columns'],
-                               [[] for x in lcdict['columns']])})
+            if returnarrays:
+                lcdict.update(lightcurve)
+            else:
+                lcdict.update({x:y for (x,y) in
+                               zip(lcdict['columns'],
+                                   [[] for x in lcdict['columns']])})
             lcok = False
 
         # generate the returned lcdict and status message
@@ -746,15 +876,9 @@ def read_and_filter_sqlitecurve(lcfile,
         returnval = (lcdict, statusmsg)
 
         # recompress the lightcurve at the end
-        if '.gz' in lcfile[-4:] and lcf:
+        if lcf:
             _compress_sqlitecurve(lcf, force=forcerecompress)
 
-        # return ndarrays if that's set
-        if returnarrays:
-            for column in lcdict['columns']:
-                lcdict[column] = np.array([x if x is not None else np.nan
-                                           for x in lcdict[column]])
-
     except Exception:
 
         if not quiet:
@@ -763,12 +887,17 @@ def read_and_filter_sqlitecurve(lcfile,
         returnval = (None, 'error while reading lightcurve file')
 
         # recompress the lightcurve at the end
-        if '.gz' in lcfile[-4:] and lcf:
+        if lcf:
             _compress_sqlitecurve(lcf, force=forcerecompress)
 
         if raiseonfail:
             raise
 
+    finally:
+
+        if db is not None:
+            db.close()
+
     return returnval
 
 
@@ -1100,6 +1229,132 @@ def _parse_csv_header(header):
     return metadict
 
 
+# this caches the column casters for each list of CSV LC columns seen so far
+_CSVLC_SCHEMAS = {}
+
+
+def _get_csvlc_schema(columns):
+    '''This returns the casters to use for a list of CSV LC columns.
+
+    The casters are looked up in `COLUMNDEFS` once for each distinct list of
+    columns (i.e. LC format version) and cached after that.
+
+    Parameters
+    ----------
+
+    columns : list of str
+        The columns in the CSV LC as listed in its header.
+
+    Returns
+    -------
+
+    tuple
+        A tuple of (column, caster) tuples. The caster is None for columns that
+        have no definition in `COLUMNDEFS`.
+
+    '''
+
+    columns = tuple(columns)
+
+    if columns not in _CSVLC_SCHEMAS:
+
+        schema = []
+
+        for col in columns:
+
+            if (col.split('_')[0] in LC_MAG_COLUMNS or
+                col.split('_')[0] in LC_ERR_COLUMNS or
+                col.split('_')[0] in LC_FLAG_COLUMNS):
+                schema.append((col, COLUMNDEFS[col.split('_')[0]][2]))
+            elif col in COLUMNDEFS:
+                schema.append((col, COLUMNDEFS[col][2]))
+            else:
+                schema.append((col, None))
+
+        _CSVLC_SCHEMAS[columns] = tuple(schema)
+
+    return _CSVLC_SCHEMAS[columns]
+
+
+def _cast_csvlc_column(values, caster):
+    '''This converts a column of CSV LC strings to an np.array.
+
+    The whole column is converted by numpy at once. If that fails because a
+    value doesn't match the column's type (e.g. an empty string in a float
+    column), this falls back to `_smartcast` for each value.
+
+    '''
+
+    if caster is str:
+        return np.array(values)
+
+    try:
+        return np.array(values, dtype=np.float64 if caster is float else caster)
+    except (TypeError, ValueError):
+        return np.array([_smartcast(x, caster) for x in values])
+
+
+# the numpy dtypes to use for the CSV LC column casters when loading all
+# columns at once. other columns are loaded as Python objects first
+CSVLC_DTYPES = {float:'f8', int:'i8'}
+
+
+def _load_csvlc_columns(lctext, schema, delimiter=','):
+    '''This loads the data section of a CSV LC into typed columns.
+
+    The data section is parsed with a single `np.loadtxt` call using a
+    structured dtype made from the column casters in `schema`. If a value
+    doesn't match its column type, this converts each column with
+    `_cast_csvlc_column` instead.
+
+    Parameters
+    ----------
+
+    lctext : str
+        The data section of the CSV LC.
+
+    schema : tuple
+        The (column, caster) tuples from `_get_csvlc_schema`.
+
+    delimiter : str
+        The column separator.
+
+    Returns
+    -------
+
+    dict
+        A dict with the column names as keys and np.arrays as values. Columns
+        without a caster are not included.
+
+    '''
+
+    dtype = [(col, CSVLC_DTYPES.get(caster, 'O')) for col, caster in schema]
+
+    try:
+
+        lcdata = np.loadtxt(StringIO(lctext),
+                            delimiter=delimiter,
+                            dtype=dtype,
+                            comments=None,
+                            ndmin=1)
+
+        return {
+            col:(np.ascontiguousarray(lcdata[col]) if caster in CSVLC_DTYPES
+                 else lcdata[col].astype(str))
+            for col, caster in schema if caster is not None
+        }
+
+    except ValueError:
+
+        lccolumns = [x.split(delimiter) for x in lctext.split('\n')
+                     if len(x) > 0]
+        lccolumns = list(zip(*lccolumns))
+
+        return {col:_cast_csvlc_column(lccolumns[colind], caster)
+                for colind, (col, caster) in enumerate(schema)
+                if caster is not None}
+
+
 ##################################
 ## READING LC CSV FORMAT LCC V1 ##
 ##################################
@@ -1185,18 +1440,35 @@ def read_lcc_csvlc(lcfile):
         colnum.append(coldef['colnum'])
         coldtypes.append(coldef['dtype'])
 
-    coldtypes = ','.join(coldtypes)
-
-    # read in the LC
-    recarr = np.genfromtxt(
-        lclines,
-        comments=commentchar,
-        delimiter=separator,
-        usecols=colnum,
-        autostrip=True,
-        names=colnames,
-        dtype=coldtypes
-    )
+    # read in the LC with a single pass of the fast numpy parser if possible,
+    # then fall back to np.genfromtxt to handle any missing values
+    try:
+
+        recarr = np.loadtxt(
+            lclines,
+            comments=commentchar,
+            delimiter=separator,
+            usecols=colnum,
+            dtype=list(zip(colnames, coldtypes)),
+            ndmin=1
+        )
+
+        # np.genfromtxt strips whitespace from the string columns
+        recarr = {x:(np.char.strip(recarr[x])
+                     if recarr.dtype[x].kind == 'U' else recarr[x])
+                  for x in colnames}
+
+    except ValueError:
+
+        recarr = np.genfromtxt(
+            lclines,
+            comments=commentchar,
+            delimiter=separator,
+            usecols=colnum,
+            autostrip=True,
+            names=colnames,
+            dtype=','.join(coldtypes)
+        )
 
     lcdict = {x:recarr[x] for x in colnames}
     lcdict['lcformat'] = lcformat
@@ -1309,59 +1581,155 @@ def read_csvlc(lcfile):
 
     '''
 
-    # read in the file and split by lines
+    # open the file as a text stream, gzip streams are read directly
     if '.gz' in os.path.basename(lcfile):
         LOGINFO('reading gzipped HATLC: %s' % lcfile)
-        infd = gzip.open(lcfile,'rb')
+        infd = gzip.open(lcfile,'rt')
     else:
         LOGINFO('reading HATLC: %s' % lcfile)
-        infd = open(lcfile,'rb')
+        infd = open(lcfile,'r')
 
-    # this transparently reads LCC CSVLCs
-    lcformat_check = infd.read(12).decode()
-    if 'LCC-CSVLC' in lcformat_check:
-        infd.close()
-        return read_lcc_csvlc(lcfile)
-    else:
-        infd.seek(0)
+    with infd:
 
-    # below is reading the HATLC v2 CSV LCs
+        # this transparently reads LCC CSVLCs
+        lcformat_check = infd.read(12)
+        if 'LCC-CSVLC' in lcformat_check:
+            infd.close()
+            return read_lcc_csvlc(lcfile)
+        else:
+            infd.seek(0)
 
-    lctext = infd.read().decode()  # argh Python 3
-    infd.close()
+        # below is reading the HATLC v2 CSV LCs
 
-    # figure out the header and get the LC columns
-    lcstart = lctext.index('# LIGHTCURVE\n')
-    lcheader = lctext[:lcstart+12]
-    lccolumns = lctext[lcstart+13:].split('\n')
-    lccolumns = [x for x in lccolumns if len(x) > 0]
+        # read the header up to the start of the LC
+        headerlines = []
+        for line in iter(infd.readline, ''):
+            headerlines.append(line)
+            if line == '# LIGHTCURVE\n':
+                break
+        else:
+            raise ValueError('no LIGHTCURVE section found in %s' % lcfile)
+
+        # initialize the lcdict and parse the CSV header
+        lcdict = _parse_csv_header(''.join(headerlines)[:-1])
+        schema = _get_csvlc_schema(lcdict['columns'])
+
+        # read all of the LC columns at once
+        lcdict.update(_load_csvlc_columns(infd.read(), schema))
+
+    for col, caster in schema:
+        if caster is None:
+            LOGWARNING('lcdict col %s has no formatter available' % col)
+
+    return lcdict
+
+
+#################################
+## READING MANY LCS IN A BATCH ##
+#################################
 
-    # initialize the lcdict and parse the CSV header
-    lcdict = _parse_csv_header(lcheader)
+def _read_hatlc_worker(task):
+    '''This reads a single HAT LC of any format for `read_hatlc_batch`.
 
-    # tranpose the LC rows into columns
-    lccolumns = [x.split(',') for x in lccolumns]
-    lccolumns = list(zip(*lccolumns))  # argh more Python 3
+    task[0] = lcfile
+    task[1] = columns
+    task[2] = sqlfilters
+    task[3] = quiet
 
-    # write the columns to the dict
-    for colind, col in enumerate(lcdict['columns']):
+    '''
+
+    lcfile, columns, sqlfilters, quiet = task
 
-        if (col.split('_')[0] in LC_MAG_COLUMNS or
-            col.split('_')[0] in LC_ERR_COLUMNS or
-            col.split('_')[0] in LC_FLAG_COLUMNS):
-            lcdict[col] = np.array([_smartcast(x,
-                                               COLUMNDEFS[col.split('_')[0]][2])
-                                    for x in lccolumns[colind]])
+    try:
 
-        elif col in COLUMNDEFS:
-            lcdict[col] = np.array([_smartcast(x,COLUMNDEFS[col][2])
-                                    for x in lccolumns[colind]])
+        if '.sqlite' in os.path.basename(lcfile):
+
+            lcdict, msg = read_and_filter_sqlitecurve(lcfile,
+                                                      columns=columns,
+                                                      sqlfilters=sqlfilters,
+                                                      quiet=quiet)
 
         else:
-            LOGWARNING('lcdict col %s has no formatter available' % col)
-            continue
 
-    return lcdict
+            lcdict = read_csvlc(lcfile)
+
+            if lcdict is not None and columns is not None:
+                for col in set(lcdict['columns']) - set(columns):
+                    lcdict.pop(col, None)
+                lcdict['columns'] = [x for x in lcdict['columns']
+                                     if x in columns]
+
+        return lcfile, lcdict
+
+    except Exception:
+
+        if not quiet:
+            LOGEXCEPTION('could not read HAT LC: %s' % lcfile)
+
+        return lcfile, None
+
+
+def read_hatlc_batch(lcfiles,
+                     columns=None,
+                     sqlfilters=None,
+                     nworkers=4,
+                     quiet=True):
+    '''This reads many HAT LCs of any format and streams back their lcdicts.
+
+    The LCs are read by a pool of threads so that reading and decompressing
+    the files overlaps with parsing them. Both the sqlite3 and gzip modules
+    release the GIL while they work. The CSV LC column casters are looked up
+    once for each LC format version and numpy converts whole columns at a
+    time, falling back to per-value casting only for columns with values that
+    don't match their type.
+
+    Parameters
+    ----------
+
+    lcfiles : list of str
+        The HAT sqlitecurves (.sqlite or .sqlite.gz), HAT data server CSV LCs,
+        or LCC-Server CSV LCs to read. These can be mixed.
+
+    columns : list of str or None
+        The LC columns to return for each object. If None, returns all of
+        them.
+
+    sqlfilters : str or None
+        The SQL filters to apply to sqlitecurves. See
+        `read_and_filter_sqlitecurve`. These are ignored for CSV LCs.
+
+    nworkers : int
+        The number of threads to use.
+
+    quiet : bool
+        If True, will not log the reason if an LC can't be read.
+
+    Yields
+    ------
+
+    tuple : (lcfile, lcdict)
+        The lcdicts are returned in the same order as `lcfiles`. `lcdict` is
+        None if the LC could not be read. At most `2*nworkers` LCs are read
+        ahead of the one being returned, so this can go through many
+        thousands of LCs without keeping them all in memory.
+
+    '''
+
+    tasks = ((x, columns, sqlfilters, quiet) for x in lcfiles)
+
+    with ThreadPoolExecutor(max_workers=nworkers) as executor:
+
+        pending = deque()
+
+        for task in tasks:
+
+            pending.append(executor.submit(_read_hatlc_worker, task))
+
+            if len(pending) >= 2*nworkers:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
 
 
 ##########################
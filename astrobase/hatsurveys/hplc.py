@@ -56,6 +56,7 @@ import glob
 import shutil
 import multiprocessing as mp
 import pickle
+from io import StringIO
 
 import numpy as np
 
@@ -105,6 +106,9 @@ COLDEFS = [('rjd',float),   # The reduced Julian date
            ('iep2',float),  # EPD magnitude for aperture 2
            ('iep3',float)]  # EPD magnitude for aperture 3
 
+# these are the dtypes used to parse the column types in COLDEFS
+TEXTLC_DTYPES = {float:'f8', str:'O'}
+
 # these are the mag columns
 MAGCOLS = ['ifl1','irm1','iep1','itf1',
            'ifl2','irm2','iep2','itf2',
@@ -115,6 +119,48 @@ MAGCOLS = ['ifl1','irm1','iep1','itf1',
 ## READING AND WRITING TEXT LCS ##
 ##################################
 
+def _load_hatpi_textlc_columns(lctext, coldefs):
+    '''This loads the text of a HATPI text LC into typed columns.
+
+    The text is parsed with a single `np.loadtxt` call using a structured dtype
+    made from the column types in `coldefs`. If this fails, the lines are split
+    and each value is converted with its column type instead.
+
+    Returns a dict with the column names as keys and np.arrays as values, and
+    the number of detections.
+
+    '''
+
+    dtype = [(col, TEXTLC_DTYPES[coltype]) for col, coltype in coldefs]
+
+    try:
+
+        lcdata = np.loadtxt(StringIO(lctext),
+                            dtype=dtype,
+                            comments='#',
+                            ndmin=1)
+
+        lccols = {
+            col:(np.ascontiguousarray(lcdata[col]) if coltype is float
+                 else lcdata[col].astype(str))
+            for col, coltype in coldefs
+        }
+        return lccols, lcdata.size
+
+    except ValueError:
+
+        LOGWARNING('could not parse the LC with np.loadtxt, '
+                   'falling back to converting each value')
+
+    lclines = [x.split() for x in lctext.split('\n')
+               if ('#' not in x and len(x.strip()) > 0)]
+    lccols = list(zip(*lclines))
+
+    return ({x[0]:np.array([x[1](y) for y in z])
+             for (x,z) in zip(coldefs, lccols)},
+            len(lclines))
+
+
 def read_hatpi_textlc(lcfile):
     '''
     This reads in a textlc that is complete up to the TFA stage.
@@ -127,30 +173,22 @@ def read_hatpi_textlc(lcfile):
         thiscoldefs = COLDEFS + [('itf2',float)]
     elif 'TF3' in lcfile:
         thiscoldefs = COLDEFS + [('itf3',float)]
+    else:
+        thiscoldefs = COLDEFS
 
     LOGINFO('reading %s' % lcfile)
 
     if lcfile.endswith('.gz'):
-        infd = gzip.open(lcfile,'r')
+        infd = gzip.open(lcfile,'rb')
     else:
-        infd = open(lcfile,'r')
+        infd = open(lcfile,'rb')
 
     with infd:
 
-        lclines = infd.read().decode().split('\n')
-        lclines = [x.split() for x in lclines if ('#' not in x and len(x) > 0)]
-        ndet = len(lclines)
-
-        if ndet > 0:
+        lcdict, ndet = _load_hatpi_textlc_columns(infd.read().decode(),
+                                                  thiscoldefs)
 
-            lccols = list(zip(*lclines))
-            lcdict = {x[0]:y for (x,y) in zip(thiscoldefs, lccols)}
-
-            # convert to ndarray
-            for col in thiscoldefs:
-                lcdict[col[0]] = np.array([col[1](x) for x in lcdict[col[0]]])
-
-        else:
+        if ndet == 0:
 
             lcdict = {}
             LOGWARNING('no detections in %s' % lcfile)
@@ -173,16 +211,19 @@ def read_hatpi_textlc(lcfile):
         }
 
         # break out the {stationid}-{framenum}{framesub}_{ccdnum} framekey
-        # into separate columns
+        # into separate columns. the regex always matches digits for these, so
+        # they can be converted as whole columns
         framekeyelems = FRAMEREGEX.findall('\n'.join(lcdict['frk']))
 
-        lcdict['stf'] = np.array([(int(x[0]) if x[0].isdigit() else np.nan)
-                                  for x in framekeyelems])
-        lcdict['cfn'] = np.array([(int(x[1]) if x[0].isdigit() else np.nan)
-                                  for x in framekeyelems])
-        lcdict['cfs'] = np.array([x[2] for x in framekeyelems])
-        lcdict['ccd'] = np.array([(int(x[3]) if x[0].isdigit() else np.nan)
-                                  for x in framekeyelems])
+        if framekeyelems:
+            stf, cfn, cfs, ccd = [np.array(x) for x in zip(*framekeyelems)]
+            lcdict['stf'] = stf.astype(np.int64)
+            lcdict['cfn'] = cfn.astype(np.int64)
+            lcdict['cfs'] = cfs
+            lcdict['ccd'] = ccd.astype(np.int64)
+        else:
+            for col in ('stf','cfn','cfs','ccd'):
+                lcdict[col] = np.array([])
 
         # update the column list with these columns
         lcdict['columns'].extend(['stf','cfn','cfs','ccd'])
@@ -261,13 +302,128 @@ def read_hatpi_pklc(lcfile):
 ## CONCATENATING LIGHT CURVES ##
 ################################
 
+def _normalize_textlc_magcols(lcdict):
+    '''
+    This normalizes the mag columns of a text LC to zero and fluxes to one.
+
+    '''
+
+    for col in MAGCOLS:
+
+        if col in lcdict:
+            thismedval = np.nanmedian(lcdict[col])
+
+            # handle fluxes
+            if col in ('ifl1','ifl2','ifl3'):
+                lcdict[col] = lcdict[col] / thismedval
+            # handle mags
+            else:
+                lcdict[col] = lcdict[col] - thismedval
+
+
+def bin_hatpi_textlc(lcdict,
+                     timebinsec,
+                     magcols=None,
+                     minbinelems=7):
+    '''This bins the mag columns of a text LC in time.
+
+    The measurements are put into bins of `timebinsec` seconds starting at the
+    earliest finite time in the LC. The binned time and mag of each bin are the
+    medians of the finite times and mags in the bin. All bins for a column are
+    calculated at once by sorting the measurements by their bin index.
+
+    lcdict is an lcdict produced by read_hatpi_textlc or concatenate_textlcs.
+
+    timebinsec is the size of the time bins in seconds.
+
+    magcols is a list of the columns to bin. If this is None, all of the
+    columns in MAGCOLS that are in the lcdict are binned.
+
+    minbinelems is the minimum number of finite measurements required in a bin
+    to include it in the binned LC.
+
+    Returns a dict with a key for each binned column. Each of these has the
+    same form as the items of lcdict['binned'] generated by read_hatpi_binnedlc:
+    {'times', 'mags', 'errs', 'nbins', 'timebins', 'timebinsec'}. The err of
+    each binned mag is the standard error of the median estimated from the
+    scatter of the mags in its bin: 1.483 x MAD/sqrt(N), where MAD is the
+    median absolute deviation of the bin's mags from the binned mag and N is
+    the number of finite mags in the bin.
+
+    '''
+
+    if magcols is None:
+        magcols = [x for x in MAGCOLS if x in lcdict['columns']]
+
+    times = lcdict['rjd']
+    finitetimes = np.isfinite(times)
+
+    binned = {}
+
+    if not np.any(finitetimes):
+        LOGERROR('no finite times in LC for %s, not binning' %
+                 lcdict['objectid'])
+        return binned
+
+    timebinjd = timebinsec/86400.0
+    mintime = np.min(times[finitetimes])
+
+    for col in magcols:
+
+        finiteind = finitetimes & np.isfinite(lcdict[col])
+        ftimes = times[finiteind]
+        fmags = lcdict[col][finiteind]
+
+        binind = np.floor((ftimes - mintime)/timebinjd).astype(np.int64)
+
+        # sort by bin index and then by value. both orders have the same bin
+        # boundaries, so the medians of each bin are at the same places
+        timeorder = np.lexsort((ftimes, binind))
+        magorder = np.lexsort((fmags, binind))
+
+        bins, binstart, bincount = np.unique(binind[timeorder],
+                                             return_index=True,
+                                             return_counts=True)
+
+        lowmid = binstart + (bincount - 1)//2
+        highmid = binstart + bincount//2
+
+        sortedtimes = ftimes[timeorder]
+        sortedmags = fmags[magorder]
+        binnedtimes = 0.5*(sortedtimes[lowmid] + sortedtimes[highmid])
+        binnedmags = 0.5*(sortedmags[lowmid] + sortedmags[highmid])
+
+        # the MAD of each bin is the median of the absolute deviations of its
+        # mags from the binned mag, found in the same way after sorting the
+        # deviations within each bin
+        sortedbinpos = np.repeat(np.arange(bins.size), bincount)
+        absdevs = np.abs(sortedmags - binnedmags[sortedbinpos])
+        sorteddevs = absdevs[np.lexsort((absdevs, sortedbinpos))]
+        binnedmads = 0.5*(sorteddevs[lowmid] + sorteddevs[highmid])
+        binnederrs = 1.483*binnedmads/np.sqrt(bincount)
+
+        goodbins = bincount >= minbinelems
+
+        binned[col] = {'times':binnedtimes[goodbins],
+                       'mags':binnedmags[goodbins],
+                       'errs':binnederrs[goodbins],
+                       'nbins':np.count_nonzero(goodbins),
+                       'timebins':mintime + bins[goodbins]*timebinjd,
+                       'timebinsec':timebinsec}
+
+    return binned
+
+
 def concatenate_textlcs(lclist,
                         sortby='rjd',
-                        normalize=True):
+                        normalize=True,
+                        dedupe=False,
+                        timebinsec=None,
+                        minbinelems=7):
     '''This concatenates a list of light curves.
 
-    Does not care about overlaps or duplicates. The light curves must all be
-    from the same aperture.
+    Does not care about overlaps or duplicates unless dedupe is True. The light
+    curves must all be from the same aperture.
 
     The intended use is to concatenate light curves across CCDs or instrument
     changes for a single object. These can then be normalized later using
@@ -279,6 +435,15 @@ def concatenate_textlcs(lclist,
     If normalize is True, then each light curve's magnitude columns are
     normalized to zero.
 
+    If dedupe is True, measurements with the same framekey as an earlier
+    measurement in the concatenated light curve are removed, so only the
+    measurement from the first light curve in lclist that has a frame is kept.
+
+    If timebinsec is not None, the concatenated light curve is also binned in
+    time with bin_hatpi_textlc using this bin size in seconds and minbinelems,
+    and the binned columns are added to the lcdict's 'binned' key in the same
+    form as read_hatpi_binnedlc.
+
     The returned lcdict has an extra column: 'lcn' that tracks which measurement
     belongs to which input light curve. This can be used with
     lcdict['concatenated'] which relates input light curve index to input light
@@ -287,81 +452,82 @@ def concatenate_textlcs(lclist,
 
     '''
 
-    # read the first light curve
-    lcdict = read_hatpi_textlc(lclist[0])
-
-    # track which LC goes where
-    # initial LC
-    lccounter = 0
-    lcdict['concatenated'] = {lccounter: os.path.abspath(lclist[0])}
-    lcdict['lcn'] = np.full_like(lcdict['rjd'], lccounter)
-
-    # normalize if needed
-    if normalize:
-
-        for col in MAGCOLS:
-
-            if col in lcdict:
-                thismedval = np.nanmedian(lcdict[col])
+    # read all of the light curves first so each column is only concatenated
+    # once at the end
+    lcdicts, lcfiles = [], []
+    ndet = 0
 
-                # handle fluxes
-                if col in ('ifl1','ifl2','ifl3'):
-                    lcdict[col] = lcdict[col] / thismedval
-                # handle mags
-                else:
-                    lcdict[col] = lcdict[col] - thismedval
-
-    # now read the rest
-    for lcf in lclist[1:]:
+    for lcf in lclist:
 
         thislcd = read_hatpi_textlc(lcf)
 
         # if the columns don't agree, skip this LC
-        if thislcd['columns'] != lcdict['columns']:
+        if lcdicts and thislcd['columns'] != lcdicts[0]['columns']:
             LOGERROR('file %s does not have the '
                      'same columns as first file %s, skipping...'
                      % (lcf, lclist[0]))
             continue
 
-        # otherwise, go ahead and start concatenatin'
-        else:
-
+        if lcdicts:
             LOGINFO('adding %s (ndet: %s) to %s (ndet: %s)'
                     % (lcf,
                        thislcd['objectinfo']['ndet'],
                        lclist[0],
-                       lcdict[lcdict['columns'][0]].size))
+                       ndet))
 
-            # update LC tracking
-            lccounter = lccounter + 1
-            lcdict['concatenated'][lccounter] = os.path.abspath(lcf)
-            lcdict['lcn'] = np.concatenate((
-                lcdict['lcn'],
-                np.full_like(thislcd['rjd'],lccounter)
-            ))
+        # normalize if needed
+        if normalize:
+            _normalize_textlc_magcols(thislcd)
 
-            # concatenate the columns
-            for col in lcdict['columns']:
+        lcdicts.append(thislcd)
+        lcfiles.append(lcf)
+        ndet = ndet + thislcd[thislcd['columns'][0]].size
 
-                # handle normalization for magnitude columns
-                if normalize and col in MAGCOLS:
+    # the first LC is the base for the concatenated one
+    lcdict = lcdicts[0]
 
-                    thismedval = np.nanmedian(thislcd[col])
-
-                    # handle fluxes
-                    if col in ('ifl1','ifl2','ifl3'):
-                        thislcd[col] = thislcd[col] / thismedval
-                    # handle mags
-                    else:
-                        thislcd[col] = thislcd[col] - thismedval
+    # track which LC goes where
+    lcdict['concatenated'] = {x:os.path.abspath(y)
+                              for x, y in enumerate(lcfiles)}
+    lcdict['lcn'] = np.concatenate([np.full_like(x['rjd'], ind)
+                                    for ind, x in enumerate(lcdicts)])
 
-                # concatenate the values
-                lcdict[col] = np.concatenate((lcdict[col], thislcd[col]))
+    # concatenate the columns
+    for col in lcdict['columns']:
+        lcdict[col] = np.concatenate([x[col] for x in lcdicts])
 
     #
     # now we're all done concatenatin'
     #
 
+    takeind = None
+
+    # remove repeated frames, keeping the first one
+    if dedupe:
+
+        takeind = np.sort(np.unique(lcdict['frk'], return_index=True)[1])
+
+        LOGINFO('removing %s measurements with duplicate framekeys...' %
+                (lcdict['frk'].size - takeind.size))
+
+    # if we're supposed to sort by a column, do so
+    if sortby and sortby in (x[0] for x in COLDEFS):
+
+        LOGINFO('sorting concatenated light curve by %s...' % sortby)
+
+        if takeind is None:
+            takeind = np.argsort(lcdict[sortby], kind='stable')
+        else:
+            takeind = takeind[np.argsort(lcdict[sortby][takeind],
+                                         kind='stable')]
+
+    # sort all the measurement columns by this index, and the lcn index as well
+    if takeind is not None:
+
+        for col in lcdict['columns']:
+            lcdict[col] = lcdict[col][takeind]
+        lcdict['lcn'] = lcdict['lcn'][takeind]
+
     # make sure to add up the ndet
     lcdict['objectinfo']['ndet'] = lcdict[lcdict['columns'][0]].size
 
@@ -371,20 +537,15 @@ def concatenate_textlcs(lclist,
     ]
 
     # update the total LC count
-    lcdict['nconcatenated'] = lccounter + 1
+    lcdict['nconcatenated'] = len(lcdicts)
 
-    # if we're supposed to sort by a column, do so
-    if sortby and sortby in (x[0] for x in COLDEFS):
+    # bin the concatenated LC if needed
+    if timebinsec:
 
-        LOGINFO('sorting concatenated light curve by %s...' % sortby)
-        sortind = np.argsort(lcdict[sortby])
-
-        # sort all the measurement columns by this index
-        for col in lcdict['columns']:
-            lcdict[col] = lcdict[col][sortind]
-
-        # make sure to sort the lcn index as well
-        lcdict['lcn'] = lcdict['lcn'][sortind]
+        LOGINFO('binning concatenated light curve to %s sec...' % timebinsec)
+        lcdict['binned'] = bin_hatpi_textlc(lcdict,
+                                            timebinsec,
+                                            minbinelems=minbinelems)
 
     LOGINFO('done. concatenated light curve has %s detections' %
             lcdict['objectinfo']['ndet'])
@@ -397,7 +558,10 @@ def concatenate_textlcs_for_objectid(lcbasedir,
                                      postfix='.gz',
                                      sortby='rjd',
                                      normalize=True,
-                                     recursive=True):
+                                     recursive=True,
+                                     dedupe=False,
+                                     timebinsec=None,
+                                     minbinelems=7):
     '''This concatenates all text LCs for an objectid with the given aperture.
 
     Does not care about overlaps or duplicates. The light curves must all be
@@ -427,6 +591,9 @@ def concatenate_textlcs_for_objectid(lcbasedir,
     for any light curves matching the specified criteria. This may take a while,
     especially on network filesystems.
 
+    dedupe, timebinsec, and minbinelems are passed to concatenate_textlcs to
+    remove duplicate frames and bin the concatenated light curve.
+
     The returned lcdict has an extra column: 'lcn' that tracks which measurement
     belongs to which input light curve. This can be used with
     lcdict['concatenated'] which relates input light curve index to input light
@@ -458,7 +625,10 @@ def concatenate_textlcs_for_objectid(lcbasedir,
     if matching and len(matching) > 0:
         clcdict = concatenate_textlcs(matching,
                                       sortby=sortby,
-                                      normalize=normalize)
+                                      normalize=normalize,
+                                      dedupe=dedupe,
+                                      timebinsec=timebinsec,
+                                      minbinelems=minbinelems)
         return clcdict
     else:
         LOGERROR('did not find any light curves for %s and aperture %s' %
@@ -466,6 +636,47 @@ def concatenate_textlcs_for_objectid(lcbasedir,
         return None
 
 
+def find_textlcs_by_objectid(lcbasedir,
+                             aperture='TF1',
+                             postfix='.gz',
+                             recursive=True):
+    '''This finds all text LCs in lcbasedir and groups them by objectid.
+
+    This searches lcbasedir once for all light curves with the given aperture
+    and postfix, instead of once for each object like
+    concatenate_textlcs_for_objectid does. The objectid of each light curve is
+    taken from the HATID in its filename.
+
+    Returns a dict with the objectids as keys and sorted lists of light curve
+    filepaths as values.
+
+    '''
+
+    LOGINFO('looking for light curves for aperture %s in directory: %s'
+            % (aperture, lcbasedir))
+
+    if recursive is False:
+        matching = glob.glob(os.path.join(lcbasedir,
+                                          '*%s*%s' % (aperture, postfix)))
+    else:
+        matching = glob.glob(os.path.join(lcbasedir,
+                                          '**',
+                                          '*%s*%s' % (aperture, postfix)),
+                             recursive=True)
+
+    lcfiles = {}
+
+    for lcf in sorted(matching):
+
+        hatid = HATIDREGEX.findall(os.path.basename(lcf))
+        if hatid:
+            lcfiles.setdefault(hatid[0], []).append(lcf)
+
+    LOGINFO('found %s files for %s objects' % (len(matching), len(lcfiles)))
+
+    return lcfiles
+
+
 def concat_write_pklc(lcbasedir,
                       objectid,
                       aperture='TF1',
@@ -473,20 +684,53 @@ def concat_write_pklc(lcbasedir,
                       sortby='rjd',
                       normalize=True,
                       outdir=None,
-                      recursive=True):
+                      recursive=True,
+                      dedupe=False,
+                      timebinsec=None,
+                      minbinelems=7,
+                      lclist=None):
     '''This concatenates all text LCs for the given object and writes to a pklc.
 
     Basically a rollup for the concatenate_textlcs_for_objectid and
     lcdict_to_pickle functions.
 
+    If timebinsec is not None, the binned light curve is generated along with
+    the concatenated one and both are written to the same pklc.
+
+    If lclist is a list of text LC filepaths for this object, these are
+    concatenated instead of searching lcbasedir for them.
+
     '''
 
-    concatlcd = concatenate_textlcs_for_objectid(lcbasedir,
-                                                 objectid,
-                                                 aperture=aperture,
-                                                 sortby=sortby,
-                                                 normalize=normalize,
-                                                 recursive=recursive)
+    if lclist is not None:
+
+        if len(lclist) > 0:
+            concatlcd = concatenate_textlcs(lclist,
+                                            sortby=sortby,
+                                            normalize=normalize,
+                                            dedupe=dedupe,
+                                            timebinsec=timebinsec,
+                                            minbinelems=minbinelems)
+        else:
+            LOGERROR('did not find any light curves for %s and aperture %s' %
+                     (objectid, aperture))
+            concatlcd = None
+
+    else:
+
+        concatlcd = concatenate_textlcs_for_objectid(lcbasedir,
+                                                     objectid,
+                                                     aperture=aperture,
+                                                     postfix=postfix,
+                                                     sortby=sortby,
+                                                     normalize=normalize,
+                                                     recursive=recursive,
+                                                     dedupe=dedupe,
+                                                     timebinsec=timebinsec,
+                                                     minbinelems=minbinelems)
+
+    if concatlcd is None:
+        return None
 
     if not outdir:
         outdir = 'pklcs'
@@ -506,7 +750,8 @@ def parallel_concat_worker(task):
 
     task[0] = lcbasedir
     task[1] = objectid
-    task[2] = {'aperture','postfix','sortby','normalize','outdir','recursive'}
+    task[2] = {'aperture','postfix','sortby','normalize','outdir','recursive',
+               'dedupe','timebinsec','minbinelems','lclist'}
 
     '''
 
@@ -529,9 +774,20 @@ def parallel_concat_lcdir(lcbasedir,
                           outdir=None,
                           recursive=True,
                           nworkers=32,
-                          maxworkertasks=1000):
+                          maxworkertasks=1000,
+                          dedupe=False,
+                          timebinsec=None,
+                          minbinelems=7):
     '''This concatenates all text LCs for the given objectidlist.
 
+    lcbasedir is searched once for all of the light curves with
+    find_textlcs_by_objectid, and each worker then concatenates the light
+    curves for one object. If objectidlist is None, all objects found in
+    lcbasedir are concatenated.
+
+    If timebinsec is not None, each object's binned light curve is generated
+    in the same pass and written to its concatenated pklc. See
+    concatenate_textlcs for dedupe, timebinsec, and minbinelems.
 
     '''
 
@@ -541,12 +797,25 @@ def parallel_concat_lcdir(lcbasedir,
     if not os.path.exists(outdir):
         os.mkdir(outdir)
 
+    lcfiles = find_textlcs_by_objectid(lcbasedir,
+                                       aperture=aperture,
+                                       postfix=postfix,
+                                       recursive=recursive)
+
+    if objectidlist is None:
+        objectidlist = sorted(lcfiles.keys())
+
     tasks = [(lcbasedir, x, {'aperture':aperture,
                              'postfix':postfix,
                              'sortby':sortby,
                              'normalize':normalize,
                              'outdir':outdir,
-                             'recursive':recursive}) for x in objectidlist]
+                             'recursive':recursive,
+                             'dedupe':dedupe,
+                             'timebinsec':timebinsec,
+                             'minbinelems':minbinelems,
+                             'lclist':lcfiles.get(x, [])})
+             for x in objectidlist]
 
     pool = mp.Pool(nworkers, maxtasksperchild=maxworkertasks)
     results = pool.map(parallel_concat_worker, tasks)
@@ -570,10 +839,16 @@ def merge_hatpi_textlc_apertures(lclist):
     by read_hatpi_textlc above (i.e. have a single column for TFA mags for a
     specific aperture at the end).
 
+    The merged lcdict has a column for the TFA mags of each aperture and is
+    sorted by framekey. The other columns are the same for all apertures and
+    are taken from the light curve of the last aperture that has each frame.
+    The 'merged' key of the lcdict relates the TFA mag columns to their input
+    light curve filepaths.
+
     '''
 
     lcaps = {}
-    framekeys = []
+    lcapfiles = {}
 
     for lc in lclist:
 
@@ -585,13 +860,53 @@ def merge_hatpi_textlc_apertures(lclist):
         for col in lcd['columns']:
             if col.startswith('itf'):
                 lcaps[col] = lcd
-        thisframekeys = lcd['frk'].tolist()
-        framekeys.extend(thisframekeys)
+                lcapfiles[col] = os.path.abspath(lc)
+
+    if not lcaps:
+        LOGERROR('no TFA light curves found in %s' % repr(lclist))
+        return None
+
+    apcols = sorted(lcaps.keys())
+    basecols = [x for x in lcaps[apcols[0]]['columns']
+                if not x.startswith('itf')]
 
     # uniqify the framekeys
-    framekeys = sorted(set(framekeys))
+    framekeys = np.unique(np.concatenate([lcaps[x]['frk'] for x in apcols]))
+
+    # find where each aperture's frames go in the merged LC
+    mergeinds = {x:np.searchsorted(framekeys, lcaps[x]['frk']) for x in apcols}
+
+    lcdict = {
+        'objectid':lcaps[apcols[0]]['objectid'],
+        'objectinfo':dict(lcaps[apcols[0]]['objectinfo']),
+        'columns':basecols + apcols,
+        'merged':lcapfiles,
+    }
+
+    # every frame is in at least one aperture LC, so all of the base columns
+    # are filled in
+    for col in basecols:
+
+        lcdict[col] = np.empty(
+            framekeys.size,
+            dtype=np.result_type(*[lcaps[x][col] for x in apcols])
+        )
+        for apcol in apcols:
+            lcdict[col][mergeinds[apcol]] = lcaps[apcol][col]
+
+    for apcol in apcols:
+        lcdict[apcol] = np.full(framekeys.size, np.nan)
+        lcdict[apcol][mergeinds[apcol]] = lcaps[apcol][apcol]
+
+    lcdict['objectinfo']['ndet'] = framekeys.size
+    lcdict['objectinfo']['stations'] = [
+        'HP%s' % x for x in np.unique(lcdict['stf']).tolist()
+    ]
+
+    LOGINFO('merged %s apertures for %s: %s frames' %
+            (len(apcols), lcdict['objectid'], framekeys.size))
 
-    # FIXME: finish this
+    return lcdict
 
 
 #######################################
@@ -762,35 +1077,72 @@ def generate_hatpi_binnedlc_pkl(binnedpklf, textlcf, timebinsec,
         return None
 
 
+def parallel_gen_binnedlc_worker(task):
+    '''
+    This is a worker for the function below.
+
+    task[0] = binnedpklf
+    task[1] = textlcf
+    task[2] = timebinsec
+
+    '''
+
+    binnedpklf, textlcf, timebinsec = task
+
+    try:
+        return generate_hatpi_binnedlc_pkl(binnedpklf, textlcf, timebinsec)
+    except Exception:
+        LOGEXCEPTION('failed to generate binned LC pickle for %s'
+                     % binnedpklf)
+        return None
+
+
 def parallel_gen_binnedlc_pkls(binnedpkldir,
                                textlcdir,
                                timebinsec,
                                binnedpklglob='*binned*sec*.pkl',
-                               textlcglob='*.tfalc.TF1*'):
+                               textlcglob='*.tfalc.TF1*',
+                               nworkers=32,
+                               maxworkertasks=1000):
     '''
     This generates the binnedlc pkls for a directory of such files.
 
-    FIXME: finish this
+    The text LC for each binned LC pickle is found using the HATID in the
+    pickle's filename. Returns a dict with the binned LC pickles as keys and the
+    generated pickles as values.
+
+    To make binned LCs directly from text LCs without the pipeline's binned LC
+    pickles, use parallel_concat_lcdir with timebinsec set instead.
 
     '''
 
     binnedpkls = sorted(glob.glob(os.path.join(binnedpkldir, binnedpklglob)))
 
     # find all the textlcs associated with these
-    textlcs = []
+    tasks = []
 
     for bpkl in binnedpkls:
 
         objectid = HATIDREGEX.findall(bpkl)
-        if objectid is not None:
-            objectid = objectid[0]
+        if not objectid:
+            LOGERROR('no HATID found in the filename of %s, skipping' % bpkl)
+            continue
+        objectid = objectid[0]
 
         searchpath = os.path.join(textlcdir, '%s-%s' % (objectid, textlcglob))
-        textlcf = glob.glob(searchpath)
+        textlcf = sorted(glob.glob(searchpath))
         if textlcf:
-            textlcs.append(textlcf)
+            tasks.append((bpkl, textlcf[0], timebinsec))
         else:
-            textlcs.append(None)
+            LOGERROR('no text LC found for %s, skipping' % bpkl)
+
+    pool = mp.Pool(nworkers, maxtasksperchild=maxworkertasks)
+    results = pool.map(parallel_gen_binnedlc_worker, tasks)
+
+    pool.close()
+    pool.join()
+
+    return {x[0]:y for (x,y) in zip(tasks, results)}
 
 
 #####################
@@ -87,8 +87,12 @@ LOGEXCEPTION = LOGGER.exception
 
 import os.path
 import gzip
+from io import StringIO
+
 import numpy as np
 
+from .hatlc import CSVLC_DTYPES
+
 
 ########################
 ## COLUMN DEFINITIONS ##
@@ -522,22 +526,45 @@ def read_csv_lightcurve(lcfile):
     # figure out the header and get the LC columns
     lcstart = lctext.index('# LIGHTCURVE\n')
     lcheader = lctext[:lcstart+12]
-    lccolumns = lctext[lcstart+13:].split('\n')
-    lccolumns = [x.split(',') for x in lccolumns if len(x) > 0]
 
     # initialize the lcdict and parse the CSV header
     lcdict = _parse_csv_header(lcheader)
 
-    # tranpose the LC rows into columns
-    lccolumns = list(zip(*lccolumns))
+    # this picks out the caster to use when reading each column using the
+    # definitions in the COLUMNDEFS dictionary
+    casters = [COLUMNDEFS[col][2] for col in lcdict['columns']]
+
+    # read all of the columns at once with the fast numpy parser
+    try:
+
+        lcdata = np.loadtxt(
+            StringIO(lctext[lcstart+13:]),
+            delimiter=',',
+            dtype=[(col, CSVLC_DTYPES.get(caster, 'O'))
+                   for col, caster in zip(lcdict['columns'], casters)],
+            comments=None,
+            ndmin=1
+        )
+
+        for col, caster in zip(lcdict['columns'], casters):
+            if caster in CSVLC_DTYPES:
+                lcdict[col.lower()] = np.ascontiguousarray(lcdata[col])
+            else:
+                lcdict[col.lower()] = lcdata[col].astype(str)
+
+    # if that fails, cast each value separately
+    except ValueError:
+
+        lccolumns = lctext[lcstart+13:].split('\n')
+        lccolumns = [x.split(',') for x in lccolumns if len(x) > 0]
 
-    # write the columns to the dict
-    for colind, col in enumerate(lcdict['columns']):
+        # tranpose the LC rows into columns
+        lccolumns = list(zip(*lccolumns))
 
-        # this picks out the caster to use when reading each column using the
-        # definitions in the lcutils.COLUMNDEFS dictionary
-        lcdict[col.lower()] = np.array([COLUMNDEFS[col][2](x)
-                                        for x in lccolumns[colind]])
+        # write the columns to the dict
+        for colind, col in enumerate(lcdict['columns']):
+            lcdict[col.lower()] = np.array([casters[colind](x)
+                                            for x in lccolumns[colind]])
 
     lcdict['columns'] = [x.lower() for x in lcdict['columns']]
 
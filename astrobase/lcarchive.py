@@ -0,0 +1,687 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# lcarchive.py - Oct 2026
+# License: MIT - see LICENSE for the full text.
+
+'''This contains functions to write and read light curve archives.
+
+A light curve archive holds the light curves for many objects (e.g. all of the
+targets in a TESS sector or a Kepler/K2 campaign) in a single file. Each column
+of the light curves is stored as one concatenated array, and an index maps each
+objectid to its (offset, length) in these arrays. The file is memory-mapped when
+it's opened, so reading a single object's light curve only touches the pages of
+the file that contain it. This avoids opening thousands of per-object pickles,
+which is slow on network filesystems.
+
+An archive is written by `write_lcarchive` (or the
+`astrobase.astrotess.tess_lcdicts_to_archive` and
+`astrobase.astrokep.kepler_lcdicts_to_archive` wrappers) and individual light
+curves are referred to as::
+
+    '/path/to/archive.lca::<objectid>'
+
+Use `list_lcarchive` to get these references for all objects in an archive. They
+can be passed to any of the `astrobase.lcproc` functions as light curve files
+using the `tess-lca` and `kep-lca` LC formats, or a custom one registered with
+`astrobase.lcproc.register_lcformat` that uses `read_lcarchive` as its reader.
+The `astrobase.lcproc` functions that work on a directory of light curves
+(e.g. `parallel_pf_lcdir`) expand any archives they find into these references
+using `expand_lcarchives`.
+
+'''
+
+#############
+## LOGGING ##
+#############
+
+import logging
+from astrobase import log_sub, log_fmt, log_date_fmt
+
+DEBUG = False
+if DEBUG:
+    level = logging.DEBUG
+else:
+    level = logging.INFO
+LOGGER = logging.getLogger(__name__)
+logging.basicConfig(
+    level=level,
+    style=log_sub,
+    format=log_fmt,
+    datefmt=log_date_fmt,
+)
+
+LOGDEBUG = LOGGER.debug
+LOGINFO = LOGGER.info
+LOGWARNING = LOGGER.warning
+LOGERROR = LOGGER.error
+LOGEXCEPTION = LOGGER.exception
+
+
+#############
+## IMPORTS ##
+#############
+
+import os.path
+import os
+import json
+import mmap
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+
+
+############
+## CONFIG ##
+############
+
+# the first bytes of every archive file
+LCARCHIVE_MAGIC = b'ABLCA\x00\x01\x00'
+
+# this separates the archive path from the objectid in a light curve reference
+LCARCHIVE_SEP = '::'
+
+# all arrays in the archive start on a multiple of this many bytes
+LCARCHIVE_ALIGN = 64
+
+# the names of the integer objectid index arrays
+LCARCHIVE_INDEXCOLS = ('offset', 'length', 'metaoffset', 'metalength')
+
+# this is a per-process cache of opened archives so each one is only opened and
+# memory-mapped once by each worker
+_LCARCHIVES = {}
+
+
+def _aligned(nbytes):
+    '''
+    This returns the next multiple of LCARCHIVE_ALIGN at or after nbytes.
+
+    '''
+    return -(-nbytes // LCARCHIVE_ALIGN) * LCARCHIVE_ALIGN
+
+
+def _dict_getcol(lcdict, col):
+    '''
+    This gets the value of a column like 'sap.sap_flux' from an lcdict.
+
+    '''
+
+    if '.' in col:
+        key, subkey = col.split('.', 1)
+        return lcdict[key][subkey]
+    else:
+        return lcdict[col]
+
+
+def _dict_setcol(lcdict, col, value):
+    '''
+    This sets the value of a column like 'sap.sap_flux' in an lcdict.
+
+    '''
+
+    if '.' in col:
+        key, subkey = col.split('.', 1)
+        lcdict[key][subkey] = value
+    else:
+        lcdict[col] = value
+
+
+def _lcdict_metadata(lcdict, columns):
+    '''This returns a copy of the lcdict without the column arrays.
+
+    The lcdict itself and its sub-dicts are shallow copied, so the input lcdict
+    isn't changed.
+
+    '''
+
+    metadata = dict(lcdict)
+
+    for col in columns:
+
+        if '.' in col:
+            key, subkey = col.split('.', 1)
+            if metadata[key] is lcdict[key]:
+                metadata[key] = dict(lcdict[key])
+            metadata[key].pop(subkey, None)
+        else:
+            metadata.pop(col, None)
+
+    return metadata
+
+
+def split_lcarchive_ref(lcfile):
+    '''This splits a light curve reference into its archive path and objectid.
+
+    Parameters
+    ----------
+
+    lcfile : str
+        A light curve reference of the form `'<archive path>::<objectid>'` or
+        a plain file path.
+
+    Returns
+    -------
+
+    tuple
+        Returns `(archive path, objectid)`. If `lcfile` is a plain file path,
+        the objectid is None.
+
+    '''
+
+    if LCARCHIVE_SEP in lcfile:
+        archivefile, objectid = lcfile.split(LCARCHIVE_SEP, 1)
+        return archivefile, objectid
+    else:
+        return lcfile, None
+
+
+def lcfile_exists(lcfile):
+    '''This checks if a light curve file or archive reference exists.
+
+    Parameters
+    ----------
+
+    lcfile : str
+        A path to a light curve file or a light curve archive reference of the
+        form `'<archive path>::<objectid>'`.
+
+    Returns
+    -------
+
+    bool
+        True if `lcfile` is a path that exists, or if it's an archive reference
+        and the archive exists and contains the objectid.
+
+    '''
+
+    archivefile, objectid = split_lcarchive_ref(lcfile)
+
+    if objectid is None:
+        return os.path.exists(lcfile)
+
+    if not os.path.exists(archivefile):
+        return False
+
+    try:
+        archive = _open_lcarchive(archivefile)
+    except Exception:
+        LOGEXCEPTION('could not open LC archive: %s' % archivefile)
+        return False
+
+    return _lcarchive_objectind(archive, objectid) is not None
+
+
+######################
+## WRITING ARCHIVES ##
+######################
+
+def _write_lcarchive_file(archivefile,
+                          header,
+                          arrays,
+                          coldtypes,
+                          metafile,
+                          metasize):
+    '''This lays out the arrays of an archive and writes it to archivefile.
+
+    `arrays` is a list of `(name, array, filename)` tuples. The index arrays are
+    given directly, and the columns are given by the filename of their temporary
+    file, with their dtypes in `coldtypes`. The pickled metadata of all objects
+    is in `metafile`. The offset of each array and of the metadata is added to
+    `header`, which is written before them.
+
+    '''
+
+    # work out where everything goes relative to the end of the header
+    offset = 0
+    for name, arr, fname in arrays:
+        if arr is None:
+            dtype = coldtypes[name[len('column.'):]]
+            count = header['ndet']
+        else:
+            dtype, count = arr.dtype, arr.size
+        header['arrays'][name] = {'dtype':dtype.str,
+                                  'count':int(count),
+                                  'offset':offset}
+        offset = _aligned(offset + int(count)*dtype.itemsize)
+
+    header['metadata'] = {'offset':offset, 'size':metasize}
+
+    headerbytes = json.dumps(header).encode('utf-8')
+    datastart = _aligned(len(LCARCHIVE_MAGIC) + 8 + len(headerbytes))
+
+    with open(archivefile, 'wb') as outfd:
+
+        outfd.write(LCARCHIVE_MAGIC)
+        outfd.write(np.array(len(headerbytes), dtype='<u8').tobytes())
+        outfd.write(headerbytes)
+
+        for name, arr, fname in arrays + [('metadata', None, metafile)]:
+
+            if name == 'metadata':
+                start = header['metadata']['offset']
+            else:
+                start = header['arrays'][name]['offset']
+            outfd.write(b'\x00'*(datastart + start - outfd.tell()))
+
+            if arr is not None:
+                outfd.write(arr.tobytes())
+            else:
+                with open(fname, 'rb') as infd:
+                    shutil.copyfileobj(infd, outfd, 16*1024*1024)
+
+
+def write_lcarchive(lcdicts,
+                    outfile,
+                    columns=None,
+                    readerfunc=None,
+                    archiveinfo=None):
+    '''This writes the light curves of many objects to a single archive file.
+
+    The output file contains:
+
+    - a JSON header describing the arrays in the file
+    - one array per light curve column, containing the concatenated values of
+      this column for all objects in the order they were provided
+    - the objectid index: the sorted objectids and the offset and length of
+      each object's light curve in the column arrays
+    - the pickled metadata of each object, i.e. its lcdict without the column
+      arrays (`objectinfo`, `lcinfo`, `varinfo`, etc.)
+
+    The columns of each object are written to temporary files in the output
+    directory as the lcdicts are read, so only one lcdict needs to be in memory
+    at a time. The archive is written to a temporary file and moved into place
+    at the end, so readers never see a partially written archive.
+
+    Parameters
+    ----------
+
+    lcdicts : list of dicts or str
+        The lcdicts of the objects to write to the archive, or paths to files
+        that will be read into lcdicts by `readerfunc`. Each lcdict must have an
+        `objectid` key, and each objectid can only appear once in an archive.
+
+    outfile : str
+        The path of the output archive file.
+
+    columns : list of str or None
+        The columns to write to the archive as arrays. Nested columns are
+        specified as e.g. 'sap.sap_flux'. If this is None, the columns in the
+        `columns` key of the first lcdict are used. Any other items in an lcdict
+        are stored in its pickled metadata. The dtype of each column is set by
+        the first lcdict, and the columns of the other lcdicts are converted to
+        this dtype. Objects that don't have all of these columns, or whose
+        columns don't have the same length, are skipped.
+
+    readerfunc : Python function or None
+        The function used to read an lcdict from each item in `lcdicts` that is
+        a str. This is required if `lcdicts` contains file paths.
+
+    archiveinfo : dict or None
+        Any JSON-able information to store in the archive's header. This is
+        returned by `read_lcarchive_info`.
+
+    Returns
+    -------
+
+    str
+        The path to the output archive.
+
+    '''
+
+    outfile = os.path.abspath(outfile)
+    tempdir = tempfile.mkdtemp(prefix='lcarchive-',
+                               dir=os.path.dirname(outfile))
+
+    coldtypes = {}
+    colfds = {}
+    objectids, index = [], {x:[] for x in LCARCHIVE_INDEXCOLS}
+    seen = set()
+    ndet, metasize = 0, 0
+
+    metafd = open(os.path.join(tempdir, 'metadata'), 'wb')
+
+    try:
+
+        for item in lcdicts:
+
+            if isinstance(item, str):
+                if readerfunc is None:
+                    raise ValueError('a readerfunc is required to read '
+                                     'the LC files to add to an archive')
+                lcdict = readerfunc(item)
+            else:
+                lcdict = item
+
+            objectid = str(lcdict['objectid'])
+
+            if columns is None:
+                columns = list(lcdict['columns'])
+
+            try:
+                colvals = [np.asarray(_dict_getcol(lcdict, x))
+                           for x in columns]
+            except KeyError:
+                LOGERROR('object %s is missing some archive columns, skipping'
+                         % objectid)
+                continue
+
+            nobs = colvals[0].size
+            if any(x.ndim != 1 or x.size != nobs for x in colvals):
+                LOGERROR('columns for object %s are not all 1-D arrays '
+                         'of the same length, skipping' % objectid)
+                continue
+
+            if objectid in seen:
+                LOGERROR('object %s is already in the archive, skipping' %
+                         objectid)
+                continue
+
+            # the first object sets the dtypes of the columns
+            if not coldtypes:
+                for col, val in zip(columns, colvals):
+                    dtype = val.dtype
+                    if dtype.kind == 'O':
+                        dtype = val.astype(np.str_).dtype
+                    coldtypes[col] = dtype.newbyteorder('=')
+                    colfds[col] = open(
+                        os.path.join(tempdir, 'column-%s' % len(colfds)), 'wb'
+                    )
+
+            for col, val in zip(columns, colvals):
+                val.astype(coldtypes[col], copy=False).tofile(colfds[col])
+
+            metadata = pickle.dumps(_lcdict_metadata(lcdict, columns),
+                                    protocol=pickle.HIGHEST_PROTOCOL)
+            metafd.write(metadata)
+
+            seen.add(objectid)
+            objectids.append(objectid)
+            index['offset'].append(ndet)
+            index['length'].append(nobs)
+            index['metaoffset'].append(metasize)
+            index['metalength'].append(len(metadata))
+
+            ndet = ndet + nobs
+            metasize = metasize + len(metadata)
+
+        metafd.close()
+        for col in colfds:
+            colfds[col].close()
+
+        if not objectids:
+            LOGERROR('no light curves to write to archive %s' % outfile)
+            return None
+
+        # sort the index by objectid so objects can be looked up with a
+        # binary search
+        objectids = np.array(objectids, dtype=np.str_)
+        sortind = np.argsort(objectids, kind='stable')
+
+        arrays = [('index.objectid', objectids[sortind], None)]
+        arrays.extend(('index.%s' % x,
+                       np.array(index[x], dtype='<i8')[sortind],
+                       None) for x in LCARCHIVE_INDEXCOLS)
+        arrays.extend(('column.%s' % x,
+                       None,
+                       colfds[x].name) for x in columns)
+
+        header = {'archiveinfo':archiveinfo,
+                  'nobjects':objectids.size,
+                  'ndet':ndet,
+                  'columns':columns,
+                  'arrays':{},
+                  'metadata':None}
+
+        tempout = os.path.join(tempdir, 'archive')
+        _write_lcarchive_file(tempout,
+                              header,
+                              arrays,
+                              coldtypes,
+                              metafd.name,
+                              metasize)
+
+        os.replace(tempout, outfile)
+
+    finally:
+
+        metafd.close()
+        for col in colfds:
+            colfds[col].close()
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+    LOGINFO('wrote %s objects with %s total detections to LC archive -> %s' %
+            (header['nobjects'], ndet, outfile))
+
+    return outfile
+
+
+######################
+## READING ARCHIVES ##
+######################
+
+def _open_lcarchive(archivefile):
+    '''This opens and memory-maps an archive, or gets it from the cache.
+
+    Returns a dict with the archive's header, its index arrays, and its column
+    arrays. All of the arrays are read-only views of the memory-mapped file.
+
+    '''
+
+    archivefile = os.path.abspath(archivefile)
+    archivestat = os.stat(archivefile)
+    archivestat = (archivestat.st_mtime_ns, archivestat.st_size)
+
+    archive = _LCARCHIVES.get(archivefile, None)
+    if archive is not None and archive['stat'] == archivestat:
+        return archive
+
+    with open(archivefile, 'rb') as infd:
+
+        if infd.read(len(LCARCHIVE_MAGIC)) != LCARCHIVE_MAGIC:
+            raise ValueError('%s is not an LC archive' % archivefile)
+
+        headerlen = int(np.frombuffer(infd.read(8), dtype='<u8')[0])
+        header = json.loads(infd.read(headerlen).decode('utf-8'))
+        mmapped = mmap.mmap(infd.fileno(), 0, access=mmap.ACCESS_READ)
+
+    datastart = _aligned(len(LCARCHIVE_MAGIC) + 8 + headerlen)
+
+    arrays = {}
+    for name, arrinfo in header['arrays'].items():
+        if arrinfo['count'] > 0:
+            arrays[name] = np.frombuffer(mmapped,
+                                         dtype=arrinfo['dtype'],
+                                         count=arrinfo['count'],
+                                         offset=datastart + arrinfo['offset'])
+        else:
+            arrays[name] = np.empty(0, dtype=arrinfo['dtype'])
+
+    archive = {'file':archivefile,
+               'stat':archivestat,
+               'header':header,
+               'mmap':mmapped,
+               'metastart':datastart + header['metadata']['offset'],
+               'arrays':arrays}
+    _LCARCHIVES[archivefile] = archive
+
+    return archive
+
+
+def _lcarchive_objectind(archive, objectid):
+    '''
+    This returns the index of objectid in the archive index or None.
+
+    '''
+
+    objectids = archive['arrays']['index.objectid']
+    ind = np.searchsorted(objectids, objectid)
+
+    if ind < objectids.size and objectids[ind] == objectid:
+        return ind
+    else:
+        return None
+
+
+def read_lcarchive_info(archivefile):
+    '''This returns the header info of an archive.
+
+    Parameters
+    ----------
+
+    archivefile : str
+        The path to an archive written by `write_lcarchive`.
+
+    Returns
+    -------
+
+    dict
+        A dict with the `archiveinfo` provided when the archive was written, the
+        number of objects in it (`nobjects`), the total number of detections in
+        it (`ndet`), the light curve `columns` it contains, and its sorted
+        `objectids`.
+
+    '''
+
+    archive = _open_lcarchive(archivefile)
+
+    return {'archiveinfo':archive['header']['archiveinfo'],
+            'nobjects':archive['header']['nobjects'],
+            'ndet':archive['header']['ndet'],
+            'columns':list(archive['header']['columns']),
+            'objectids':archive['arrays']['index.objectid'].tolist()}
+
+
+def list_lcarchive(archivefile):
+    '''This returns the light curve references for all objects in an archive.
+
+    Parameters
+    ----------
+
+    archivefile : str
+        The path to an archive written by `write_lcarchive`.
+
+    Returns
+    -------
+
+    list of str
+        The light curve references of the form `'<archive path>::<objectid>'`
+        sorted by objectid. These can be used as light curve file names by
+        `read_lcarchive` and all of the `astrobase.lcproc` functions.
+
+    '''
+
+    archive = _open_lcarchive(archivefile)
+
+    return ['%s%s%s' % (archive['file'], LCARCHIVE_SEP, x)
+            for x in archive['arrays']['index.objectid'].tolist()]
+
+
+def _is_lcarchive(lcfile):
+    '''
+    This checks if lcfile is an archive file by looking for its magic bytes.
+
+    '''
+
+    if LCARCHIVE_SEP in lcfile or not os.path.isfile(lcfile):
+        return False
+
+    with open(lcfile, 'rb') as infd:
+        return infd.read(len(LCARCHIVE_MAGIC)) == LCARCHIVE_MAGIC
+
+
+def expand_lcarchives(lcfiles):
+    '''This replaces any archives in a list of LC files with their references.
+
+    Use this to turn the files found in a light curve directory into the list
+    of light curves to process. Only files ending in `.lca` are checked.
+
+    Parameters
+    ----------
+
+    lcfiles : list of str
+        A list of paths to light curve files, archives, or light curve archive
+        references.
+
+    Returns
+    -------
+
+    list of str
+        The input list with each archive replaced in place by the references to
+        all of its objects from `list_lcarchive`. Everything else is returned
+        as is.
+
+    '''
+
+    expanded = []
+
+    for lcf in lcfiles:
+
+        if lcf.endswith('.lca') and _is_lcarchive(lcf):
+            expanded.extend(list_lcarchive(lcf))
+        else:
+            expanded.append(lcf)
+
+    return expanded
+
+
+def read_lcarchive(lcfile, objectid=None):
+    '''This reads the lcdict of a single object from an archive.
+
+    Only the parts of the archive's memory-mapped column arrays that belong to
+    the object are read. The archive is opened once per process and kept open
+    for later reads, unless the file changes.
+
+    Parameters
+    ----------
+
+    lcfile : str
+        A light curve reference of the form `'<archive path>::<objectid>'` or
+        the path to an archive.
+
+    objectid : str or None
+        The objectid of the object to read. If this is None, the objectid is
+        taken from `lcfile`. If `lcfile` doesn't have one, the archive must
+        contain only one object.
+
+    Returns
+    -------
+
+    lcdict
+        The lcdict of the object, with the same items as the lcdict that was
+        written to the archive. The column arrays are copies, so they can be
+        changed without affecting the archive.
+
+    '''
+
+    archivefile, refobjectid = split_lcarchive_ref(lcfile)
+    if objectid is None:
+        objectid = refobjectid
+
+    archive = _open_lcarchive(archivefile)
+    arrays = archive['arrays']
+
+    if objectid is None:
+        if archive['header']['nobjects'] != 1:
+            raise ValueError('an objectid is required to read from '
+                             'LC archive %s' % archivefile)
+        ind = 0
+    else:
+        ind = _lcarchive_objectind(archive, objectid)
+        if ind is None:
+            raise KeyError('object %s is not in LC archive %s' %
+                           (objectid, archivefile))
+
+    metastart = archive['metastart'] + int(arrays['index.metaoffset'][ind])
+    metaend = metastart + int(arrays['index.metalength'][ind])
+    lcdict = pickle.loads(archive['mmap'][metastart:metaend])
+
+    offset = int(arrays['index.offset'][ind])
+    length = int(arrays['index.length'][ind])
+
+    for col in archive['header']['columns']:
+        _dict_setcol(lcdict,
+                     col,
+                     arrays['column.%s' % col][offset:offset+length].copy())
+
+    return lcdict
@@ -9,6 +9,10 @@
 - :py:func:`astrobase.lcfit.sinusoidal.fourier_fit_magseries`: fit an arbitrary
   order Fourier series to a magnitude/flux time series.
 
+- :py:func:`astrobase.lcfit.sinusoidal.fourier_fit_magseries_periods`: fit an
+  arbitrary order Fourier series to a magnitude/flux time series at several
+  fixed periods at once.
+
 - :py:func:`astrobase.lcfit.nonphysical.spline_fit_magseries`: fit a univariate
   cubic spline to a magnitude/flux time series with a specified spline knot
   fraction.
@@ -68,7 +72,10 @@ LOGEXCEPTION = LOGGER.exception
 ## HOIST THE FIT FUNCTIONS UP HERE ##
 #####################################
 
-from .sinusoidal import fourier_fit_magseries
+from .sinusoidal import (
+    fourier_fit_magseries,
+    fourier_fit_magseries_periods
+)
 from .nonphysical import (
     spline_fit_magseries,
     savgol_fit_magseries,
@@ -55,7 +55,7 @@ from scipy.optimize import curve_fit
 from ..lcmath import sigclip_magseries
 from ..lcmodels import eclipses
 
-from .utils import make_fit_plot
+from .utils import make_fit_plot, curvefit_folded_model
 from .nonphysical import spline_fit_magseries, savgol_fit_magseries
 
 
@@ -367,29 +367,46 @@ def gaussianeb_fit_magseries(
             )
 
         #
-        # set up the curve fit function
+        # if the period and epoch are both fixed, the phase-fold doesn't change
+        # between model evaluations, so we fit only the shape params with the
+        # cached phase-folded model and its analytic jacobian
         #
-        curvefit_func = partial(eclipses.invgauss_eclipses_curvefit_func,
-                                zerolevel=npmedian(smags),
-                                fixed_params=fitfunc_fixed)
+        if 'period' in fitfunc_fixed and 'epoch' in fitfunc_fixed:
 
-        #
-        # run the fit
-        #
-        if curve_fit_kwargs is not None:
-
-            finalparams, covmatrix = curve_fit(
-                curvefit_func,
-                stimes, smags,
-                p0=ebparams,
-                sigma=serrs,
-                bounds=curvefit_bounds,
-                absolute_sigma=(not scale_errs_redchisq_unity),
-                **curve_fit_kwargs
+            foldedmodel = eclipses.InvGaussEclipsesModel(
+                stimes, smags, serrs,
+                ebparams[0], ebparams[1],
+                zerolevel=npmedian(smags)
+            )
+            finalparams, covmatrix = curvefit_folded_model(
+                foldedmodel,
+                ebparams[:2],
+                ebparams[2:],
+                shape_bounds=(curvefit_bounds[0][2:],
+                              curvefit_bounds[1][2:]),
+                scale_errs_redchisq_unity=scale_errs_redchisq_unity,
+                curve_fit_kwargs=curve_fit_kwargs
             )
 
         else:
 
+            #
+            # set up the curve fit function and its analytic jacobian
+            #
+            curvefit_func = partial(eclipses.invgauss_eclipses_curvefit_func,
+                                    zerolevel=npmedian(smags),
+                                    fixed_params=fitfunc_fixed)
+            curvefit_jac = partial(eclipses.invgauss_eclipses_curvefit_jacobian,
+                                   zerolevel=npmedian(smags),
+                                   fixed_params=fitfunc_fixed)
+
+            fitkwargs = {'jac':curvefit_jac}
+            if curve_fit_kwargs is not None:
+                fitkwargs.update(curve_fit_kwargs)
+
+            #
+            # run the fit
+            #
             finalparams, covmatrix = curve_fit(
                 curvefit_func,
                 stimes, smags,
@@ -397,6 +414,7 @@ def gaussianeb_fit_magseries(
                 sigma=serrs,
                 bounds=curvefit_bounds,
                 absolute_sigma=(not scale_errs_redchisq_unity),
+                **fitkwargs
             )
 
     except Exception:
@@ -9,6 +9,10 @@
 - :py:func:`astrobase.lcfit.sinusoidal.fourier_fit_magseries`: fit an arbitrary
   order Fourier series to a magnitude/flux time series.
 
+- :py:func:`astrobase.lcfit.sinusoidal.fourier_fit_magseries_periods`: fit an
+  arbitrary order Fourier series to a magnitude/flux time series at several
+  fixed periods using a single batched linear least-squares solve.
+
 '''
 
 #############
@@ -50,6 +54,7 @@ from numpy import (
     nonzero as npnonzero, array as nparray, concatenate as npconcatenate,
     diag as npdiag, sqrt as npsqrt, inf as npinf
 )
+import numpy as np
 
 from scipy.optimize import (
     minimize as spminimize,
@@ -59,7 +64,11 @@ from scipy.optimize import (
 from ..lcmath import sigclip_magseries
 from ..lcmodels import sinusoidal
 
-from .utils import get_phased_quantities, make_fit_plot
+from .utils import (
+    get_phased_quantities,
+    make_fit_plot,
+    curvefit_folded_model
+)
 
 
 #####################################################
@@ -134,6 +143,421 @@ def _fourier_chisq(fourierparams,
     return chisq
 
 
+##########################################################
+## LINEAR LEAST-SQUARES FOURIER FITTING AT FIXED PERIOD ##
+##########################################################
+
+def _fourier_linear_design(phase, fourierorder):
+    '''This returns the design matrix for a linear fit of a Fourier series.
+
+    With a fixed period, each term of the Fourier cosine series used in this
+    module, `A_x cos(2 pi x phase + phi_x)`, is a linear combination of
+    `cos(2 pi x phase)` and `sin(2 pi x phase)`. The zeroth order term is a
+    constant. The columns of the design matrix are::
+
+        [1, cos(2 pi phase), sin(2 pi phase), cos(4 pi phase), sin(4 pi phase),
+         ..., cos(2 pi (X-1) phase), sin(2 pi (X-1) phase)]
+
+    where X is the Fourier order, for a total of 2X - 1 columns.
+
+    Parameters
+    ----------
+
+    phase : np.array
+        The phases to evaluate the basis functions at. This can have any number
+        of leading dimensions, e.g. shape (nperiods, ndet) for a batch of
+        phased light curves.
+
+    fourierorder : int
+        The Fourier order of the series.
+
+    Returns
+    -------
+
+    np.array
+        The design matrix with shape `phase.shape + (2*fourierorder - 1,)`.
+
+    '''
+
+    columns = [np.ones_like(phase)]
+
+    for x in range(1, fourierorder):
+        angle = 2.0*pi_value*x*phase
+        columns.extend((np.cos(angle), np.sin(angle)))
+
+    return np.stack(columns, axis=-1)
+
+
+def _fourier_linear_solve(phase, mags, errs, fourierorder, zerolevel):
+    '''This solves for the linear Fourier coefficients at a batch of periods.
+
+    All Fourier orders up to `fourierorder` are fit together with one QR
+    decomposition of the error-weighted design matrix per period. Since the
+    columns of the design matrix are ordered by Fourier order, the same
+    decomposition also gives the chi-sq of the fits truncated at each lower
+    order.
+
+    Parameters
+    ----------
+
+    phase : np.array
+        The phases of the observations at each period, with shape (nperiods,
+        ndet).
+
+    mags,errs : np.array
+        The mags/fluxes and their errors, with shape (ndet,).
+
+    fourierorder : int
+        The Fourier order of the series.
+
+    zerolevel : float
+        The zero-level of the series, subtracted from `mags` before the fit.
+
+    Returns
+    -------
+
+    (coeffs, coeffcov, chisq_by_order) : tuple
+        `coeffs` are the fit coefficients for the columns of the design matrix
+        from :py:func:`._fourier_linear_design` with shape (nperiods, 2X - 1),
+        `coeffcov` is their covariance matrix with shape (nperiods, 2X - 1, 2X -
+        1) assuming the `errs` are absolute, and `chisq_by_order` is the chi-sq
+        of the fit truncated at Fourier orders 1 to X, with shape (nperiods,
+        X).
+
+    '''
+
+    design = _fourier_linear_design(phase, fourierorder)/errs[:,None]
+    target = (mags - zerolevel)/errs
+
+    qmat, rmat = np.linalg.qr(design)
+    qty = np.einsum('pnk,n->pk', qmat, target)
+
+    rinv = np.linalg.inv(rmat)
+    coeffs = np.einsum('pjk,pk->pj', rinv, qty)
+    coeffcov = np.matmul(rinv, np.swapaxes(rinv, -1, -2))
+
+    # the order X fit uses the first 2X - 1 columns
+    explained = np.cumsum(qty*qty, axis=-1)[:,0::2]
+    chisq_by_order = npsum(target*target) - explained
+
+    return coeffs, coeffcov, chisq_by_order
+
+
+def _fourier_linear_to_ampphase(coeffs, coeffcov):
+    '''This converts linear Fourier coefficients to amplitudes and phases.
+
+    The returned parameters are in the same form as the `finalparams` of
+    :py:func:`.fourier_fit_magseries`. The zeroth order term is a constant, so
+    its amplitude is set to the fit constant and its phase is set to 0.0.
+
+    Parameters
+    ----------
+
+    coeffs : np.array
+        The linear coefficients from :py:func:`._fourier_linear_solve` with
+        shape (nperiods, 2X - 1).
+
+    coeffcov : np.array
+        Their covariance matrices with shape (nperiods, 2X - 1, 2X - 1).
+
+    Returns
+    -------
+
+    (ampphase, ampphasecov) : tuple
+        `ampphase` has shape (nperiods, 2X) and contains the X amplitudes
+        followed by the X phases for each period. `ampphasecov` is the
+        covariance matrix of these with shape (nperiods, 2X, 2X).
+
+    '''
+
+    nperiods, ncoeffs = coeffs.shape
+    fourierorder = (ncoeffs + 1)//2
+
+    cosc, sinc = coeffs[:,1::2], coeffs[:,2::2]
+
+    amps = np.concatenate((coeffs[:,:1], np.hypot(cosc, sinc)), axis=1)
+    phases = np.concatenate((np.zeros((nperiods,1)), np.arctan2(-sinc, cosc)),
+                            axis=1)
+
+    # propagate the covariance using the Jacobian of the transformation
+    jacobian = np.zeros((nperiods, 2*fourierorder, ncoeffs))
+    jacobian[:,0,0] = 1.0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        amp2 = amps[:,1:]*amps[:,1:]
+        for x in range(1, fourierorder):
+            jacobian[:,x,2*x-1] = cosc[:,x-1]/amps[:,x]
+            jacobian[:,x,2*x] = sinc[:,x-1]/amps[:,x]
+            jacobian[:,fourierorder+x,2*x-1] = sinc[:,x-1]/amp2[:,x-1]
+            jacobian[:,fourierorder+x,2*x] = -cosc[:,x-1]/amp2[:,x-1]
+
+    ampphasecov = np.matmul(np.matmul(jacobian, coeffcov),
+                            np.swapaxes(jacobian, -1, -2))
+
+    return np.concatenate((amps, phases), axis=1), ampphasecov
+
+
+def _fourier_linear_fit(stimes, smags, serrs, periods, fourierorder,
+                        scale_errs_redchisq_unity=True,
+                        magsarefluxes=False,
+                        verbose=True):
+    '''This does the linear fixed-period Fourier fits at a batch of periods.
+
+    The input time-series should already be sigma-clipped and have no zero
+    errors. The results are in the same form as the results from
+    :py:func:`.fourier_fit_magseries`.
+
+    Parameters
+    ----------
+
+    stimes,smags,serrs : np.array
+        The input mag/flux time-series to fit.
+
+    periods : sequence of floats
+        The periods to fit the Fourier series at.
+
+    fourierorder : int
+        The Fourier order of the series.
+
+    scale_errs_redchisq_unity : bool
+        If True, the standard errors on the fit parameters will be scaled to
+        make the reduced chi-sq = 1.0, the same as the ``absolute_sigma=False``
+        behavior of ``scipy.optimize.curve_fit``.
+
+    magsarefluxes : bool
+        If True, will treat the input values of `mags` as fluxes for purposes of
+        finding the time of minimum light.
+
+    verbose : bool
+        If True, will indicate progress and warn of any problems.
+
+    Returns
+    -------
+
+    list of dicts
+        One fit result dict per input period.
+
+    '''
+
+    periods = np.atleast_1d(np.asarray(periods, dtype=np.float64))
+    zerolevel = npmedian(smags)
+
+    # the number of params is the same as for curve_fit: period + coeffs
+    nparams = 2*fourierorder + 1
+
+    try:
+
+        if smags.size <= nparams:
+            raise ValueError('not enough observations (%s) to fit '
+                             'a Fourier series of order %s' %
+                             (smags.size, fourierorder))
+
+        mintime = npmin(stimes)
+        iphase = (stimes - mintime)[None,:]/periods[:,None]
+        iphase = iphase - np.floor(iphase)
+
+        coeffs, coeffcov, chisq_by_order = _fourier_linear_solve(
+            iphase, smags, serrs, fourierorder, zerolevel
+        )
+        allparams, allcov = _fourier_linear_to_ampphase(coeffs, coeffcov)
+        fitok = np.all(np.isfinite(allparams), axis=1)
+
+    except Exception:
+        LOGEXCEPTION('linear Fourier fit failed')
+        allparams, allcov, chisq_by_order = None, None, None
+        fitok = np.zeros(periods.size, dtype=np.bool_)
+
+    results = []
+
+    for ind, period in enumerate(periods):
+
+        phase, pmags, perrs, ptimes, mintime = (
+            get_phased_quantities(stimes, smags, serrs, period)
+        )
+
+        if not fitok[ind]:
+
+            LOGERROR('fourier-fit: linear least-squares fit to the '
+                     'light curve failed for period %.6f' % period)
+            results.append({
+                'fittype':'fourier',
+                'fitinfo':{
+                    'fourierorder':fourierorder,
+                    'fitmethod':'linear',
+                    'finalparams':None,
+                    'finalparamerrs':None,
+                    'initialfit':None,
+                    'fitmags':None,
+                    'fitperiod':None,
+                    'fitepoch':None,
+                    'actual_fitepoch':None,
+                },
+                'fitchisq':npnan,
+                'fitredchisq':npnan,
+                'fitplotfile':None,
+                'magseries':{
+                    'times':ptimes,
+                    'phase':phase,
+                    'mags':pmags,
+                    'errs':perrs,
+                    'magsarefluxes':magsarefluxes
+                }
+            })
+            continue
+
+        finalparams = allparams[ind]
+        fitmags = _fourier_func(finalparams, phase, pmags)
+
+        fitchisq = npsum(
+            ((fitmags - pmags)*(fitmags - pmags)) / (perrs*perrs)
+        )
+
+        # this matches the definition used for the curve_fit fits
+        n_free_params = len(pmags) - nparams - 1
+        fitredchisq = fitchisq/n_free_params
+
+        covmatrix = allcov[ind]
+        if scale_errs_redchisq_unity:
+            covmatrix = covmatrix*fitchisq/(len(pmags) - nparams)
+
+        # the period is fixed so its error is zero
+        stderrs = npconcatenate((nparray([0.0]), npsqrt(npdiag(covmatrix))))
+
+        if verbose:
+            LOGINFO(
+                'linear fit done for period %.6f. '
+                'chisq = %.5f, reduced chisq = %.5f' %
+                (period, fitchisq, fitredchisq)
+            )
+
+        if not magsarefluxes:
+            fitmagminind = npwhere(fitmags == npmax(fitmags))
+        else:
+            fitmagminind = npwhere(fitmags == npmin(fitmags))
+        if len(fitmagminind[0]) > 1:
+            fitmagminind = (fitmagminind[0][0],)
+
+        results.append({
+            'fittype':'fourier',
+            'fitinfo':{
+                'fourierorder':fourierorder,
+                'fitmethod':'linear',
+                'finalparams':finalparams,
+                'finalparamerrs':stderrs,
+                'initialfit':None,
+                'fitmags':fitmags,
+                'fitperiod':period,
+                'fitepoch':mintime,
+                'actual_fitepoch':ptimes[fitmagminind],
+                # the chi-sq of the fits truncated at orders 1 to X
+                'fitchisq_by_order':chisq_by_order[ind],
+            },
+            'fitchisq':fitchisq,
+            'fitredchisq':fitredchisq,
+            'fitplotfile':None,
+            'magseries':{
+                'times':ptimes,
+                'phase':phase,
+                'mags':pmags,
+                'errs':perrs,
+                'magsarefluxes':magsarefluxes
+            },
+        })
+
+    return results
+
+
+def fourier_fit_magseries_periods(
+        times, mags, errs, periods,
+        fourierorder=3,
+        scale_errs_redchisq_unity=True,
+        sigclip=3.0,
+        magsarefluxes=False,
+        verbose=True,
+):
+    '''This fits a Fourier series to a mag/flux time series at several periods.
+
+    The period is held fixed for each fit, so the Fourier series is a linear
+    model in the cosine and sine coefficients of each order. The fits at all of
+    the input periods are done together with a batched linear least-squares
+    solve, and the coefficients are converted back to the amplitudes and phases
+    used by :py:func:`.fourier_fit_magseries`. This is much faster than calling
+    that function once per period.
+
+    Parameters
+    ----------
+
+    times,mags,errs : np.array
+        The input mag/flux time-series to fit a Fourier cosine series to.
+
+    periods : sequence of floats
+        The periods to use for the Fourier fits.
+
+    fourierorder : int
+        The Fourier order of the series to fit.
+
+    scale_errs_redchisq_unity : bool
+        If True, the standard errors on the fit parameters will be scaled to
+        make the reduced chi-sq = 1.0.
+
+    sigclip : float or int or sequence of two floats/ints or None
+        If a single float or int, a symmetric sigma-clip will be performed using
+        the number provided as the sigma-multiplier to cut out from the input
+        time-series.
+
+        If a list of two ints/floats is provided, the function will perform an
+        'asymmetric' sigma-clip. The first element in this list is the sigma
+        value to use for fainter flux/mag values; the second element in this
+        list is the sigma value to use for brighter flux/mag values. For
+        example, `sigclip=[10., 3.]`, will sigclip out greater than 10-sigma
+        dimmings and greater than 3-sigma brightenings. Here the meaning of
+        "dimming" and "brightening" is set by *physics* (not the magnitude
+        system), which is why the `magsarefluxes` kwarg must be correctly set.
+
+        If `sigclip` is None, no sigma-clipping will be performed, and the
+        time-series (with non-finite elems removed) will be passed through to
+        the output.
+
+    magsarefluxes : bool
+        If True, will treat the input values of `mags` as fluxes for purposes of
+        sig-clipping and finding the time of minimum light.
+
+    verbose : bool
+        If True, will indicate progress and warn of any problems.
+
+    Returns
+    -------
+
+    list of dicts
+        This returns a list of fit result dicts, one per input period, in the
+        same form as the result from :py:func:`.fourier_fit_magseries`. The
+        'fitinfo' dict in each of these also has a 'fitchisq_by_order' key
+        containing the chi-sq values of the fits truncated at Fourier orders 1
+        to `fourierorder`.
+
+    '''
+
+    stimes, smags, serrs = sigclip_magseries(times, mags, errs,
+                                             sigclip=sigclip,
+                                             magsarefluxes=magsarefluxes)
+
+    # get rid of zero errs
+    nzind = npnonzero(serrs)
+    stimes, smags, serrs = stimes[nzind], smags[nzind], serrs[nzind]
+
+    if verbose:
+        LOGINFO('fitting Fourier series of order %s to '
+                'mag series with %s observations at %s periods' %
+                (fourierorder, len(stimes), np.size(periods)))
+
+    return _fourier_linear_fit(
+        stimes, smags, serrs, periods, fourierorder,
+        scale_errs_redchisq_unity=scale_errs_redchisq_unity,
+        magsarefluxes=magsarefluxes,
+        verbose=verbose
+    )
+
+
 def fourier_fit_magseries(
         times, mags, errs, period,
         fourierorder=None,
@@ -146,6 +570,7 @@ def fourier_fit_magseries(
         ignoreinitfail=True,
         verbose=True,
         curve_fit_kwargs=None,
+        fitmethod='curve_fit',
 ):
     '''This fits a Fourier series to a mag/flux time series.
 
@@ -225,6 +650,18 @@ def fourier_fit_magseries(
         If not None, this should be a dict containing extra kwargs to pass to
         the scipy.optimize.curve_fit function.
 
+    fitmethod : {'curve_fit', 'linear'}
+        If 'curve_fit', the Fourier series is fit with an initial global
+        minimization followed by ``scipy.optimize.curve_fit``. If 'linear' and
+        `fix_period` is True, the Fourier series is fit directly with a linear
+        least-squares solve for the cosine and sine coefficients of all orders,
+        which are then converted to the usual amplitudes and phases. This is
+        much faster and always finds the global minimum chi-sq, but the
+        amplitude of the zeroth order term is returned as the fit constant with
+        a zero phase and the other amplitudes are always positive, so the
+        `finalparams` may differ from the 'curve_fit' ones for the same model.
+        `fourierparams` is only used to get the Fourier order for this method.
+
     Returns
     -------
 
@@ -304,6 +741,39 @@ def fourier_fit_magseries(
                                                        period,
                                                        mintime))
 
+    if fitmethod == 'linear':
+
+        if fix_period:
+
+            returndict = _fourier_linear_fit(
+                stimes, smags, serrs, [period], fourierorder,
+                scale_errs_redchisq_unity=scale_errs_redchisq_unity,
+                magsarefluxes=magsarefluxes,
+                verbose=verbose
+            )[0]
+
+            # make the fit plot if required
+            if (plotfit and isinstance(plotfit, str) and
+                returndict['fitinfo']['finalparams'] is not None):
+
+                make_fit_plot(returndict['magseries']['phase'],
+                              returndict['magseries']['mags'],
+                              returndict['magseries']['errs'],
+                              returndict['fitinfo']['fitmags'],
+                              period,
+                              returndict['fitinfo']['fitepoch'],
+                              returndict['fitinfo']['fitepoch'],
+                              plotfit,
+                              magsarefluxes=magsarefluxes)
+
+                returndict['fitplotfile'] = plotfit
+
+            return returndict
+
+        else:
+            LOGWARNING('the linear Fourier fit requires a fixed period, '
+                       'using curve_fit instead')
+
     # initial minimize call to find global minimum in chi-sq
     initialfit = spminimize(_fourier_chisq,
                             fourierparams,
@@ -319,22 +789,32 @@ def fourier_fit_magseries(
 
         try:
 
-            curvefit_params = npconcatenate((
-                nparray([period]),
-                leastsqparams
-            ))
-
-            # set up the bounds for the fit parameters
+            # with a fixed period, the phase-fold doesn't change between
+            # model evaluations, so we fit only the Fourier coeffs with the
+            # cached phase-folded model and its analytic jacobian
             if fix_period:
-                curvefit_bounds = (
-                    [period - 1.0e-7] +
-                    [-npinf]*fourierorder +
-                    [-npinf]*fourierorder,
-                    [period + 1.0e-7] +
-                    [npinf]*fourierorder +
-                    [npinf]*fourierorder
+
+                foldedmodel = sinusoidal.FourierSinusoidalModel(
+                    stimes, smags, serrs,
+                    period, mintime, fourierorder,
+                    zerolevel=npmedian(smags)
+                )
+                finalparams, covmatrix = curvefit_folded_model(
+                    foldedmodel,
+                    [period],
+                    leastsqparams,
+                    scale_errs_redchisq_unity=scale_errs_redchisq_unity,
+                    curve_fit_kwargs=curve_fit_kwargs
                 )
+
             else:
+
+                curvefit_params = npconcatenate((
+                    nparray([period]),
+                    leastsqparams
+                ))
+
+                # set up the bounds for the fit parameters
                 curvefit_bounds = (
                     [0.0] +
                     [-npinf]*fourierorder +
@@ -344,26 +824,20 @@ def fourier_fit_magseries(
                     [npinf]*fourierorder
                 )
 
-            curvefit_func = partial(
-                sinusoidal.fourier_curvefit_func,
-                zerolevel=npmedian(smags),
-                epoch=mintime,
-                fixed_period=period if fix_period else None,
-            )
-
-            if curve_fit_kwargs is not None:
-
-                finalparams, covmatrix = curve_fit(
-                    curvefit_func,
-                    stimes, smags,
-                    p0=curvefit_params,
-                    sigma=serrs,
-                    bounds=curvefit_bounds,
-                    absolute_sigma=(not scale_errs_redchisq_unity),
-                    **curve_fit_kwargs
+                curvefit_func = partial(
+                    sinusoidal.fourier_curvefit_func,
+                    zerolevel=npmedian(smags),
+                    epoch=mintime,
+                )
+                curvefit_jac = partial(
+                    sinusoidal.fourier_curvefit_jacobian,
+                    zerolevel=npmedian(smags),
+                    epoch=mintime,
                 )
 
-            else:
+                fitkwargs = {'jac':curvefit_jac}
+                if curve_fit_kwargs is not None:
+                    fitkwargs.update(curve_fit_kwargs)
 
                 finalparams, covmatrix = curve_fit(
                     curvefit_func,
@@ -372,6 +846,7 @@ def fourier_fit_magseries(
                     sigma=serrs,
                     bounds=curvefit_bounds,
                     absolute_sigma=(not scale_errs_redchisq_unity),
+                    **fitkwargs
                 )
 
         except Exception:
@@ -423,6 +898,7 @@ def fourier_fit_magseries(
                 'fittype':'fourier',
                 'fitinfo':{
                     'fourierorder':fourierorder,
+                    'fitmethod':'curve_fit',
                     # return coeffs only for backwards compatibility with
                     # existing functions that use the returned value of
                     # fourier_fit_magseries
@@ -468,6 +944,7 @@ def fourier_fit_magseries(
                 'fittype':'fourier',
                 'fitinfo':{
                     'fourierorder':fourierorder,
+                    'fitmethod':'curve_fit',
                     'finalparams':None,
                     'finalparamerrs':None,
                     'initialfit':initialfit,
@@ -499,6 +976,7 @@ def fourier_fit_magseries(
             'fittype':'fourier',
             'fitinfo':{
                 'fourierorder':fourierorder,
+                'fitmethod':'curve_fit',
                 'finalparams':None,
                 'finalparamerrs':None,
                 'initialfit':initialfit,
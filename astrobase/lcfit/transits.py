@@ -95,7 +95,7 @@ except Exception:
 
 from ..lcmodels import transits
 from ..lcmath import sigclip_magseries
-from .utils import make_fit_plot
+from .utils import make_fit_plot, curvefit_folded_model
 from .nonphysical import savgol_fit_magseries, spline_fit_magseries
 
 
@@ -393,36 +393,54 @@ def traptransit_fit_magseries(
             )
 
         #
-        # set up the curve fit function
+        # if the period and epoch are both fixed, the phase-fold doesn't change
+        # between model evaluations, so we fit only the shape params with the
+        # cached phase-folded model and its analytic jacobian
         #
-        curvefit_func = partial(transits.trapezoid_transit_curvefit_func,
-                                zerolevel=np.median(smags),
-                                fixed_params=fitfunc_fixed)
+        if 'period' in fitfunc_fixed and 'epoch' in fitfunc_fixed:
 
-        #
-        # run the fit
-        #
-        if curve_fit_kwargs is not None:
-
-            finalparams, covmatrix = curve_fit(
-                curvefit_func,
-                stimes, smags,
-                p0=transitparams,
-                sigma=serrs,
-                bounds=curvefit_bounds,
-                absolute_sigma=(not scale_errs_redchisq_unity),
-                **curve_fit_kwargs
+            foldedmodel = transits.TrapezoidTransitModel(
+                stimes, smags, serrs,
+                transitparams[0], transitparams[1],
+                zerolevel=np.median(smags)
+            )
+            finalparams, covmatrix = curvefit_folded_model(
+                foldedmodel,
+                transitparams[:2],
+                transitparams[2:],
+                shape_bounds=(curvefit_bounds[0][2:],
+                              curvefit_bounds[1][2:]),
+                scale_errs_redchisq_unity=scale_errs_redchisq_unity,
+                curve_fit_kwargs=curve_fit_kwargs
             )
 
         else:
 
+            #
+            # set up the curve fit function and its analytic jacobian
+            #
+            curvefit_func = partial(transits.trapezoid_transit_curvefit_func,
+                                    zerolevel=np.median(smags),
+                                    fixed_params=fitfunc_fixed)
+            curvefit_jac = partial(transits.trapezoid_transit_curvefit_jacobian,
+                                   zerolevel=np.median(smags),
+                                   fixed_params=fitfunc_fixed)
+
+            fitkwargs = {'jac':curvefit_jac}
+            if curve_fit_kwargs is not None:
+                fitkwargs.update(curve_fit_kwargs)
+
+            #
+            # run the fit
+            #
             finalparams, covmatrix = curve_fit(
                 curvefit_func,
                 stimes, smags,
                 p0=transitparams,
                 sigma=serrs,
-                absolute_sigma=(not scale_errs_redchisq_unity),
                 bounds=curvefit_bounds,
+                absolute_sigma=(not scale_errs_redchisq_unity),
+                **fitkwargs
             )
 
     except Exception:
@@ -646,19 +664,21 @@ def _log_prior_transit_plus_line(theta, priorbounds):
     return _log_prior_transit(theta, priorbounds)
 
 
-def _log_likelihood_transit(theta, params, model, t, flux, err_flux,
-                            priorbounds):
+def _update_transit_params(theta, params, paramkeys):
     '''
-    Given a batman TransitModel and its proposed parameters (theta), update the
-    batman params object with the proposed parameters and evaluate the gaussian
-    likelihood.
+    This updates a batman TransitParams object with the proposed parameters.
 
-    Note: the priorbounds are only needed to parse theta.
+    `paramkeys` is the sorted list of the keys in the priorbounds dict, which
+    tells us which parts of theta correspond to which physical quantities.
+
+    Returns the (poly_order0, poly_order1) coefficients of the line for the
+    transit plus line model. These are 0.0 if they're not in `paramkeys`.
     '''
 
     u = []
+    poly_order0, poly_order1 = 0.0, 0.0
 
-    for ix, key in enumerate(sorted(priorbounds.keys())):
+    for ix, key in enumerate(paramkeys):
 
         if key == 'rp':
             params.rp = theta[ix]
@@ -671,14 +691,33 @@ def _log_likelihood_transit(theta, params, model, t, flux, err_flux,
         elif key == 'period':
             params.per = theta[ix]
         elif key == 'ecc':
-            params.per = theta[ix]
+            params.ecc = theta[ix]
         elif key == 'omega':
             params.w = theta[ix]
         elif key == 'u_linear':
             u.append(theta[ix])
-        elif key == 'u_quadratic':
+        elif key in ('u_quad', 'u_quadratic'):
             u.append(theta[ix])
             params.u = u
+        elif key == 'poly_order0':
+            poly_order0 = theta[ix]
+        elif key == 'poly_order1':
+            poly_order1 = theta[ix]
+
+    return poly_order0, poly_order1
+
+
+def _log_likelihood_transit(theta, params, model, t, flux, err_flux,
+                            priorbounds):
+    '''
+    Given a batman TransitModel and its proposed parameters (theta), update the
+    batman params object with the proposed parameters and evaluate the gaussian
+    likelihood.
+
+    Note: the priorbounds are only needed to parse theta.
+    '''
+
+    _update_transit_params(theta, params, sorted(priorbounds.keys()))
 
     lc = model.light_curve(params)
     residuals = flux - lc
@@ -699,39 +738,9 @@ def _log_likelihood_transit_plus_line(theta, params, model, t, data_flux,
     Note: the priorbounds are only needed to parse theta.
     '''
 
-    u = []
-    for ix, key in enumerate(sorted(priorbounds.keys())):
-
-        if key == 'rp':
-            params.rp = theta[ix]
-        elif key == 't0':
-            params.t0 = theta[ix]
-        elif key == 'sma':
-            params.a = theta[ix]
-        elif key == 'incl':
-            params.inc = theta[ix]
-        elif key == 'period':
-            params.per = theta[ix]
-        elif key == 'ecc':
-            params.per = theta[ix]
-        elif key == 'omega':
-            params.w = theta[ix]
-        elif key == 'u_linear':
-            u.append(theta[ix])
-        elif key == 'u_quadratic':
-            u.append(theta[ix])
-            params.u = u
-        elif key == 'poly_order0':
-            poly_order0 = theta[ix]
-        elif key == 'poly_order1':
-            poly_order1 = theta[ix]
-
-    try:
-        poly_order0
-    except Exception:
-        poly_order0 = 0
-    else:
-        pass
+    poly_order0, poly_order1 = _update_transit_params(
+        theta, params, sorted(priorbounds.keys())
+    )
 
     transit = model.light_curve(params)
     line = poly_order0 + t*poly_order1
@@ -775,10 +784,207 @@ def log_posterior_transit_plus_line(theta, params, model, t, flux, err_flux,
         )
 
 
+def _log_posterior_transit_walkers(thetas, params, model, t, flux, err_flux,
+                                   priorbounds, withline=False):
+    '''
+    This evaluates the posterior probability for a batch of walkers at once.
+
+    `thetas` is an array of shape (n_walkers, n_dim). The uniform priors are
+    checked for all walkers with a single array comparison, the transit models
+    for the walkers inside the prior bounds are evaluated in this process and
+    stacked, and the gaussian log-likelihoods are then calculated together.
+    '''
+
+    thetas = np.atleast_2d(thetas)
+    paramkeys = sorted(priorbounds.keys())
+    bounds = np.array([priorbounds[k] for k in paramkeys], dtype=np.float64)
+
+    allowed = np.all(
+        (thetas > bounds[:,0]) & (thetas < bounds[:,1]),
+        axis=1
+    )
+    log_posterior = np.full(thetas.shape[0], -np.inf)
+
+    if not np.any(allowed):
+        return log_posterior
+
+    model_flux = np.empty((np.count_nonzero(allowed), t.size))
+
+    for ix, theta in enumerate(thetas[allowed]):
+
+        poly_order0, poly_order1 = _update_transit_params(theta,
+                                                          params,
+                                                          paramkeys)
+        model_flux[ix,:] = model.light_curve(params)
+
+        if withline:
+            model_flux[ix,:] += poly_order0 + t*poly_order1
+
+    residuals = (flux - model_flux)/err_flux
+    log_norm = np.sum(np.log(2*np.pi*(err_flux)**2))
+
+    log_posterior[allowed] = -0.5*(
+        np.sum(residuals*residuals, axis=1) + log_norm
+    )
+
+    return log_posterior
+
+
+def log_posterior_transit_vectorized(thetas, params, model, t, flux, err_flux,
+                                     priorbounds):
+    '''
+    Evaluate posterior probabilities for an array of proposed model parameters
+    with shape (n_walkers, n_dim) and the observed flux timeseries.
+
+    This is used with `emcee.EnsembleSampler(..., vectorize=True)`.
+    '''
+    return _log_posterior_transit_walkers(thetas, params, model, t, flux,
+                                          err_flux, priorbounds,
+                                          withline=False)
+
+
+def log_posterior_transit_plus_line_vectorized(thetas, params, model, t, flux,
+                                               err_flux, priorbounds):
+    '''
+    Evaluate posterior probabilities for an array of proposed model parameters
+    with shape (n_walkers, n_dim) and the observed flux timeseries, for the
+    transit plus line model.
+
+    This is used with `emcee.EnsembleSampler(..., vectorize=True)`.
+    '''
+    return _log_posterior_transit_walkers(thetas, params, model, t, flux,
+                                          err_flux, priorbounds,
+                                          withline=True)
+
+
 ###################################################
 ## MANDEL & AGOL TRANSIT MODEL FIT TO MAG SERIES ##
 ###################################################
 
+def _transit_mcmc_theta(fitparams):
+    '''
+    This gets the initial MCMC parameter vector from the fitparams dict.
+
+    Returns `(theta, fitparamnames)`.
+    '''
+
+    theta, fitparamnames = [], []
+    for k in np.sort(list(fitparams.keys())):
+        if isinstance(fitparams[k], float) or isinstance(fitparams[k], int):
+            theta.append(fitparams[k])
+            fitparamnames.append(fitparams[k])
+        elif isinstance(fitparams[k], list):
+            if not len(fitparams[k]) == 2:
+                raise ValueError('should only be quadratic LD coeffs')
+            theta.append(fitparams[k][0])
+            theta.append(fitparams[k][1])
+            fitparamnames.append(fitparams[k][0])
+            fitparamnames.append(fitparams[k][1])
+
+    return theta, fitparamnames
+
+
+def _transit_mcmc_backend(mcmcbackend, samplesavpath):
+    '''
+    This returns `mcmcbackend` if it's provided, or an
+    `emcee.backends.HDFBackend` for the HDF5 file at `samplesavpath`.
+    '''
+
+    if mcmcbackend is not None:
+        return mcmcbackend
+    else:
+        return emcee.backends.HDFBackend(samplesavpath)
+
+
+def _run_transit_mcmc(fittype,
+                      backend,
+                      initial_position_vec,
+                      log_posterior,
+                      log_posterior_vectorized,
+                      posterior_args,
+                      n_dim,
+                      n_mcmc_steps,
+                      n_walkers,
+                      nworkers,
+                      vectorize,
+                      mcmcprogressbar,
+                      verbose):
+    '''
+    This runs the MCMC for the Mandel & Agol transit fitters.
+
+    If `backend` already has samples in it, the chain is continued from
+    these. Otherwise, it starts from `initial_position_vec`. The posterior is
+    evaluated by `log_posterior_vectorized` for all walkers at once if
+    `vectorize` is True, or by `log_posterior` in a pool of `nworkers`
+    processes otherwise.
+
+    The fitters take the burn-in and the acceptance fraction from the full
+    chain in `backend`. For a fresh backend, these are the same as using
+    `n_mcmc_steps` and the sampler's acceptance fraction.
+    '''
+
+    from multiprocessing import Pool
+
+    if vectorize:
+        mcmcmode = 'vectorized'
+    else:
+        mcmcmode = '{:d} threads'.format(nworkers)
+
+    # if this is the first run, then start from the initial positions.
+    # otherwise, resume from the previous samples.
+    starting_positions = initial_position_vec
+    isfirstrun = True
+    if os.path.exists(backend.filename) and backend.initialized:
+        if backend.iteration > 1:
+            starting_positions = None
+            isfirstrun = False
+
+    if verbose and isfirstrun:
+        LOGINFO(
+            'start {:s} MCMC with {:d} dims, {:d} steps, {:d} walkers,'.
+            format(fittype, n_dim, n_mcmc_steps, n_walkers) +
+            ' {:s}'.format(mcmcmode)
+        )
+    elif verbose and not isfirstrun:
+        LOGINFO(
+            'continue {:s} with {:d} dims, {:d} steps, {:d} walkers, '.
+            format(fittype, n_dim, n_mcmc_steps, n_walkers) +
+            '{:s}'.format(mcmcmode)
+        )
+
+    if vectorize:
+
+        sampler = emcee.EnsembleSampler(
+            n_walkers, n_dim, log_posterior_vectorized,
+            args=posterior_args,
+            vectorize=True,
+            backend=backend
+        )
+        sampler.run_mcmc(starting_positions, n_mcmc_steps,
+                         progress=mcmcprogressbar)
+
+    else:
+
+        with Pool(nworkers) as pool:
+            sampler = emcee.EnsembleSampler(
+                n_walkers, n_dim, log_posterior,
+                args=posterior_args,
+                pool=pool,
+                backend=backend
+            )
+            sampler.run_mcmc(starting_positions, n_mcmc_steps,
+                             progress=mcmcprogressbar)
+
+    if verbose:
+        LOGINFO(
+            'ended {:s} MCMC run with {:d} steps, {:d} walkers, '.format(
+                fittype, n_mcmc_steps, n_walkers
+            ) + '{:s}'.format(mcmcmode)
+        )
+
+    return sampler
+
+
 def mandelagol_fit_magseries(
         times, mags, errs,
         fitparams,
@@ -799,7 +1005,9 @@ def mandelagol_fit_magseries(
         magsarefluxes=False,
         sigclip=10.0,
         verbose=True,
-        nworkers=4
+        nworkers=4,
+        vectorize=False,
+        mcmcbackend=None,
 ):
     '''
     This fits a Mandel & Agol (2002) planetary transit model to a flux time
@@ -858,7 +1066,9 @@ def mandelagol_fit_magseries(
         known planet, or fake data). Only for plotting purposes.
 
     burninpercent : float
-        The percent of MCMC samples to discard as burn-in.
+        The percent of MCMC samples to discard as burn-in. This is taken from
+        the full chain in the backend. If the chain is continued from samples
+        collected by an earlier run, these count towards the burn-in as well.
 
     plotcorner : str or False
         If this is a str, points to the path of output corner plot that will be
@@ -867,6 +1077,7 @@ def mandelagol_fit_magseries(
     samplesavpath : str
         This must be provided so `emcee` can save its MCMC samples to disk as
         HDF5 files. This will set the path of the output HDF5file written.
+        This is ignored if `mcmcbackend` is provided.
 
     n_walkers : int
         The number of MCMC walkers to use.
@@ -923,7 +1134,23 @@ def mandelagol_fit_magseries(
         If True, will indicate MCMC progress.
 
     nworkers : int
-        The number of parallel workers to launch for MCMC.
+        The number of parallel workers to launch for MCMC. This is ignored if
+        `vectorize` is True.
+
+    vectorize : bool
+        If True, the posterior for all of the walkers will be evaluated at
+        once in this process using the `vectorize=True` mode of
+        `emcee.EnsembleSampler`, instead of sending each walker's evaluation
+        to a pool of `nworkers` processes. This avoids pickling the BATMAN
+        model and light curve for every evaluation, which usually takes longer
+        than the model itself. This also makes it safe to run several of these
+        fits at once in separate processes.
+
+    mcmcbackend : emcee.backends.Backend or None
+        If this is provided, the MCMC samples will be saved to and read from
+        this `emcee` backend instead of an HDF5 file at `samplesavpath`. Use
+        this to keep many chains in a single HDF5 file, e.g. with an
+        `emcee.backends.HDFBackend` with a different `name` for each chain.
 
     Returns
     -------
@@ -942,7 +1169,8 @@ def mandelagol_fit_magseries(
                     'finalparamerrs':formal errors in the params,
                     'fitmags': the model fit mags,
                     'fitepoch': the epoch of minimum light for the fit,
-                    'acceptancefraction': fraction of MCMC ensemble. low=bad.
+                    'acceptancefraction': fraction of MCMC ensemble over
+                                          the full chain. low=bad.
                     'autocorrtime': if autocorrtime ~= n_mcmc_steps, not good.
                 },
                 'fitplotfile': the output fit plot if fitplot is not None,
@@ -957,12 +1185,11 @@ def mandelagol_fit_magseries(
 
     '''
 
-    from multiprocessing import Pool
     fittype = 'mandelagol'
 
     if not magsarefluxes:
         raise NotImplementedError('magsarefluxes is not implemented yet.')
-    if not samplesavpath:
+    if not samplesavpath and mcmcbackend is None:
         raise ValueError(
             'This function requires that you save the samples somewhere'
         )
@@ -1001,18 +1228,7 @@ def mandelagol_fit_magseries(
     init_flux = init_m.light_curve(init_params)
 
     # guessed initial params. give nice guesses, or else emcee struggles.
-    theta, fitparamnames = [], []
-    for k in np.sort(list(fitparams.keys())):
-        if isinstance(fitparams[k], float) or isinstance(fitparams[k], int):
-            theta.append(fitparams[k])
-            fitparamnames.append(fitparams[k])
-        elif isinstance(fitparams[k], list):
-            if not len(fitparams[k]) == 2:
-                raise ValueError('should only be quadratic LD coeffs')
-            theta.append(fitparams[k][0])
-            theta.append(fitparams[k][1])
-            fitparamnames.append(fitparams[k][0])
-            fitparamnames.append(fitparams[k][1])
+    theta, fitparamnames = _transit_mcmc_theta(fitparams)
 
     # initialize sampler
     n_dim = len(theta)
@@ -1022,56 +1238,36 @@ def mandelagol_fit_magseries(
     # run the MCMC, unless you just want to load the available samples
     if not skipsampling:
 
-        backend = emcee.backends.HDFBackend(samplesavpath)
+        backend = _transit_mcmc_backend(mcmcbackend, samplesavpath)
+
         if overwriteexistingsamples:
             LOGWARNING(
-                'erased samples previously at {:s}'.format(samplesavpath)
+                'erased samples previously at {:s}'.format(backend.filename)
             )
             backend.reset(n_walkers, n_dim)
 
         # if this is the first run, then start from a gaussian ball.
         # otherwise, resume from the previous samples.
-        starting_positions = initial_position_vec
-        isfirstrun = True
-        if os.path.exists(backend.filename):
-            if backend.iteration > 1:
-                starting_positions = None
-                isfirstrun = False
-
-        if verbose and isfirstrun:
-            LOGINFO(
-                'start {:s} MCMC with {:d} dims, {:d} steps, {:d} walkers,'.
-                format(fittype, n_dim, n_mcmc_steps, n_walkers) +
-                ' {:d} threads'.format(nworkers)
-            )
-        elif verbose and not isfirstrun:
-            LOGINFO(
-                'continue {:s} with {:d} dims, {:d} steps, {:d} walkers, '.
-                format(fittype, n_dim, n_mcmc_steps, n_walkers) +
-                '{:d} threads'.format(nworkers)
-            )
-
-        with Pool(nworkers) as pool:
-            sampler = emcee.EnsembleSampler(
-                n_walkers, n_dim, log_posterior_transit,
-                args=(init_params, init_m, stimes,
-                      smags, serrs, priorbounds),
-                pool=pool,
-                backend=backend
-            )
-            sampler.run_mcmc(starting_positions, n_mcmc_steps,
-                             progress=mcmcprogressbar)
-
-        if verbose:
-            LOGINFO(
-                'ended {:s} MCMC run with {:d} steps, {:d} walkers, '.format(
-                    fittype, n_mcmc_steps, n_walkers
-                ) + '{:d} threads'.format(nworkers)
-            )
-
-    reader = emcee.backends.HDFBackend(samplesavpath)
-
-    n_to_discard = int(burninpercent*n_mcmc_steps)
+        _run_transit_mcmc(fittype,
+                          backend,
+                          initial_position_vec,
+                          log_posterior_transit,
+                          log_posterior_transit_vectorized,
+                          (init_params, init_m, stimes,
+                           smags, serrs, priorbounds),
+                          n_dim,
+                          n_mcmc_steps,
+                          n_walkers,
+                          nworkers,
+                          vectorize,
+                          mcmcprogressbar,
+                          verbose)
+
+    reader = _transit_mcmc_backend(mcmcbackend, samplesavpath)
+
+    # discard the burn-in from the full chain, which may include samples from
+    # earlier runs
+    n_to_discard = int(burninpercent*reader.iteration)
 
     samples = reader.get_chain(discard=n_to_discard, flat=True)
 
@@ -1123,8 +1319,8 @@ def mandelagol_fit_magseries(
             'finalparamerrs':stderrs,
             'fitmags':fitmags,
             'fitepoch':fepoch,
-            'acceptancefraction':np.mean(sampler.acceptance_fraction),
-            'autocorrtime':np.mean(sampler.get_autocorr_time(c=1, quiet=True))
+            'acceptancefraction':np.mean(reader.accepted/reader.iteration),
+            'autocorrtime':np.mean(reader.get_autocorr_time(c=1, quiet=True))
         },
         'fitplotfile':None,
         'magseries':{
@@ -1204,7 +1400,9 @@ def mandelagol_and_line_fit_magseries(
         magsarefluxes=True,
         sigclip=10.0,
         verbose=True,
-        nworkers=4
+        nworkers=4,
+        vectorize=False,
+        mcmcbackend=None,
 ):
     '''The model fit by this function is: a Mandel & Agol (2002) transit, PLUS a
     line. You can fit and fix whatever parameters you want.
@@ -1266,7 +1464,9 @@ def mandelagol_and_line_fit_magseries(
         known planet, or fake data). Only for plotting purposes.
 
     burninpercent : float
-        The percent of MCMC samples to discard as burn-in.
+        The percent of MCMC samples to discard as burn-in. This is taken from
+        the full chain in the backend. If the chain is continued from samples
+        collected by an earlier run, these count towards the burn-in as well.
 
     plotcorner : str or False
         If this is a str, points to the path of output corner plot that will be
@@ -1279,6 +1479,7 @@ def mandelagol_and_line_fit_magseries(
     samplesavpath : str
         This must be provided so `emcee` can save its MCMC samples to disk as
         HDF5 files. This will set the path of the output HDF5file written.
+        This is ignored if `mcmcbackend` is provided.
 
     n_walkers : int
         The number of MCMC walkers to use.
@@ -1344,7 +1545,23 @@ def mandelagol_and_line_fit_magseries(
         If True, will indicate MCMC progress.
 
     nworkers : int
-        The number of parallel workers to launch for MCMC.
+        The number of parallel workers to launch for MCMC. This is ignored if
+        `vectorize` is True.
+
+    vectorize : bool
+        If True, the posterior for all of the walkers will be evaluated at
+        once in this process using the `vectorize=True` mode of
+        `emcee.EnsembleSampler`, instead of sending each walker's evaluation
+        to a pool of `nworkers` processes. This avoids pickling the BATMAN
+        model and light curve for every evaluation, which usually takes longer
+        than the model itself. This also makes it safe to run several of these
+        fits at once in separate processes.
+
+    mcmcbackend : emcee.backends.Backend or None
+        If this is provided, the MCMC samples will be saved to and read from
+        this `emcee` backend instead of an HDF5 file at `samplesavpath`. Use
+        this to keep many chains in a single HDF5 file, e.g. with an
+        `emcee.backends.HDFBackend` with a different `name` for each chain.
 
     Returns
     -------
@@ -1363,7 +1580,8 @@ def mandelagol_and_line_fit_magseries(
                     'finalparamerrs':formal errors in the params,
                     'fitmags': the model fit mags,
                     'fitepoch': the epoch of minimum light for the fit,
-                    'acceptancefraction': fraction of MCMC ensemble. low=bad.
+                    'acceptancefraction': fraction of MCMC ensemble over
+                                          the full chain. low=bad.
                     'autocorrtime': if autocorrtime ~= n_mcmc_steps, not good.
                 },
                 'fitplotfile': the output fit plot if fitplot is not None,
@@ -1377,12 +1595,11 @@ def mandelagol_and_line_fit_magseries(
             }
     '''
 
-    from multiprocessing import Pool
     fittype = 'mandelagol_and_line'
 
     if not magsarefluxes:
         raise NotImplementedError('magsarefluxes is not implemented yet.')
-    if not samplesavpath:
+    if not samplesavpath and mcmcbackend is None:
         raise ValueError(
             'This function requires that you save the samples somewhere'
         )
@@ -1428,18 +1645,7 @@ def mandelagol_and_line_fit_magseries(
     )
 
     # guessed initial params. give nice guesses, or else emcee struggles.
-    theta, fitparamnames = [], []
-    for k in np.sort(list(fitparams.keys())):
-        if isinstance(fitparams[k], float) or isinstance(fitparams[k], int):
-            theta.append(fitparams[k])
-            fitparamnames.append(fitparams[k])
-        elif isinstance(fitparams[k], list):
-            if not len(fitparams[k]) == 2:
-                raise ValueError('should only be quadratic LD coeffs')
-            theta.append(fitparams[k][0])
-            theta.append(fitparams[k][1])
-            fitparamnames.append(fitparams[k][0])
-            fitparamnames.append(fitparams[k][1])
+    theta, fitparamnames = _transit_mcmc_theta(fitparams)
 
     # initialize sampler
     n_dim = len(theta)
@@ -1447,10 +1653,11 @@ def mandelagol_and_line_fit_magseries(
     # run the MCMC, unless you just want to load the available samples
     if not skipsampling:
 
-        backend = emcee.backends.HDFBackend(samplesavpath)
+        backend = _transit_mcmc_backend(mcmcbackend, samplesavpath)
+
         if overwriteexistingsamples:
             LOGWARNING(
-                'erased samples previously at {:s}'.format(samplesavpath)
+                'erased samples previously at {:s}'.format(backend.filename)
             )
             backend.reset(n_walkers, n_dim)
 
@@ -1482,46 +1689,28 @@ def mandelagol_and_line_fit_magseries(
 
         initial_position_vec = [theta_ml + eps*np.random.randn(n_dim)
                                 for i in range(n_walkers)]
-        starting_positions = initial_position_vec
-        isfirstrun = True
-        if os.path.exists(backend.filename):
-            if backend.iteration > 1:
-                starting_positions = None
-                isfirstrun = False
-
-        if verbose and isfirstrun:
-            LOGINFO(
-                'start {:s} MCMC with {:d} dims, {:d} steps, {:d} walkers,'.
-                format(fittype, n_dim, n_mcmc_steps, n_walkers) +
-                ' {:d} threads'.format(nworkers)
-            )
-        elif verbose and not isfirstrun:
-            LOGINFO(
-                'continue {:s} with {:d} dims, {:d} steps, {:d} walkers, '.
-                format(fittype, n_dim, n_mcmc_steps, n_walkers) +
-                '{:d} threads'.format(nworkers)
-            )
 
-        with Pool(nworkers) as pool:
-            sampler = emcee.EnsembleSampler(
-                n_walkers, n_dim, log_posterior_transit_plus_line,
-                args=(init_params, init_m, stimes, smags, serrs, priorbounds),
-                pool=pool,
-                backend=backend
-            )
-            sampler.run_mcmc(starting_positions, n_mcmc_steps,
-                             progress=mcmcprogressbar)
-
-        if verbose:
-            LOGINFO(
-                'ended {:s} MCMC run with {:d} steps, {:d} walkers, '.format(
-                    fittype, n_mcmc_steps, n_walkers
-                ) + '{:d} threads'.format(nworkers)
-            )
+        _run_transit_mcmc(
+            fittype,
+            backend,
+            initial_position_vec,
+            log_posterior_transit_plus_line,
+            log_posterior_transit_plus_line_vectorized,
+            (init_params, init_m, stimes, smags, serrs, priorbounds),
+            n_dim,
+            n_mcmc_steps,
+            n_walkers,
+            nworkers,
+            vectorize,
+            mcmcprogressbar,
+            verbose
+        )
 
-    reader = emcee.backends.HDFBackend(samplesavpath)
+    reader = _transit_mcmc_backend(mcmcbackend, samplesavpath)
 
-    n_to_discard = int(burninpercent*n_mcmc_steps)
+    # discard the burn-in from the full chain, which may include samples from
+    # earlier runs
+    n_to_discard = int(burninpercent*reader.iteration)
 
     samples = reader.get_chain(discard=n_to_discard, flat=True)
 
@@ -1582,8 +1771,8 @@ def mandelagol_and_line_fit_magseries(
             'finalparamerrs':stderrs,
             'fitmags':fitmags,
             'fitepoch':fepoch+timeoffset,
-            'acceptancefraction':np.mean(sampler.acceptance_fraction),
-            'autocorrtime':np.mean(sampler.get_autocorr_time(c=1, quiet=True))
+            'acceptancefraction':np.mean(reader.accepted/reader.iteration),
+            'autocorrtime':np.mean(reader.get_autocorr_time(c=1, quiet=True))
         },
         'fitplotfile':None,
         'magseries':{
@@ -39,11 +39,11 @@ LOGEXCEPTION = LOGGER.exception
 ## IMPORTS ##
 #############
 
-import copy
+import time
 from functools import partial
 
 import numpy as np
-from scipy.optimize import least_squares
+from scipy.optimize import least_squares, curve_fit
 
 import matplotlib
 matplotlib.use('Agg')
@@ -229,10 +229,388 @@ def make_fit_plot(phase, pmags, perrs, fitmags,
     plt.close()
 
 
+##########################################
+## FITTING MODELS AT A FIXED PHASE-FOLD ##
+##########################################
+
+def curvefit_folded_model(foldedmodel,
+                          foldparams,
+                          shapeparams,
+                          shape_bounds=(-np.inf, np.inf),
+                          scale_errs_redchisq_unity=True,
+                          curve_fit_kwargs=None):
+    '''This fits the shape params of a model folded at a fixed period and epoch.
+
+    Parameters
+    ----------
+
+    foldedmodel : object
+        A cached phase-folded model from `astrobase.lcmodels`, e.g.
+        `astrobase.lcmodels.transits.TrapezoidTransitModel`. Its
+        `curvefit_func` and `curvefit_jacobian` are used with
+        `scipy.optimize.curve_fit`.
+
+    foldparams : sequence of floats
+        The fixed fold params (e.g. the period and epoch) that come before the
+        shape params in the full model parameter list.
+
+    shapeparams : sequence of floats
+        The initial values of the shape params.
+
+    shape_bounds : 2-tuple
+        The lower and upper bounds on the shape params in the form used by
+        `scipy.optimize.curve_fit`.
+
+    scale_errs_redchisq_unity : bool
+        If True, the standard errors on the fit parameters will be scaled to
+        make the reduced chi-sq = 1.0. This sets the ``absolute_sigma`` kwarg
+        for the ``scipy.optimize.curve_fit`` function to False.
+
+    curve_fit_kwargs : dict or None
+        If not None, this should be a dict containing extra kwargs to pass to
+        the scipy.optimize.curve_fit function.
+
+    Returns
+    -------
+
+    (finalparams, covmatrix) : tuple
+        The full model parameter list with the fixed fold params first and the
+        covariance matrix for all of the params. The rows and columns of the
+        covariance matrix for the fold params are zero.
+
+    '''
+
+    # always use the trust-region method so the covariance matrix is
+    # calculated the same way with and without bounds on the shape params
+    fitkwargs = {'jac':foldedmodel.curvefit_jacobian,
+                 'method':'trf'}
+    if curve_fit_kwargs is not None:
+        fitkwargs.update(curve_fit_kwargs)
+
+    shapefit, shapecov = curve_fit(
+        foldedmodel.curvefit_func,
+        foldedmodel.phase, foldedmodel.mags,
+        p0=shapeparams,
+        sigma=foldedmodel.errs,
+        bounds=shape_bounds,
+        absolute_sigma=(not scale_errs_redchisq_unity),
+        **fitkwargs
+    )
+
+    nfold = len(foldparams)
+    finalparams = np.concatenate((np.asarray(foldparams, dtype=np.float64),
+                                  shapefit))
+    covmatrix = np.zeros((finalparams.size, finalparams.size))
+    covmatrix[nfold:, nfold:] = shapecov
+
+    return finalparams, covmatrix
+
+
 #######################
 ## ITERATIVE FITTING ##
 #######################
 
+def _weighted_residuals(coeffs,
+                        *args,
+                        objective_func=None,
+                        weights=None,
+                        objective_kwargs=None):
+    '''This multiplies the residual array from an objective function by the
+    per-point weights.
+
+    `weights` is the same array for all of the calls in a fit iteration and
+    is updated in place by :py:func:`.iterative_fit_masked` after each
+    iteration.
+
+    '''
+
+    if objective_kwargs:
+        residuals = objective_func(coeffs, *args, **objective_kwargs)
+    else:
+        residuals = objective_func(coeffs, *args)
+
+    return np.asarray(residuals)*weights
+
+
+def _mask_objective_arg(arg, mask, npts):
+    '''This applies the clip mask to an objective function arg if it's an array
+    with one element per data point.
+
+    '''
+
+    if isinstance(arg, np.ndarray) and arg.ndim > 0 and arg.shape[0] == npts:
+        return arg[mask]
+    else:
+        return arg
+
+
+def iterative_fit_masked(data_x,
+                         data_y,
+                         init_coeffs,
+                         objective_func,
+                         objective_args=None,
+                         objective_kwargs=None,
+                         optimizer_func=least_squares,
+                         optimizer_kwargs=None,
+                         optimizer_needs_scalar=False,
+                         objective_residualarr_func=None,
+                         fit_iterations=5,
+                         fit_reject_sigma=3.0,
+                         stop_when_unchanged=True,
+                         verbose=True):
+    '''This runs iterative fitting with sigma-clipping of fit outliers using a
+    clip mask instead of copies of the input arrays.
+
+    Each fit iteration starts from the fit coefficients of the previous
+    iteration. Points rejected after an iteration are removed from the next
+    iteration by setting their weights to zero in a per-point weight array
+    that multiplies the residuals returned by the `objective_func`. The
+    `data_x`, `data_y`, and `objective_args` arrays are never copied unless
+    `optimizer_needs_scalar` is True, since a scalar objective function can't
+    be weighted per point. In this case, the unclipped points of `data_x`,
+    `data_y`, and any `objective_args` arrays with the same length as `data_y`
+    are passed to the `objective_func` instead.
+
+    Points are only ever removed, so the clip set can only grow. If
+    `stop_when_unchanged` is True, the iterations stop as soon as an iteration
+    doesn't reject any new points, since another fit would give the same
+    result.
+
+    Parameters
+    ----------
+
+    data_x : np.array
+        Array of the independent variable.
+
+    data_y : np.array
+        Array of the dependent variable.
+
+    init_coeffs:
+        The initial values of the fit function coefficients.
+
+    objective_func : Python function
+        A function that is used to calculate residuals between the model and the
+        `data_y` array. This should have a signature similar to::
+
+            def objective_func(fit_coeffs, data_x, data_y,
+                               *objective_args, **objective_kwargs)
+
+        and return an array of residuals with one element for each element of
+        `data_y`, or a scalar value indicating some sort of sum of residuals
+        (depending on what the optimizer function requires).
+
+        If this function returns a scalar value, you must set
+        `optimizer_needs_scalar` to True, and provide a Python function in
+        `objective_residualarr_func` that returns an array of residuals for each
+        value of `data_x` and `data_y` given an array of fit coefficients.
+
+    objective_args : tuple or None
+        A tuple of arguments to pass into the `objective_func`.
+
+    objective_kwargs : dict or None
+        A dict of keyword arguments to pass into the `objective_func`.
+
+    optimizer_func : Python function
+        The function that minimizes the residual between the model and the
+        `data_y` array using the `objective_func`. This should have a
+        signature similar to one of the optimizer functions in `scipy.optimize
+        <https://docs.scipy.org/doc/scipy/reference/optimize.html>`_, i.e.::
+
+            def optimizer_func(objective_func,
+                               initial_coeffs,
+                               args=(),
+                               kwargs={},
+                               ...)
+
+        and return a `scipy.optimize.OptimizeResult
+        <https://docs.scipy.org/doc/scipy/reference/generated/scipy.optimize.OptimizeResult.html>`_.
+
+    optimizer_kwargs : dict or None
+        A dict of kwargs to pass into the `optimizer_func` function.
+
+    optimizer_needs_scalar : bool
+        If True, this indicates that the optimizer requires a scalar value to be
+        returned from the `objective_func`. This is the case for
+        `scipy.optimize.minimize`. If this is True, you must also provide a
+        function in `objective_residualarr_func`.
+
+    objective_residualarr_func : Python function
+        This is used in conjunction with `optimizer_needs_scalar`. The function
+        provided here must return an array of residuals for each value of
+        `data_x` and `data_y` given an array of fit coefficients. It must have
+        the following signature::
+
+            def objective_residualarr_func(coeffs, data_x, data_y,
+                                           *objective_args, **objective_kwargs)
+
+    fit_iterations : int
+        The maximum number of iterations of the fit to perform while throwing
+        out outliers to the fit.
+
+    fit_reject_sigma : float
+        The maximum deviation allowed to consider a `data_y` item as an outlier
+        to the fit and to remove it from consideration in a successive iteration
+        of the fit.
+
+    stop_when_unchanged : bool
+        If True, stops the iterations early when no new points are rejected.
+
+    verbose : bool
+        If True, reports per iteration on the cost function value and the number
+        of items remaining after sigma-clipping outliers.
+
+    Returns
+    -------
+
+    dict or None
+        Returns a dict of the following form::
+
+            {'coeffs': the fit coefficients from the last iteration,
+             'fitinfo': the optimizer function output from the last iteration,
+             'mask': boolean array of the points used for the last fit,
+             'niterations': the number of fit iterations done,
+             'converged': True if the last iteration rejected no new points,
+             'totaltime': the total time taken in seconds,
+             'iterations': a list of dicts with per iteration diagnostics:
+                 [{'iteration': the iteration number,
+                   'success': the optimizer's success flag,
+                   'nfit': the number of points used for the fit,
+                   'nrejected': the number of points newly rejected,
+                   'cost': the optimizer's cost or objective function value,
+                   'coeffs_change': max abs change in the fit coeffs,
+                   'time': the time taken in seconds for the iteration}, ...]}
+
+        Returns None if `optimizer_needs_scalar` is True but no
+        `objective_residualarr_func` is provided.
+
+    '''
+
+    if optimizer_needs_scalar and objective_residualarr_func is None:
+        LOGERROR("an objective_residualarr_func is required "
+                 "if optimizer_needs_scalar = True")
+        return None
+
+    if not optimizer_kwargs:
+        optimizer_kwargs = {}
+    if not objective_args:
+        objective_args = ()
+    if not objective_kwargs:
+        objective_kwargs = {}
+
+    npts = np.size(data_y)
+
+    # the clip mask and the residual weights. these are updated in place after
+    # each iteration
+    mask = np.ones(npts, dtype=np.bool_)
+    weights = np.ones(npts, dtype=np.float64)
+
+    coeffs = np.array(init_coeffs, dtype=np.float64)
+    fit_info = None
+    converged = False
+    iterations = []
+
+    if optimizer_needs_scalar:
+        if objective_kwargs:
+            obj_func = partial(objective_func, **objective_kwargs)
+        else:
+            obj_func = objective_func
+    else:
+        obj_func = partial(_weighted_residuals,
+                           objective_func=objective_func,
+                           weights=weights,
+                           objective_kwargs=objective_kwargs)
+        obj_args = (data_x, data_y, *objective_args)
+
+    fitstart = time.time()
+
+    for iteration_count in range(fit_iterations):
+
+        iterstart = time.time()
+        nfit = int(mask.sum())
+
+        if optimizer_needs_scalar:
+            if nfit == npts:
+                obj_args = (data_x, data_y, *objective_args)
+            else:
+                obj_args = (
+                    data_x[mask],
+                    data_y[mask],
+                    *(_mask_objective_arg(x, mask, npts)
+                      for x in objective_args)
+                )
+
+        fit_info = optimizer_func(
+            obj_func,
+            coeffs,
+            args=obj_args,
+            **optimizer_kwargs
+        )
+
+        # get the residual array for all points. the residuals at the points
+        # that are already clipped aren't used
+        if optimizer_needs_scalar:
+            residual = np.asarray(
+                objective_residualarr_func(fit_info.x,
+                                           data_x,
+                                           data_y,
+                                           *objective_args,
+                                           **objective_kwargs)
+            )
+            cost = fit_info.fun
+        elif 'fun' in fit_info.keys() and np.size(fit_info.fun) == npts:
+            residual = fit_info.fun
+            cost = fit_info.cost if 'cost' in fit_info.keys() else None
+        else:
+            residual = obj_func(fit_info.x, *obj_args)
+            cost = fit_info.cost if 'cost' in fit_info.keys() else None
+
+        residual_median = np.nanmedian(residual[mask])
+        residual_mad = np.nanmedian(np.abs(residual[mask] - residual_median))
+        residual_stdev = residual_mad*1.4826
+        rejected = mask & ~(np.abs(residual) < residual_stdev*fit_reject_sigma)
+        nrejected = int(rejected.sum())
+
+        mask[rejected] = False
+        weights[rejected] = 0.0
+
+        coeffs_change = float(np.max(np.abs(fit_info.x - coeffs)))
+        coeffs = np.array(fit_info.x, dtype=np.float64)
+
+        iterations.append({'iteration':iteration_count,
+                           'success':fit_info.success,
+                           'nfit':nfit,
+                           'nrejected':nrejected,
+                           'cost':cost,
+                           'coeffs_change':coeffs_change,
+                           'time':time.time() - iterstart})
+
+        if verbose:
+            LOGINFO(
+                "Fit success: %s for iteration: %s, "
+                "remaining items after sigma-clip: %s, "
+                "cost function value: %s" % (fit_info.success,
+                                             iteration_count,
+                                             nfit - nrejected,
+                                             cost)
+            )
+
+        if not fit_info.success:
+            LOGERROR("Fit did not succeed on iteration: %s" % iteration_count)
+
+        if nrejected == 0:
+            converged = True
+            if stop_when_unchanged:
+                break
+
+    return {'coeffs':coeffs,
+            'fitinfo':fit_info,
+            'mask':mask,
+            'niterations':len(iterations),
+            'converged':converged,
+            'totaltime':time.time() - fitstart,
+            'iterations':iterations}
+
+
 def iterative_fit(data_x,
                   data_y,
                   init_coeffs,
@@ -245,11 +623,17 @@ def iterative_fit(data_x,
                   objective_residualarr_func=None,
                   fit_iterations=5,
                   fit_reject_sigma=3.0,
+                  stop_when_unchanged=False,
                   verbose=True,
                   full_output=False):
     '''This is a function to run iterative fitting based on repeated
     sigma-clipping of fit outliers.
 
+    This uses :py:func:`.iterative_fit_masked`, which starts each iteration
+    from the previous fit coefficients and clips outliers with a mask instead
+    of copying the input arrays. Use that function directly to get the clip
+    mask and per iteration diagnostics.
+
     Parameters
     ----------
 
@@ -330,6 +714,11 @@ def iterative_fit(data_x,
         to the fit and to remove it from consideration in a successive iteration
         of the fit.
 
+    stop_when_unchanged : bool
+        If True, stops the iterations early when an iteration doesn't reject
+        any new points. This is False by default so all `fit_iterations` are
+        run like before.
+
     verbose : bool
         If True, reports per iteration on the cost function value and the number
         of items remaining in `data_x` and `data_y` after sigma-clipping
@@ -350,105 +739,28 @@ def iterative_fit(data_x,
 
     '''
 
-    iteration_count = 0
-
-    # paranoid copying for the input --- probably unnecessary but just in case
-    coeffs = copy.deepcopy(init_coeffs)
-    fit_data_x = copy.deepcopy(data_x)
-    fit_data_y = copy.deepcopy(data_y)
-
-    while iteration_count < fit_iterations:
-
-        if not optimizer_kwargs:
-            optimizer_kwargs = {}
-
-        if not objective_args:
-            obj_args = (fit_data_x, fit_data_y)
-        else:
-            obj_args = (fit_data_x, fit_data_y, *objective_args)
-
-        if not objective_kwargs:
-            obj_func = objective_func
-        else:
-            obj_func = partial(objective_func, **objective_kwargs)
-
-        # set up the residualarr function if provided
-        if objective_residualarr_func is not None and optimizer_needs_scalar:
-
-            if not objective_kwargs:
-                objective_resarr_func = objective_residualarr_func
-            else:
-                objective_resarr_func = partial(objective_residualarr_func,
-                                                **objective_kwargs)
-
-        fit_info = optimizer_func(
-            obj_func,
-            coeffs,
-            args=obj_args,
-            **optimizer_kwargs
-        )
-
-        # this handles the case where the optimizer is
-        # scipy.optimize.least_squares
-        if 'cost' in fit_info.keys():
-
-            residual = fit_info.fun
-            residual_median = np.nanmedian(residual)
-            residual_mad = np.nanmedian(np.abs(residual - residual_median))
-            residual_stdev = residual_mad*1.4826
-            keep_ind = np.abs(residual) < residual_stdev*fit_reject_sigma
-
-            fit_data_x = fit_data_x[keep_ind]
-            fit_data_y = fit_data_y[keep_ind]
-            coeffs = fit_info.x
-
-            if verbose:
-                LOGINFO(
-                    "Fit success: %s for iteration: %s, "
-                    "remaining items after sigma-clip: %s, "
-                    "cost function value: %s" % (fit_info.success,
-                                                 iteration_count,
-                                                 keep_ind.sum(),
-                                                 fit_info.cost)
-                )
-
-        # this handles the case where the optimizer is scipy.optimize.minimize
-        # or similar
-        elif ('cost' not in fit_info.keys() and
-              (optimizer_needs_scalar and
-               objective_residualarr_func is not None)):
-
-            residual = objective_resarr_func(
-                fit_info.x,
-                *obj_args
-            )
-            residual_median = np.nanmedian(residual)
-            residual_mad = np.nanmedian(np.abs(residual - residual_median))
-            residual_stdev = residual_mad*1.4826
-            keep_ind = np.abs(residual) < residual_stdev*fit_reject_sigma
-
-            fit_data_x = fit_data_x[keep_ind]
-            fit_data_y = fit_data_y[keep_ind]
-            coeffs = fit_info.x
-
-            if verbose:
-                LOGINFO(
-                    "Fit success: %s, for iteration: %s, "
-                    "remaining items after sigma-clip: %s, "
-                    "residual scalar value: %s" % (fit_info.success,
-                                                   iteration_count,
-                                                   keep_ind.sum(),
-                                                   fit_info.fun)
-                )
-
-        else:
-
-            LOGERROR("Fit did not succeed on iteration: %s" % iteration_count)
-
-        iteration_count = iteration_count + 1
+    fit = iterative_fit_masked(
+        data_x,
+        data_y,
+        init_coeffs,
+        objective_func,
+        objective_args=objective_args,
+        objective_kwargs=objective_kwargs,
+        optimizer_func=optimizer_func,
+        optimizer_kwargs=optimizer_kwargs,
+        optimizer_needs_scalar=optimizer_needs_scalar,
+        objective_residualarr_func=objective_residualarr_func,
+        fit_iterations=fit_iterations,
+        fit_reject_sigma=fit_reject_sigma,
+        stop_when_unchanged=stop_when_unchanged,
+        verbose=verbose
+    )
+
+    if fit is None:
+        return None
 
     # at the end, return the fit coeffs
     if not full_output:
-        return fit_info.x
+        return fit['coeffs']
     else:
-        return fit_info.x, fit_info
+        return fit['coeffs'], fit['fitinfo']
@@ -288,50 +288,12 @@ def invgauss_eclipses_curvefit_func(
     phase = (times - epoch)/period
     phase = phase - np.floor(phase)
 
-    eclipsemodel = np.full_like(phase, zerolevel)
-
-    primaryecl_amp = -pdepth
-    secondaryecl_amp = -pdepth * psdepthratio
-
-    primaryecl_std = pduration/5.0    # we use 5-sigma as full-width -> duration
-    secondaryecl_std = pduration/5.0  # secondary eclipse has the same duration
-
-    halfduration = pduration/2.0
-
-    # phase indices
-    primary_eclipse_ingress = (
-        (phase >= (1.0 - halfduration)) & (phase <= 1.0)
-    )
-    primary_eclipse_egress = (
-        (phase >= 0.0) & (phase <= halfduration)
-    )
-
-    secondary_eclipse_phase = (
-        (phase >= (secondaryphase - halfduration)) &
-        (phase <= (secondaryphase + halfduration))
-    )
-
-    # put in the eclipses
-    eclipsemodel[primary_eclipse_ingress] = (
-        zerolevel + _gaussian(phase[primary_eclipse_ingress],
-                              primaryecl_amp,
-                              1.0,
-                              primaryecl_std)
-    )
-    eclipsemodel[primary_eclipse_egress] = (
-        zerolevel + _gaussian(phase[primary_eclipse_egress],
-                              primaryecl_amp,
-                              0.0,
-                              primaryecl_std)
-    )
-    eclipsemodel[secondary_eclipse_phase] = (
-        zerolevel + _gaussian(phase[secondary_eclipse_phase],
-                              secondaryecl_amp,
-                              secondaryphase,
-                              secondaryecl_std)
-    )
-
-    return eclipsemodel
+    return _invgauss_eclipses_model(phase,
+                                    pdepth,
+                                    pduration,
+                                    psdepthratio,
+                                    secondaryphase,
+                                    zerolevel)
 
 
 def invgauss_eclipses_residual(ebparams, times, mags, errs):
@@ -391,3 +353,391 @@ def invgauss_eclipses_residual(ebparams, times, mags, errs):
 
     # this is now a weighted residual taking into account the measurement err
     return (pmags - modelmags)/perrs
+
+
+########################
+## ANALYTIC JACOBIANS ##
+########################
+
+def _invgauss_eclipses_windows(phase, pduration, secondaryphase):
+    '''This returns the phase indices and centers of the eclipse gaussians.
+
+    Parameters
+    ----------
+
+    phase : np.array
+        The phases at which the model will be evaluated.
+
+    pduration,secondaryphase : float
+        The primary eclipse duration and the secondary eclipse phase.
+
+    Returns
+    -------
+
+    list of tuples
+        Each tuple is (index, loc, is_secondary) for the primary eclipse
+        ingress, the primary eclipse egress, and the secondary eclipse, in the
+        order they're applied to the model.
+
+    '''
+
+    halfduration = pduration/2.0
+
+    primary_eclipse_ingress = (
+        (phase >= (1.0 - halfduration)) & (phase <= 1.0)
+    )
+    primary_eclipse_egress = (
+        (phase >= 0.0) & (phase <= halfduration)
+    )
+    secondary_eclipse_phase = (
+        (phase >= (secondaryphase - halfduration)) &
+        (phase <= (secondaryphase + halfduration))
+    )
+
+    return [(primary_eclipse_ingress, 1.0, False),
+            (primary_eclipse_egress, 0.0, False),
+            (secondary_eclipse_phase, secondaryphase, True)]
+
+
+def _invgauss_eclipses_model(phase,
+                             pdepth,
+                             pduration,
+                             psdepthratio,
+                             secondaryphase,
+                             zerolevel):
+    '''This returns the inverted gaussian eclipses model at the given phases.
+
+    Parameters
+    ----------
+
+    phase : np.array
+        The phases at which the model will be evaluated.
+
+    pdepth,pduration,psdepthratio,secondaryphase : float
+        The eclipse shape parameters.
+
+    zerolevel : float
+        The out of eclipse value of the model.
+
+    Returns
+    -------
+
+    np.array
+        The eclipses model evaluated at `phase`.
+
+    '''
+
+    # we use 5-sigma as full-width -> duration for both eclipses
+    eclipse_std = pduration/5.0
+
+    eclipsemodel = np.full(phase.shape, zerolevel, dtype=np.float64)
+
+    # put in the eclipses
+    for ind, loc, secondary in _invgauss_eclipses_windows(
+            phase, pduration, secondaryphase
+    ):
+        amp = -pdepth*psdepthratio if secondary else -pdepth
+        eclipsemodel[ind] = (
+            zerolevel + _gaussian(phase[ind], amp, loc, eclipse_std)
+        )
+
+    return eclipsemodel
+
+
+def _invgauss_eclipses_derivatives(phase,
+                                   pdepth,
+                                   pduration,
+                                   psdepthratio,
+                                   secondaryphase):
+    '''This returns the derivatives of the eclipses model at the given phases.
+
+    Parameters
+    ----------
+
+    phase : np.array
+        The phases at which to evaluate the derivatives.
+
+    pdepth,pduration,psdepthratio,secondaryphase : float
+        The eclipse shape parameters.
+
+    Returns
+    -------
+
+    np.array
+        An array of shape (phase.size, 5) with the derivatives of the model
+        wrt the phase, `pdepth`, `pduration`, `psdepthratio`, and
+        `secondaryphase`.
+
+    '''
+
+    # we use 5-sigma as full-width -> duration for both eclipses
+    eclipse_std = pduration/5.0
+    eclipse_var = eclipse_std*eclipse_std
+
+    jac = np.zeros((phase.size, 5))
+
+    for ind, loc, secondary in _invgauss_eclipses_windows(
+            phase, pduration, secondaryphase
+    ):
+
+        dx = phase[ind] - loc
+        gauss = np.exp(-dx*dx/(2.0*eclipse_var))
+        depthfactor = psdepthratio if secondary else 1.0
+
+        # the model in each window is zerolevel - depth*gauss. these are
+        # assigned in the same order as the model so overlapping windows get
+        # the same derivatives
+        jac[ind, 0] = pdepth*depthfactor*gauss*dx/eclipse_var
+        jac[ind, 1] = -depthfactor*gauss
+        jac[ind, 2] = (-pdepth*depthfactor*gauss*dx*dx /
+                       (5.0*eclipse_var*eclipse_std))
+
+        if secondary:
+            jac[ind, 3] = -pdepth*gauss
+            jac[ind, 4] = -jac[ind, 0]
+        else:
+            jac[ind, 3:] = 0.0
+
+    return jac
+
+
+def invgauss_eclipses_curvefit_jacobian(
+        times,
+        period,
+        epoch,
+        pdepth,
+        pduration,
+        psdepthratio,
+        secondaryphase,
+        zerolevel=0.0,
+        fixed_params=None,
+):
+    '''This returns the Jacobian of `invgauss_eclipses_curvefit_func`.
+
+    This can be passed to scipy.optimize.curve_fit as its `jac` kwarg so it
+    doesn't need to estimate the derivatives with finite differences. Apply
+    the same functools.partial as for the model function, e.g.::
+
+        curvefit_jac = functools.partial(
+                           eclipses.invgauss_eclipses_curvefit_jacobian,
+                           zerolevel=np.median(mags),
+                           fixed_params={'secondaryphase':0.5})
+
+    Parameters
+    ----------
+
+    times : np.array
+        The array of times at which the derivatives will be evaluated.
+
+    period,epoch,pdepth,pduration,psdepthratio,secondaryphase : float
+        The eclipse model parameters. See `invgauss_eclipses_curvefit_func`.
+
+    zerolevel : float
+        The out of eclipse value of the model. The derivatives don't depend on
+        this.
+
+    fixed_params : dict or None
+        The same dict of fixed parameters passed to
+        `invgauss_eclipses_curvefit_func`. The derivatives wrt these are zero.
+
+    Returns
+    -------
+
+    np.array
+        An array of shape (times.size, 6) with the derivatives of the model wrt
+        `period`, `epoch`, `pdepth`, `pduration`, `psdepthratio`, and
+        `secondaryphase`.
+
+    '''
+
+    if fixed_params is None:
+        fixed_params = {}
+
+    period = fixed_params.get('period', period)
+    epoch = fixed_params.get('epoch', epoch)
+    pdepth = fixed_params.get('pdepth', pdepth)
+    pduration = fixed_params.get('pduration', pduration)
+    psdepthratio = fixed_params.get('psdepthratio', psdepthratio)
+    secondaryphase = fixed_params.get('secondaryphase', secondaryphase)
+
+    # generate the phases
+    phase = (times - epoch)/period
+    phase = phase - np.floor(phase)
+
+    derivs = _invgauss_eclipses_derivatives(phase, pdepth, pduration,
+                                            psdepthratio, secondaryphase)
+
+    # the period and epoch only enter the model through the phase
+    jac = np.empty((times.size, 6))
+    jac[:,0] = -derivs[:,0]*(times - epoch)/(period*period)
+    jac[:,1] = -derivs[:,0]/period
+    jac[:,2:] = derivs[:,1:]
+
+    for ind, key in enumerate(('period', 'epoch', 'pdepth', 'pduration',
+                               'psdepthratio', 'secondaryphase')):
+        if key in fixed_params:
+            jac[:,ind] = 0.0
+
+    return jac
+
+
+###############################
+## CACHED PHASE-FOLDED MODEL ##
+###############################
+
+class InvGaussEclipsesModel(object):
+    '''This is an inverted gaussian eclipses model folded at a fixed period and
+    epoch.
+
+    The phases of the input times and the phase sort order are calculated once
+    when the model is constructed, so evaluating the model for different values
+    of the eclipse shape parameters (`pdepth`, `pduration`, `psdepthratio`,
+    `secondaryphase`) doesn't need to redo them. `curvefit_func` and
+    `curvefit_jacobian` can be passed directly to `scipy.optimize.curve_fit` as
+    its `f` and `jac`, and `residual` and `residual_jacobian` to
+    `scipy.optimize.least_squares` as its `fun` and `jac`.
+
+    Attributes
+    ----------
+
+    period,epoch : float
+        The period and epoch used to fold the times.
+
+    phase : np.array
+        The phases of the input times, in sorted order.
+
+    sortind : np.array
+        The index array that sorts the input arrays by phase.
+
+    times,mags,errs : np.array
+        The input time-series in phase order.
+
+    zerolevel : float
+        The out-of-eclipse level of the model.
+
+    '''
+
+    paramnames = ('pdepth', 'pduration', 'psdepthratio', 'secondaryphase')
+
+    def __init__(self, times, mags, errs, period, epoch, zerolevel=None):
+        '''Constructor for this class.
+
+        Parameters
+        ----------
+
+        times,mags,errs : np.array
+            The input time-series to fold.
+
+        period,epoch : float
+            The period and time of primary eclipse minimum to fold the
+            time-series with.
+
+        zerolevel : float or None
+            The out-of-eclipse level of the model. If None, the median of the
+            `mags` will be used.
+
+        '''
+
+        iphase = (times - epoch)/period
+        iphase = iphase - np.floor(iphase)
+
+        self.period = period
+        self.epoch = epoch
+        self.sortind = np.argsort(iphase)
+        self.phase = iphase[self.sortind]
+        self.times = times[self.sortind]
+        self.mags = mags[self.sortind]
+        self.errs = errs[self.sortind]
+
+        if zerolevel is None:
+            self.zerolevel = np.median(self.mags)
+        else:
+            self.zerolevel = zerolevel
+
+    def curvefit_func(self,
+                      phase,
+                      pdepth,
+                      pduration,
+                      psdepthratio,
+                      secondaryphase):
+        '''This evaluates the model at the given phases.
+
+        Parameters
+        ----------
+
+        phase : np.array
+            The phases at which to evaluate the model. Use `self.phase` to get
+            the model for the folded time-series.
+
+        pdepth,pduration,psdepthratio,secondaryphase : float
+            The eclipse shape parameters.
+
+        Returns
+        -------
+
+        np.array
+            The model evaluated at `phase`.
+
+        '''
+
+        return _invgauss_eclipses_model(phase,
+                                        pdepth,
+                                        pduration,
+                                        psdepthratio,
+                                        secondaryphase,
+                                        self.zerolevel)
+
+    def curvefit_jacobian(self,
+                          phase,
+                          pdepth,
+                          pduration,
+                          psdepthratio,
+                          secondaryphase):
+        '''This returns the derivatives of the model wrt the shape parameters.
+
+        Parameters
+        ----------
+
+        phase : np.array
+            The phases at which to evaluate the derivatives.
+
+        pdepth,pduration,psdepthratio,secondaryphase : float
+            The eclipse shape parameters.
+
+        Returns
+        -------
+
+        np.array
+            An array of shape (phase.size, 4) with the derivatives of the model
+            wrt `pdepth`, `pduration`, `psdepthratio`, and `secondaryphase`.
+
+        '''
+
+        return _invgauss_eclipses_derivatives(
+            phase, pdepth, pduration, psdepthratio, secondaryphase
+        )[:,1:]
+
+    def model(self, shapeparams):
+        '''This returns the model for the folded time-series.
+
+        `shapeparams` is a sequence of (`pdepth`, `pduration`, `psdepthratio`,
+        `secondaryphase`). The model is in phase order.
+
+        '''
+        return self.curvefit_func(self.phase, *shapeparams)
+
+    def residual(self, shapeparams):
+        '''This returns the error-weighted residual for the folded time-series.
+
+        `shapeparams` is a sequence of (`pdepth`, `pduration`, `psdepthratio`,
+        `secondaryphase`).
+
+        '''
+        return (self.mags - self.model(shapeparams))/self.errs
+
+    def residual_jacobian(self, shapeparams):
+        '''This returns the Jacobian of `residual` wrt the shape parameters.
+
+        '''
+        return (-self.curvefit_jacobian(self.phase, *shapeparams) /
+                self.errs[:,None])
@@ -136,3 +136,98 @@ def flare_model_residual(flareparams, times, mags, errs):
     modelmags, _, _, _ = flare_model(flareparams, times, mags, errs)
 
     return (mags - modelmags)/errs
+
+
+########################
+## ANALYTIC JACOBIANS ##
+########################
+
+def flare_model_jacobian(flareparams, times, mags, errs):
+    '''This returns the derivatives of `flare_model` wrt the flare params.
+
+    Parameters
+    ----------
+
+    flareparams : list of float
+        This defines the flare model::
+
+            [amplitude,
+             flare_peak_time,
+             rise_gaussian_stdev,
+             decay_time_constant]
+
+        See `flare_model` for details.
+
+    times,mags,errs : np.array
+        The input time-series of measurements and associated errors. The model
+        mags are the input `mags` plus the flare, so the derivatives only
+        depend on the `times`.
+
+    Returns
+    -------
+
+    np.array
+        An array of shape (times.size, 4) with the derivatives of the model
+        mags wrt `amplitude`, `flare_peak_time`, `rise_gaussian_stdev`, and
+        `decay_time_constant`.
+
+    '''
+
+    (amplitude, flare_peak_time,
+     rise_gaussian_stdev, decay_time_constant) = flareparams
+
+    jac = np.zeros((times.size, 4))
+
+    # before peak gaussian rise...
+    riseind = times < flare_peak_time
+    dt = times[riseind] - flare_peak_time
+    rise = np.exp(-(dt*dt)/(2.0*rise_gaussian_stdev*rise_gaussian_stdev))
+
+    jac[riseind, 0] = rise
+    jac[riseind, 1] = (
+        amplitude*rise*dt/(rise_gaussian_stdev*rise_gaussian_stdev)
+    )
+    jac[riseind, 2] = (
+        amplitude*rise*dt*dt /
+        (rise_gaussian_stdev*rise_gaussian_stdev*rise_gaussian_stdev)
+    )
+
+    # after peak exponential decay...
+    decayind = times > flare_peak_time
+    dt = times[decayind] - flare_peak_time
+    decay = np.exp(-dt/decay_time_constant)
+
+    jac[decayind, 0] = decay
+    jac[decayind, 1] = amplitude*decay/decay_time_constant
+    jac[decayind, 3] = (
+        amplitude*decay*dt/(decay_time_constant*decay_time_constant)
+    )
+
+    return jac
+
+
+def flare_model_residual_jacobian(flareparams, times, mags, errs):
+    '''This returns the Jacobian of `flare_model_residual`.
+
+    This can be passed to scipy.optimize.least_squares as its `jac` kwarg along
+    with `flare_model_residual` as its `fun`, with `args=(times, mags, errs)`.
+
+    Parameters
+    ----------
+
+    flareparams : list of float
+        This defines the flare model. See `flare_model` for details.
+
+    times,mags,errs : np.array
+        The input time-series of measurements and associated errors.
+
+    Returns
+    -------
+
+    np.array
+        An array of shape (times.size, 4) with the derivatives of the residual
+        wrt the flare params.
+
+    '''
+
+    return -flare_model_jacobian(flareparams, times, mags, errs)/errs[:,None]
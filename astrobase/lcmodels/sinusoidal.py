@@ -246,3 +246,336 @@ def sine_series_sum(fourierparams, times, mags, errs):
         modelmags += fo
 
     return modelmags, phase, ptimes, pmags, perrs
+
+
+########################
+## ANALYTIC JACOBIANS ##
+########################
+
+def _fourier_harmonics(phase, fourierorder):
+    '''This returns the cosine and sine of each harmonic of the phase.
+
+    Parameters
+    ----------
+
+    phase : np.array
+        The phases at which the Fourier series will be evaluated.
+
+    fourierorder : int
+        The number of terms in the Fourier series.
+
+    Returns
+    -------
+
+    (harmonic_cos, harmonic_sin) : tuple of np.arrays
+        Arrays of shape (phase.size, fourierorder) with the cosine and sine of
+        2.pi.x.phase for x = 0, 1, ..., fourierorder - 1.
+
+    '''
+
+    harmonic_phase = (
+        2.0*np.pi*np.asarray(phase)[:,None]*np.arange(fourierorder)[None,:]
+    )
+    return np.cos(harmonic_phase), np.sin(harmonic_phase)
+
+
+def _fourier_derivatives(harmonic_cos, harmonic_sin, fourier_coeffs):
+    '''This returns the derivatives of the Fourier series.
+
+    Parameters
+    ----------
+
+    harmonic_cos,harmonic_sin : np.array
+        The cosine and sine of each harmonic of the phase from
+        `_fourier_harmonics`.
+
+    fourier_coeffs : sequence of floats
+        The amplitudes followed by the phases of the series.
+
+    Returns
+    -------
+
+    np.array
+        An array of shape (nphases, 1 + 2*fourierorder) with the derivatives of
+        the series wrt the phase, the amplitudes, and the phases.
+
+    '''
+
+    fourierorder = harmonic_cos.shape[1]
+
+    fourier_coeffs = np.asarray(fourier_coeffs, dtype=np.float64)
+    amps = fourier_coeffs[:fourierorder]
+    phases = fourier_coeffs[fourierorder:]
+
+    cosphases, sinphases = np.cos(phases), np.sin(phases)
+
+    # d/dphase of amp*cos(2.pi.x.phase + pha) is -2.pi.x.amp*sin(...)
+    sinterms = harmonic_sin*cosphases + harmonic_cos*sinphases
+    dphase = -sinterms.dot(2.0*np.pi*np.arange(fourierorder)*amps)
+
+    return np.hstack((
+        dphase[:,None],
+        harmonic_cos*cosphases - harmonic_sin*sinphases,
+        -amps*sinterms
+    ))
+
+
+def fourier_curvefit_jacobian(times,
+                              period,
+                              *fourier_coeffs,
+                              zerolevel=0.0,
+                              epoch=None,
+                              fixed_period=None):
+    '''This returns the Jacobian of `fourier_curvefit_func`.
+
+    This can be passed to scipy.optimize.curve_fit as its `jac` kwarg so it
+    doesn't need to estimate the derivatives with finite differences. Apply
+    the same functools.partial as for the model function.
+
+    Parameters
+    ----------
+
+    times : np.array
+        An array of times at which the derivatives will be evaluated.
+
+    period : float
+        The period of the sinusoidal variability.
+
+    fourier_coeffs : float
+        The N amplitudes followed by the N phases of the series.
+
+    zerolevel : float
+        The base level of the model. The derivatives don't depend on this.
+
+    epoch : float or None
+        The epoch to use to generate the phased light curve. If None, the
+        minimum value of the times array will be used.
+
+    fixed_period : float or None
+        If not None, the period is held fixed at this value and the derivatives
+        wrt the period are zero.
+
+    Returns
+    -------
+
+    np.array
+        An array of shape (times.size, 1 + 2N) with the derivatives of the
+        model wrt the period, the amplitudes, and the phases.
+
+    '''
+
+    if epoch is None:
+        epoch = times.min()
+
+    if fixed_period is not None:
+        period = fixed_period
+
+    fourier_order = int(len(fourier_coeffs)/2.0)
+
+    # phase the times with this period
+    phase = (times - epoch)/period
+    phase = phase - np.floor(phase)
+
+    harmonic_cos, harmonic_sin = _fourier_harmonics(phase, fourier_order)
+    jac = _fourier_derivatives(harmonic_cos, harmonic_sin, fourier_coeffs)
+
+    # the period only enters the model through the phase
+    if fixed_period is not None:
+        jac[:,0] = 0.0
+    else:
+        jac[:,0] = -jac[:,0]*(times - epoch)/(period*period)
+
+    return jac
+
+
+###############################
+## CACHED PHASE-FOLDED MODEL ##
+###############################
+
+class FourierSinusoidalModel(object):
+    '''This is a Fourier cosine series model folded at a fixed period and epoch.
+
+    This is the same model as `fourier_curvefit_func`. The phases of the input
+    times, the phase sort order, and the cosine and sine of each harmonic of
+    the phase are calculated once when the model is constructed. Each term of
+    the series is then::
+
+        amp*cos(2.pi.x.phase + pha) =
+            amp*cos(pha)*cos(2.pi.x.phase) - amp*sin(pha)*sin(2.pi.x.phase)
+
+    so evaluating the model for a new set of Fourier coefficients is just two
+    matrix-vector products. `curvefit_func` and `curvefit_jacobian` can be
+    passed directly to `scipy.optimize.curve_fit` as its `f` and `jac`, and
+    `residual` and `residual_jacobian` to `scipy.optimize.least_squares` as
+    its `fun` and `jac`.
+
+    Attributes
+    ----------
+
+    period,epoch : float
+        The period and epoch used to fold the times.
+
+    fourierorder : int
+        The number of terms in the Fourier series.
+
+    phase : np.array
+        The phases of the input times, in sorted order.
+
+    sortind : np.array
+        The index array that sorts the input arrays by phase.
+
+    times,mags,errs : np.array
+        The input time-series in phase order.
+
+    zerolevel : float
+        The base level of the model.
+
+    '''
+
+    def __init__(self,
+                 times,
+                 mags,
+                 errs,
+                 period,
+                 epoch,
+                 fourierorder,
+                 zerolevel=None):
+        '''Constructor for this class.
+
+        Parameters
+        ----------
+
+        times,mags,errs : np.array
+            The input time-series to fold.
+
+        period,epoch : float
+            The period and epoch to fold the time-series with.
+
+        fourierorder : int
+            The number of terms in the Fourier series. The model will take
+            2*`fourierorder` coefficients: the amplitudes followed by the
+            phases.
+
+        zerolevel : float or None
+            The base level of the model. If None, the median of the `mags` will
+            be used.
+
+        '''
+
+        iphase = (times - epoch)/period
+        iphase = iphase - np.floor(iphase)
+
+        self.period = period
+        self.epoch = epoch
+        self.fourierorder = fourierorder
+        self.sortind = np.argsort(iphase)
+        self.phase = iphase[self.sortind]
+        self.times = times[self.sortind]
+        self.mags = mags[self.sortind]
+        self.errs = errs[self.sortind]
+
+        if zerolevel is None:
+            self.zerolevel = np.median(self.mags)
+        else:
+            self.zerolevel = zerolevel
+
+        self._harmonic_cos, self._harmonic_sin = _fourier_harmonics(
+            self.phase, fourierorder
+        )
+
+    def _harmonics(self, phase):
+        '''This returns the cosine and sine of each harmonic of `phase`.
+
+        These are cached for `self.phase`.
+
+        '''
+
+        if phase is self.phase:
+            return self._harmonic_cos, self._harmonic_sin
+
+        return _fourier_harmonics(phase, self.fourierorder)
+
+    def curvefit_func(self, phase, *fourier_coeffs):
+        '''This evaluates the model at the given phases.
+
+        Parameters
+        ----------
+
+        phase : np.array
+            The phases at which to evaluate the model. Use `self.phase` to use
+            the cached harmonics and get the model for the folded time-series.
+
+        fourier_coeffs : float
+            The `fourierorder` amplitudes followed by the `fourierorder`
+            phases of the series.
+
+        Returns
+        -------
+
+        np.array
+            The model evaluated at `phase`.
+
+        '''
+
+        harmonic_cos, harmonic_sin = self._harmonics(phase)
+
+        fourier_coeffs = np.asarray(fourier_coeffs, dtype=np.float64)
+        amps = fourier_coeffs[:self.fourierorder]
+        phases = fourier_coeffs[self.fourierorder:]
+
+        return (self.zerolevel +
+                harmonic_cos.dot(amps*np.cos(phases)) -
+                harmonic_sin.dot(amps*np.sin(phases)))
+
+    def curvefit_jacobian(self, phase, *fourier_coeffs):
+        '''This returns the derivatives of the model wrt the coefficients.
+
+        Parameters
+        ----------
+
+        phase : np.array
+            The phases at which to evaluate the derivatives.
+
+        fourier_coeffs : float
+            The `fourierorder` amplitudes followed by the `fourierorder`
+            phases of the series.
+
+        Returns
+        -------
+
+        np.array
+            An array of shape (phase.size, 2*fourierorder) with the
+            derivatives of the model wrt the amplitudes followed by the
+            derivatives wrt the phases.
+
+        '''
+
+        harmonic_cos, harmonic_sin = self._harmonics(phase)
+
+        return _fourier_derivatives(harmonic_cos, harmonic_sin,
+                                    fourier_coeffs)[:,1:]
+
+    def model(self, fourier_coeffs):
+        '''This returns the model for the folded time-series.
+
+        `fourier_coeffs` is a sequence of the amplitudes followed by the
+        phases. The model is in phase order.
+
+        '''
+        return self.curvefit_func(self.phase, *fourier_coeffs)
+
+    def residual(self, fourier_coeffs):
+        '''This returns the error-weighted residual for the folded time-series.
+
+        `fourier_coeffs` is a sequence of the amplitudes followed by the
+        phases.
+
+        '''
+        return (self.mags - self.model(fourier_coeffs))/self.errs
+
+    def residual_jacobian(self, fourier_coeffs):
+        '''This returns the Jacobian of `residual` wrt the coefficients.
+
+        '''
+        return (-self.curvefit_jacobian(self.phase, *fourier_coeffs) /
+                self.errs[:,None])
@@ -188,7 +188,7 @@ def trapezoid_transit_curvefit_func(
             period = fixed_params['period']
         if 'epoch' in fixed_params:
             epoch = fixed_params['epoch']
-        if 'pdepth' in fixed_params:
+        if 'depth' in fixed_params:
             depth = fixed_params['depth']
         if 'duration' in fixed_params:
             duration = fixed_params['duration']
@@ -199,39 +199,11 @@ def trapezoid_transit_curvefit_func(
     phase = (times - epoch)/period
     phase = phase - np.floor(phase)
 
-    transitmodel = np.full_like(phase, zerolevel)
-
-    halftransitduration = duration/2.0
-    bottomlevel = zerolevel - depth
-    slope = depth/ingressduration
-
-    # the four contact points of the eclipse
-    firstcontact = 1.0 - halftransitduration
-    secondcontact = firstcontact + ingressduration
-    thirdcontact = halftransitduration - ingressduration
-    fourthcontact = halftransitduration
-
-    ## the phase indices ##
-
-    # during ingress
-    ingressind = (phase > firstcontact) & (phase < secondcontact)
-
-    # at transit bottom
-    bottomind = (phase > secondcontact) | (phase < thirdcontact)
-
-    # during egress
-    egressind = (phase > thirdcontact) & (phase < fourthcontact)
-
-    # set the transit model
-    transitmodel[ingressind] = (
-        zerolevel - slope*(phase[ingressind] - firstcontact)
-    )
-    transitmodel[bottomind] = bottomlevel
-    transitmodel[egressind] = (
-        bottomlevel + slope*(phase[egressind] - thirdcontact)
-    )
-
-    return transitmodel
+    return _trapezoid_transit_model(phase,
+                                    depth,
+                                    duration,
+                                    ingressduration,
+                                    zerolevel)
 
 
 def trapezoid_transit_residual(transitparams, times, mags, errs):
@@ -277,3 +249,369 @@ def trapezoid_transit_residual(transitparams, times, mags, errs):
 
     # this is now a weighted residual taking into account the measurement err
     return (pmags - modelmags)/perrs
+
+
+########################
+## ANALYTIC JACOBIANS ##
+########################
+
+def _trapezoid_transit_indices(phase, duration, ingressduration):
+    '''This returns the contact points and in-transit phase indices.
+
+    Parameters
+    ----------
+
+    phase : np.array
+        The phases at which the model will be evaluated.
+
+    duration,ingressduration : float
+        The transit and ingress durations in phase units.
+
+    Returns
+    -------
+
+    (firstcontact, thirdcontact, fourthcontact,
+     ingressind, bottomind, egressind) : tuple
+        The contact points used to calculate the model and the boolean index
+        arrays for the ingress, transit bottom, and egress phases.
+
+    '''
+
+    halftransitduration = duration/2.0
+
+    # the four contact points of the eclipse
+    firstcontact = 1.0 - halftransitduration
+    secondcontact = firstcontact + ingressduration
+    thirdcontact = halftransitduration - ingressduration
+    fourthcontact = halftransitduration
+
+    ingressind = (phase > firstcontact) & (phase < secondcontact)
+    bottomind = (phase > secondcontact) | (phase < thirdcontact)
+    egressind = (phase > thirdcontact) & (phase < fourthcontact)
+
+    return (firstcontact, thirdcontact, fourthcontact,
+            ingressind, bottomind, egressind)
+
+
+def _trapezoid_transit_model(phase, depth, duration, ingressduration,
+                             zerolevel):
+    '''This returns the trapezoid transit model at the given phases.
+
+    Parameters
+    ----------
+
+    phase : np.array
+        The phases at which the model will be evaluated.
+
+    depth,duration,ingressduration : float
+        The transit depth, and the transit and ingress durations in phase
+        units.
+
+    zerolevel : float
+        The level of the model outside transit.
+
+    Returns
+    -------
+
+    np.array
+        The transit model evaluated at `phase`.
+
+    '''
+
+    transitinds = _trapezoid_transit_indices(phase,
+                                             duration,
+                                             ingressduration)
+    (firstcontact, thirdcontact, fourthcontact,
+     ingressind, bottomind, egressind) = transitinds
+
+    slope = depth/ingressduration
+    bottomlevel = zerolevel - depth
+
+    # set the transit model
+    transitmodel = np.full(phase.shape, zerolevel, dtype=np.float64)
+    transitmodel[ingressind] = (
+        zerolevel - slope*(phase[ingressind] - firstcontact)
+    )
+    transitmodel[bottomind] = bottomlevel
+    transitmodel[egressind] = (
+        bottomlevel + slope*(phase[egressind] - thirdcontact)
+    )
+
+    return transitmodel
+
+
+def _trapezoid_transit_derivatives(phase, depth, duration, ingressduration):
+    '''This returns the derivatives of the trapezoid model at the given phases.
+
+    Parameters
+    ----------
+
+    phase : np.array
+        The phases at which to evaluate the derivatives.
+
+    depth,duration,ingressduration : float
+        The transit shape parameters.
+
+    Returns
+    -------
+
+    np.array
+        An array of shape (phase.size, 4) with the derivatives of the model
+        wrt the phase, `depth`, `duration`, and `ingressduration`.
+
+    '''
+
+    transitinds = _trapezoid_transit_indices(phase, duration, ingressduration)
+    (firstcontact, thirdcontact, fourthcontact,
+     ingressind, bottomind, egressind) = transitinds
+
+    slope = depth/ingressduration
+    jac = np.zeros((phase.size, 4))
+
+    # during ingress, the model is zerolevel - slope*(phase - firstcontact)
+    ingressx = phase[ingressind] - firstcontact
+    jac[ingressind, 0] = -slope
+    jac[ingressind, 1] = -ingressx/ingressduration
+    jac[ingressind, 2] = -slope/2.0
+    jac[ingressind, 3] = slope*ingressx/ingressduration
+
+    # at the bottom, only the depth matters. these are assigned in the same
+    # order as the model so overlapping indices get the same derivatives
+    jac[bottomind] = (0.0, -1.0, 0.0, 0.0)
+
+    # during egress, the model is bottomlevel + slope*(phase - thirdcontact)
+    egressx = phase[egressind] - thirdcontact
+    jac[egressind, 0] = slope
+    jac[egressind, 1] = -1.0 + egressx/ingressduration
+    jac[egressind, 2] = -slope/2.0
+    jac[egressind, 3] = (
+        slope*(fourthcontact - phase[egressind])/ingressduration
+    )
+
+    return jac
+
+
+def trapezoid_transit_curvefit_jacobian(
+        times,
+        period,
+        epoch,
+        depth,
+        duration,
+        ingressduration,
+        zerolevel=0.0,
+        fixed_params=None,
+):
+    '''This returns the Jacobian of `trapezoid_transit_curvefit_func`.
+
+    This can be passed to scipy.optimize.curve_fit as its `jac` kwarg so it
+    doesn't need to estimate the derivatives with finite differences. Apply
+    the same functools.partial as for the model function, e.g.::
+
+        curvefit_jac = functools.partial(
+                           transits.trapezoid_transit_curvefit_jacobian,
+                           zerolevel=np.median(mags),
+                           fixed_params={'ingressduration':0.05})
+
+    Parameters
+    ----------
+
+    times : np.array
+        The array of times used to construct the transit model.
+
+    period,epoch,depth,duration,ingressduration : float
+        The transit model parameters. See `trapezoid_transit_curvefit_func`.
+
+    zerolevel : float
+        The level of the measurements outside transit. The derivatives don't
+        depend on this.
+
+    fixed_params : dict or None
+        The same dict of fixed parameters passed to
+        `trapezoid_transit_curvefit_func`. The derivatives wrt these are zero.
+
+    Returns
+    -------
+
+    np.array
+        An array of shape (times.size, 5) with the derivatives of the model wrt
+        `period`, `epoch`, `depth`, `duration`, and `ingressduration`.
+
+    '''
+
+    if fixed_params is None:
+        fixed_params = {}
+
+    period = fixed_params.get('period', period)
+    epoch = fixed_params.get('epoch', epoch)
+    depth = fixed_params.get('depth', depth)
+    duration = fixed_params.get('duration', duration)
+    ingressduration = fixed_params.get('ingressduration', ingressduration)
+
+    # generate the phases
+    phase = (times - epoch)/period
+    phase = phase - np.floor(phase)
+
+    derivs = _trapezoid_transit_derivatives(phase, depth, duration,
+                                            ingressduration)
+
+    # the period and epoch only enter the model through the phase
+    jac = np.empty((times.size, 5))
+    jac[:,0] = -derivs[:,0]*(times - epoch)/(period*period)
+    jac[:,1] = -derivs[:,0]/period
+    jac[:,2:] = derivs[:,1:]
+
+    for ind, key in enumerate(('period', 'epoch', 'depth',
+                               'duration', 'ingressduration')):
+        if key in fixed_params:
+            jac[:,ind] = 0.0
+
+    return jac
+
+
+###############################
+## CACHED PHASE-FOLDED MODEL ##
+###############################
+
+class TrapezoidTransitModel(object):
+    '''This is a trapezoid transit model folded at a fixed period and epoch.
+
+    The phases of the input times and the phase sort order are calculated once
+    when the model is constructed, so evaluating the model for different values
+    of the transit shape parameters (`depth`, `duration`, `ingressduration`)
+    doesn't need to redo them. `curvefit_func` and `curvefit_jacobian` can be
+    passed directly to `scipy.optimize.curve_fit` as its `f` and `jac`, and
+    `residual` and `residual_jacobian` to `scipy.optimize.least_squares` as
+    its `fun` and `jac`.
+
+    Attributes
+    ----------
+
+    period,epoch : float
+        The period and epoch used to fold the times.
+
+    phase : np.array
+        The phases of the input times, in sorted order.
+
+    sortind : np.array
+        The index array that sorts the input arrays by phase.
+
+    times,mags,errs : np.array
+        The input time-series in phase order.
+
+    zerolevel : float
+        The out-of-transit level of the model.
+
+    '''
+
+    paramnames = ('depth', 'duration', 'ingressduration')
+
+    def __init__(self, times, mags, errs, period, epoch, zerolevel=None):
+        '''Constructor for this class.
+
+        Parameters
+        ----------
+
+        times,mags,errs : np.array
+            The input time-series to fold.
+
+        period,epoch : float
+            The period and time of mid-transit to fold the time-series with.
+
+        zerolevel : float or None
+            The out-of-transit level of the model. If None, the median of the
+            `mags` will be used.
+
+        '''
+
+        iphase = (times - epoch)/period
+        iphase = iphase - np.floor(iphase)
+
+        self.period = period
+        self.epoch = epoch
+        self.sortind = np.argsort(iphase)
+        self.phase = iphase[self.sortind]
+        self.times = times[self.sortind]
+        self.mags = mags[self.sortind]
+        self.errs = errs[self.sortind]
+
+        if zerolevel is None:
+            self.zerolevel = np.median(self.mags)
+        else:
+            self.zerolevel = zerolevel
+
+    def curvefit_func(self, phase, depth, duration, ingressduration):
+        '''This evaluates the model at the given phases.
+
+        Parameters
+        ----------
+
+        phase : np.array
+            The phases at which to evaluate the model. Use `self.phase` to get
+            the model for the folded time-series.
+
+        depth,duration,ingressduration : float
+            The transit shape parameters.
+
+        Returns
+        -------
+
+        np.array
+            The model evaluated at `phase`.
+
+        '''
+
+        return _trapezoid_transit_model(phase,
+                                        depth,
+                                        duration,
+                                        ingressduration,
+                                        self.zerolevel)
+
+    def curvefit_jacobian(self, phase, depth, duration, ingressduration):
+        '''This returns the derivatives of the model wrt the shape parameters.
+
+        Parameters
+        ----------
+
+        phase : np.array
+            The phases at which to evaluate the derivatives.
+
+        depth,duration,ingressduration : float
+            The transit shape parameters.
+
+        Returns
+        -------
+
+        np.array
+            An array of shape (phase.size, 3) with the derivatives of the model
+            wrt `depth`, `duration`, and `ingressduration`.
+
+        '''
+
+        return _trapezoid_transit_derivatives(
+            phase, depth, duration, ingressduration
+        )[:,1:]
+
+    def model(self, shapeparams):
+        '''This returns the model for the folded time-series.
+
+        `shapeparams` is a sequence of (`depth`, `duration`,
+        `ingressduration`). The model is in phase order.
+
+        '''
+        return self.curvefit_func(self.phase, *shapeparams)
+
+    def residual(self, shapeparams):
+        '''This returns the error-weighted residual for the folded time-series.
+
+        `shapeparams` is a sequence of (`depth`, `duration`,
+        `ingressduration`).
+
+        '''
+        return (self.mags - self.model(shapeparams))/self.errs
+
+    def residual_jacobian(self, shapeparams):
+        '''This returns the Jacobian of `residual` wrt the shape parameters.
+
+        '''
+        return (-self.curvefit_jacobian(self.phase, *shapeparams) /
+                self.errs[:,None])
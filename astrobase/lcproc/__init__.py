@@ -56,9 +56,18 @@ submodules in this package can be used to process these LCs:
   :py:mod:`astrobase.lcproc.checkplotproc` to generate and update checkplot
   pickles.
 
+- :py:mod:`astrobase.lcproc.pipeline`: contains functions that run a chain of
+  processing stages (normalization, sigma-clipping, EPD, TFA, time-binning,
+  and variability features) on collections of light curves, reading each light
+  curve only once.
+
 - :py:mod:`astrobase.lcproc.tfa`: contains functions that drive the application
   of the Trend Filtering Algorithm (TFA) to large collections of light curves.
 
+- :py:mod:`astrobase.lcproc.transitfit`: contains functions that run MCMC
+  transit model fits for many transit candidates in parallel, keeping the MCMC
+  chains in a single HDF5 file so interrupted fits can be resumed.
+
 - :py:mod:`astrobase.lcproc.varthreshold`: contains functions that help decide
   where to place thresholds on several variability indices for a collection of
   light curves to maximize recovery of actual variable stars.
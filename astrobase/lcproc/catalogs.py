@@ -44,6 +44,9 @@ import pickle
 import os
 import os.path
 import glob
+import json
+import ast
+import operator
 import shutil
 import multiprocessing as mp
 from concurrent.futures import ProcessPoolExecutor
@@ -93,6 +96,14 @@ FILTEROPS = {'eq':'==',
              'le':'<=',
              'ne':'!='}
 
+# these are the vectorized versions of the filter operators above
+FILTEROPFUNCS = {'eq':operator.eq,
+                 'gt':operator.gt,
+                 'ge':operator.ge,
+                 'lt':operator.lt,
+                 'le':operator.le,
+                 'ne':operator.ne}
+
 
 ###################
 ## LOCAL IMPORTS ##
@@ -100,7 +111,9 @@ FILTEROPS = {'eq':'==',
 
 from astrobase.plotbase import fits_finder_chart
 from astrobase.cpserver.checkplotlist import checkplot_infokey_worker
+from astrobase.lcarchive import expand_lcarchives
 from astrobase.lcproc import get_lcformat
+from astrobase.coordutils import make_zoneindex, load_zoneindex, ZoneIndex
 
 
 #####################################################
@@ -221,6 +234,228 @@ def _lclist_parallel_worker(task):
     return lcobjdict
 
 
+def _lclist_find_lcfiles(basedir, fileglob, recursive, lcformat):
+    '''This finds all light curves matching `fileglob` in `basedir`.
+
+    `basedir` is either a single directory or a list of directories.
+
+    '''
+
+    # handle the case where basedir is a list of directories
+    if isinstance(basedir, list):
+
+        matching = []
+
+        for bdir in basedir:
+
+            # now find the files
+            LOGINFO('searching for %s light curves in %s ...' % (lcformat,
+                                                                 bdir))
+
+            if recursive is False:
+                matching.extend(glob.glob(os.path.join(bdir, fileglob)))
+
+            else:
+                matching.extend(glob.glob(os.path.join(bdir,
+                                                       '**',
+                                                       fileglob),
+                                          recursive=True))
+
+    # otherwise, handle the usual case of one basedir to search in
+    else:
+
+        # now find the files
+        LOGINFO('searching for %s light curves in %s ...' %
+                (lcformat, basedir))
+
+        if recursive is False:
+            matching = glob.glob(os.path.join(basedir, fileglob))
+
+        else:
+            matching = glob.glob(os.path.join(basedir,
+                                              '**',
+                                              fileglob),recursive=True)
+
+    # light curve archives are expanded into their objects' LC references
+    return expand_lcarchives(matching)
+
+
+def _lclist_tag_duplicates(lclistdict):
+    '''This tags duplicated objectids in the lclistdict in place.
+
+    The first instance of each objectid is assumed to be the actual one. The
+    rest get a '-2', '-3', etc. suffix.
+
+    '''
+
+    uniques, counts = np.unique(lclistdict['objects']['objectid'],
+                                return_counts=True)
+
+    duplicated_objectids = uniques[counts > 1]
+
+    if duplicated_objectids.size > 0:
+
+        # redo the objectid array so it has a bit larger dtype so the extra
+        # tag can fit into the field
+        dt = lclistdict['objects']['objectid'].dtype.str
+        dt = '<U%s' % (
+            int(dt.replace('<','').replace('U','').replace('S','')) + 3
+        )
+        lclistdict['objects']['objectid'] = np.array(
+            lclistdict['objects']['objectid'],
+            dtype=dt
+        )
+
+        for objid in duplicated_objectids:
+
+            objid_inds = np.where(
+                lclistdict['objects']['objectid'] == objid
+            )
+
+            # mark the duplicates, assume the first instance is the actual
+            # one
+            for ncounter, nind in enumerate(objid_inds[0][1:]):
+                lclistdict['objects']['objectid'][nind] = '%s-%s' % (
+                    lclistdict['objects']['objectid'][nind],
+                    ncounter+2
+                )
+                LOGWARNING(
+                    'tagging duplicated instance %s of objectid: '
+                    '%s as %s-%s, lightcurve: %s' %
+                    (ncounter+2, objid, objid, ncounter+2,
+                     lclistdict['objects']['lcfname'][nind])
+                )
+
+
+def _lclist_make_coordindex(lclistdict, makecoordindex, outformat,
+                            zone_height):
+    '''This adds the spatial index for the object coordinates to lclistdict.
+
+    Returns the (ra, decl) arrays used to make the index.
+
+    '''
+
+    try:
+
+        # deref the column names
+        racol, declcol = makecoordindex
+        racol = racol.split('.')[-1]
+        declcol = declcol.split('.')[-1]
+
+        # get the ras and decls
+        objra, objdecl = (lclistdict['objects'][racol],
+                          lclistdict['objects'][declcol])
+
+        # get the xyz unit vectors from ra,decl
+        # since i had to remind myself:
+        # https://en.wikipedia.org/wiki/Equatorial_coordinate_system
+        cosdecl = np.cos(np.radians(objdecl))
+        sindecl = np.sin(np.radians(objdecl))
+        cosra = np.cos(np.radians(objra))
+        sinra = np.sin(np.radians(objra))
+        xyz = np.column_stack((cosra*cosdecl,sinra*cosdecl, sindecl))
+
+        # generate the kdtree. mmap catalogs get a zone index instead
+        # because it can be memory-mapped back in
+        if outformat == 'mmap':
+            kdt = make_zoneindex(objra, objdecl,
+                                 zone_height=zone_height)
+        else:
+            kdt = sps.cKDTree(xyz,copy_data=True)
+
+        # put the tree into the dict
+        lclistdict['kdtree'] = kdt
+
+        LOGINFO('kdtree generated for (ra, decl): (%s, %s)' %
+                (makecoordindex[0], makecoordindex[1]))
+
+    except Exception:
+        LOGEXCEPTION('could not make kdtree for (ra, decl): (%s, %s)' %
+                     (makecoordindex[0], makecoordindex[1]))
+        raise
+
+    return objra, objdecl
+
+
+def _lclist_field_xy_finder(lclistdict,
+                            outfile,
+                            objra,
+                            objdecl,
+                            field_fitsfile,
+                            field_wcsfrom,
+                            field_scale,
+                            field_stretch,
+                            field_colormap,
+                            field_findersize,
+                            field_pltopts,
+                            field_grid,
+                            field_gridcolor,
+                            field_zoomcontain):
+    '''This adds frame x/y coordinates to lclistdict and makes a finder.
+
+    The `field_*` kwargs are the same as those for `make_lclist`.
+
+    '''
+
+    # read in the FITS file
+    if field_wcsfrom is None:
+
+        hdulist = pyfits.open(field_fitsfile)
+        hdr = hdulist[0].header
+        hdulist.close()
+
+        w = WCS(hdr)
+        wcsok = True
+
+    elif os.path.exists(field_wcsfrom):
+
+        w = WCS(field_wcsfrom)
+        wcsok = True
+
+    else:
+
+        LOGERROR('could not determine WCS info for input FITS: %s' %
+                 field_fitsfile)
+        wcsok = False
+
+    if wcsok:
+
+        # first, transform the ra/decl to x/y and put these in the
+        # lclist output dict
+        radecl = np.column_stack((objra, objdecl))
+        lclistdict['objects']['framexy'] = w.all_world2pix(
+            radecl,
+            1
+        )
+
+        # next, we'll make a PNG plot for the finder
+        finder_outfile = os.path.join(
+            os.path.dirname(outfile),
+            os.path.splitext(os.path.basename(outfile))[0] + '.png'
+        )
+
+        finder_png = fits_finder_chart(
+            field_fitsfile,
+            finder_outfile,
+            wcsfrom=field_wcsfrom,
+            scale=field_scale,
+            stretch=field_stretch,
+            colormap=field_colormap,
+            findersize=field_findersize,
+            overlay_ra=objra,
+            overlay_decl=objdecl,
+            overlay_pltopts=field_pltopts,
+            overlay_zoomcontain=field_zoomcontain,
+            grid=field_grid,
+            gridcolor=field_gridcolor
+        )
+
+        if finder_png is not None:
+            LOGINFO('generated a finder PNG '
+                    'with an object position overlay '
+                    'for this LC list: %s' % finder_png)
+
+
 def make_lclist(basedir,
                 outfile,
                 use_list_of_filenames=None,
@@ -248,7 +483,9 @@ def make_lclist(basedir,
                 field_gridcolor='k',
                 field_zoomcontain=True,
                 maxlcs=None,
-                nworkers=NCPUS):
+                nworkers=NCPUS,
+                outformat='pkl',
+                zone_height=0.05):
 
     '''This generates a light curve catalog for all light curves in a directory.
 
@@ -286,7 +523,8 @@ def make_lclist(basedir,
     outfile : str
         This is the name of the output file to write. This will be a pickle
         file, so a good convention to use for this name is something like
-        'my-lightcurve-catalog.pkl'.
+        'my-lightcurve-catalog.pkl'. If `outformat` is 'mmap', this is the name
+        of the output catalog directory instead.
 
     use_list_of_filenames : list of str or None
         Use this kwarg to override whatever is provided in `basedir` and
@@ -407,11 +645,22 @@ def make_lclist(basedir,
         This sets the number of parallel workers to launch to collect
         information from the light curves.
 
+    outformat : {'pkl', 'mmap'}
+        If this is 'pkl', the catalog is written as a single pickle with a
+        `cKDTree` spatial index. If this is 'mmap', the catalog is written as
+        a directory of memory-mappable column arrays with a persisted
+        `ZoneIndex` spatial index instead (see `write_mmap_lclist`).
+
+    zone_height : float
+        The declination zone height in decimal degrees to use for the
+        `ZoneIndex` if `outformat` is 'mmap'.
+
     Returns
     -------
 
     str
-        Returns the path to the generated light curve catalog pickle file.
+        Returns the path to the generated light curve catalog pickle file or
+        catalog directory.
 
     '''
 
@@ -442,40 +691,8 @@ def make_lclist(basedir,
 
     else:
 
-        # handle the case where basedir is a list of directories
-        if isinstance(basedir, list):
-
-            matching = []
-
-            for bdir in basedir:
-
-                # now find the files
-                LOGINFO('searching for %s light curves in %s ...' % (lcformat,
-                                                                     bdir))
-
-                if recursive is False:
-                    matching.extend(glob.glob(os.path.join(bdir, fileglob)))
-
-                else:
-                    matching.extend(glob.glob(os.path.join(bdir,
-                                                           '**',
-                                                           fileglob),
-                                              recursive=True))
-
-        # otherwise, handle the usual case of one basedir to search in
-        else:
-
-            # now find the files
-            LOGINFO('searching for %s light curves in %s ...' %
-                    (lcformat, basedir))
-
-            if recursive is False:
-                matching = glob.glob(os.path.join(basedir, fileglob))
-
-            else:
-                matching = glob.glob(os.path.join(basedir,
-                                                  '**',
-                                                  fileglob),recursive=True)
+        matching = _lclist_find_lcfiles(basedir, fileglob, recursive,
+                                        lcformat)
 
     #
     # now that we have all the files, process them
@@ -542,155 +759,715 @@ def make_lclist(basedir,
             lclistdict['objects'][col] = np.array(lclistdict['objects'][col])
 
         # handle duplicate objectids with different light curves
-        uniques, counts = np.unique(lclistdict['objects']['objectid'],
-                                    return_counts=True)
+        _lclist_tag_duplicates(lclistdict)
 
-        duplicated_objectids = uniques[counts > 1]
+        # if we're supposed to make a spatial index, do so
+        objra, objdecl = None, None
+
+        if (makecoordindex and
+            isinstance(makecoordindex, (list, tuple)) and
+            len(makecoordindex) == 2):
 
-        if duplicated_objectids.size > 0:
+            objra, objdecl = _lclist_make_coordindex(lclistdict,
+                                                     makecoordindex,
+                                                     outformat,
+                                                     zone_height)
 
-            # redo the objectid array so it has a bit larger dtype so the extra
-            # tag can fit into the field
-            dt = lclistdict['objects']['objectid'].dtype.str
-            dt = '<U%s' % (
-                int(dt.replace('<','').replace('U','').replace('S','')) + 3
-            )
-            lclistdict['objects']['objectid'] = np.array(
-                lclistdict['objects']['objectid'],
-                dtype=dt
-            )
+        # generate the xy pairs if fieldfits is not None
+        if field_fitsfile and os.path.exists(field_fitsfile):
 
-            for objid in duplicated_objectids:
+            _lclist_field_xy_finder(lclistdict,
+                                    outfile,
+                                    objra,
+                                    objdecl,
+                                    field_fitsfile,
+                                    field_wcsfrom,
+                                    field_scale,
+                                    field_stretch,
+                                    field_colormap,
+                                    field_findersize,
+                                    field_pltopts,
+                                    field_grid,
+                                    field_gridcolor,
+                                    field_zoomcontain)
+
+        # write the pickle or the mmap catalog
+        if outformat == 'mmap':
+            write_mmap_lclist(lclistdict, outfile, zone_height=zone_height)
+        else:
+            with open(outfile,'wb') as outfd:
+                pickle.dump(lclistdict, outfd,
+                            protocol=pickle.HIGHEST_PROTOCOL)
 
-                objid_inds = np.where(
-                    lclistdict['objects']['objectid'] == objid
-                )
+        LOGINFO('done. LC info -> %s' % outfile)
+        return outfile
 
-                # mark the duplicates, assume the first instance is the actual
-                # one
-                for ncounter, nind in enumerate(objid_inds[0][1:]):
-                    lclistdict['objects']['objectid'][nind] = '%s-%s' % (
-                        lclistdict['objects']['objectid'][nind],
-                        ncounter+2
-                    )
-                    LOGWARNING(
-                        'tagging duplicated instance %s of objectid: '
-                        '%s as %s-%s, lightcurve: %s' %
-                        (ncounter+2, objid, objid, ncounter+2,
-                         lclistdict['objects']['lcfname'][nind])
-                    )
+    else:
 
-        # if we're supposed to make a spatial index, do so
-        if (makecoordindex and
-            isinstance(makecoordindex, (list, tuple)) and
-            len(makecoordindex) == 2):
+        LOGERROR('no files found in %s matching %s' % (basedir, fileglob))
+        return None
+
+
+#######################################################
+## MEMORY-MAPPED LIGHT CURVE CATALOGS (MMAP LCLISTS) ##
+#######################################################
+
+# this is the name of the JSON file describing an mmap catalog directory
+MMAP_LCLIST_INFOFILE = 'lclist-info.json'
+
+# these mark the missing values of object columns in their .missing.npy masks
+MMAP_MISSING_NONE = 1
+MMAP_MISSING_NAN = 2
+
+
+def _jsonable(value):
+    '''This turns numpy scalars, arrays, and tuples into JSON-able values.
+
+    Anything else that JSON can't handle is turned into its repr.
+
+    '''
+
+    if isinstance(value, dict):
+        return {k:_jsonable(v) for k, v in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [_jsonable(x) for x in value]
+    elif isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    elif value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    else:
+        return repr(value)
+
+
+def _mmap_column_array(colval):
+    '''This turns an lclist column into an array that can be memory-mapped.
+
+    Object arrays can't be memory-mapped. If all of their values that aren't
+    None or nan are numbers, they're turned into float arrays. Otherwise, they
+    are turned into unicode string arrays. The missing values are stored as nan
+    or an empty string respectively, and are recorded in a mask array so
+    `read_lclist` can put them back.
+
+    Returns
+    -------
+
+    (colarr, missing) : tuple
+        `colarr` is the array to save. `missing` is None if there are no
+        missing values to restore. Otherwise, it's an int8 array with
+        `MMAP_MISSING_NONE` where the value was None, `MMAP_MISSING_NAN` where
+        it was nan, and 0 everywhere else.
+
+    '''
+
+    colarr = np.asarray(colval)
+
+    if colarr.dtype.kind != 'O':
+        return colarr, None
+
+    missing = np.zeros(colarr.shape, dtype=np.int8)
+    isnumeric = True
+
+    for ind, val in enumerate(colarr.flat):
+
+        if val is None:
+            missing.flat[ind] = MMAP_MISSING_NONE
+        elif isinstance(val, (float, np.floating)) and np.isnan(val):
+            missing.flat[ind] = MMAP_MISSING_NAN
+        elif (isinstance(val, (bool, np.bool_)) or
+              not isinstance(val, (int, float, np.number))):
+            isnumeric = False
+
+    filled = colarr.copy()
+
+    if isnumeric:
+        filled[missing > 0] = np.nan
+        colarr = filled.astype(np.float64)
+    else:
+        filled[missing > 0] = ''
+        colarr = filled.astype(np.str_)
+
+    if missing.any():
+        return colarr, missing
+    else:
+        return colarr, None
+
+
+def write_mmap_lclist(lclistdict,
+                      outdir,
+                      zone_height=0.05,
+                      objectcols=None):
+    '''This writes a light curve catalog dict to a memory-mappable catalog.
+
+    The output is a directory containing:
+
+    - `lclist-info.json`: all of the non-column items of the lclistdict along
+      with the list of object columns
+    - `objects/<column>.npy`: one .npy file per column in
+      `lclistdict['objects']`
+    - `objects/<column>.missing.npy`: a mask of the None and nan values for
+      each object column that has them
+    - `zoneindex/`: the persisted `astrobase.coordutils.ZoneIndex` for the
+      catalog's object coordinates
+
+    None of these are pickles. Use `read_lclist` to open the catalog. Its
+    column arrays and spatial index are memory-mapped read-only, so any number
+    of parallel workers can share a single on-disk catalog without each one
+    loading all of it into memory.
+
+    Parameters
+    ----------
+
+    lclistdict : dict
+        A light curve catalog dict of the form produced by `make_lclist`. If
+        its `kdtree` item is a `scipy.spatial.cKDTree`, it will be replaced by
+        a `ZoneIndex` made from the `makecoordindex` columns.
+
+    outdir : str
+        The output catalog directory. This will be created if it doesn't
+        exist.
+
+    zone_height : float
+        The declination zone height in decimal degrees to use if a new
+        `ZoneIndex` needs to be generated.
+
+    objectcols : list of str or None
+        If this is a list of column names, only these columns of
+        `lclistdict['objects']` are written to an existing catalog in
+        `outdir`, along with its updated info JSON. The other columns and the
+        spatial index are left alone. This is used to append columns to a
+        catalog without rewriting all of it.
+
+    Returns
+    -------
+
+    str
+        The path to the output catalog directory.
+
+    '''
+
+    objectsdir = os.path.join(outdir, 'objects')
+    if not os.path.exists(objectsdir):
+        os.makedirs(objectsdir)
+
+    if objectcols is None:
+        writecols = list(lclistdict['objects'].keys())
+        update_only = False
+    else:
+        writecols = list(objectcols)
+        update_only = os.path.exists(
+            os.path.join(outdir, MMAP_LCLIST_INFOFILE)
+        )
+
+    # the columns with missing values that aren't being rewritten
+    if update_only:
+        missingcols = [x for x in lclistdict.get('missingcols', [])
+                       if x not in writecols]
+    else:
+        missingcols = []
+
+    # write the columns. existing files are removed first instead of being
+    # overwritten because they may be hardlinks to the files of another
+    # catalog (see `add_cpinfo_to_lclist`)
+    for col in writecols:
+
+        colarr, missing = _mmap_column_array(lclistdict['objects'][col])
+        colfile = os.path.join(objectsdir, '%s.npy' % col)
+        missingfile = os.path.join(objectsdir, '%s.missing.npy' % col)
+
+        if os.path.exists(colfile):
+            os.remove(colfile)
+        np.save(colfile, colarr, allow_pickle=False)
+
+        if os.path.exists(missingfile):
+            os.remove(missingfile)
+
+        if missing is not None:
+            np.save(missingfile, missing, allow_pickle=False)
+            missingcols.append(col)
+
+    objectcols = list(lclistdict['objects'].keys())
+
+    # write the spatial index
+    kdt = lclistdict.get('kdtree', None)
+    makecoordindex = lclistdict.get('makecoordindex', None)
+
+    if update_only:
+        kdt = None
+        haveindex = os.path.exists(os.path.join(outdir, 'zoneindex'))
+
+    elif (kdt is not None and
+          not isinstance(kdt, ZoneIndex) and
+          makecoordindex and len(makecoordindex) == 2):
+
+        racol, declcol = [x.split('.')[-1] for x in makecoordindex]
+        kdt = make_zoneindex(lclistdict['objects'][racol],
+                             lclistdict['objects'][declcol],
+                             zone_height=zone_height)
+
+    if isinstance(kdt, ZoneIndex):
+        if os.path.isdir(os.path.join(outdir, 'zoneindex')):
+            shutil.rmtree(os.path.join(outdir, 'zoneindex'))
+        kdt.save(os.path.join(outdir, 'zoneindex'))
+        haveindex = True
+    elif not update_only:
+        haveindex = False
+
+    # write everything else to the info JSON
+    lclistinfo = {
+        k:_jsonable(v) for k, v in lclistdict.items()
+        if k not in ('objects', 'kdtree')
+    }
+    lclistinfo['objectcols'] = objectcols
+    lclistinfo['missingcols'] = missingcols
+    lclistinfo['zoneindex'] = haveindex
+
+    infofile = os.path.join(outdir, MMAP_LCLIST_INFOFILE)
+    if os.path.exists(infofile):
+        os.remove(infofile)
+
+    with open(infofile, 'w') as outfd:
+        json.dump(lclistinfo, outfd, indent=2)
+
+    LOGINFO('wrote %s/%s columns of mmap LC catalog -> %s' %
+            (len(writecols), len(objectcols), outdir))
+
+    return outdir
+
+
+def _link_mmap_lclist(lc_catalog, outdir, skipcols):
+    '''This makes a copy of an mmap catalog by hardlinking its files.
+
+    The object column files of `skipcols` are left out since they'll be
+    written by the caller. The info JSON is small and is always copied. The
+    other files are copied only if they can't be hardlinked, e.g. if `outdir`
+    is on a different filesystem.
+
+    '''
+
+    skipfiles = {os.path.join('objects', '%s%s' % (col, ext))
+                 for col in skipcols
+                 for ext in ('.npy', '.missing.npy')}
+
+    for dirpath, dirnames, filenames in os.walk(lc_catalog):
+
+        reldir = os.path.relpath(dirpath, lc_catalog)
+        outpath = os.path.normpath(os.path.join(outdir, reldir))
+        if not os.path.exists(outpath):
+            os.makedirs(outpath)
+
+        for fname in filenames:
+
+            relfile = os.path.normpath(os.path.join(reldir, fname))
+            if relfile in skipfiles:
+                continue
+
+            infile = os.path.join(dirpath, fname)
+            linkfile = os.path.join(outpath, fname)
+
+            if relfile == MMAP_LCLIST_INFOFILE:
+                shutil.copy2(infile, linkfile)
+                continue
 
             try:
+                os.link(infile, linkfile)
+            except OSError:
+                shutil.copy2(infile, linkfile)
 
-                # deref the column names
-                racol, declcol = makecoordindex
-                racol = racol.split('.')[-1]
-                declcol = declcol.split('.')[-1]
+    return outdir
 
-                # get the ras and decls
-                objra, objdecl = (lclistdict['objects'][racol],
-                                  lclistdict['objects'][declcol])
 
-                # get the xyz unit vectors from ra,decl
-                # since i had to remind myself:
-                # https://en.wikipedia.org/wiki/Equatorial_coordinate_system
-                cosdecl = np.cos(np.radians(objdecl))
-                sindecl = np.sin(np.radians(objdecl))
-                cosra = np.cos(np.radians(objra))
-                sinra = np.sin(np.radians(objra))
-                xyz = np.column_stack((cosra*cosdecl,sinra*cosdecl, sindecl))
+def read_lclist(lc_catalog, mmap=True):
+    '''This reads a light curve catalog in either the pickle or mmap format.
 
-                # generate the kdtree
-                kdt = sps.cKDTree(xyz,copy_data=True)
+    Parameters
+    ----------
 
-                # put the tree into the dict
-                lclistdict['kdtree'] = kdt
+    lc_catalog : str or dict
+        If this is a path to a directory, it's read as a catalog written by
+        `write_mmap_lclist`. If this is a path to a file, it's read as a
+        catalog pickle written by `make_lclist`. If this is a dict, it's
+        assumed to be an already loaded catalog and is returned as is.
 
-                LOGINFO('kdtree generated for (ra, decl): (%s, %s)' %
-                        (makecoordindex[0], makecoordindex[1]))
+    mmap : bool
+        If True, the column arrays and spatial index of an mmap catalog are
+        memory-mapped read-only instead of being read into memory. Columns
+        with None or nan values in the original object arrays are always read
+        into memory as object arrays with these values put back.
 
-            except Exception:
-                LOGEXCEPTION('could not make kdtree for (ra, decl): (%s, %s)' %
-                             (makecoordindex[0], makecoordindex[1]))
-                raise
+    Returns
+    -------
 
-        # generate the xy pairs if fieldfits is not None
-        if field_fitsfile and os.path.exists(field_fitsfile):
+    dict
+        A light curve catalog dict with the same items as the one produced by
+        `make_lclist`. For mmap catalogs, the `kdtree` item is a `ZoneIndex`
+        which supports the same queries as a `cKDTree`.
+
+    '''
+
+    if isinstance(lc_catalog, dict):
+        return lc_catalog
+
+    if not os.path.isdir(lc_catalog):
+
+        with open(lc_catalog,'rb') as infd:
+            lclist = pickle.load(infd)
+        return lclist
+
+    with open(os.path.join(lc_catalog, MMAP_LCLIST_INFOFILE), 'r') as infd:
+        lclist = json.load(infd)
+
+    mmap_mode = 'r' if mmap else None
+
+    lclist['objects'] = {
+        col:np.load(os.path.join(lc_catalog, 'objects', '%s.npy' % col),
+                    mmap_mode=mmap_mode,
+                    allow_pickle=False)
+        for col in lclist['objectcols']
+    }
+
+    # put back the None and nan values of object columns. these columns are
+    # read into memory as object arrays
+    for col in lclist.get('missingcols', []):
+
+        missing = np.load(
+            os.path.join(lc_catalog, 'objects', '%s.missing.npy' % col),
+            allow_pickle=False
+        )
+        colvals = lclist['objects'][col].astype(object)
+        colvals[missing == MMAP_MISSING_NONE] = None
+        colvals[missing == MMAP_MISSING_NAN] = np.nan
+        lclist['objects'][col] = colvals
+
+    if lclist['zoneindex']:
+        lclist['kdtree'] = load_zoneindex(
+            os.path.join(lc_catalog, 'zoneindex'),
+            mmap=mmap
+        )
+
+    return lclist
+
+
+def convert_lclist_to_mmap(lc_catalog,
+                           outdir,
+                           zone_height=0.05):
+    '''This converts a light curve catalog pickle to the mmap catalog format.
+
+    Parameters
+    ----------
+
+    lc_catalog : str
+        The path to the light curve catalog pickle made by `make_lclist`.
+
+    outdir : str
+        The output catalog directory.
+
+    zone_height : float
+        The declination zone height in decimal degrees to use for the
+        catalog's `ZoneIndex`.
+
+    Returns
+    -------
+
+    str
+        The path to the output catalog directory.
+
+    '''
 
-            # read in the FITS file
-            if field_wcsfrom is None:
+    return write_mmap_lclist(read_lclist(lc_catalog),
+                             outdir,
+                             zone_height=zone_height)
 
-                hdulist = pyfits.open(field_fitsfile)
-                hdr = hdulist[0].header
-                hdulist.close()
 
-                w = WCS(hdr)
-                wcsok = True
+###############################################
+## COMPILED FILTERS FOR LIGHT CURVE CATALOGS ##
+###############################################
 
-            elif os.path.exists(field_wcsfrom):
+def compile_lclist_filters(columnfilters):
+    '''This parses column filter strings into vectorized predicates.
 
-                w = WCS(field_wcsfrom)
-                wcsok = True
+    Parameters
+    ----------
+
+    columnfilters : list of str
+        This is a list of column filter strings of the form used by
+        `filter_lclist`::
+
+            '<lc_catalog column>|<operator>|<operand>'
+
+        where <operator> is one of the keys of the `FILTEROPS` dict and
+        <operand> is a Python literal (a number or a quoted string). An
+        unquoted operand that isn't a number is taken as a string.
+
+    Returns
+    -------
+
+    list of tuples
+        Returns a list of `(filterspec, column, opfunc, operand)` tuples, one
+        for each filter that could be parsed. Filters that can't be parsed are
+        logged and skipped. These can be passed to `apply_lclist_filters`
+        as many times as needed without re-parsing the filter strings.
+
+    '''
+
+    compiled = []
+
+    for cfilt in columnfilters:
+
+        try:
+
+            fcol, foperator, foperand = cfilt.split('|')
+
+            try:
+                operand = ast.literal_eval(foperand.strip())
+            except (ValueError, SyntaxError):
+                operand = foperand.strip()
+
+            compiled.append((cfilt,
+                             fcol.strip(),
+                             FILTEROPFUNCS[foperator.strip()],
+                             operand))
+
+        except Exception:
+
+            LOGEXCEPTION('filter: could not understand filter spec: %s'
+                         % cfilt)
+            LOGWARNING('filter: not applying this broken filter')
+
+    return compiled
+
+
+def apply_lclist_filters(lclist,
+                         compiled_filters,
+                         indices=None):
+    '''This applies compiled column filters to a light curve catalog.
+
+    Parameters
+    ----------
+
+    lclist : dict
+        A light curve catalog dict as returned by `read_lclist`.
 
+    compiled_filters : list of tuples
+        The output of `compile_lclist_filters`.
+
+    indices : np.array or None
+        If this is provided, only these catalog rows will be considered. This
+        is used to chain filters after a cone-search or cross-match so that
+        only the rows still in play are read from each column.
+
+    Returns
+    -------
+
+    np.array
+        The sorted indices of the catalog rows that pass all of the
+        filters. Filters for columns that aren't in the catalog or with
+        operands that can't be compared to their column are logged and
+        skipped.
+
+    '''
+
+    for cfilt, fcol, opfunc, operand in compiled_filters:
+
+        try:
+
+            colvals = lclist['objects'][fcol]
+
+            # fancy indexing only pulls in the rows we need from
+            # memory-mapped columns
+            if indices is not None:
+                colvals = colvals[indices]
             else:
+                colvals = np.asarray(colvals)
 
-                LOGERROR('could not determine WCS info for input FITS: %s' %
-                         field_fitsfile)
-                wcsok = False
+            if colvals.dtype.kind in 'biufc':
+                keep = np.isfinite(colvals) & opfunc(colvals, operand)
+            else:
+                keep = np.asarray(opfunc(colvals, operand), dtype=bool)
 
-            if wcsok:
+        except (KeyError, TypeError, ValueError):
 
-                # first, transform the ra/decl to x/y and put these in the
-                # lclist output dict
-                radecl = np.column_stack((objra, objdecl))
-                lclistdict['objects']['framexy'] = w.all_world2pix(
-                    radecl,
-                    1
-                )
+            LOGERROR('filter: could not apply filter: %s, '
+                     'check its column name and operand type' % cfilt)
+            LOGWARNING('filter: not applying this broken filter')
+            continue
 
-                # next, we'll make a PNG plot for the finder
-                finder_outfile = os.path.join(
-                    os.path.dirname(outfile),
-                    os.path.splitext(os.path.basename(outfile))[0] + '.png'
-                )
+        if indices is None:
+            indices = np.flatnonzero(keep)
+        else:
+            indices = indices[keep]
 
-                finder_png = fits_finder_chart(
-                    field_fitsfile,
-                    finder_outfile,
-                    wcsfrom=field_wcsfrom,
-                    scale=field_scale,
-                    stretch=field_stretch,
-                    colormap=field_colormap,
-                    findersize=field_findersize,
-                    overlay_ra=objra,
-                    overlay_decl=objdecl,
-                    overlay_pltopts=field_pltopts,
-                    overlay_zoomcontain=field_zoomcontain,
-                    grid=field_grid,
-                    gridcolor=field_gridcolor
-                )
+        LOGINFO('filter: %s -> objects matching: %s ' % (cfilt, indices.size))
 
-                if finder_png is not None:
-                    LOGINFO('generated a finder PNG '
-                            'with an object position overlay '
-                            'for this LC list: %s' % finder_png)
+    if indices is None:
+        indices = np.arange(len(lclist['objects']['lcfname']))
 
-        # write the pickle
-        with open(outfile,'wb') as outfd:
-            pickle.dump(lclistdict, outfd, protocol=pickle.HIGHEST_PROTOCOL)
+    return indices
 
-        LOGINFO('done. LC info -> %s' % outfile)
-        return outfile
 
-    else:
+def filter_lclist_indices(lclist,
+                          xmatchexternal=None,
+                          xmatchdistarcsec=3.0,
+                          externalcolnums=(0,1,2),
+                          externalcolnames=('objectid','ra','decl'),
+                          externalcoldtypes='U20,f8,f8',
+                          externalcolsep=None,
+                          externalcommentchar='#',
+                          conesearch=None,
+                          conesearchworkers=1,
+                          columnfilters=None):
+    '''This returns the indices of catalog objects matching all selections.
 
-        LOGERROR('no files found in %s matching %s' % (basedir, fileglob))
-        return None
+    This is the selection engine behind `filter_lclist`. It runs the
+    cross-match, cone-search, and column filters against an already loaded
+    catalog and returns row indices instead of copies of the catalog columns,
+    so the catalog only needs to be read in once for any number of
+    selections. Each step only looks at the rows that survived the previous
+    steps.
+
+    Parameters
+    ----------
+
+    lclist : dict or str
+        A light curve catalog dict as returned by `read_lclist` or the path to
+        a catalog pickle or mmap catalog directory.
+
+    xmatchexternal,xmatchdistarcsec : str or None, float
+        The external catalog file to cross-match to and the match radius in
+        arcseconds. See `filter_lclist`.
+
+    externalcolnums,externalcolnames,externalcoldtypes : sequence, sequence, str
+        These describe the columns to read from `xmatchexternal`. See
+        `filter_lclist`.
+
+    externalcolsep,externalcommentchar : str or None, str
+        The column separator and comment character for `xmatchexternal`.
+
+    conesearch : list of float or None
+        This is a three element list: [center_ra_deg, center_decl_deg,
+        search_radius_deg].
+
+    conesearchworkers : int
+        The number of parallel workers to use for the cone-search if the
+        catalog has a `cKDTree`.
+
+    columnfilters : list of str or list of tuples or None
+        Either a list of column filter strings (see `filter_lclist`) or the
+        output of `compile_lclist_filters` for these.
+
+    Returns
+    -------
+
+    tuple
+        Returns `(matching_indices, ext_matching_objects)`. The first element
+        is a sorted np.array of catalog row indices and the second is a list
+        of the rows of the external catalog that matched catalog objects (this
+        is empty if `xmatchexternal` is not used).
+
+    '''
+
+    lclist = read_lclist(lclist)
+    indices = None
+    ext_matching_objects = []
+
+    # do the xmatch first
+    if (xmatchexternal and
+        isinstance(xmatchexternal, str) and
+        os.path.exists(xmatchexternal)):
+
+        # read in the external file
+        extcat = np.genfromtxt(xmatchexternal,
+                               usecols=externalcolnums,
+                               delimiter=externalcolsep,
+                               names=externalcolnames,
+                               dtype=externalcoldtypes,
+                               comments=externalcommentchar)
+
+        ext_cosdecl = np.cos(np.radians(extcat['decl']))
+        ext_sindecl = np.sin(np.radians(extcat['decl']))
+        ext_cosra = np.cos(np.radians(extcat['ra']))
+        ext_sinra = np.sin(np.radians(extcat['ra']))
+
+        ext_xyz = np.column_stack((ext_cosra*ext_cosdecl,
+                                   ext_sinra*ext_cosdecl,
+                                   ext_sindecl))
+        ext_xyzdist = 2.0 * np.sin(np.radians(xmatchdistarcsec/3600.0)/2.0)
+
+        # get our kdtree
+        our_kdt = lclist['kdtree']
+
+        # do a query_ball_tree. zone indexes from mmap catalogs are queried
+        # with the external points directly
+        if isinstance(our_kdt, ZoneIndex):
+            extkd_matchinds = our_kdt.query_ball_point(ext_xyz, ext_xyzdist)
+        else:
+            ext_kdt = sps.cKDTree(ext_xyz)
+            extkd_matchinds = ext_kdt.query_ball_tree(our_kdt, ext_xyzdist)
+
+        ext_matches = []
+
+        for extind, mind in enumerate(extkd_matchinds):
+            if len(mind) > 0:
+                ext_matches.append(mind[0])
+
+                # get the whole matching row for the ext objects recarray
+                ext_matching_objects.append(extcat[extind])
+
+        indices = np.unique(np.array(ext_matches, dtype=np.int64))
+
+        LOGINFO('xmatch: objects matched to %s within %.1f arcsec: %s' %
+                (xmatchexternal, xmatchdistarcsec, indices.size))
+
+    # do the cone search next
+    if (conesearch and
+        isinstance(conesearch, (list, tuple)) and
+        len(conesearch) == 3):
+
+        racenter, declcenter, searchradius = conesearch
+        cosdecl = np.cos(np.radians(declcenter))
+        sindecl = np.sin(np.radians(declcenter))
+        cosra = np.cos(np.radians(racenter))
+        sinra = np.sin(np.radians(racenter))
+
+        # this is the search distance in xyz unit vectors
+        xyzdist = 2.0 * np.sin(np.radians(searchradius)/2.0)
+
+        # look up the coordinates. newer scipy versions call the n_jobs kwarg
+        # 'workers' instead
+        try:
+            kdtindices = lclist['kdtree'].query_ball_point(
+                [cosra*cosdecl, sinra*cosdecl, sindecl],
+                xyzdist,
+                workers=conesearchworkers
+            )
+        except TypeError:
+            kdtindices = lclist['kdtree'].query_ball_point(
+                [cosra*cosdecl, sinra*cosdecl, sindecl],
+                xyzdist,
+                n_jobs=conesearchworkers
+            )
+        kdtindices = np.unique(np.array(kdtindices, dtype=np.int64))
+
+        LOGINFO('cone search: objects within %.4f deg '
+                'of (%.3f, %.3f): %s' %
+                (searchradius, racenter, declcenter, kdtindices.size))
+
+        if indices is None:
+            indices = kdtindices
+        else:
+            indices = np.intersect1d(indices, kdtindices, assume_unique=True)
+
+    # finally, do the column filters on whatever's left
+    if columnfilters:
+
+        if isinstance(columnfilters[0], str):
+            columnfilters = compile_lclist_filters(columnfilters)
+
+        indices = apply_lclist_filters(lclist, columnfilters, indices=indices)
+
+    if indices is None:
+        indices = np.arange(len(lclist['objects']['lcfname']))
+
+    return indices, ext_matching_objects
 
 
 def filter_lclist(lc_catalog,
@@ -738,9 +1515,18 @@ def filter_lclist(lc_catalog,
     `xmatchexternal` -> `conesearch` -> `columnfilters`. All results from these
     operations are joined using a logical AND operation.
 
+    If you're going to run many selections on the same catalog, load it once
+    with `read_lclist` and use `filter_lclist_indices` directly instead. That
+    returns index arrays into the catalog columns and can take column filters
+    pre-parsed by `compile_lclist_filters`.
+
     Parameters
     ----------
 
+    lc_catalog : str
+        The path to the light curve catalog pickle or mmap catalog directory
+        made by `make_lclist`.
+
     objectidcol : str
         This is the name of the object ID column in the light curve catalog.
 
@@ -879,202 +1665,83 @@ def filter_lclist(lc_catalog,
         Returns a two elem tuple: (matching_object_lcfiles, matching_objectids)
         if conesearch and/or column filters are used. If `xmatchexternal` is
         also used, a three-elem tuple is returned: (matching_object_lcfiles,
-        matching_objectids, extcat_matched_objectids).
+        matching_objectids, extcat_matched_objectids). If the cross-match or
+        cone-search finds no objects, a tuple of Nones of the same length is
+        returned.
 
     '''
 
-    with open(lc_catalog,'rb') as infd:
-        lclist = pickle.load(infd)
-
-    # generate numpy arrays of the matching object indexes. we do it this way so
-    # we can AND everything at the end, instead of having to look up the objects
-    # at these indices and running the columnfilter on them
-    xmatch_matching_index = np.full_like(lclist['objects'][objectidcol],
-                                         False,
-                                         dtype=np.bool)
-    conesearch_matching_index = np.full_like(lclist['objects'][objectidcol],
-                                             False,
-                                             dtype=np.bool)
-
-    # do the xmatch first
-    ext_matches = []
-    ext_matching_objects = []
-
-    if (xmatchexternal and
-        isinstance(xmatchexternal, str) and
-        os.path.exists(xmatchexternal)):
-
-        try:
-
-            # read in the external file
-            extcat = np.genfromtxt(xmatchexternal,
-                                   usecols=externalcolnums,
-                                   delimiter=externalcolsep,
-                                   names=externalcolnames,
-                                   dtype=externalcoldtypes,
-                                   comments=externalcommentchar)
-
-            ext_cosdecl = np.cos(np.radians(extcat['decl']))
-            ext_sindecl = np.sin(np.radians(extcat['decl']))
-            ext_cosra = np.cos(np.radians(extcat['ra']))
-            ext_sinra = np.sin(np.radians(extcat['ra']))
-
-            ext_xyz = np.column_stack((ext_cosra*ext_cosdecl,
-                                       ext_sinra*ext_cosdecl,
-                                       ext_sindecl))
-            ext_xyzdist = 2.0 * np.sin(np.radians(xmatchdistarcsec/3600.0)/2.0)
+    lclist = read_lclist(lc_catalog)
 
-            # get our kdtree
-            our_kdt = lclist['kdtree']
-
-            # get the external kdtree
-            ext_kdt = sps.cKDTree(ext_xyz)
-
-            # do a query_ball_tree
-            extkd_matchinds = ext_kdt.query_ball_tree(our_kdt, ext_xyzdist)
-
-            for extind, mind in enumerate(extkd_matchinds):
-                if len(mind) > 0:
-                    ext_matches.append(mind[0])
-
-                    # get the whole matching row for the ext objects recarray
-                    ext_matching_objects.append(extcat[extind])
-
-            ext_matches = np.array(ext_matches)
-
-            if ext_matches.size > 0:
-
-                # update the xmatch_matching_index
-                xmatch_matching_index[ext_matches] = True
-
-                LOGINFO('xmatch: objects matched to %s within %.1f arcsec: %s' %
-                        (xmatchexternal, xmatchdistarcsec, ext_matches.size))
-
-            else:
-
-                LOGERROR("xmatch: no objects were cross-matched to external "
-                         "catalog spec: %s, can't continue" % xmatchexternal)
-                return None, None, None
-
-        except Exception:
-
-            LOGEXCEPTION('could not match to external catalog spec: %s' %
-                         repr(xmatchexternal))
-            raise
-
-    # do the cone search next
-    if (conesearch and
-        isinstance(conesearch, (list, tuple)) and
-        len(conesearch) == 3):
-
-        try:
-
-            racenter, declcenter, searchradius = conesearch
-            cosdecl = np.cos(np.radians(declcenter))
-            sindecl = np.sin(np.radians(declcenter))
-            cosra = np.cos(np.radians(racenter))
-            sinra = np.sin(np.radians(racenter))
-
-            # this is the search distance in xyz unit vectors
-            xyzdist = 2.0 * np.sin(np.radians(searchradius)/2.0)
-
-            # get the kdtree
-            our_kdt = lclist['kdtree']
-
-            # look up the coordinates
-            kdtindices = our_kdt.query_ball_point([cosra*cosdecl,
-                                                   sinra*cosdecl,
-                                                   sindecl],
-                                                  xyzdist,
-                                                  n_jobs=conesearchworkers)
-
-            if kdtindices and len(kdtindices) > 0:
-
-                LOGINFO('cone search: objects within %.4f deg '
-                        'of (%.3f, %.3f): %s' %
-                        (searchradius, racenter, declcenter, len(kdtindices)))
-
-                # update the conesearch_matching_index
-                matchingind = kdtindices
-                conesearch_matching_index[np.array(matchingind)] = True
-
-            # we fail immediately if we found nothing. this assumes the user
-            # cares more about the cone-search than the regular column filters
-            else:
-
-                LOGERROR("cone-search: no objects were found within "
-                         "%.4f deg of (%.3f, %.3f): %s, can't continue" %
-                         (searchradius, racenter, declcenter, len(kdtindices)))
-                return None, None
-
-        except Exception:
-
-            LOGEXCEPTION('cone-search: could not run a cone-search, '
-                         'is there a kdtree present in %s?' % lc_catalog)
-            raise
-
-    # now that we're done with cone-search, do the column filtering
-    allfilterinds = []
-    if columnfilters and isinstance(columnfilters, list):
-
-        # go through each filter
-        for cfilt in columnfilters:
-
-            try:
-
-                fcol, foperator, foperand = cfilt.split('|')
-                foperator = FILTEROPS[foperator]
-
-                # generate the evalstring
-                filterstr = (
-                    "np.isfinite(lclist['objects']['%s']) & "
-                    "(lclist['objects']['%s'] %s %s)"
-                ) % (fcol, fcol, foperator, foperand)
-                filterind = eval(filterstr)
+    # get the indices of the objects matching the xmatch and cone-search. the
+    # column filters are applied after these are checked below
+    try:
 
-                ngood = lclist['objects'][objectidcol][filterind].size
-                LOGINFO('filter: %s -> objects matching: %s ' % (cfilt, ngood))
+        matching_index, ext_matching_objects = filter_lclist_indices(
+            lclist,
+            xmatchexternal=xmatchexternal,
+            xmatchdistarcsec=xmatchdistarcsec,
+            externalcolnums=externalcolnums,
+            externalcolnames=externalcolnames,
+            externalcoldtypes=externalcoldtypes,
+            externalcolsep=externalcolsep,
+            externalcommentchar=externalcommentchar,
+            conesearch=conesearch,
+            conesearchworkers=conesearchworkers
+        )
 
-                allfilterinds.append(filterind)
+    except Exception:
 
-            except Exception:
+        LOGEXCEPTION('could not run the requested cross-match or '
+                     'cone-search, is there a kdtree present in %s?' %
+                     lc_catalog)
+        raise
 
-                LOGEXCEPTION('filter: could not understand filter spec: %s'
-                             % cfilt)
-                LOGWARNING('filter: not applying this broken filter')
+    # we fail immediately if the xmatch or cone-search found nothing. this
+    # assumes the user cares more about these than the regular column filters
+    if (xmatchexternal and
+        isinstance(xmatchexternal, str) and
+        len(ext_matching_objects) == 0):
 
-    # now that we have all the filter indices good to go
-    # logical-AND all the things
+        LOGERROR("xmatch: no objects were cross-matched to external "
+                 "catalog spec: %s, can't continue" % xmatchexternal)
+        return None, None, None
 
-    # make sure we only do filtering if we were told to do so
-    if (xmatchexternal or conesearch or columnfilters):
+    if conesearch and matching_index.size == 0:
 
-        filterstack = []
-        if xmatchexternal:
-            filterstack.append(xmatch_matching_index)
-        if conesearch:
-            filterstack.append(conesearch_matching_index)
-        if columnfilters:
-            filterstack.extend(allfilterinds)
+        LOGERROR("cone-search: no objects were found within "
+                 "%.4f deg of (%.3f, %.3f), can't continue" %
+                 (conesearch[2], conesearch[0], conesearch[1]))
 
-        finalfilterind = np.column_stack(filterstack)
-        finalfilterind = np.all(finalfilterind, axis=1)
+        if xmatchexternal and isinstance(xmatchexternal, str):
+            return None, None, None
+        else:
+            return None, None
 
-        # get the filtered object light curves and object names
-        filteredobjectids = lclist['objects'][objectidcol][finalfilterind]
-        filteredlcfnames = lclist['objects']['lcfname'][finalfilterind]
+    # finally, do the column filters on whatever's left. each filter only
+    # looks at the rows that survived the previous ones
+    if columnfilters:
 
-    else:
+        matching_index = apply_lclist_filters(
+            lclist,
+            compile_lclist_filters(columnfilters),
+            indices=matching_index if (xmatchexternal or conesearch) else None
+        )
 
-        filteredobjectids = lclist['objects'][objectidcol]
-        filteredlcfnames = lclist['objects']['lcfname']
+    # get the filtered object light curves and object names
+    filteredobjectids = np.asarray(
+        lclist['objects'][objectidcol][matching_index]
+    )
+    filteredlcfnames = np.asarray(
+        lclist['objects']['lcfname'][matching_index]
+    )
 
     # if we're told to make a finder chart with the selected objects
     if field_fitsfile is not None and os.path.exists(field_fitsfile):
 
         # get the RA and DEC of the matching objects
-        matching_ra = lclist['objects'][racol][finalfilterind]
-        matching_decl = lclist['objects'][declcol][finalfilterind]
+        matching_ra = lclist['objects'][racol][matching_index]
+        matching_decl = lclist['objects'][declcol][matching_index]
 
         matching_postfix = []
 
@@ -1382,6 +2049,121 @@ CPINFO_DEFAULTKEYS = [
 ]
 
 
+def update_cpinfo_keyindex(checkplots,
+                           keyindex,
+                           infokeys=CPINFO_DEFAULTKEYS,
+                           nworkers=NCPUS):
+    '''This gets checkplot info keys using a persistent checkplot key index.
+
+    The key index is a JSON file that caches the values of the requested
+    `infokeys` for each checkplot along with the checkplot's modification time
+    and size. Only checkplots that are new, have changed since they were last
+    indexed, or are missing some of the requested keys in the index are
+    actually opened. Everything else comes straight from the index, so
+    re-running `add_cpinfo_to_lclist` for a different magcol or after adding a
+    few more checkplots doesn't read every checkplot pickle again.
+
+    The cached values are stored after the None and nan substitutions in
+    `infokeys` are applied, so delete the key index if you change these.
+
+    Parameters
+    ----------
+
+    checkplots : list of str
+        The checkplot pickle files to get info for.
+
+    keyindex : str
+        The path to the key index JSON file. This will be created if it
+        doesn't exist and updated with any newly read checkplots.
+
+    infokeys : list of tuples
+        The keys to get from each checkplot. See `add_cpinfo_to_lclist`.
+
+    nworkers : int
+        The number of parallel workers to launch to read checkplots.
+
+    Returns
+    -------
+
+    list of lists
+        Returns the same thing as running `_cpinfo_key_worker` on each
+        checkplot: a list of `[objectid, key1 value, key2 value, ...]` for
+        each element of `checkplots`.
+
+    '''
+
+    if os.path.exists(keyindex):
+        with open(keyindex,'r') as infd:
+            keyindexdict = json.load(infd)
+    else:
+        keyindexdict = {'checkplots':{}}
+
+    indexed = keyindexdict['checkplots']
+    keynames = [x[0] for x in infokeys]
+
+    # figure out which checkplots we need to read
+    cpstats = {}
+    toread = []
+
+    for cpf in checkplots:
+
+        cpkey = os.path.abspath(cpf)
+        cpstat = os.stat(cpf)
+        cpstats[cpkey] = (cpstat.st_mtime, cpstat.st_size)
+
+        cpentry = indexed.get(cpkey, None)
+
+        if (cpentry is None or
+            cpentry['mtime'] != cpstat.st_mtime or
+            cpentry['size'] != cpstat.st_size or
+            any(k not in cpentry['values'] for k in keynames)):
+            toread.append(cpf)
+
+    LOGINFO('checkplot key index: %s checkplots indexed, %s to read' %
+            (len(checkplots) - len(toread), len(toread)))
+
+    # read only the new or changed checkplots
+    if len(toread) > 0:
+
+        tasklist = [(cpf, infokeys) for cpf in toread]
+
+        with ProcessPoolExecutor(max_workers=nworkers) as executor:
+            readresults = list(executor.map(_cpinfo_key_worker, tasklist))
+
+        for cpf, cpvals in zip(toread, readresults):
+
+            cpkey = os.path.abspath(cpf)
+            cpmtime, cpsize = cpstats[cpkey]
+
+            if cpkey in indexed:
+                cpvalues = indexed[cpkey]['values']
+            else:
+                cpvalues = {}
+
+            cpvalues['objectid'] = _jsonable(cpvals[0])
+            cpvalues.update(
+                {k:_jsonable(v) for k, v in zip(keynames, cpvals[1:])}
+            )
+
+            indexed[cpkey] = {'mtime':cpmtime,
+                              'size':cpsize,
+                              'values':cpvalues}
+
+        with open(keyindex,'w') as outfd:
+            json.dump(keyindexdict, outfd)
+
+    # return the results in the same form as _cpinfo_key_worker
+    results = []
+
+    for cpf in checkplots:
+
+        cpvalues = indexed[os.path.abspath(cpf)]['values']
+        results.append([cpvalues['objectid']] +
+                       [cpvalues[k] for k in keynames])
+
+    return results
+
+
 def add_cpinfo_to_lclist(
         checkplots,  # list or a directory path
         initial_lc_catalog,
@@ -1389,7 +2171,8 @@ def add_cpinfo_to_lclist(
         outfile,
         checkplotglob='checkplot*.pkl*',
         infokeys=CPINFO_DEFAULTKEYS,
-        nworkers=NCPUS
+        nworkers=NCPUS,
+        cpkeyindex=None
 ):
     '''This adds checkplot info to the initial light curve catalogs generated by
     `make_lclist`.
@@ -1415,8 +2198,8 @@ def add_cpinfo_to_lclist(
         will be interpreted as a list of checkplot pickle files to process.
 
     initial_lc_catalog : str
-        This is the path to the light curve catalog pickle made by
-        `make_lclist`.
+        This is the path to the light curve catalog pickle or mmap catalog
+        directory made by `make_lclist`.
 
     magcol : str
         This is used to indicate the light curve magnitude column to extract
@@ -1431,7 +2214,8 @@ def add_cpinfo_to_lclist(
 
     outfile : str
         This is the file name of the output 'augmented' light curve catalog
-        pickle file that will be written.
+        pickle file that will be written. If `initial_lc_catalog` is an mmap
+        catalog directory, this is the output catalog directory instead.
 
     infokeys : list of tuples
 
@@ -1456,12 +2240,19 @@ def add_cpinfo_to_lclist(
         The number of parallel workers to launch to extract checkplot
         information.
 
+    cpkeyindex : str or None
+        If this is the path to a JSON file, the checkplot info is read from
+        this checkplot key index instead of from every checkplot pickle, and
+        only new or changed checkplots are actually opened. The key index is
+        created if it doesn't exist. See `update_cpinfo_keyindex`.
+
     Returns
     -------
 
     str
         Returns the path to the generated 'augmented' light curve catalog pickle
-        file.
+        file or mmap catalog directory. If `initial_lc_catalog` is an mmap
+        catalog directory, only the new columns are written to `outfile`.
 
     '''
 
@@ -1469,20 +2260,29 @@ def add_cpinfo_to_lclist(
     if not isinstance(checkplots, list) and os.path.exists(checkplots):
         checkplots = sorted(glob.glob(os.path.join(checkplots, checkplotglob)))
 
-    tasklist = [(cpf, infokeys) for cpf in checkplots]
+    if cpkeyindex is not None:
 
-    with ProcessPoolExecutor(max_workers=nworkers) as executor:
-        resultfutures = executor.map(_cpinfo_key_worker, tasklist)
+        results = update_cpinfo_keyindex(checkplots,
+                                         cpkeyindex,
+                                         infokeys=infokeys,
+                                         nworkers=nworkers)
+
+    else:
 
-    results = list(resultfutures)
-    executor.shutdown()
+        tasklist = [(cpf, infokeys) for cpf in checkplots]
+
+        with ProcessPoolExecutor(max_workers=nworkers) as executor:
+            resultfutures = executor.map(_cpinfo_key_worker, tasklist)
+
+        results = list(resultfutures)
+        executor.shutdown()
 
     # now that we have all the checkplot info, we need to match to the
     # objectlist in the lclist
 
-    # open the lclist
-    with open(initial_lc_catalog,'rb') as infd:
-        lc_catalog = pickle.load(infd)
+    # open the lclist. mmap catalogs are memory-mapped so only the objectid
+    # column is actually read in
+    lc_catalog = read_lclist(initial_lc_catalog)
 
     # convert the lc_catalog['columns'] item to a list if it's not
     # this is so we can append columns to it later
@@ -1539,50 +2339,35 @@ def add_cpinfo_to_lclist(
         if eactual not in lc_catalog['columns']:
             lc_catalog['columns'].append(eactual)
 
-        # we'll overwrite earlier existing columns in any case
-        lc_catalog['objects'][eactual] = []
-
-    # now go through each objectid in the catalog and add the extra keys to
-    # their respective arrays
-    for catobj in tqdm(catalog_objectids):
-
-        cp_objind = np.where(checkplot_objectids == catobj)
-
-        if len(cp_objind[0]) > 0:
+    # join the checkplots to the catalog on objectid. the first checkplot for
+    # each objectid wins
+    cp_uniqueids, cp_firstind = np.unique(checkplot_objectids,
+                                          return_index=True)
 
-            # get the info line for this checkplot
-            thiscpinfo = results[cp_objind[0][0]]
-
-            # the first element is the objectid which we remove
-            thiscpinfo = thiscpinfo[1:]
-
-            # update the object catalog entries for this object
-            for ekind, ek in enumerate(actualkeys):
-
-                # add the actual thing to the output list
-                lc_catalog['objects'][ek].append(
-                    thiscpinfo[ekind]
-                )
+    if cp_uniqueids.size > 0:
+        cp_pos = np.searchsorted(cp_uniqueids, catalog_objectids)
+        cp_pos[cp_pos == cp_uniqueids.size] = 0
+        cat_matched = cp_uniqueids[cp_pos] == catalog_objectids
+        cp_matched = cp_firstind[cp_pos[cat_matched]]
+    else:
+        cat_matched = np.full(catalog_objectids.size, False)
+        cp_matched = np.array([], dtype=np.int64)
 
-        else:
+    LOGINFO('%s/%s catalog objects have checkplots' %
+            (cat_matched.sum(), catalog_objectids.size))
 
-            # update the object catalog entries for this object
-            for ekind, ek in enumerate(actualkeys):
+    # now add the extra keys for each object to their respective arrays.
+    # objects without checkplots get the None substitution value
+    for ekind, ek in enumerate(actualkeys):
 
-                thiskeyspec = infokeys[ekind]
-                nonesub = thiskeyspec[-2]
+        nonesub = infokeys[ekind][-2]
 
-                lc_catalog['objects'][ek].append(
-                    nonesub
-                )
+        colvals = np.empty(catalog_objectids.size, dtype=object)
+        colvals.fill(nonesub)
+        for catind, cpind in zip(np.flatnonzero(cat_matched), cp_matched):
+            colvals[catind] = results[cpind][ekind+1]
 
-    # now we should have all the new keys in the object catalog
-    # turn them into arrays
-    for ek in actualkeys:
-
-        lc_catalog['objects'][ek] = np.array(
-            lc_catalog['objects'][ek]
-        )
+        lc_catalog['objects'][ek] = np.array(colvals.tolist())
 
     # add the magcol to the lc_catalog
     if 'magcols' in lc_catalog:
@@ -1591,8 +2376,25 @@ def add_cpinfo_to_lclist(
     else:
         lc_catalog['magcols'] = [magcol]
 
-    # write back the new object catalog
-    with open(outfile, 'wb') as outfd:
-        pickle.dump(lc_catalog, outfd, protocol=pickle.HIGHEST_PROTOCOL)
+    # write back the new object catalog in the same format as the input. for
+    # mmap catalogs, we hardlink the unchanged files of the existing catalog if
+    # needed and then only write out the new columns
+    if os.path.isdir(initial_lc_catalog):
+
+        if (os.path.abspath(outfile) !=
+            os.path.abspath(initial_lc_catalog)):
+
+            # remove the output catalog from a previous run first
+            if os.path.isdir(outfile):
+                LOGWARNING('overwriting existing LC catalog: %s' % outfile)
+                shutil.rmtree(outfile)
+
+            _link_mmap_lclist(initial_lc_catalog, outfile, actualkeys)
+
+        write_mmap_lclist(lc_catalog, outfile, objectcols=actualkeys)
+
+    else:
+        with open(outfile, 'wb') as outfd:
+            pickle.dump(lc_catalog, outfd, protocol=pickle.HIGHEST_PROTOCOL)
 
     return outfile
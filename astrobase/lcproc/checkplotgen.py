@@ -75,6 +75,7 @@ NCPUS = mp.cpu_count()
 ## LOCAL IMPORTS ##
 ###################
 
+from astrobase.lcarchive import lcfile_exists
 from astrobase.lcmath import normalize_magseries, sigclip_magseries
 
 from astrobase.checkplot.pkl_io import _write_checkplot_picklefile
@@ -189,7 +190,7 @@ def update_checkplotdict_nbrlcs(
                              nbr['lcfpath'])
 
         # get the light curve
-        if not os.path.exists(lcfpath):
+        if not lcfile_exists(lcfpath):
             LOGERROR('objectid: %s, neighbor: %s, '
                      'lightcurve: %s not found, skipping...' %
                      (checkplotdict['objectid'], objectid, lcfpath))
@@ -645,7 +646,7 @@ def runcp(
     if errcols is None:
         errcols = derrcols
 
-    if ((lcfname is not None or pfpickle is None) and os.path.exists(lcfname)):
+    if ((lcfname is not None or pfpickle is None) and lcfile_exists(lcfname)):
 
         lcfpath = lcfname
         objectid = None
@@ -658,10 +659,10 @@ def runcp(
             lcfbasename = pfresults['lcfbasename']
             lcfsearchpath = os.path.join(lcbasedir, lcfbasename)
 
-            if os.path.exists(lcfsearchpath):
+            if lcfile_exists(lcfsearchpath):
                 lcfpath = lcfsearchpath
 
-            elif lcfname is not None and os.path.exists(lcfname):
+            elif lcfname is not None and lcfile_exists(lcfname):
                 lcfpath = lcfname
 
             else:
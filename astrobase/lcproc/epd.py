@@ -68,14 +68,56 @@ NCPUS = mp.cpu_count()
 ## LOCAL IMPORTS ##
 ###################
 
+from astrobase.lcarchive import expand_lcarchives
 from astrobase.lcproc import get_lcformat
-from astrobase.varbase.trends import epd_magseries, smooth_magseries_savgol
+from astrobase.varbase.trends import (
+    epd_magseries,
+    epd_magseries_linear,
+    epd_magseries_batch,
+    smooth_magseries_savgol
+)
 
 
 ##################################
 ## LIGHT CURVE DETRENDING - EPD ##
 ##################################
 
+EPD_EXTERNALPARAMS = ('fsv','fdv','fkv','xcc','ycc','bgv','bge','iha','izd')
+
+
+def _get_epd_externalparams(lcdict, externalparams):
+    '''This gets the EPD external parameter arrays from an lcdict.
+
+    Returns a list of arrays in the order of `EPD_EXTERNALPARAMS`.
+
+    '''
+
+    if externalparams is not None:
+        return [lcdict[externalparams[x]] for x in EPD_EXTERNALPARAMS]
+    else:
+        return [lcdict[x] for x in EPD_EXTERNALPARAMS]
+
+
+def _write_epd_lc(lcfile, lcdict, magcol, epd):
+    '''This writes an lcdict with EPD results to a pickle next to the LC.
+
+    '''
+
+    lcdict['epd'] = epd
+    outfile = os.path.join(
+        os.path.dirname(lcfile),
+        '%s-epd-%s-pklc.pkl' % (
+            squeeze(lcdict['objectid']).replace(' ','-'),
+            magcol
+        )
+    )
+    with open(outfile,'wb') as outfd:
+        pickle.dump(lcdict, outfd,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+
+    return outfile
+
+
 def apply_epd_magseries(lcfile,
                         timecol,
                         magcol,
@@ -86,7 +128,10 @@ def apply_epd_magseries(lcfile,
                         epdsmooth_sigclip=3.0,
                         epdsmooth_windowsize=21,
                         epdsmooth_func=smooth_magseries_savgol,
-                        epdsmooth_extraparams=None):
+                        epdsmooth_extraparams=None,
+                        epdfit_method='leastsq',
+                        epdfit_weighted=False,
+                        epdfit_sigclip=None):
 
     '''This applies external parameter decorrelation (EPD) to a light curve.
 
@@ -173,6 +218,22 @@ def apply_epd_magseries(lcfile,
         This is a dict of any extra filter params to supply to the smoothing
         function.
 
+    epdfit_method : {'leastsq', 'linear'}
+        If 'leastsq', the EPD function is fit using `scipy.optimize.leastsq`
+        with `varbase.trends.epd_magseries`. If 'linear', the EPD coefficients
+        are solved for directly with linear least-squares by
+        `varbase.trends.epd_magseries_linear`, which is much faster and gives
+        the same results.
+
+    epdfit_weighted : bool
+        If True and `epdfit_method` is 'linear', the EPD fit is weighted by
+        1/err^2.
+
+    epdfit_sigclip : float or None
+        If this is not None and `epdfit_method` is 'linear', points with EPD
+        fit residuals larger than this many times the residual MAD-stdev are
+        removed and the fit is redone.
+
     Returns
     -------
 
@@ -213,66 +274,180 @@ def apply_epd_magseries(lcfile,
         isinstance(lcdict[0], dict)):
         lcdict = lcdict[0]
 
-    objectid = lcdict['objectid']
     times, mags, errs = lcdict[timecol], lcdict[magcol], lcdict[errcol]
+    fsv, fdv, fkv, xcc, ycc, bgv, bge, iha, izd = _get_epd_externalparams(
+        lcdict,
+        externalparams
+    )
 
-    if externalparams is not None:
+    # apply the corrections for EPD
+    if epdfit_method == 'linear':
+
+        epd = epd_magseries_linear(
+            times,
+            mags,
+            errs,
+            fsv, fdv, fkv, xcc, ycc, bgv, bge, iha, izd,
+            magsarefluxes=magsarefluxes,
+            epdsmooth_sigclip=epdsmooth_sigclip,
+            epdsmooth_windowsize=epdsmooth_windowsize,
+            epdsmooth_func=epdsmooth_func,
+            epdsmooth_extraparams=epdsmooth_extraparams,
+            epdfit_weighted=epdfit_weighted,
+            epdfit_sigclip=epdfit_sigclip
+        )
 
-        fsv = lcdict[externalparams['fsv']]
-        fdv = lcdict[externalparams['fdv']]
-        fkv = lcdict[externalparams['fkv']]
+    else:
 
-        xcc = lcdict[externalparams['xcc']]
-        ycc = lcdict[externalparams['ycc']]
+        epd = epd_magseries(
+            times,
+            mags,
+            errs,
+            fsv, fdv, fkv, xcc, ycc, bgv, bge, iha, izd,
+            magsarefluxes=magsarefluxes,
+            epdsmooth_sigclip=epdsmooth_sigclip,
+            epdsmooth_windowsize=epdsmooth_windowsize,
+            epdsmooth_func=epdsmooth_func,
+            epdsmooth_extraparams=epdsmooth_extraparams
+        )
 
-        bgv = lcdict[externalparams['bgv']]
-        bge = lcdict[externalparams['bge']]
+    # save the EPD magseries to a pickle LC
+    return _write_epd_lc(lcfile, lcdict, magcol, epd)
+
+
+def apply_epd_magseries_batch(lcfile,
+                              timecol,
+                              magcols,
+                              errcols,
+                              externalparams,
+                              lcformat='hat-sql',
+                              lcformatdir=None,
+                              epdsmooth_sigclip=3.0,
+                              epdsmooth_windowsize=21,
+                              epdsmooth_func=smooth_magseries_savgol,
+                              epdsmooth_extraparams=None,
+                              epdfit_weighted=False,
+                              epdfit_sigclip=None):
+    '''This applies linear least-squares EPD to several magcols of an LC.
+
+    The light curve is read once, and all `magcols` are detrended together
+    with `varbase.trends.epd_magseries_batch`, which builds the EPD design
+    matrix from the external parameters only once. This is useful for light
+    curves with several apertures sharing the same times and external
+    parameters.
 
-        iha = lcdict[externalparams['iha']]
-        izd = lcdict[externalparams['izd']]
+    Parameters
+    ----------
 
-    else:
+    lcfile : str
+        The filename of the light curve file to process.
 
-        fsv = lcdict['fsv']
-        fdv = lcdict['fdv']
-        fkv = lcdict['fkv']
+    timecol : str
+        The key in the lcdict for the times shared by all `magcols`.
 
-        xcc = lcdict['xcc']
-        ycc = lcdict['ycc']
+    magcols,errcols : lists of str
+        The keys in the lcdict for the mags/fluxes and associated measurement
+        errors to run EPD on.
 
-        bgv = lcdict['bgv']
-        bge = lcdict['bge']
+    externalparams : dict or None
+        This is a dict that indicates which keys in the lcdict obtained from the
+        lcfile correspond to the required external parameters. See
+        `apply_epd_magseries` for details.
 
-        iha = lcdict['iha']
-        izd = lcdict['izd']
+    lcformat : str
+        This is the `formatkey` associated with your light curve format, which
+        you previously passed in to the `lcproc.register_lcformat`
+        function. This will be used to look up how to find and read the light
+        curve file.
 
-    # apply the corrections for EPD
-    epd = epd_magseries(
-        times,
-        mags,
-        errs,
+    lcformatdir : str or None
+        If this is provided, gives the path to a directory when you've stored
+        your lcformat description JSONs, other than the usual directories lcproc
+        knows to search for them in. Use this along with `lcformat` to specify
+        an LC format JSON file that's not currently registered with lcproc.
+
+    epdsmooth_sigclip : float or int or sequence of two floats/ints or None
+        This specifies how to sigma-clip the input LC before fitting the EPD
+        function to it. See `apply_epd_magseries` for details.
+
+    epdsmooth_windowsize : int
+        This is the number of LC points to smooth over to generate a smoothed
+        light curve that will be used to fit the EPD function.
+
+    epdsmooth_func : Python function
+        This sets the smoothing filter function to use. See
+        `apply_epd_magseries` for details.
+
+    epdsmooth_extraparams : dict
+        This is a dict of any extra filter params to supply to the smoothing
+        function.
+
+    epdfit_weighted : bool
+        If True, the EPD fit is weighted by 1/err^2.
+
+    epdfit_sigclip : float or None
+        If this is not None, points with EPD fit residuals larger than this
+        many times the residual MAD-stdev are removed and the fit is redone.
+
+    Returns
+    -------
+
+    list of str
+        The EPD light curve pickle written for each element of `magcols`, in
+        the same form as those written by `apply_epd_magseries`, or None for
+        any magcols where EPD failed.
+
+    '''
+    try:
+        formatinfo = get_lcformat(lcformat,
+                                  use_lcformat_dir=lcformatdir)
+        if formatinfo:
+            (dfileglob, readerfunc,
+             dtimecols, dmagcols, derrcols,
+             magsarefluxes, normfunc) = formatinfo
+        else:
+            LOGERROR("can't figure out the light curve format")
+            return None
+    except Exception:
+        LOGEXCEPTION("can't figure out the light curve format")
+        return None
+
+    lcdict = readerfunc(lcfile)
+    if ((isinstance(lcdict, (tuple, list))) and
+        isinstance(lcdict[0], dict)):
+        lcdict = lcdict[0]
+
+    fsv, fdv, fkv, xcc, ycc, bgv, bge, iha, izd = _get_epd_externalparams(
+        lcdict,
+        externalparams
+    )
+
+    epdlist = epd_magseries_batch(
+        lcdict[timecol],
+        [lcdict[x] for x in magcols],
+        [lcdict[x] for x in errcols],
         fsv, fdv, fkv, xcc, ycc, bgv, bge, iha, izd,
         magsarefluxes=magsarefluxes,
         epdsmooth_sigclip=epdsmooth_sigclip,
         epdsmooth_windowsize=epdsmooth_windowsize,
         epdsmooth_func=epdsmooth_func,
-        epdsmooth_extraparams=epdsmooth_extraparams
+        epdsmooth_extraparams=epdsmooth_extraparams,
+        epdfit_weighted=epdfit_weighted,
+        epdfit_sigclip=epdfit_sigclip
     )
 
-    # save the EPD magseries to a pickle LC
-    lcdict['epd'] = epd
-    outfile = os.path.join(
-        os.path.dirname(lcfile),
-        '%s-epd-%s-pklc.pkl' % (
-            squeeze(objectid).replace(' ','-'),
-            magcol
-        )
-    )
-    with open(outfile,'wb') as outfd:
-        pickle.dump(lcdict, outfd,
-                    protocol=pickle.HIGHEST_PROTOCOL)
+    # save the EPD magseries for each magcol to its own pickle LC
+    outfiles = []
 
-    return outfile
+    for magcol, epd in zip(magcols, epdlist):
+
+        if epd is None:
+            LOGERROR('EPD failed for %s, magcol: %s' % (lcfile, magcol))
+            outfiles.append(None)
+        else:
+            outfiles.append(_write_epd_lc(lcfile, lcdict, magcol, epd))
+
+    return outfiles
 
 
 def parallel_epd_worker(task):
@@ -293,6 +468,9 @@ def parallel_epd_worker(task):
         - task[8] = epdsmooth_windowsize
         - task[9] = epdsmooth_func
         - task[10] = epdsmooth_extraparams
+        - task[11] = epdfit_method
+        - task[12] = epdfit_weighted
+        - task[13] = epdfit_sigclip
 
     Returns
     -------
@@ -304,9 +482,10 @@ def parallel_epd_worker(task):
     '''
 
     (lcfile, timecol, magcol, errcol,
-     externalparams, lcformat, lcformatdir, magsarefluxes,
+     externalparams, lcformat, lcformatdir,
      epdsmooth_sigclip, epdsmooth_windowsize,
-     epdsmooth_func, epdsmooth_extraparams) = task
+     epdsmooth_func, epdsmooth_extraparams,
+     epdfit_method, epdfit_weighted, epdfit_sigclip) = task
 
     try:
 
@@ -320,7 +499,10 @@ def parallel_epd_worker(task):
                                   epdsmooth_sigclip=epdsmooth_sigclip,
                                   epdsmooth_windowsize=epdsmooth_windowsize,
                                   epdsmooth_func=epdsmooth_func,
-                                  epdsmooth_extraparams=epdsmooth_extraparams)
+                                  epdsmooth_extraparams=epdsmooth_extraparams,
+                                  epdfit_method=epdfit_method,
+                                  epdfit_weighted=epdfit_weighted,
+                                  epdfit_sigclip=epdfit_sigclip)
         if epd is not None:
             LOGINFO('%s -> %s EPD OK' % (lcfile, epd))
             return epd
@@ -334,6 +516,72 @@ def parallel_epd_worker(task):
         return None
 
 
+def parallel_epd_batch_worker(task):
+    '''This is a parallel worker for linear EPD on several magcols of an LC.
+
+    Parameters
+    ----------
+
+    task : tuple
+        - task[0] = lcfile
+        - task[1] = timecol
+        - task[2] = magcols
+        - task[3] = errcols
+        - task[4] = externalparams
+        - task[5] = lcformat
+        - task[6] = lcformatdir
+        - task[7] = epdsmooth_sigclip
+        - task[8] = epdsmooth_windowsize
+        - task[9] = epdsmooth_func
+        - task[10] = epdsmooth_extraparams
+        - task[11] = epdfit_weighted
+        - task[12] = epdfit_sigclip
+
+    Returns
+    -------
+
+    list
+        The output EPD LC pickle file for each magcol or None if EPD failed
+        for it.
+
+    '''
+
+    (lcfile, timecol, magcols, errcols,
+     externalparams, lcformat, lcformatdir,
+     epdsmooth_sigclip, epdsmooth_windowsize,
+     epdsmooth_func, epdsmooth_extraparams,
+     epdfit_weighted, epdfit_sigclip) = task
+
+    try:
+
+        epds = apply_epd_magseries_batch(
+            lcfile,
+            timecol,
+            magcols,
+            errcols,
+            externalparams,
+            lcformat=lcformat,
+            lcformatdir=lcformatdir,
+            epdsmooth_sigclip=epdsmooth_sigclip,
+            epdsmooth_windowsize=epdsmooth_windowsize,
+            epdsmooth_func=epdsmooth_func,
+            epdsmooth_extraparams=epdsmooth_extraparams,
+            epdfit_weighted=epdfit_weighted,
+            epdfit_sigclip=epdfit_sigclip
+        )
+        if epds is not None:
+            LOGINFO('%s -> %s EPD OK' % (lcfile, epds))
+            return epds
+        else:
+            LOGERROR('EPD failed for %s' % lcfile)
+            return [None]*len(magcols)
+
+    except Exception:
+
+        LOGEXCEPTION('EPD failed for %s' % lcfile)
+        return [None]*len(magcols)
+
+
 def parallel_epd_lclist(lclist,
                         externalparams,
                         timecols=None,
@@ -345,6 +593,9 @@ def parallel_epd_lclist(lclist,
                         epdsmooth_windowsize=21,
                         epdsmooth_func=smooth_magseries_savgol,
                         epdsmooth_extraparams=None,
+                        epdfit_method='leastsq',
+                        epdfit_weighted=False,
+                        epdfit_sigclip=None,
                         nworkers=NCPUS,
                         maxworkertasks=1000):
     '''This applies EPD in parallel to all LCs in the input list.
@@ -434,6 +685,23 @@ def parallel_epd_lclist(lclist,
         This is a dict of any extra filter params to supply to the smoothing
         function.
 
+    epdfit_method : {'leastsq', 'linear'}
+        If 'leastsq', the EPD function is fit using `scipy.optimize.leastsq`
+        with `varbase.trends.epd_magseries`. If 'linear', the EPD coefficients
+        are solved for directly with linear least-squares by
+        `varbase.trends.epd_magseries_linear`, which is much faster and gives
+        the same results. With 'linear', all magcols sharing a timecol in
+        each light curve are detrended together.
+
+    epdfit_weighted : bool
+        If True and `epdfit_method` is 'linear', the EPD fit is weighted by
+        1/err^2.
+
+    epdfit_sigclip : float or None
+        If this is not None and `epdfit_method` is 'linear', points with EPD
+        fit residuals larger than this many times the residual MAD-stdev are
+        removed and the fit is redone.
+
     nworkers : int
         The number of parallel workers to launch when processing the LCs.
 
@@ -485,12 +753,38 @@ def parallel_epd_lclist(lclist,
 
     outdict = {}
 
+    # for linear EPD, do all magcols sharing a timecol in each LC at once
+    if epdfit_method == 'linear':
+
+        for t in sorted(set(timecols), key=list(timecols).index):
+
+            tmagcols = [m for tc, m in zip(timecols, magcols) if tc == t]
+            terrcols = [e for tc, e in zip(timecols, errcols) if tc == t]
+
+            tasks = [(x, t, tmagcols, terrcols,
+                      externalparams, lcformat, lcformatdir,
+                      epdsmooth_sigclip, epdsmooth_windowsize,
+                      epdsmooth_func, epdsmooth_extraparams,
+                      epdfit_weighted, epdfit_sigclip) for
+                     x in lclist]
+
+            pool = mp.Pool(nworkers, maxtasksperchild=maxworkertasks)
+            results = pool.map(parallel_epd_batch_worker, tasks)
+            pool.close()
+            pool.join()
+
+            for mind, m in enumerate(tmagcols):
+                outdict[m] = [x[mind] for x in results]
+
+        return outdict
+
     # run by magcol
     for t, m, e in zip(timecols, magcols, errcols):
 
         tasks = [(x, t, m, e, externalparams, lcformat, lcformatdir,
                   epdsmooth_sigclip, epdsmooth_windowsize,
-                  epdsmooth_func, epdsmooth_extraparams) for
+                  epdsmooth_func, epdsmooth_extraparams,
+                  epdfit_method, epdfit_weighted, epdfit_sigclip) for
                  x in lclist]
 
         pool = mp.Pool(nworkers, maxtasksperchild=maxworkertasks)
@@ -516,6 +810,9 @@ def parallel_epd_lcdir(
         epdsmooth_windowsize=21,
         epdsmooth_func=smooth_magseries_savgol,
         epdsmooth_extraparams=None,
+        epdfit_method='leastsq',
+        epdfit_weighted=False,
+        epdfit_sigclip=None,
         nworkers=NCPUS,
         maxworkertasks=1000
 ):
@@ -608,6 +905,23 @@ def parallel_epd_lcdir(
         This is a dict of any extra filter params to supply to the smoothing
         function.
 
+    epdfit_method : {'leastsq', 'linear'}
+        If 'leastsq', the EPD function is fit using `scipy.optimize.leastsq`
+        with `varbase.trends.epd_magseries`. If 'linear', the EPD coefficients
+        are solved for directly with linear least-squares by
+        `varbase.trends.epd_magseries_linear`, which is much faster and gives
+        the same results. With 'linear', all magcols sharing a timecol in
+        each light curve are detrended together.
+
+    epdfit_weighted : bool
+        If True and `epdfit_method` is 'linear', the EPD fit is weighted by
+        1/err^2.
+
+    epdfit_sigclip : float or None
+        If this is not None and `epdfit_method` is 'linear', points with EPD
+        fit residuals larger than this many times the residual MAD-stdev are
+        removed and the fit is redone.
+
     nworkers : int
         The number of parallel workers to launch when processing the LCs.
 
@@ -652,7 +966,9 @@ def parallel_epd_lcdir(
     if lcfileglob is None:
         lcfileglob = fileglob
 
-    lclist = sorted(glob.glob(os.path.join(lcdir, lcfileglob)))
+    lclist = expand_lcarchives(
+        sorted(glob.glob(os.path.join(lcdir, lcfileglob)))
+    )
 
     return parallel_epd_lclist(
         lclist,
@@ -661,10 +977,14 @@ def parallel_epd_lcdir(
         magcols=magcols,
         errcols=errcols,
         lcformat=lcformat,
+        lcformatdir=lcformatdir,
         epdsmooth_sigclip=epdsmooth_sigclip,
         epdsmooth_windowsize=epdsmooth_windowsize,
         epdsmooth_func=epdsmooth_func,
         epdsmooth_extraparams=epdsmooth_extraparams,
+        epdfit_method=epdfit_method,
+        epdfit_weighted=epdfit_weighted,
+        epdfit_sigclip=epdfit_sigclip,
         nworkers=nworkers,
         maxworkertasks=maxworkertasks
     )
@@ -68,6 +68,7 @@ NCPUS = mp.cpu_count()
 ## LOCAL IMPORTS ##
 ###################
 
+from astrobase.lcarchive import expand_lcarchives
 from astrobase.lcproc import get_lcformat
 from astrobase.lcmath import (
     normalize_magseries,
@@ -453,7 +454,9 @@ def parallel_timebin_lcdir(lcdir,
         LOGEXCEPTION("can't figure out the light curve format")
         return None
 
-    lclist = sorted(glob.glob(os.path.join(lcdir, fileglob)))
+    lclist = expand_lcarchives(
+        sorted(glob.glob(os.path.join(lcdir, fileglob)))
+    )
 
     return parallel_timebin(lclist,
                             binsizesec,
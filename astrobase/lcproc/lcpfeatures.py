@@ -79,6 +79,7 @@ NCPUS = mp.cpu_count()
 ## LOCAL IMPORTS ##
 ###################
 
+from astrobase.lcarchive import lcfile_exists
 from astrobase.lcmath import normalize_magseries
 from astrobase.varclass import periodicfeatures
 
@@ -275,7 +276,7 @@ def get_periodicfeatures(
         errcols = derrcols
 
     # check if the light curve file exists
-    if not os.path.exists(lcfile):
+    if not lcfile_exists(lcfile):
         LOGERROR("can't find LC %s for object %s" % (lcfile, objectid))
         return None
 
@@ -79,7 +79,9 @@ NCPUS = mp.cpu_count()
 ###################
 
 from astrobase.varclass import starfeatures
+from astrobase.lcarchive import expand_lcarchives
 from astrobase.lcproc import get_lcformat
+from astrobase.lcproc.catalogs import read_lclist
 
 
 ###################
@@ -355,7 +357,9 @@ def serial_starfeatures(lclist,
 
         A catalog pickle of the form needed can be produced using
         :py:func:`astrobase.lcproc.catalogs.make_lclist` or
-        :py:func:`astrobase.lcproc.catalogs.filter_lclist`.
+        :py:func:`astrobase.lcproc.catalogs.filter_lclist`. This can also be
+        the path to an mmap catalog directory, in which case the `kdtree` is a
+        memory-mapped :py:class:`astrobase.coordutils.ZoneIndex`.
 
     neighbor_radius_arcsec : float
         This indicates the radius in arcsec to search for neighbors for this
@@ -458,9 +462,8 @@ def serial_starfeatures(lclist,
     if maxobjects:
         lclist = lclist[:maxobjects]
 
-    # read in the kdtree pickle
-    with open(lc_catalog_pickle, 'rb') as infd:
-        kdt_dict = pickle.load(infd)
+    # read in the kdtree pickle or mmap catalog
+    kdt_dict = read_lclist(lc_catalog_pickle)
 
     kdt = kdt_dict['kdtree']
     objlist = kdt_dict['objects']['objectid']
@@ -510,7 +513,9 @@ def parallel_starfeatures(lclist,
 
         A catalog pickle of the form needed can be produced using
         :py:func:`astrobase.lcproc.catalogs.make_lclist` or
-        :py:func:`astrobase.lcproc.catalogs.filter_lclist`.
+        :py:func:`astrobase.lcproc.catalogs.filter_lclist`. This can also be
+        the path to an mmap catalog directory, in which case the `kdtree` is a
+        memory-mapped :py:class:`astrobase.coordutils.ZoneIndex`.
 
     neighbor_radius_arcsec : float
         This indicates the radius in arcsec to search for neighbors for this
@@ -632,9 +637,8 @@ def parallel_starfeatures(lclist,
     if maxobjects:
         lclist = lclist[:maxobjects]
 
-    # read in the kdtree pickle
-    with open(lc_catalog_pickle, 'rb') as infd:
-        kdt_dict = pickle.load(infd)
+    # read in the kdtree pickle or mmap catalog
+    kdt_dict = read_lclist(lc_catalog_pickle)
 
     kdt = kdt_dict['kdtree']
     objlist = kdt_dict['objects']['objectid']
@@ -688,7 +692,9 @@ def parallel_starfeatures_lcdir(lcdir,
 
         A catalog pickle of the form needed can be produced using
         :py:func:`astrobase.lcproc.catalogs.make_lclist` or
-        :py:func:`astrobase.lcproc.catalogs.filter_lclist`.
+        :py:func:`astrobase.lcproc.catalogs.filter_lclist`. This can also be
+        the path to an mmap catalog directory, in which case the `kdtree` is a
+        memory-mapped :py:class:`astrobase.coordutils.ZoneIndex`.
 
     neighbor_radius_arcsec : float
         This indicates the radius in arcsec to search for neighbors for this
@@ -823,6 +829,9 @@ def parallel_starfeatures_lcdir(lcdir,
                                           fileglob),
                              recursive=True)
 
+    # light curve archives are expanded into their objects' LC references
+    matching = expand_lcarchives(matching)
+
     # now that we have all the files, process them
     if matching and len(matching) > 0:
 
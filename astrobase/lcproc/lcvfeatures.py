@@ -82,6 +82,7 @@ NCPUS = mp.cpu_count()
 from astrobase.lcmath import normalize_magseries
 from astrobase.varclass import varfeatures
 
+from astrobase.lcarchive import expand_lcarchives
 from astrobase.lcproc import get_lcformat
 
 
@@ -544,6 +545,9 @@ def parallel_varfeatures_lcdir(lcdir,
                                           fileglob),
                              recursive=True)
 
+    # light curve archives are expanded into their objects' LC references
+    matching = expand_lcarchives(matching)
+
     # now that we have all the files, process them
     if matching and len(matching) > 0:
 
@@ -64,6 +64,7 @@ import numpy as np
 ## LOCAL IMPORTS ##
 ###################
 
+from astrobase.lcarchive import lcfile_exists, expand_lcarchives
 from astrobase.lcmath import normalize_magseries
 from astrobase import periodbase
 from astrobase.periodbase.kbls import bls_snr
@@ -458,7 +459,7 @@ def _runpf_worker(task):
      pfmethods, pfkwargs, getblssnr, sigclip, nworkers, minobservations,
      excludeprocessed) = task
 
-    if os.path.exists(lcfile):
+    if lcfile_exists(lcfile):
         pfresult = runpf(lcfile,
                          outdir,
                          timecols=timecols,
@@ -798,6 +799,9 @@ def parallel_pf_lcdir(lcdir,
                                           '**',
                                           fileglob),recursive=True)
 
+    # light curve archives are expanded into their objects' LC references
+    matching = expand_lcarchives(matching)
+
     # now that we have all the files, process them
     if matching and len(matching) > 0:
 
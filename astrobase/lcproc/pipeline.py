@@ -0,0 +1,751 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# pipeline.py - Oct 2026
+# License: MIT - see LICENSE for the full text.
+
+'''
+This contains functions that run a chain of light curve processing stages
+(normalization, sigma-clipping, EPD, TFA, time-binning, and variability
+features) on large numbers of light curves, reading each light curve only once
+and writing a single output pickle for it.
+
+The separate `lcproc.epd`, `lcproc.tfa`, `lcproc.lcbin`, and
+`lcproc.lcvfeatures` functions each read every light curve and write their
+own pickle for it. Running them one after another for a large collection of
+light curves is mostly bound by I/O, which the functions here avoid.
+
+'''
+
+#############
+## LOGGING ##
+#############
+
+import logging
+from astrobase import log_sub, log_fmt, log_date_fmt
+
+DEBUG = False
+if DEBUG:
+    level = logging.DEBUG
+else:
+    level = logging.INFO
+LOGGER = logging.getLogger(__name__)
+logging.basicConfig(
+    level=level,
+    style=log_sub,
+    format=log_fmt,
+    datefmt=log_date_fmt,
+)
+
+LOGDEBUG = LOGGER.debug
+LOGINFO = LOGGER.info
+LOGWARNING = LOGGER.warning
+LOGERROR = LOGGER.error
+LOGEXCEPTION = LOGGER.exception
+
+
+#############
+## IMPORTS ##
+#############
+
+import pickle
+import os
+import os.path
+import glob
+import multiprocessing as mp
+
+from tornado.escape import squeeze
+
+import numpy as np
+
+# to turn a list of keys into a dict address
+# from https://stackoverflow.com/a/14692747
+from functools import reduce
+from operator import getitem
+
+
+def _dict_get(datadict, keylist):
+    return reduce(getitem, keylist, datadict)
+
+
+############
+## CONFIG ##
+############
+
+NCPUS = mp.cpu_count()
+
+# these are the available pipeline stages. they always run in this order.
+PIPELINE_STAGES = ('normalize', 'sigclip', 'epd', 'tfa', 'bin', 'features')
+
+
+###################
+## LOCAL IMPORTS ##
+###################
+
+from astrobase.lcarchive import expand_lcarchives
+from astrobase.lcproc import get_lcformat
+from astrobase.lcproc.epd import _get_epd_externalparams
+from astrobase.lcproc.tfa import tfa_magseries, read_tfa_templateinfo
+from astrobase.lcmath import (
+    normalize_magseries,
+    sigclip_magseries_with_extparams,
+    time_bin_magseries_with_errs,
+)
+from astrobase.varbase.trends import (
+    epd_magseries,
+    epd_magseries_linear,
+    smooth_magseries_savgol,
+)
+from astrobase.varclass import varfeatures
+
+
+###############################
+## SINGLE-READ LC PROCESSING ##
+###############################
+
+def _pipeline_stages(stages, templateinfo, binsizesec):
+    '''This checks the requested pipeline stages and puts them in order.
+
+    Returns None if a stage is unknown or is missing its required inputs.
+
+    '''
+
+    stages = list(stages)
+    for stage in stages:
+        if stage not in PIPELINE_STAGES:
+            LOGERROR('unknown pipeline stage: %s, must be one of %s' %
+                     (stage, repr(PIPELINE_STAGES)))
+            return None
+    stages = [x for x in PIPELINE_STAGES if x in stages]
+
+    if 'tfa' in stages and templateinfo is None:
+        LOGERROR('the tfa pipeline stage requires templateinfo')
+        return None
+    if 'bin' in stages and not binsizesec:
+        LOGERROR('the bin pipeline stage requires binsizesec')
+        return None
+
+    return stages
+
+
+def _pipeline_read_lcdict(lcfile, readerfunc, normfunc, stages,
+                          externalparams):
+    '''This reads the LC for the pipeline and gets its EPD external params.
+
+    The LC is normalized with the LC format's normalization function here if
+    there is one and the 'normalize' stage is requested.
+
+    Returns `(lcdict, extparams)`.
+
+    '''
+
+    lcdict = readerfunc(lcfile)
+
+    # this should handle lists/tuples being returned by readerfunc
+    # we assume that the first element is the actual lcdict
+    # FIXME: figure out how to not need this assumption
+    if ( (isinstance(lcdict, (list, tuple))) and
+         (isinstance(lcdict[0], dict)) ):
+        lcdict = lcdict[0]
+
+    # normalize using the special function if specified
+    if 'normalize' in stages and normfunc is not None:
+        lcdict = normfunc(lcdict)
+
+    if 'epd' in stages:
+        extparams = _get_epd_externalparams(lcdict, externalparams)
+    else:
+        extparams = []
+
+    return lcdict, extparams
+
+
+def _pipeline_epd(times, mags, errs, eparams,
+                  magsarefluxes,
+                  epdfit_method,
+                  epdsmooth_sigclip,
+                  epdsmooth_windowsize,
+                  epdsmooth_func,
+                  epdsmooth_extraparams):
+    '''This runs the 'epd' pipeline stage.
+
+    Returns the EPD-corrected `(times, mags, errs)` and the EPD info dict.
+
+    '''
+
+    if epdfit_method == 'linear':
+        epdfunc = epd_magseries_linear
+    else:
+        epdfunc = epd_magseries
+
+    epd = epdfunc(
+        times, mags, errs,
+        *eparams,
+        magsarefluxes=magsarefluxes,
+        epdsmooth_sigclip=epdsmooth_sigclip,
+        epdsmooth_windowsize=epdsmooth_windowsize,
+        epdsmooth_func=epdsmooth_func,
+        epdsmooth_extraparams=epdsmooth_extraparams
+    )
+    if epd is None:
+        raise ValueError('EPD failed')
+
+    return (epd['times'], epd['mags'], epd['errs'],
+            {'fitcoeffs':epd['fitcoeffs'],
+             'mags_median':epd['mags_median'],
+             'mags_mad':epd['mags_mad']})
+
+
+def _pipeline_tfa(times, mags, errs, lcdict, mcol,
+                  templateinfo,
+                  mintemplatedist_arcmin,
+                  tfa_interp,
+                  tfa_sigclip,
+                  magsarefluxes):
+    '''This runs the 'tfa' pipeline stage.
+
+    Returns the TFA-corrected `(times, mags, errs)` and the TFA info dict.
+
+    '''
+
+    tfa = tfa_magseries(
+        times, mags, errs,
+        templateinfo,
+        mcol,
+        lcdict['objectid'],
+        lcdict['objectinfo']['ra'],
+        lcdict['objectinfo']['decl'],
+        mintemplatedist_arcmin=mintemplatedist_arcmin,
+        interp=tfa_interp,
+        sigclip=tfa_sigclip,
+        magsarefluxes=magsarefluxes
+    )
+
+    return (tfa['times'], tfa['mags'], tfa['errs'],
+            {'corrections':tfa['corrections'],
+             'templates_used':tfa['templates_used'],
+             'mags_median':tfa['mags_median'],
+             'mags_mad':tfa['mags_mad']})
+
+
+def _pipeline_features(times, mags, errs, mcol, lcfile,
+                       mindet,
+                       magsarefluxes):
+    '''This runs the 'features' pipeline stage.
+
+    Returns the variability features dict or None if there are fewer than
+    `mindet` finite LC points.
+
+    '''
+
+    finind = (np.isfinite(times) &
+              np.isfinite(mags) &
+              np.isfinite(errs))
+
+    if mags[finind].size < mindet:
+        LOGINFO('not enough LC points: %s in %s LC: %s' %
+                (mags[finind].size, mcol,
+                 os.path.basename(lcfile)))
+        return None
+
+    return varfeatures.all_nonperiodic_features(
+        times, mags, errs,
+        magsarefluxes=magsarefluxes
+    )
+
+
+def _pipeline_bestmagcol(pipeline, magcols):
+    '''This returns the magcol with the smallest MAD at the end.
+
+    '''
+
+    magmads = np.full(len(magcols), np.inf)
+    for mind, mcol in enumerate(magcols):
+        if pipeline[mcol] is not None and pipeline[mcol]['mags'].size > 0:
+            finalmags = pipeline[mcol]['mags']
+            magmads[mind] = np.nanmedian(
+                np.abs(finalmags - np.nanmedian(finalmags))
+            )
+
+    if np.isfinite(magmads).any():
+        return magcols[np.argmin(magmads)]
+    else:
+        return None
+
+
+def run_lc_pipeline(
+        lcfile,
+        stages=('normalize', 'sigclip', 'features'),
+        outdir=None,
+        lcformat='hat-sql',
+        lcformatdir=None,
+        timecols=None,
+        magcols=None,
+        errcols=None,
+        sigclip=5.0,
+        externalparams=None,
+        epdfit_method='linear',
+        epdsmooth_sigclip=3.0,
+        epdsmooth_windowsize=21,
+        epdsmooth_func=smooth_magseries_savgol,
+        epdsmooth_extraparams=None,
+        templateinfo=None,
+        mintemplatedist_arcmin=10.0,
+        tfa_interp='nearest',
+        tfa_sigclip=5.0,
+        binsizesec=None,
+        minbinelems=7,
+        mindet=1000,
+):
+    '''This runs a chain of processing stages on all magcols of a single LC.
+
+    The light curve is read once, and each of the requested `stages` is
+    applied in turn to the mag series for each magcol in memory. The stages
+    are always run in the order given by `PIPELINE_STAGES`:
+
+    - 'normalize': normalizes the mag series using
+      `lcmath.normalize_magseries`, or the LC format's normalization function
+      if it has one.
+
+    - 'sigclip': sigma-clips the mag series and removes non-finite values.
+
+    - 'epd': applies External Parameter Decorrelation using
+      `varbase.trends.epd_magseries_linear` or `varbase.trends.epd_magseries`.
+
+    - 'tfa': applies the Trend Filtering Algorithm using
+      `lcproc.tfa.tfa_magseries`. This puts the mag series on the TFA template
+      timebase.
+
+    - 'bin': time-bins the mag series using
+      `lcmath.time_bin_magseries_with_errs`.
+
+    - 'features': gets the non-periodic variability features using
+      `varclass.varfeatures.all_nonperiodic_features`.
+
+    Parameters
+    ----------
+
+    lcfile : str
+        The light curve file to process.
+
+    stages : sequence of str
+        The stages to run. These must be in `PIPELINE_STAGES`.
+
+    outdir : str or None
+        The directory to write the output pickle to. If None, this is the
+        directory that `lcfile` is in.
+
+    lcformat : str
+        This is the `formatkey` associated with your light curve format, which
+        you previously passed in to the `lcproc.register_lcformat`
+        function. This will be used to look up how to find and read the light
+        curve file.
+
+    lcformatdir : str or None
+        If this is provided, gives the path to a directory when you've stored
+        your lcformat description JSONs, other than the usual directories lcproc
+        knows to search for them in. Use this along with `lcformat` to specify
+        an LC format JSON file that's not currently registered with lcproc.
+
+    timecols,magcols,errcols : lists of str
+        The keys in the lcdict produced by your light curve reader function that
+        correspond to the times, mags/fluxes, and associated measurement errors
+        that will be processed. If these are None, the default values for
+        `timecols`, `magcols`, and `errcols` for your light curve format will be
+        used here.
+
+    sigclip : float or sequence of two floats or None
+        The sigma-clip to use for the 'sigclip' stage.
+
+    externalparams : dict or None
+        The lcdict keys for the EPD external parameters. See
+        `lcproc.epd.apply_epd_magseries` for details.
+
+    epdfit_method : {'linear', 'leastsq'}
+        The EPD fitting method, see `lcproc.epd.apply_epd_magseries`.
+
+    epdsmooth_sigclip : float or int or sequence of two floats/ints or None
+        This specifies how to sigma-clip the input LC before fitting the EPD
+        function to it.
+
+    epdsmooth_windowsize : int
+        This is the number of LC points to smooth over to generate a smoothed
+        light curve that will be used to fit the EPD function.
+
+    epdsmooth_func : Python function
+        This sets the smoothing filter function to use for EPD.
+
+    epdsmooth_extraparams : dict
+        This is a dict of any extra filter params to supply to the smoothing
+        function.
+
+    templateinfo : dict or str or None
+        The dict or pickle produced by `lcproc.tfa.tfa_templates_lclist`. This
+        is required for the 'tfa' stage.
+
+    mintemplatedist_arcmin : float
+        Objects in the TFA template ensemble closer than this distance to the
+        target will be removed from the ensemble.
+
+    tfa_interp : str
+        The kind of interpolation to use when reforming the mag series to the
+        TFA template timebase.
+
+    tfa_sigclip : float or sequence of two floats or None
+        The sigma-clip to apply to the mag series before TFA.
+
+    binsizesec : float or None
+        The time bin-size in seconds. This is required for the 'bin' stage.
+
+    minbinelems : int
+        The minimum number of time-bin elements required to accept a time-bin as
+        valid for the output binned light curve.
+
+    mindet : int
+        The minimum number of finite LC points required to generate variability
+        features.
+
+    Returns
+    -------
+
+    str
+        The output pickle file. This contains the lcdict with an added
+        `lcdict['pipeline']` key, of the form::
+
+            {'stages': the list of stages that were run,
+             'magcols': the magcols that were processed,
+             'bestmagcol': the magcol with the smallest final MAD,
+             <magcol>: {'times': the final times,
+                        'mags': the final mags,
+                        'errs': the final errs,
+                        'epd': {'fitcoeffs','mags_median','mags_mad'},
+                        'tfa': {'corrections','templates_used',
+                                'mags_median','mags_mad'},
+                        'binned': {'nbins','timebins','binsizesec'},
+                        'features': the variability features dict},
+             ...}
+
+        The keys for each stage are only present if that stage was run. If
+        processing fails for a magcol, its value is None.
+
+    '''
+
+    stages = _pipeline_stages(stages, templateinfo, binsizesec)
+    if stages is None:
+        return None
+
+    try:
+        formatinfo = get_lcformat(lcformat,
+                                  use_lcformat_dir=lcformatdir)
+        if formatinfo:
+            (dfileglob, readerfunc,
+             dtimecols, dmagcols, derrcols,
+             magsarefluxes, normfunc) = formatinfo
+        else:
+            LOGERROR("can't figure out the light curve format")
+            return None
+    except Exception:
+        LOGEXCEPTION("can't figure out the light curve format")
+        return None
+
+    # override the default timecols, magcols, and errcols
+    # using the ones provided to the function
+    if timecols is None:
+        timecols = dtimecols
+    if magcols is None:
+        magcols = dmagcols
+    if errcols is None:
+        errcols = derrcols
+
+    if 'tfa' in stages:
+        templateinfo = read_tfa_templateinfo(templateinfo)
+
+    # get the LC into a dict. this is the only time it's read
+    lcdict, extparams = _pipeline_read_lcdict(lcfile,
+                                              readerfunc,
+                                              normfunc,
+                                              stages,
+                                              externalparams)
+
+    pipeline = {'stages':stages,
+                'magcols':list(magcols)}
+
+    for tcol, mcol, ecol in zip(timecols, magcols, errcols):
+
+        try:
+
+            times = _dict_get(lcdict, tcol.split('.'))
+            mags = _dict_get(lcdict, mcol.split('.'))
+            errs = _dict_get(lcdict, ecol.split('.'))
+            eparams = list(extparams)
+
+            magcolresult = {}
+
+            if 'normalize' in stages and normfunc is None:
+                times, mags = normalize_magseries(
+                    times, mags,
+                    magsarefluxes=magsarefluxes
+                )
+
+            # the external parameters are clipped along with the mag series
+            # so they stay lined up for EPD
+            if 'sigclip' in stages:
+                times, mags, errs, eparams = sigclip_magseries_with_extparams(
+                    times, mags, errs,
+                    eparams,
+                    sigclip=sigclip,
+                    magsarefluxes=magsarefluxes
+                )
+
+            if 'epd' in stages:
+                times, mags, errs, magcolresult['epd'] = _pipeline_epd(
+                    times, mags, errs, eparams,
+                    magsarefluxes,
+                    epdfit_method,
+                    epdsmooth_sigclip,
+                    epdsmooth_windowsize,
+                    epdsmooth_func,
+                    epdsmooth_extraparams
+                )
+
+            if 'tfa' in stages:
+                times, mags, errs, magcolresult['tfa'] = _pipeline_tfa(
+                    times, mags, errs, lcdict, mcol,
+                    templateinfo,
+                    mintemplatedist_arcmin,
+                    tfa_interp,
+                    tfa_sigclip,
+                    magsarefluxes
+                )
+
+            if 'bin' in stages:
+
+                binned = time_bin_magseries_with_errs(times,
+                                                      mags,
+                                                      errs,
+                                                      binsize=binsizesec,
+                                                      minbinelems=minbinelems)
+
+                times, mags, errs = (binned['binnedtimes'],
+                                     binned['binnedmags'],
+                                     binned['binnederrs'])
+                magcolresult['binned'] = {'nbins':binned['nbins'],
+                                          'timebins':binned['jdbins'],
+                                          'binsizesec':binsizesec}
+
+            if 'features' in stages:
+                magcolresult['features'] = _pipeline_features(
+                    times, mags, errs, mcol, lcfile,
+                    mindet,
+                    magsarefluxes
+                )
+
+            magcolresult.update({'times':times,
+                                 'mags':mags,
+                                 'errs':errs})
+            pipeline[mcol] = magcolresult
+
+        except Exception:
+
+            LOGEXCEPTION('pipeline failed for %s, magcol: %s' %
+                         (os.path.basename(lcfile), mcol))
+            pipeline[mcol] = None
+
+    # the best magcol is the one with the smallest MAD at the end
+    pipeline['bestmagcol'] = _pipeline_bestmagcol(pipeline, magcols)
+
+    lcdict['pipeline'] = pipeline
+
+    if outdir is None:
+        outdir = os.path.dirname(lcfile)
+
+    outfile = os.path.join(
+        outdir,
+        '%s-pipeline-pklc.pkl' % squeeze(lcdict['objectid']).replace(' ','-')
+    )
+
+    with open(outfile, 'wb') as outfd:
+        pickle.dump(lcdict, outfd, protocol=pickle.HIGHEST_PROTOCOL)
+
+    return outfile
+
+
+def _lc_pipeline_worker(task):
+    '''
+    This is a parallel worker for the function below.
+
+    task[0] = lcfile
+    task[1] = dict of kwargs for run_lc_pipeline
+
+    '''
+
+    lcfile, kwargs = task
+
+    try:
+        outfile = run_lc_pipeline(lcfile, **kwargs)
+        if outfile:
+            LOGINFO('%s -> %s pipeline OK' % (lcfile, outfile))
+        return outfile
+    except Exception:
+        LOGEXCEPTION('pipeline failed for %s' % lcfile)
+        return None
+
+
+def parallel_lc_pipeline(lclist,
+                         stages=('normalize', 'sigclip', 'features'),
+                         outdir=None,
+                         maxobjects=None,
+                         nworkers=NCPUS,
+                         maxworkertasks=1000,
+                         **pipelinekwargs):
+    '''This runs `run_lc_pipeline` in parallel on a list of LCs.
+
+    Parameters
+    ----------
+
+    lclist : list of str
+        The light curve files to process.
+
+    stages : sequence of str
+        The stages to run. These must be in `PIPELINE_STAGES`.
+
+    outdir : str or None
+        The directory to write the output pickles to. If None, each is written
+        to the directory its input LC is in.
+
+    maxobjects : int or None
+        If provided, LC processing will stop at `lclist[maxobjects]`.
+
+    nworkers : int
+        The number of parallel workers to launch.
+
+    maxworkertasks : int
+        The maximum number of tasks a parallel worker will complete before being
+        replaced to guard against memory leaks.
+
+    pipelinekwargs : additional keyword arguments
+        These are passed to `run_lc_pipeline`. If `templateinfo` is a pickle
+        path, each worker memory-maps its template matrices rather than getting
+        its own copy.
+
+    Returns
+    -------
+
+    dict
+        The returned dict contains keys = input LC basenames, vals = output
+        pipeline pickles.
+
+    '''
+
+    if outdir and not os.path.exists(outdir):
+        os.makedirs(outdir)
+
+    if maxobjects is not None:
+        lclist = lclist[:maxobjects]
+
+    kwargs = dict(pipelinekwargs)
+    kwargs.update({'stages':stages, 'outdir':outdir})
+
+    tasks = [(x, kwargs) for x in lclist]
+
+    pool = mp.Pool(nworkers, maxtasksperchild=maxworkertasks)
+    results = pool.map(_lc_pipeline_worker, tasks)
+    pool.close()
+    pool.join()
+
+    return {os.path.basename(x):y for (x,y) in zip(lclist, results)}
+
+
+def parallel_lc_pipeline_lcdir(lcdir,
+                               stages=('normalize', 'sigclip', 'features'),
+                               lcfileglob=None,
+                               outdir=None,
+                               maxobjects=None,
+                               lcformat='hat-sql',
+                               lcformatdir=None,
+                               nworkers=NCPUS,
+                               maxworkertasks=1000,
+                               **pipelinekwargs):
+    '''This runs `run_lc_pipeline` in parallel on all LCs in a directory.
+
+    Parameters
+    ----------
+
+    lcdir : str
+        The directory containing the light curves to process.
+
+    stages : sequence of str
+        The stages to run. These must be in `PIPELINE_STAGES`.
+
+    lcfileglob : str or None
+        The UNIX file glob to use when searching for light curve files in
+        `lcdir`. If None, the default file glob associated with registered LC
+        format provided is used.
+
+    outdir : str or None
+        The directory to write the output pickles to. If None, each is written
+        to the directory its input LC is in.
+
+    maxobjects : int or None
+        If provided, LC processing will stop at `lclist[maxobjects]`.
+
+    lcformat : str
+        This is the `formatkey` associated with your light curve format, which
+        you previously passed in to the `lcproc.register_lcformat`
+        function. This will be used to look up how to find and read the light
+        curve files.
+
+    lcformatdir : str or None
+        If this is provided, gives the path to a directory when you've stored
+        your lcformat description JSONs, other than the usual directories lcproc
+        knows to search for them in. Use this along with `lcformat` to specify
+        an LC format JSON file that's not currently registered with lcproc.
+
+    nworkers : int
+        The number of parallel workers to launch.
+
+    maxworkertasks : int
+        The maximum number of tasks a parallel worker will complete before being
+        replaced to guard against memory leaks.
+
+    pipelinekwargs : additional keyword arguments
+        These are passed to `run_lc_pipeline`.
+
+    Returns
+    -------
+
+    dict
+        The returned dict contains keys = input LC basenames, vals = output
+        pipeline pickles.
+
+    '''
+
+    try:
+        formatinfo = get_lcformat(lcformat,
+                                  use_lcformat_dir=lcformatdir)
+        if formatinfo:
+            (fileglob, readerfunc,
+             dtimecols, dmagcols, derrcols,
+             magsarefluxes, normfunc) = formatinfo
+        else:
+            LOGERROR("can't figure out the light curve format")
+            return None
+    except Exception:
+        LOGEXCEPTION("can't figure out the light curve format")
+        return None
+
+    if lcfileglob is None:
+        lcfileglob = fileglob
+
+    lclist = expand_lcarchives(
+        sorted(glob.glob(os.path.join(lcdir, lcfileglob)))
+    )
+
+    return parallel_lc_pipeline(lclist,
+                                stages=stages,
+                                outdir=outdir,
+                                maxobjects=maxobjects,
+                                lcformat=lcformat,
+                                lcformatdir=lcformatdir,
+                                nworkers=nworkers,
+                                maxworkertasks=maxworkertasks,
+                                **pipelinekwargs)
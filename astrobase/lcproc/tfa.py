@@ -45,6 +45,7 @@ import os.path
 import glob
 import multiprocessing as mp
 import gzip
+import hashlib
 
 from tornado.escape import squeeze
 
@@ -53,7 +54,6 @@ import numpy.random as npr
 npr.seed(0xc0ffee)
 
 import scipy.interpolate as spi
-from scipy import linalg as spla
 
 import matplotlib
 matplotlib.use('Agg')
@@ -75,6 +75,20 @@ def _dict_get(datadict, keylist):
 
 NCPUS = mp.cpu_count()
 
+# these are the large arrays in each magcol's templateinfo dict that
+# tfa_templates_lclist writes to .npy files next to the templateinfo pickle so
+# they can be memory-mapped by TFA workers
+TFA_TEMPLATE_MATRIX_KEYS = (
+    'template_magseries',
+    'template_errseries',
+    'template_normal_matrix',
+    'template_normal_matrix_inverse',
+)
+
+# this holds templateinfo dicts read by read_tfa_templateinfo so each process
+# only does this once per templateinfo pickle
+_TFA_TEMPLATEINFO_CACHE = {}
+
 
 ###################
 ## LOCAL IMPORTS ##
@@ -87,7 +101,9 @@ from astrobase.lcmath import (
     sigclip_magseries
 )
 
+from astrobase.lcarchive import expand_lcarchives
 from astrobase.lcproc import get_lcformat
+from astrobase.lcproc.catalogs import read_lclist
 
 
 ##################################
@@ -252,6 +268,153 @@ def _collect_tfa_stats(task):
         return None
 
 
+def _reform_magseries_for_tfa(times,
+                              mags,
+                              errs,
+                              timebase,
+                              interpolate_type,
+                              sigclip,
+                              normalize=True,
+                              magsarefluxes=False):
+    '''This reforms a single mag series to the TFA template timebase.
+
+    This does: 0. normalize (if `normalize` is True), 1. sigclip, 2. reform to
+    `timebase`, 3. renorm to zero. It's the part of
+    `_reform_templatelc_for_tfa` that doesn't need to read the light curve, so
+    it can be used on lcdicts that are already in memory.
+
+    Returns a dict with the renormed 'mags', the interpolated 'errs', and the
+    interpolated (but not renormed) 'origmags'.
+
+    '''
+
+    # normalize here if not using special normalization
+    if normalize:
+        times, mags = normalize_magseries(
+            times, mags,
+            magsarefluxes=magsarefluxes
+        )
+
+    # 1. sigclip as requested
+    stimes, smags, serrs = sigclip_magseries(times,
+                                             mags,
+                                             errs,
+                                             sigclip=sigclip)
+
+    # 2. now, we'll renorm to the timebase
+    mags_interpolator = spi.interp1d(stimes, smags,
+                                     kind=interpolate_type,
+                                     fill_value='extrapolate')
+    errs_interpolator = spi.interp1d(stimes, serrs,
+                                     kind=interpolate_type,
+                                     fill_value='extrapolate')
+
+    interpolated_mags = mags_interpolator(timebase)
+    interpolated_errs = errs_interpolator(timebase)
+
+    # 3. renorm to zero
+    magmedian = np.median(interpolated_mags)
+
+    renormed_mags = interpolated_mags - magmedian
+
+    return {'mags':renormed_mags,
+            'errs':interpolated_errs,
+            'origmags':interpolated_mags}
+
+
+def _tfa_reform_cache_file(reformcache,
+                           lcfile,
+                           magcol,
+                           timebase,
+                           interpolate_type,
+                           sigclip,
+                           normalize,
+                           magsarefluxes):
+    '''This returns the path to the cached reformed mag series for an LC.
+
+    The cache key includes the path, size, and mtime of `lcfile`, the magcol,
+    the reform settings, and a hash of the timebase, so a changed LC or
+    different reform settings won't pick up a stale entry, but re-running TFA
+    with a different template set on the same timebase will.
+
+    '''
+
+    lcstat = os.stat(lcfile)
+
+    cachekey = hashlib.sha256()
+    cachekey.update(
+        repr((os.path.abspath(lcfile),
+              lcstat.st_size,
+              lcstat.st_mtime,
+              magcol,
+              interpolate_type,
+              sigclip,
+              normalize,
+              magsarefluxes)).encode()
+    )
+    cachekey.update(
+        np.ascontiguousarray(timebase, dtype=np.float64).tobytes()
+    )
+
+    return os.path.join(
+        reformcache,
+        '%s-%s-%s-tfareform.npz' % (os.path.basename(lcfile),
+                                    magcol,
+                                    cachekey.hexdigest()[:16])
+    )
+
+
+def _tfa_read_reform_cache(cachefile):
+    '''This reads a cached reformed mag series if it exists.
+
+    Returns None if there's nothing cached or it can't be read.
+
+    '''
+
+    if cachefile is None or not os.path.exists(cachefile):
+        return None
+
+    try:
+        with np.load(cachefile) as npzf:
+            return {'mags':npzf['mags'],
+                    'errs':npzf['errs'],
+                    'origmags':npzf['origmags']}
+    except Exception:
+        LOGEXCEPTION('could not read cached reformed LC: %s' % cachefile)
+        return None
+
+
+def _tfa_write_reform_cache(cachefile, reformed):
+    '''This writes a reformed mag series to the cache.
+
+    The file is written to a temporary name first and moved into place so
+    workers running at the same time never see a partial file.
+
+    '''
+
+    if cachefile is None:
+        return None
+
+    try:
+
+        if not os.path.exists(os.path.dirname(cachefile)):
+            os.makedirs(os.path.dirname(cachefile), exist_ok=True)
+
+        tempfile = '%s.tmp-%s' % (cachefile, os.getpid())
+        with open(tempfile, 'wb') as outfd:
+            np.savez(outfd,
+                     mags=reformed['mags'],
+                     errs=reformed['errs'],
+                     origmags=reformed['origmags'])
+        os.replace(tempfile, cachefile)
+
+        return cachefile
+
+    except Exception:
+        LOGEXCEPTION('could not write cached reformed LC: %s' % cachefile)
+        return None
+
+
 def _reform_templatelc_for_tfa(task):
     '''
     This is a parallel worker that reforms light curves for TFA.
@@ -265,6 +428,7 @@ def _reform_templatelc_for_tfa(task):
     task[6] = timebase
     task[7] = interpolate_type
     task[8] = sigclip
+    task[9] = reformcache (optional)
 
     '''
 
@@ -272,7 +436,8 @@ def _reform_templatelc_for_tfa(task):
 
         (lcfile, lcformat, lcformatdir,
          tcol, mcol, ecol,
-         timebase, interpolate_type, sigclip) = task
+         timebase, interpolate_type, sigclip) = task[:9]
+        reformcache = task[9] if len(task) > 9 else None
 
         try:
             formatinfo = get_lcformat(lcformat,
@@ -288,6 +453,20 @@ def _reform_templatelc_for_tfa(task):
             LOGEXCEPTION("can't figure out the light curve format")
             return None
 
+        # if this LC was reformed to this timebase before, we don't need to
+        # read it in again
+        if reformcache:
+            cachefile = _tfa_reform_cache_file(
+                reformcache, lcfile, mcol,
+                timebase, interpolate_type, sigclip,
+                normfunc is None, magsarefluxes
+            )
+            outdict = _tfa_read_reform_cache(cachefile)
+            if outdict is not None:
+                return outdict
+        else:
+            cachefile = None
+
         # get the LC into a dict
         lcdict = readerfunc(lcfile)
 
@@ -298,8 +477,6 @@ def _reform_templatelc_for_tfa(task):
              (isinstance(lcdict[0], dict)) ):
             lcdict = lcdict[0]
 
-        outdict = {}
-
         # dereference the columns and get them from the lcdict
         if '.' in tcol:
             tcolget = tcol.split('.')
@@ -319,45 +496,15 @@ def _reform_templatelc_for_tfa(task):
             ecolget = [ecol]
         errs = _dict_get(lcdict, ecolget)
 
-        # normalize here if not using special normalization
-        if normfunc is None:
-            ntimes, nmags = normalize_magseries(
-                times, mags,
-                magsarefluxes=magsarefluxes
-            )
-
-        times, mags, errs = ntimes, nmags, errs
-
-        #
-        # now we'll do: 1. sigclip, 2. reform to timebase, 3. renorm to zero
-        #
-
-        # 1. sigclip as requested
-        stimes, smags, serrs = sigclip_magseries(times,
-                                                 mags,
-                                                 errs,
-                                                 sigclip=sigclip)
-
-        # 2. now, we'll renorm to the timebase
-        mags_interpolator = spi.interp1d(stimes, smags,
-                                         kind=interpolate_type,
-                                         fill_value='extrapolate')
-        errs_interpolator = spi.interp1d(stimes, serrs,
-                                         kind=interpolate_type,
-                                         fill_value='extrapolate')
-
-        interpolated_mags = mags_interpolator(timebase)
-        interpolated_errs = errs_interpolator(timebase)
-
-        # 3. renorm to zero
-        magmedian = np.median(interpolated_mags)
-
-        renormed_mags = interpolated_mags - magmedian
-
-        # update the dict
-        outdict = {'mags':renormed_mags,
-                   'errs':interpolated_errs,
-                   'origmags':interpolated_mags}
+        outdict = _reform_magseries_for_tfa(
+            times, mags, errs,
+            timebase,
+            interpolate_type,
+            sigclip,
+            normalize=normfunc is None,
+            magsarefluxes=magsarefluxes
+        )
+        _tfa_write_reform_cache(cachefile, outdict)
 
         #
         # done with this magcol
@@ -395,6 +542,8 @@ def tfa_templates_lclist(
         errcols=None,
         nworkers=NCPUS,
         maxworkertasks=1000,
+        write_template_matrices=False,
+        reformcache=None,
 ):
     '''This selects template objects for TFA.
 
@@ -425,9 +574,12 @@ def tfa_templates_lclist(
     Parameters
     ----------
 
-    lclist : list of str
+    lclist : list of str or str
         This is a list of light curves to use as input to generate the template
-        set.
+        set. If this is a str, it's taken to be the path to a light curve
+        catalog pickle or mmap catalog directory made by
+        :py:func:`astrobase.lcproc.catalogs.make_lclist` and all of the light
+        curves in it will be used.
 
     outfile : str
         This is the pickle filename to which the TFA template list will be
@@ -536,13 +688,32 @@ def tfa_templates_lclist(
         The maximum number of tasks to run per worker before it is replaced by a
         fresh one.
 
+    write_template_matrices : bool
+        If True, the template mag series, error series, normal matrix, and its
+        inverse for each magcol are written to .npy files in a directory next
+        to `outfile` (called `outfile` minus its extension + '-matrices')
+        instead of into the `outfile` pickle itself. The pickle must then be
+        read back in with `read_tfa_templateinfo`; this memory-maps the
+        arrays, so parallel TFA workers share a single copy of them instead of
+        each unpickling their own. A plain `pickle.load` of the pickle will
+        have None for these arrays.
+
+    reformcache : str or None
+        If this is a directory, the template LCs reformed to the template
+        timebase are cached there, and reused by this function and the
+        `apply_tfa_magseries*` functions for any LC that was already reformed
+        to the same timebase with the same settings.
+
     Returns
     -------
 
     dict
         This function returns a dict that can be passed directly to
-        `apply_tfa_magseries` below. It can optionally produce a pickle with the
-        same dict, which can also be passed to that function.
+        `apply_tfa_magseries` below. It also writes this dict to `outfile`,
+        which can also be passed to that function. If `process_template_lcs`
+        is True, each magcol's dict also contains the template normal matrix
+        and its inverse, so these don't need to be recomputed for every light
+        curve TFA is applied to.
 
     '''
 
@@ -569,6 +740,10 @@ def tfa_templates_lclist(
     if errcols is None:
         errcols = derrcols
 
+    # get the light curve list from a catalog if we're given one
+    if isinstance(lclist, str):
+        lclist = [str(x) for x in read_lclist(lclist)['objects']['lcfname']]
+
     LOGINFO('collecting light curve information for %s objects in list...' %
             len(lclist))
 
@@ -945,7 +1120,7 @@ def tfa_templates_lclist(
                     tasks = [(x, lcformat, lcformatdir,
                               tcol, mcol, ecol,
                               timebase, template_interpolate,
-                              template_sigclip) for x
+                              template_sigclip, reformcache) for x
                              in templatelcf]
 
                     pool = mp.Pool(nworkers, maxtasksperchild=maxworkertasks)
@@ -960,9 +1135,20 @@ def tfa_templates_lclist(
                     template_errseries = np.array([x['errs']
                                                    for x in reform_results])
 
+                    # factorize the template normal matrix once here so
+                    # apply_tfa_magseries doesn't have to do it per target
+                    (template_normal_matrix,
+                     template_normal_matrix_inverse,
+                     template_normal_matrix_fullrank) = (
+                         _tfa_normal_matrix_factorization(template_magseries)
+                    )
+
                 else:
                     template_magseries = None
                     template_errseries = None
+                    template_normal_matrix = None
+                    template_normal_matrix_inverse = None
+                    template_normal_matrix_fullrank = None
 
                 # put everything into a templateinfo dict for this magcol
                 outdict[mcol].update({
@@ -980,7 +1166,14 @@ def tfa_templates_lclist(
                     'template_eta':templateeta,
                     'template_ndet':templatendet,
                     'template_magseries':template_magseries,
-                    'template_errseries':template_errseries
+                    'template_errseries':template_errseries,
+                    'template_normal_matrix':template_normal_matrix,
+                    'template_normal_matrix_inverse':(
+                        template_normal_matrix_inverse
+                    ),
+                    'template_normal_matrix_fullrank':(
+                        template_normal_matrix_fullrank
+                    ),
                 })
 
                 # make a KDTree on the template coordinates
@@ -1037,128 +1230,284 @@ def tfa_templates_lclist(
     # end of operating on each magcol
     #
 
+    _write_tfa_templateinfo(outdict,
+                            outfile,
+                            write_template_matrices=write_template_matrices)
+
+    # return the templateinfo dict
+    return outdict
+
+
+########################################
+## TFA TEMPLATEINFO PICKLES AND FILES ##
+########################################
+
+def _tfa_template_matrix_dir(templateinfo_pkl):
+    '''This returns the template matrix directory for a templateinfo pickle.
+
+    '''
+
+    pklbase = templateinfo_pkl
+    if pklbase.endswith('.gz'):
+        pklbase = pklbase[:-3]
+
+    return '%s-matrices' % os.path.splitext(pklbase)[0]
+
+
+def _write_tfa_templateinfo(templateinfo,
+                            outfile,
+                            write_template_matrices=False):
+    '''This writes a templateinfo dict to a pickle.
+
+    If `write_template_matrices` is True, the arrays in
+    `TFA_TEMPLATE_MATRIX_KEYS` for each magcol go into .npy files in the
+    directory given by `_tfa_template_matrix_dir(outfile)` and are set to None
+    in the pickle. `read_tfa_templateinfo` puts them back.
+
+    '''
+
+    pickledict = templateinfo
+
+    if write_template_matrices:
+
+        matrixdir = _tfa_template_matrix_dir(outfile)
+        if not os.path.exists(matrixdir):
+            os.makedirs(matrixdir)
+
+        # shallow copies, so the arrays in the dict we return are untouched
+        pickledict = dict(templateinfo)
+        pickledict['template_matrix_dir'] = os.path.basename(matrixdir)
+
+        for mcol in templateinfo['magcols']:
+
+            if mcol not in templateinfo:
+                continue
+
+            pickledict[mcol] = dict(templateinfo[mcol])
+
+            for key in TFA_TEMPLATE_MATRIX_KEYS:
+
+                matrix = templateinfo[mcol].get(key, None)
+                if matrix is None:
+                    continue
+
+                np.save(os.path.join(matrixdir, '%s-%s.npy' % (mcol, key)),
+                        matrix)
+                pickledict[mcol][key] = None
+
+        LOGINFO('wrote TFA template matrices to %s' % matrixdir)
+
     if outfile.endswith('.gz'):
         outfd = gzip.open(outfile,'wb')
     else:
         outfd = open(outfile,'wb')
 
     with outfd:
-        pickle.dump(outdict, outfd, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(pickledict, outfd, protocol=pickle.HIGHEST_PROTOCOL)
 
-    # return the templateinfo dict
-    return outdict
+    return outfile
 
 
-def apply_tfa_magseries(lcfile,
-                        timecol,
-                        magcol,
-                        errcol,
-                        templateinfo,
-                        mintemplatedist_arcmin=10.0,
-                        lcformat='hat-sql',
-                        lcformatdir=None,
-                        interp='nearest',
-                        sigclip=5.0):
-    '''This applies the TFA correction to an LC given TFA template information.
+def _tfa_templateinfo_signature(templateinfo_pkl, matrixdir):
+    '''This returns the sizes and mtimes of a templateinfo pickle's files.
 
-    Parameters
-    ----------
+    These are the pickle itself and all of the .npy files in its template
+    matrix directory `matrixdir` (if this is not None).
 
-    lcfile : str
-        This is the light curve file to apply the TFA correction to.
+    '''
 
-    timecol,magcol,errcol : str
-        These are the column keys in the lcdict for the LC file to apply the TFA
-        correction to.
+    pklstat = os.stat(templateinfo_pkl)
+    signature = [(templateinfo_pkl, pklstat.st_size, pklstat.st_mtime_ns)]
+
+    if matrixdir is not None and os.path.isdir(matrixdir):
+
+        for matrixf in sorted(glob.glob(os.path.join(matrixdir, '*.npy'))):
+            matrixstat = os.stat(matrixf)
+            signature.append((matrixf,
+                              matrixstat.st_size,
+                              matrixstat.st_mtime_ns))
+
+    return tuple(signature)
+
+
+def read_tfa_templateinfo(templateinfo, mmap=True):
+    '''This reads a templateinfo pickle made by `tfa_templates_lclist`.
+
+    If the template matrices were written to a directory next to the pickle,
+    they're memory-mapped read-only from there. All processes reading the
+    same pickle then share the same pages for these instead of each holding
+    their own copy. The result is cached per process, so TFA workers only read
+    the pickle once.
+
+    Parameters
+    ----------
 
     templateinfo : dict or str
         This is either the dict produced by `tfa_templates_lclist` or the pickle
-        produced by the same function.
+        produced by the same function. A dict is returned as is.
 
-    mintemplatedist_arcmin : float
-        This sets the minimum distance required from the target object for
-        objects in the TFA template ensemble. Objects closer than this distance
-        will be removed from the ensemble.
+    mmap : bool
+        If True, the template matrices are memory-mapped. If False, they're
+        read into memory.
 
-    lcformat : str
-        This is the `formatkey` associated with your light curve format, which
-        you previously passed in to the `lcproc.register_lcformat`
-        function. This will be used to look up how to find and read the light
-        curves specified in `basedir` or `use_list_of_filenames`.
+    Returns
+    -------
 
-    lcformatdir : str or None
-        If this is provided, gives the path to a directory when you've stored
-        your lcformat description JSONs, other than the usual directories lcproc
-        knows to search for them in. Use this along with `lcformat` to specify
-        an LC format JSON file that's not currently registered with lcproc.
+    dict
+        The templateinfo dict.
 
-    interp : str
-        This is passed to scipy.interpolate.interp1d as the kind of
-        interpolation to use when reforming this light curve to the timebase of
-        the TFA templates.
+    '''
 
-    sigclip : float or sequence of two floats or None
-        This is the sigma clip to apply to this light curve before running TFA
-        on it.
+    if not isinstance(templateinfo, str):
+        return templateinfo
+
+    cachekey = (os.path.abspath(templateinfo), mmap)
+
+    # the cached templateinfo is only used if neither the pickle nor any of
+    # its template matrix files have changed since it was read
+    if cachekey in _TFA_TEMPLATEINFO_CACHE:
+
+        cachedsig, cachedmatrixdir, cachedinfo = (
+            _TFA_TEMPLATEINFO_CACHE[cachekey]
+        )
+        if cachedsig == _tfa_templateinfo_signature(templateinfo,
+                                                    cachedmatrixdir):
+            return cachedinfo
+
+    if templateinfo.endswith('.gz'):
+        infd = gzip.open(templateinfo,'rb')
+    else:
+        infd = open(templateinfo,'rb')
+
+    with infd:
+        templateinfodict = pickle.load(infd)
+
+    matrixdir = templateinfodict.get('template_matrix_dir', None)
+
+    if matrixdir is not None:
+
+        matrixdir = os.path.join(os.path.dirname(templateinfo), matrixdir)
+
+        for mcol in templateinfodict['magcols']:
+
+            if mcol not in templateinfodict:
+                continue
+
+            for key in TFA_TEMPLATE_MATRIX_KEYS:
+
+                matrixf = os.path.join(matrixdir, '%s-%s.npy' % (mcol, key))
+                if os.path.exists(matrixf):
+                    templateinfodict[mcol][key] = np.load(
+                        matrixf,
+                        mmap_mode='r' if mmap else None
+                    )
+
+    _TFA_TEMPLATEINFO_CACHE.clear()
+    _TFA_TEMPLATEINFO_CACHE[cachekey] = (
+        _tfa_templateinfo_signature(templateinfo, matrixdir),
+        matrixdir,
+        templateinfodict
+    )
+
+    return templateinfodict
+
+
+#####################################
+## TFA NORMAL MATRIX FACTORIZATION ##
+#####################################
+
+def _tfa_normal_matrix_factorization(template_magseries):
+    '''This factorizes the TFA template normal matrix.
+
+    Parameters
+    ----------
+
+    template_magseries : np.array
+        The template mag series array with shape (n_templates, n_timebase).
 
     Returns
     -------
 
-    str
-        This returns the filename of the light curve file generated after TFA
-        applications. This is a pickle (that can be read by `lcproc.read_pklc`)
-        in the same directory as `lcfile`. The `magcol` will be encoded in the
-        filename, so each `magcol` in `lcfile` gets its own output file.
+    tuple
+        Returns `(normal_matrix, normal_matrix_inverse, fullrank)`. The inverse
+        is the SVD pseudo-inverse. `fullrank` is True if the normal matrix is
+        non-singular, in which case the inverse for any subset of templates
+        can be obtained from it by a block downdate.
 
     '''
 
-    try:
-        formatinfo = get_lcformat(lcformat,
-                                  use_lcformat_dir=lcformatdir)
-        if formatinfo:
-            (dfileglob, readerfunc,
-             dtimecols, dmagcols, derrcols,
-             magsarefluxes, normfunc) = formatinfo
-        else:
-            LOGERROR("can't figure out the light curve format")
-            return None
-    except Exception:
-        LOGEXCEPTION("can't figure out the light curve format")
-        return None
+    normal_matrix = np.dot(template_magseries, template_magseries.T)
+    normal_matrix_inverse = np.linalg.pinv(normal_matrix)
+    fullrank = bool(
+        np.linalg.matrix_rank(normal_matrix) == normal_matrix.shape[0]
+    )
 
-    # get the templateinfo from a pickle if necessary
-    if isinstance(templateinfo,str) and os.path.exists(templateinfo):
-        with open(templateinfo,'rb') as infd:
-            templateinfo = pickle.load(infd)
+    return normal_matrix, normal_matrix_inverse, fullrank
 
-    lcdict = readerfunc(lcfile)
-    if ((isinstance(lcdict, (tuple, list))) and
-        isinstance(lcdict[0], dict)):
-        lcdict = lcdict[0]
 
-    objectid = lcdict['objectid']
+def _tfa_get_factorization(templateinfo, magcol):
+    '''This gets the normal matrix factorization for a magcol's templates.
+
+    The factorization is computed by `tfa_templates_lclist`. For templateinfo
+    dicts made before that was done, it's computed here and added to the
+    templateinfo dict so it's only done once.
+
+    '''
+
+    mcolinfo = templateinfo[magcol]
+
+    if mcolinfo.get('template_magseries', None) is None:
+        raise ValueError(
+            'the template matrices for magcol: %s are not in this '
+            'templateinfo dict, use read_tfa_templateinfo to read the '
+            'templateinfo pickle' % magcol
+        )
+
+    if mcolinfo.get('template_normal_matrix_inverse', None) is None:
+
+        (mcolinfo['template_normal_matrix'],
+         mcolinfo['template_normal_matrix_inverse'],
+         mcolinfo['template_normal_matrix_fullrank']) = (
+             _tfa_normal_matrix_factorization(mcolinfo['template_magseries'])
+        )
+
+    return (mcolinfo['template_normal_matrix'],
+            mcolinfo['template_normal_matrix_inverse'],
+            mcolinfo['template_normal_matrix_fullrank'])
+
+
+def _tfa_template_exclusions(templateinfo,
+                             magcol,
+                             objectid,
+                             ra,
+                             decl,
+                             mintemplatedist_arcmin):
+    '''This finds the templates to exclude when correcting an object.
+
+    These are the object itself if it's in the template ensemble and any
+    template objects closer than `mintemplatedist_arcmin` to it.
+
+    Returns
+    -------
+
+    np.array
+        A sorted array of template indices to exclude.
+
+    '''
 
-    # this is the initial template array
-    tmagseries = templateinfo[magcol][
-        'template_magseries'
-    ][::]
+    mcolinfo = templateinfo[magcol]
 
     # if the object itself is in the template ensemble, remove it
-    if objectid in templateinfo[magcol]['template_objects']:
+    selfind = np.flatnonzero(mcolinfo['template_objects'] == objectid)
 
+    if selfind.size > 0:
         LOGWARNING('object %s found in the TFA template ensemble, removing...' %
                    objectid)
 
-        templateind = templateinfo[magcol]['template_objects'] == objectid
-
-        # get the objects in the tmagseries not corresponding to the current
-        # object's index
-        tmagseries = tmagseries[~templateind,:]
-
     # check if there are close matches to the current object in the templates
     object_matches = coordutils.conesearch_kdtree(
-        templateinfo[magcol]['template_radecl_kdtree'],
-        lcdict['objectinfo']['ra'], lcdict['objectinfo']['decl'],
+        mcolinfo['template_radecl_kdtree'],
+        ra, decl,
         mintemplatedist_arcmin/60.0
     )
 
@@ -1170,65 +1519,165 @@ def apply_tfa_magseries(lcfile,
             "from the template applied to this object." %
             (objectid, mintemplatedist_arcmin, len(object_matches))
         )
-        removalind = np.full(
-            templateinfo[magcol]['template_objects'].size,
-            False, dtype=np.bool
-        )
-        removalind[np.array(object_matches)] = True
-        tmagseries = tmagseries[~removalind,:]
 
-    #
-    # finally, proceed to TFA
-    #
+    return np.union1d(selfind,
+                      np.array(object_matches, dtype=np.int64))
 
-    # this is the normal matrix
-    normal_matrix = np.dot(tmagseries, tmagseries.T)
 
-    # get the inverse of the matrix
-    normal_matrix_inverse = spla.pinv2(normal_matrix)
+def _tfa_excluded_inverse(templateinfo,
+                          magcol,
+                          excludeind,
+                          cache=None):
+    '''This gets the normal matrix inverse with some templates excluded.
 
-    # get the timebase from the template
-    timebase = templateinfo[magcol]['timebase']
+    If the full normal matrix is non-singular, the inverse of the normal
+    matrix for the remaining templates K (with S being the excluded ones) is
+    obtained from the full inverse B with a block downdate::
 
-    # use this to reform the target lc in the same manner as that for a TFA
-    # template LC
-    reformed_targetlc = _reform_templatelc_for_tfa((
-        lcfile,
-        lcformat,
-        lcformatdir,
-        timecol,
-        magcol,
-        errcol,
-        timebase,
-        interp,
-        sigclip
-    ))
+        inv(A_KK) = B_KK - B_KS inv(B_SS) B_SK
 
-    # calculate the scalar products of the target and template magseries
-    scalar_products = np.dot(tmagseries, reformed_targetlc['mags'])
+    which only needs the solve of a small |S| x |S| system instead of a fresh
+    pseudo-inverse. Otherwise, the pseudo-inverse of A_KK is computed
+    directly.
 
-    # calculate the corrections
-    corrections = np.dot(normal_matrix_inverse, scalar_products)
+    Parameters
+    ----------
 
-    # finally, get the corrected time series for the target object
-    corrected_magseries = (
-        reformed_targetlc['origmags'] -
-        np.dot(tmagseries.T, corrections)
-    )
+    templateinfo : dict
+        The templateinfo dict from `tfa_templates_lclist`.
 
-    outdict = {
-        'times':timebase,
-        'mags':corrected_magseries,
-        'errs':reformed_targetlc['errs'],
-        'mags_median':np.median(corrected_magseries),
+    magcol : str
+        The magcol to get the inverse for.
+
+    excludeind : np.array
+        The sorted template indices to exclude.
+
+    cache : dict or None
+        If this is a dict, results are cached in it keyed by the exclusion
+        set, so targets sharing the same excluded templates don't redo this.
+
+    Returns
+    -------
+
+    tuple
+        Returns `(keepind, normal_matrix_inverse)`, where `keepind` is a
+        boolean array of the templates in use.
+
+    '''
+
+    cachekey = (magcol, tuple(excludeind.tolist()))
+
+    if cache is not None and cachekey in cache:
+        return cache[cachekey]
+
+    normal_matrix, normal_matrix_inverse, fullrank = _tfa_get_factorization(
+        templateinfo,
+        magcol
+    )
+
+    keepind = np.full(normal_matrix.shape[0], True)
+    keepind[excludeind] = False
+
+    if excludeind.size == 0:
+
+        excluded_inverse = normal_matrix_inverse
+
+    elif fullrank and keepind.any():
+
+        kinds = np.flatnonzero(keepind)
+        b_kk = normal_matrix_inverse[np.ix_(kinds, kinds)]
+        b_ks = normal_matrix_inverse[np.ix_(kinds, excludeind)]
+        b_ss = normal_matrix_inverse[np.ix_(excludeind, excludeind)]
+
+        excluded_inverse = b_kk - np.dot(b_ks, np.linalg.solve(b_ss, b_ks.T))
+
+    else:
+
+        excluded_inverse = np.linalg.pinv(
+            normal_matrix[np.ix_(keepind, keepind)]
+        )
+
+    if cache is not None:
+        cache[cachekey] = (keepind, excluded_inverse)
+
+    return keepind, excluded_inverse
+
+
+def _tfa_reform_target(lcfile,
+                       timecol,
+                       magcol,
+                       errcol,
+                       readerfunc,
+                       normfunc,
+                       magsarefluxes,
+                       timebase,
+                       interp,
+                       sigclip,
+                       reformcache=None):
+    '''This reads a TFA target LC and reforms it to the template timebase.
+
+    If `reformcache` is a directory, the reformed mag series is taken from
+    there if this LC was reformed to this timebase before, and saved there
+    otherwise. The LC itself is always read because the TFA output includes
+    its lcdict.
+
+    Returns a tuple of the lcdict and the reformed mag series dict from
+    `_reform_magseries_for_tfa`.
+
+    '''
+
+    lcdict = readerfunc(lcfile)
+    if ((isinstance(lcdict, (tuple, list))) and
+        isinstance(lcdict[0], dict)):
+        lcdict = lcdict[0]
+
+    if reformcache:
+        cachefile = _tfa_reform_cache_file(
+            reformcache, lcfile, magcol,
+            timebase, interp, sigclip,
+            normfunc is None, magsarefluxes
+        )
+        reformed_targetlc = _tfa_read_reform_cache(cachefile)
+        if reformed_targetlc is not None:
+            return lcdict, reformed_targetlc
+    else:
+        cachefile = None
+
+    times = _dict_get(lcdict, timecol.split('.'))
+    mags = _dict_get(lcdict, magcol.split('.'))
+    errs = _dict_get(lcdict, errcol.split('.'))
+
+    reformed_targetlc = _reform_magseries_for_tfa(
+        times, mags, errs,
+        timebase,
+        interp,
+        sigclip,
+        normalize=normfunc is None,
+        magsarefluxes=magsarefluxes
+    )
+    _tfa_write_reform_cache(cachefile, reformed_targetlc)
+
+    return lcdict, reformed_targetlc
+
+
+def _tfa_write_target(lcfile,
+                      lcdict,
+                      magcol,
+                      timebase,
+                      corrected_magseries,
+                      work):
+    '''This writes a TFA-corrected LC to a pickle next to the original LC.
+
+    '''
+
+    outdict = {
+        'times':timebase,
+        'mags':corrected_magseries,
+        'errs':work['reformed_targetlc']['errs'],
+        'mags_median':np.median(corrected_magseries),
         'mags_mad': np.median(np.abs(corrected_magseries -
                                      np.median(corrected_magseries))),
-        'work':{'tmagseries':tmagseries,
-                'normal_matrix':normal_matrix,
-                'normal_matrix_inverse':normal_matrix_inverse,
-                'scalar_products':scalar_products,
-                'corrections':corrections,
-                'reformed_targetlc':reformed_targetlc},
+        'work':work,
     }
 
     # we'll write back the tfa times and mags to the lcdict
@@ -1236,7 +1685,7 @@ def apply_tfa_magseries(lcfile,
     outfile = os.path.join(
         os.path.dirname(lcfile),
         '%s-tfa-%s-pklc.pkl' % (
-            squeeze(objectid).replace(' ','-'),
+            squeeze(lcdict['objectid']).replace(' ','-'),
             magcol
         )
     )
@@ -1246,6 +1695,445 @@ def apply_tfa_magseries(lcfile,
     return outfile
 
 
+def tfa_magseries(times, mags, errs,
+                  templateinfo,
+                  magcol,
+                  objectid,
+                  ra,
+                  decl,
+                  mintemplatedist_arcmin=10.0,
+                  interp='nearest',
+                  sigclip=5.0,
+                  normalize=False,
+                  magsarefluxes=False):
+    '''This applies the TFA correction to a mag series that's in memory.
+
+    This is the same correction as that done by `apply_tfa_magseries`, but
+    for a mag series that's already been read in (and possibly processed
+    further, e.g. by EPD), so it can be used as one stage of a larger
+    processing chain like `lcproc.pipeline.run_lc_pipeline`.
+
+    Parameters
+    ----------
+
+    times,mags,errs : np.array
+        The mag series to apply TFA to.
+
+    templateinfo : dict or str
+        This is either the dict produced by `tfa_templates_lclist` or the pickle
+        produced by the same function.
+
+    magcol : str
+        The magcol in `templateinfo` to get the templates from.
+
+    objectid,ra,decl : str, float, float
+        The object ID and coordinates of the object. These are used to remove
+        the object itself and any of its close neighbors from the templates.
+
+    mintemplatedist_arcmin : float
+        This sets the minimum distance required from the target object for
+        objects in the TFA template ensemble. Objects closer than this distance
+        will be removed from the ensemble.
+
+    interp : str
+        This is passed to scipy.interpolate.interp1d as the kind of
+        interpolation to use when reforming the mag series to the timebase of
+        the TFA templates.
+
+    sigclip : float or sequence of two floats or None
+        This is the sigma clip to apply to the mag series before running TFA
+        on it.
+
+    normalize : bool
+        If True, the mag series will be normalized before TFA.
+
+    magsarefluxes : bool
+        Set this to True if `mags` actually contains fluxes.
+
+    Returns
+    -------
+
+    dict
+        Returns a dict of the form::
+
+            {'times': the TFA template timebase,
+             'mags': the TFA-corrected mags,
+             'errs': the errs interpolated to the timebase,
+             'mags_median': median of the TFA-corrected mags,
+             'mags_mad': MAD of the TFA-corrected mags,
+             'corrections': the TFA coefficients for each template used,
+             'templates_used': a boolean array of templates used}
+
+    '''
+
+    templateinfo = read_tfa_templateinfo(templateinfo)
+    timebase = templateinfo[magcol]['timebase']
+
+    reformed = _reform_magseries_for_tfa(
+        times, mags, errs,
+        timebase,
+        interp,
+        sigclip,
+        normalize=normalize,
+        magsarefluxes=magsarefluxes
+    )
+
+    excludeind = _tfa_template_exclusions(
+        templateinfo, magcol,
+        objectid, ra, decl,
+        mintemplatedist_arcmin
+    )
+    keepind, normal_matrix_inverse = _tfa_excluded_inverse(
+        templateinfo, magcol, excludeind
+    )
+
+    tmagseries = templateinfo[magcol]['template_magseries'][keepind,:]
+    corrections = np.dot(normal_matrix_inverse,
+                         np.dot(tmagseries, reformed['mags']))
+    corrected_magseries = (
+        reformed['origmags'] - np.dot(tmagseries.T, corrections)
+    )
+    corrected_median = np.median(corrected_magseries)
+
+    return {
+        'times':timebase,
+        'mags':corrected_magseries,
+        'errs':reformed['errs'],
+        'mags_median':corrected_median,
+        'mags_mad':np.median(np.abs(corrected_magseries - corrected_median)),
+        'corrections':corrections,
+        'templates_used':keepind,
+    }
+
+
+def apply_tfa_magseries(lcfile,
+                        timecol,
+                        magcol,
+                        errcol,
+                        templateinfo,
+                        mintemplatedist_arcmin=10.0,
+                        lcformat='hat-sql',
+                        lcformatdir=None,
+                        interp='nearest',
+                        sigclip=5.0,
+                        reformcache=None):
+    '''This applies the TFA correction to an LC given TFA template information.
+
+    The normal matrix inverse for the templates used for this LC is obtained
+    from the one stored in `templateinfo` by a block downdate if any templates
+    have to be excluded for this object. Use `apply_tfa_magseries_batch` to
+    correct many LCs at once.
+
+    Parameters
+    ----------
+
+    lcfile : str
+        This is the light curve file to apply the TFA correction to.
+
+    timecol,magcol,errcol : str
+        These are the column keys in the lcdict for the LC file to apply the TFA
+        correction to.
+
+    templateinfo : dict or str
+        This is either the dict produced by `tfa_templates_lclist` or the pickle
+        produced by the same function.
+
+    mintemplatedist_arcmin : float
+        This sets the minimum distance required from the target object for
+        objects in the TFA template ensemble. Objects closer than this distance
+        will be removed from the ensemble.
+
+    lcformat : str
+        This is the `formatkey` associated with your light curve format, which
+        you previously passed in to the `lcproc.register_lcformat`
+        function. This will be used to look up how to find and read the light
+        curves specified in `basedir` or `use_list_of_filenames`.
+
+    lcformatdir : str or None
+        If this is provided, gives the path to a directory when you've stored
+        your lcformat description JSONs, other than the usual directories lcproc
+        knows to search for them in. Use this along with `lcformat` to specify
+        an LC format JSON file that's not currently registered with lcproc.
+
+    interp : str
+        This is passed to scipy.interpolate.interp1d as the kind of
+        interpolation to use when reforming this light curve to the timebase of
+        the TFA templates.
+
+    sigclip : float or sequence of two floats or None
+        This is the sigma clip to apply to this light curve before running TFA
+        on it.
+
+    reformcache : str or None
+        If this is a directory, the light curve reformed to the template
+        timebase is cached there and reused on later runs with the same
+        timebase and settings, e.g. with a different template set.
+
+    Returns
+    -------
+
+    str
+        This returns the filename of the light curve file generated after TFA
+        applications. This is a pickle (that can be read by `lcproc.read_pklc`)
+        in the same directory as `lcfile`. The `magcol` will be encoded in the
+        filename, so each `magcol` in `lcfile` gets its own output file.
+
+    '''
+
+    try:
+        formatinfo = get_lcformat(lcformat,
+                                  use_lcformat_dir=lcformatdir)
+        if formatinfo:
+            (dfileglob, readerfunc,
+             dtimecols, dmagcols, derrcols,
+             magsarefluxes, normfunc) = formatinfo
+        else:
+            LOGERROR("can't figure out the light curve format")
+            return None
+    except Exception:
+        LOGEXCEPTION("can't figure out the light curve format")
+        return None
+
+    # get the templateinfo from a pickle if necessary
+    templateinfo = read_tfa_templateinfo(templateinfo)
+
+    # get the timebase from the template
+    timebase = templateinfo[magcol]['timebase']
+
+    # read the target LC and reform it in the same manner as that for a TFA
+    # template LC
+    lcdict, reformed_targetlc = _tfa_reform_target(
+        lcfile,
+        timecol, magcol, errcol,
+        readerfunc, normfunc, magsarefluxes,
+        timebase, interp, sigclip,
+        reformcache=reformcache
+    )
+    objectid = lcdict['objectid']
+
+    # remove the object itself and any close neighbors from the templates and
+    # get the normal matrix inverse for the rest of them
+    excludeind = _tfa_template_exclusions(
+        templateinfo, magcol,
+        objectid,
+        lcdict['objectinfo']['ra'], lcdict['objectinfo']['decl'],
+        mintemplatedist_arcmin
+    )
+    keepind, normal_matrix_inverse = _tfa_excluded_inverse(
+        templateinfo, magcol, excludeind
+    )
+
+    #
+    # finally, proceed to TFA
+    #
+
+    # this is the template array and its normal matrix
+    tmagseries = templateinfo[magcol]['template_magseries'][keepind,:]
+    normal_matrix = templateinfo[magcol]['template_normal_matrix'][
+        np.ix_(keepind, keepind)
+    ]
+
+    # calculate the scalar products of the target and template magseries
+    scalar_products = np.dot(tmagseries, reformed_targetlc['mags'])
+
+    # calculate the corrections
+    corrections = np.dot(normal_matrix_inverse, scalar_products)
+
+    # finally, get the corrected time series for the target object
+    corrected_magseries = (
+        reformed_targetlc['origmags'] -
+        np.dot(tmagseries.T, corrections)
+    )
+
+    return _tfa_write_target(lcfile, lcdict, magcol, timebase,
+                             corrected_magseries,
+                             {'tmagseries':tmagseries,
+                              'normal_matrix':normal_matrix,
+                              'normal_matrix_inverse':normal_matrix_inverse,
+                              'scalar_products':scalar_products,
+                              'corrections':corrections,
+                              'reformed_targetlc':reformed_targetlc})
+
+
+def apply_tfa_magseries_batch(lcfiles,
+                              timecol,
+                              magcol,
+                              errcol,
+                              templateinfo,
+                              mintemplatedist_arcmin=10.0,
+                              lcformat='hat-sql',
+                              lcformatdir=None,
+                              interp='nearest',
+                              sigclip=5.0,
+                              reformcache=None):
+    '''This applies the TFA correction to many LCs at once.
+
+    This produces the same output light curves as running
+    `apply_tfa_magseries` on each of `lcfiles`, but groups the targets by the
+    set of templates excluded for each of them (usually none, or the few
+    closest to the target). The normal matrix inverse for each such set comes
+    from a block downdate of the full inverse that's computed once by
+    `tfa_templates_lclist`, and all targets in a group are corrected together
+    using matrix-matrix products instead of one matrix-vector product at a
+    time.
+
+    Parameters
+    ----------
+
+    lcfiles : list of str
+        The light curve files to apply the TFA correction to.
+
+    timecol,magcol,errcol : str
+        These are the column keys in the lcdict for the LC files to apply the
+        TFA correction to.
+
+    templateinfo : dict or str
+        This is either the dict produced by `tfa_templates_lclist` or the pickle
+        produced by the same function.
+
+    mintemplatedist_arcmin : float
+        This sets the minimum distance required from each target object for
+        objects in the TFA template ensemble. Objects closer than this distance
+        will be removed from the ensemble used for that target.
+
+    lcformat : str
+        This is the `formatkey` associated with your light curve format, which
+        you previously passed in to the `lcproc.register_lcformat`
+        function. This will be used to look up how to find and read the light
+        curves specified in `basedir` or `use_list_of_filenames`.
+
+    lcformatdir : str or None
+        If this is provided, gives the path to a directory when you've stored
+        your lcformat description JSONs, other than the usual directories lcproc
+        knows to search for them in. Use this along with `lcformat` to specify
+        an LC format JSON file that's not currently registered with lcproc.
+
+    interp : str
+        This is passed to scipy.interpolate.interp1d as the kind of
+        interpolation to use when reforming the light curves to the timebase of
+        the TFA templates.
+
+    sigclip : float or sequence of two floats or None
+        This is the sigma clip to apply to the light curves before running TFA
+        on them.
+
+    reformcache : str or None
+        If this is a directory, the light curves reformed to the template
+        timebase are cached there and reused on later runs with the same
+        timebase and settings, e.g. with a different template set.
+
+    Returns
+    -------
+
+    list
+        The output TFA light curve filename for each element of `lcfiles`, or
+        None for those that failed.
+
+    '''
+
+    try:
+        formatinfo = get_lcformat(lcformat,
+                                  use_lcformat_dir=lcformatdir)
+        if formatinfo:
+            (dfileglob, readerfunc,
+             dtimecols, dmagcols, derrcols,
+             magsarefluxes, normfunc) = formatinfo
+        else:
+            LOGERROR("can't figure out the light curve format")
+            return None
+    except Exception:
+        LOGEXCEPTION("can't figure out the light curve format")
+        return None
+
+    # get the templateinfo from a pickle if necessary
+    templateinfo = read_tfa_templateinfo(templateinfo)
+
+    timebase = templateinfo[magcol]['timebase']
+    template_magseries = templateinfo[magcol]['template_magseries']
+
+    # read in and reform all of the targets, then group them by the templates
+    # that need to be excluded for each
+    targets = {}
+    groups = {}
+
+    for lcind, lcfile in enumerate(lcfiles):
+
+        try:
+
+            lcdict, reformed_targetlc = _tfa_reform_target(
+                lcfile,
+                timecol, magcol, errcol,
+                readerfunc, normfunc, magsarefluxes,
+                timebase, interp, sigclip,
+                reformcache=reformcache
+            )
+            excludeind = _tfa_template_exclusions(
+                templateinfo, magcol,
+                lcdict['objectid'],
+                lcdict['objectinfo']['ra'], lcdict['objectinfo']['decl'],
+                mintemplatedist_arcmin
+            )
+
+            targets[lcind] = (lcdict, reformed_targetlc)
+            groups.setdefault(tuple(excludeind.tolist()), []).append(lcind)
+
+        except Exception:
+            LOGEXCEPTION('could not read and reform %s for TFA' % lcfile)
+
+    LOGINFO('magcol: %s, %s targets in %s template exclusion groups' %
+            (magcol, len(targets), len(groups)))
+
+    outfiles = [None]*len(lcfiles)
+    inverse_cache = {}
+
+    for excludekey, lcinds in groups.items():
+
+        keepind, normal_matrix_inverse = _tfa_excluded_inverse(
+            templateinfo, magcol,
+            np.array(excludekey, dtype=np.int64),
+            cache=inverse_cache
+        )
+        tmagseries = template_magseries[keepind,:]
+        normal_matrix = templateinfo[magcol]['template_normal_matrix'][
+            np.ix_(keepind, keepind)
+        ]
+
+        # these are (n_timebase, n_targets) arrays
+        target_mags = np.column_stack(
+            [targets[x][1]['mags'] for x in lcinds]
+        )
+        target_origmags = np.column_stack(
+            [targets[x][1]['origmags'] for x in lcinds]
+        )
+
+        # all of the TFA bits for this group at once
+        scalar_products = np.dot(tmagseries, target_mags)
+        corrections = np.dot(normal_matrix_inverse, scalar_products)
+        corrected_magseries = (
+            target_origmags - np.dot(tmagseries.T, corrections)
+        )
+
+        for colind, lcind in enumerate(lcinds):
+
+            lcdict, reformed_targetlc = targets[lcind]
+
+            try:
+                outfiles[lcind] = _tfa_write_target(
+                    lcfiles[lcind], lcdict, magcol, timebase,
+                    corrected_magseries[:,colind],
+                    {'tmagseries':tmagseries,
+                     'normal_matrix':normal_matrix,
+                     'normal_matrix_inverse':normal_matrix_inverse,
+                     'scalar_products':scalar_products[:,colind],
+                     'corrections':corrections[:,colind],
+                     'reformed_targetlc':reformed_targetlc}
+                )
+            except Exception:
+                LOGEXCEPTION('could not write TFA LC for %s' % lcfiles[lcind])
+
+    return outfiles
+
+
 def _parallel_tfa_worker(task):
     '''
     This is a parallel worker for the function below.
@@ -1257,15 +2145,16 @@ def _parallel_tfa_worker(task):
     task[4] = templateinfo
     task[5] = lcformat
     task[6] = lcformatdir
-    task[6] = interp
-    task[7] = sigclip
-    task[8] = mintemplatedist_arcmin
+    task[7] = interp
+    task[8] = sigclip
+    task[9] = mintemplatedist_arcmin
+    task[10] = reformcache
 
     '''
 
     (lcfile, timecol, magcol, errcol,
      templateinfo, lcformat, lcformatdir,
-     interp, sigclip, mintemplatedist_arcmin) = task
+     interp, sigclip, mintemplatedist_arcmin, reformcache) = task
 
     try:
 
@@ -1276,7 +2165,8 @@ def _parallel_tfa_worker(task):
             lcformatdir=lcformatdir,
             interp=interp,
             sigclip=sigclip,
-            mintemplatedist_arcmin=mintemplatedist_arcmin
+            mintemplatedist_arcmin=mintemplatedist_arcmin,
+            reformcache=reformcache
         )
         if res:
             LOGINFO('%s -> %s TFA OK' % (lcfile, res))
@@ -1288,6 +2178,48 @@ def _parallel_tfa_worker(task):
         return None
 
 
+def _parallel_tfa_batch_worker(task):
+    '''
+    This is a parallel worker for batched TFA in the function below.
+
+    task[0] = lcfiles
+    task[1] = timecol
+    task[2] = magcol
+    task[3] = errcol
+    task[4] = templateinfo
+    task[5] = lcformat
+    task[6] = lcformatdir
+    task[7] = interp
+    task[8] = sigclip
+    task[9] = mintemplatedist_arcmin
+    task[10] = reformcache
+
+    '''
+
+    (lcfiles, timecol, magcol, errcol,
+     templateinfo, lcformat, lcformatdir,
+     interp, sigclip, mintemplatedist_arcmin, reformcache) = task
+
+    try:
+
+        return apply_tfa_magseries_batch(
+            lcfiles, timecol, magcol, errcol,
+            templateinfo,
+            lcformat=lcformat,
+            lcformatdir=lcformatdir,
+            interp=interp,
+            sigclip=sigclip,
+            mintemplatedist_arcmin=mintemplatedist_arcmin,
+            reformcache=reformcache
+        )
+
+    except Exception:
+
+        LOGEXCEPTION('batched TFA failed for %s LCs starting with %s' %
+                     (len(lcfiles), lcfiles[0]))
+        return [None]*len(lcfiles)
+
+
 def parallel_tfa_lclist(lclist,
                         templateinfo,
                         timecols=None,
@@ -1299,7 +2231,9 @@ def parallel_tfa_lclist(lclist,
                         sigclip=5.0,
                         mintemplatedist_arcmin=10.0,
                         nworkers=NCPUS,
-                        maxworkertasks=1000):
+                        maxworkertasks=1000,
+                        batchsize=None,
+                        reformcache=None):
     '''This applies TFA in parallel to all LCs in the given list of file names.
 
     Parameters
@@ -1354,6 +2288,18 @@ def parallel_tfa_lclist(lclist,
         The maximum number of tasks per worker allowed before it's replaced by a
         fresh one.
 
+    batchsize : int or None
+        If this is an int, the light curves are split into batches of this
+        size and each worker corrects a whole batch at once using
+        `apply_tfa_magseries_batch`. This is much faster for large numbers of
+        light curves since the template normal matrix isn't re-inverted for
+        each one.
+
+    reformcache : str or None
+        If this is a directory, the light curves reformed to the template
+        timebase are cached there and reused on later runs with the same
+        timebase and settings, e.g. with a different template set.
+
     Returns
     -------
 
@@ -1363,10 +2309,14 @@ def parallel_tfa_lclist(lclist,
 
     '''
 
-    # open the templateinfo first
+    # open the templateinfo first. if this is a pickle, the workers get its
+    # path so they can memory-map the template matrices instead of each
+    # getting a pickled copy of them
     if isinstance(templateinfo,str) and os.path.exists(templateinfo):
-        with open(templateinfo,'rb') as infd:
-            templateinfo = pickle.load(infd)
+        workertemplateinfo = templateinfo
+        templateinfo = read_tfa_templateinfo(templateinfo)
+    else:
+        workertemplateinfo = templateinfo
 
     try:
         formatinfo = get_lcformat(lcformat,
@@ -1397,15 +2347,33 @@ def parallel_tfa_lclist(lclist,
     # run by magcol
     for t, m, e in zip(timecols, magcols, errcols):
 
-        tasks = [(x, t, m, e, templateinfo,
-                  lcformat, lcformatdir,
-                  interp, sigclip, mintemplatedist_arcmin) for
-                 x in lclist]
+        if batchsize:
 
-        pool = mp.Pool(nworkers, maxtasksperchild=maxworkertasks)
-        results = pool.map(_parallel_tfa_worker, tasks)
-        pool.close()
-        pool.join()
+            tasks = [(lclist[x:x+batchsize], t, m, e, workertemplateinfo,
+                      lcformat, lcformatdir,
+                      interp, sigclip, mintemplatedist_arcmin,
+                      reformcache) for
+                     x in range(0, len(lclist), batchsize)]
+
+            pool = mp.Pool(nworkers, maxtasksperchild=maxworkertasks)
+            batchresults = pool.map(_parallel_tfa_batch_worker, tasks)
+            pool.close()
+            pool.join()
+
+            results = [x for batch in batchresults for x in batch]
+
+        else:
+
+            tasks = [(x, t, m, e, workertemplateinfo,
+                      lcformat, lcformatdir,
+                      interp, sigclip, mintemplatedist_arcmin,
+                      reformcache) for
+                     x in lclist]
+
+            pool = mp.Pool(nworkers, maxtasksperchild=maxworkertasks)
+            results = pool.map(_parallel_tfa_worker, tasks)
+            pool.close()
+            pool.join()
 
         outdict[m] = results
 
@@ -1424,7 +2392,9 @@ def parallel_tfa_lcdir(lcdir,
                        sigclip=5.0,
                        mintemplatedist_arcmin=10.0,
                        nworkers=NCPUS,
-                       maxworkertasks=1000):
+                       maxworkertasks=1000,
+                       batchsize=None,
+                       reformcache=None):
     '''This applies TFA in parallel to all LCs in a directory.
 
     Parameters
@@ -1484,6 +2454,18 @@ def parallel_tfa_lcdir(lcdir,
         The maximum number of tasks per worker allowed before it's replaced by a
         fresh one.
 
+    batchsize : int or None
+        If this is an int, the light curves are split into batches of this
+        size and each worker corrects a whole batch at once using
+        `apply_tfa_magseries_batch`. This is much faster for large numbers of
+        light curves since the template normal matrix isn't re-inverted for
+        each one.
+
+    reformcache : str or None
+        If this is a directory, the light curves reformed to the template
+        timebase are cached there and reused on later runs with the same
+        timebase and settings, e.g. with a different template set.
+
     Returns
     -------
 
@@ -1493,11 +2475,6 @@ def parallel_tfa_lcdir(lcdir,
 
     '''
 
-    # open the templateinfo first
-    if isinstance(templateinfo,str) and os.path.exists(templateinfo):
-        with open(templateinfo,'rb') as infd:
-            templateinfo = pickle.load(infd)
-
     try:
         formatinfo = get_lcformat(lcformat,
                                   use_lcformat_dir=lcformatdir)
@@ -1516,7 +2493,9 @@ def parallel_tfa_lcdir(lcdir,
     if lcfileglob is None:
         lcfileglob = dfileglob
 
-    lclist = sorted(glob.glob(os.path.join(lcdir, lcfileglob)))
+    lclist = expand_lcarchives(
+        sorted(glob.glob(os.path.join(lcdir, lcfileglob)))
+    )
 
     return parallel_tfa_lclist(
         lclist,
@@ -1525,10 +2504,12 @@ def parallel_tfa_lcdir(lcdir,
         magcols=magcols,
         errcols=errcols,
         lcformat=lcformat,
-        lcformatdir=None,
+        lcformatdir=lcformatdir,
         interp=interp,
         sigclip=sigclip,
         mintemplatedist_arcmin=mintemplatedist_arcmin,
         nworkers=nworkers,
-        maxworkertasks=maxworkertasks
+        maxworkertasks=maxworkertasks,
+        batchsize=batchsize,
+        reformcache=reformcache
     )
@@ -0,0 +1,937 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# transitfit.py - Oct 2026
+# License: MIT - see LICENSE for the full text.
+
+'''
+This contains functions to run transit model fits for many candidates (e.g. BLS
+peaks from `lcproc.periodsearch`) on large collections of light curves.
+
+The fits are scheduled over a single process pool, with one candidate per
+task. Each Mandel-Agol MCMC fit evaluates all of its walkers in-process, so the
+throughput scales with the number of workers. The MCMC chains for all
+candidates are kept in a single shared HDF5 file, with one group per chain, and
+interrupted chains are resumed from where they stopped. A summary table of the
+posteriors for all candidates is written at the end.
+
+'''
+
+#############
+## LOGGING ##
+#############
+
+import logging
+from astrobase import log_sub, log_fmt, log_date_fmt
+
+DEBUG = False
+if DEBUG:
+    level = logging.DEBUG
+else:
+    level = logging.INFO
+LOGGER = logging.getLogger(__name__)
+logging.basicConfig(
+    level=level,
+    style=log_sub,
+    format=log_fmt,
+    datefmt=log_date_fmt,
+)
+
+LOGDEBUG = LOGGER.debug
+LOGINFO = LOGGER.info
+LOGWARNING = LOGGER.warning
+LOGERROR = LOGGER.error
+LOGEXCEPTION = LOGGER.exception
+
+
+#############
+## IMPORTS ##
+#############
+
+import pickle
+import os
+import os.path
+import gzip
+import importlib.util
+import multiprocessing as mp
+from contextlib import contextmanager
+
+import numpy as np
+
+# to turn a list of keys into a dict address
+# from https://stackoverflow.com/a/14692747
+from functools import reduce
+from operator import getitem
+
+
+def _dict_get(datadict, keylist):
+    return reduce(getitem, keylist, datadict)
+
+
+try:
+    import emcee
+
+    # emcee's HDF5 backend imports h5py itself, we only need to know that
+    # it's there
+    if importlib.util.find_spec('h5py') is None:
+        raise ImportError('h5py is required for the MCMC chain store')
+
+    class LockedHDFBackend(emcee.backends.HDFBackend):
+        '''This is an emcee HDF5 backend that holds a lock while its file is
+        open.
+
+        This allows many processes to keep their MCMC chains in different
+        groups of the same HDF5 file, since HDF5 files can't be safely written
+        to by more than one process at a time. The lock is only held while a
+        step is written or the chain is read, which takes much less time than
+        the model evaluations for a step. The lock must be re-entrant because
+        some of the `emcee.backends.HDFBackend` methods open the file again
+        while it's already open.
+
+        Parameters
+        ----------
+
+        filename : str
+            The HDF5 file to use.
+
+        name : str
+            The name of the HDF5 group to keep this chain in.
+
+        lock : multiprocessing.RLock or None
+            The lock to hold while the file is open. If None, no lock is used.
+
+        kwargs : additional keyword arguments
+            These are passed to `emcee.backends.HDFBackend`.
+
+        '''
+
+        def __init__(self, filename, name='mcmc', lock=None, **kwargs):
+            self.lock = lock
+            super().__init__(filename, name=name, **kwargs)
+
+        @contextmanager
+        def open(self, mode='r'):
+
+            if self.lock is not None:
+                self.lock.acquire()
+
+            try:
+                f = super().open(mode)
+                try:
+                    yield f
+                finally:
+                    f.close()
+            finally:
+                if self.lock is not None:
+                    self.lock.release()
+
+    chainstore_dependencies = True
+
+except Exception:
+    chainstore_dependencies = False
+
+
+############
+## CONFIG ##
+############
+
+NCPUS = mp.cpu_count()
+
+# the supported fit methods
+TRANSITFIT_METHODS = ('mandelagol', 'traptransit')
+
+# the names of the traptransit_fit_magseries finalparams
+TRAPTRANSIT_PARAMS = ('period', 'epoch', 'depth', 'duration',
+                      'ingressduration')
+
+# this is the lock for the shared HDF5 chain store. this is set for each worker
+# process by the pool initializer
+_CHAINSTORE_LOCK = None
+
+
+###################
+## LOCAL IMPORTS ##
+###################
+
+from astrobase.lcproc import get_lcformat
+from astrobase.lcfit.transits import (
+    mandelagol_fit_magseries,
+    traptransit_fit_magseries,
+)
+
+
+#######################
+## UTILITY FUNCTIONS ##
+#######################
+
+def _transitfit_jobname(objectid, magcol, period):
+    '''
+    This returns the name for a candidate fit, used for its chain and pickle.
+
+    '''
+
+    jobname = '%s-%s-P%.6f' % (objectid, magcol, period)
+    return jobname.replace('/','_').replace(' ','_')
+
+
+def _transitfit_kwargs(fitmethod, period, epoch, priors, magsarefluxes):
+    '''This gets the model fit kwargs for a candidate from its job priors.
+
+    See :py:func:`.run_transitfit` for the keys that can be in `priors`.
+
+    '''
+
+    if priors is None:
+        priors = {}
+
+    depth = priors.get('depth', None)
+    duration = priors.get('duration', None)
+
+    if duration is None or not np.isfinite(duration):
+        duration = 0.05
+
+    if fitmethod == 'traptransit':
+
+        if depth is None or not np.isfinite(depth):
+            depth = 0.01
+        depth = np.abs(depth) if magsarefluxes else -np.abs(depth)
+
+        transitparams = priors.get(
+            'transitparams',
+            [period, epoch, depth, duration, 0.2*duration]
+        )
+
+        return {'transitparams':list(transitparams),
+                'param_bounds':priors.get('param_bounds', None)}
+
+    # otherwise, this is the Mandel-Agol fit
+    if depth is None or not np.isfinite(depth):
+        init_rp = 0.1
+    else:
+        init_rp = min(np.sqrt(np.abs(depth)), 0.4)
+
+    # for a central transit on a circular orbit, the transit duration in phase
+    # units is about 1/(pi a/Rstar)
+    init_sma = min(max(1.0/(np.pi*duration), 2.0), 90.0)
+    t0_window = max(0.5*duration*period, 0.01)
+
+    fitparams = dict(priors.get('fitparams',
+                                {'t0':epoch, 'rp':init_rp, 'sma':init_sma}))
+    fixedparams = dict(priors.get('fixedparams',
+                                  {'incl':90.0, 'ecc':0.0, 'omega':90.0,
+                                   'u':[0.3, 0.2], 'limb_dark':'quadratic'}))
+    priorbounds = dict(priors.get('priorbounds',
+                                  {'t0':(epoch - t0_window,
+                                         epoch + t0_window),
+                                   'rp':(0.0, 0.5),
+                                   'sma':(1.5, 100.0)}))
+
+    # fill in the period and epoch from the job if needed
+    if 'period' not in fitparams:
+        fixedparams['period'] = period
+    if 't0' not in fixedparams and 't0' not in fitparams:
+        fitparams['t0'] = epoch
+
+    return {'fitparams':fitparams,
+            'fixedparams':fixedparams,
+            'priorbounds':priorbounds}
+
+
+def _transitfit_summary_row(fitresult, fitmethod):
+    '''
+    This gets the fit params and their errors from a model fit result dict.
+
+    '''
+
+    row = {'params':{},
+           'acceptancefraction':np.nan,
+           'autocorrtime':np.nan,
+           'nsteps':0,
+           'redchisq':np.nan}
+
+    fitinfo = fitresult['fitinfo']
+
+    if fitmethod == 'traptransit':
+
+        if fitinfo['finalparams'] is None:
+            return None
+
+        for pname, pval, perr in zip(TRAPTRANSIT_PARAMS,
+                                     fitinfo['finalparams'],
+                                     fitinfo['finalparamerrs']):
+            row['params'][pname] = (pval, perr, perr)
+
+        row['redchisq'] = fitresult['fitredchisq']
+
+    else:
+
+        medianparams = fitinfo['finalparams']
+        perrs = fitinfo['finalparamerrs']['std_perrs']
+        merrs = fitinfo['finalparamerrs']['std_merrs']
+
+        for pname in sorted(medianparams.keys()):
+            row['params'][pname] = (medianparams[pname],
+                                    perrs.get(pname, np.nan),
+                                    merrs.get(pname, np.nan))
+
+        row['acceptancefraction'] = fitinfo['acceptancefraction']
+        row['autocorrtime'] = fitinfo['autocorrtime']
+        row['nsteps'] = fitinfo['nsteps']
+
+    return row
+
+
+def _write_transitfit_summary(rows, outfile):
+    '''This writes the summary table for all candidate fits to a CSV file.
+
+    The table has one row per candidate and magcol. The fit parameter columns
+    are the union of the fit parameters over all of the candidates, with three
+    columns each: `<param>`, `<param>_errp`, `<param>_errm` for the median and
+    the upper and lower 1-sigma errors. These are nan for candidates that
+    didn't fit that parameter or whose fit failed.
+
+    Returns a dict of the table columns as np.arrays.
+
+    '''
+
+    paramnames = sorted(
+        set(p for row in rows for p in row['params'].keys())
+    )
+
+    strcols = ['name', 'objectid', 'lcfile', 'magcol', 'fitmethod', 'status',
+               'resultpkl']
+    floatcols = ['period', 'epoch', 'acceptancefraction', 'autocorrtime',
+                 'redchisq']
+    intcols = ['nsteps']
+
+    table = {}
+
+    for col in strcols:
+        table[col] = np.array([str(row[col]) for row in rows])
+    for col in floatcols:
+        table[col] = np.array([row[col] for row in rows], dtype=np.float64)
+    for col in intcols:
+        table[col] = np.array([row[col] for row in rows], dtype=np.int64)
+
+    paramcols = []
+    for pname in paramnames:
+        for ind, suffix in enumerate(('', '_errp', '_errm')):
+            col = '%s%s' % (pname, suffix)
+            table[col] = np.array(
+                [row['params'][pname][ind] if pname in row['params']
+                 else np.nan for row in rows],
+                dtype=np.float64
+            )
+            paramcols.append(col)
+
+    columns = strcols + floatcols + intcols + paramcols
+
+    with open(outfile, 'w') as outfd:
+
+        outfd.write('%s\n' % ','.join(columns))
+
+        for ind in range(len(rows)):
+            outfd.write(
+                '%s\n' % ','.join(
+                    ('%.10g' % table[col][ind]) if col not in strcols
+                    else table[col][ind]
+                    for col in columns
+                )
+            )
+
+    table['columns'] = columns
+    return table
+
+
+##########################
+## SINGLE LC TRANSITFIT ##
+##########################
+
+def _transitfit_read_lcdict(lcfile, readerfunc, normfunc):
+    '''This reads a light curve and normalizes it if its format says so.
+
+    '''
+
+    lcdict = readerfunc(lcfile)
+
+    # this should handle lists/tuples being returned by readerfunc
+    # we assume that the first element is the actual lcdict
+    # FIXME: figure out how to not need this assumption
+    if ( (isinstance(lcdict, (list, tuple))) and
+         (isinstance(lcdict[0], dict)) ):
+        lcdict = lcdict[0]
+
+    if normfunc is not None:
+        lcdict = normfunc(lcdict)
+
+    return lcdict
+
+
+def _transitfit_mandelagol(times, mags, errs,
+                           fitkwargs,
+                           jobname,
+                           chainstore,
+                           sigclip,
+                           n_walkers,
+                           n_mcmc_steps,
+                           burninpercent,
+                           exp_time_minutes,
+                           overwriteexistingsamples):
+    '''This runs a Mandel-Agol fit with its chain in the shared chain store.
+
+    If the chain for `jobname` already exists in `chainstore`, it's resumed
+    until it has `n_mcmc_steps` steps.
+
+    '''
+
+    backend = LockedHDFBackend(chainstore,
+                               name=jobname,
+                               lock=_CHAINSTORE_LOCK)
+
+    # figure out how many steps are left in this chain
+    if (not overwriteexistingsamples and
+        backend.initialized):
+        nsteps_done = backend.iteration
+    else:
+        nsteps_done = 0
+    nsteps_left = n_mcmc_steps - nsteps_done
+
+    if nsteps_done > 0:
+        LOGINFO('%s: resuming chain at step %s of %s' %
+                (jobname, nsteps_done, n_mcmc_steps))
+
+    fitresult = mandelagol_fit_magseries(
+        times, mags, errs,
+        fitkwargs['fitparams'],
+        fitkwargs['priorbounds'],
+        fitkwargs['fixedparams'],
+        burninpercent=burninpercent,
+        n_walkers=n_walkers,
+        n_mcmc_steps=max(nsteps_left, 1),
+        exp_time_minutes=exp_time_minutes,
+        skipsampling=(nsteps_left <= 0),
+        overwriteexistingsamples=overwriteexistingsamples,
+        magsarefluxes=True,
+        sigclip=sigclip,
+        verbose=False,
+        vectorize=True,
+        mcmcbackend=backend,
+    )
+    fitresult['fitinfo']['chainstore'] = os.path.abspath(chainstore)
+    fitresult['fitinfo']['chainname'] = jobname
+    fitresult['fitinfo']['nsteps'] = backend.iteration
+
+    return fitresult
+
+
+def run_transitfit(lcfile,
+                   period,
+                   epoch,
+                   priors=None,
+                   fitmethod='mandelagol',
+                   outdir=None,
+                   chainstore=None,
+                   lcformat='hat-sql',
+                   lcformatdir=None,
+                   timecols=None,
+                   magcols=None,
+                   errcols=None,
+                   sigclip=10.0,
+                   n_walkers=50,
+                   n_mcmc_steps=400,
+                   burninpercent=0.3,
+                   exp_time_minutes=2,
+                   overwriteexistingsamples=False):
+    '''This fits a transit model to a single candidate in a light curve.
+
+    Parameters
+    ----------
+
+    lcfile : str
+        The light curve file to fit.
+
+    period,epoch : float
+        The period and epoch of the transit candidate, e.g. from BLS.
+
+    priors : dict or None
+        This sets up the model fit. It can have the following keys, all of which
+        are optional::
+
+            {'depth': the transit depth from e.g. BLS, used for the initial
+                      Rp/Rstar (Mandel-Agol) or depth (trapezoid),
+             'duration': the transit duration in phase units from e.g. BLS,
+                         used for the initial a/Rstar and the width of the
+                         t0 prior (Mandel-Agol) or duration (trapezoid),
+             'fitparams', 'fixedparams', 'priorbounds': these replace the
+                        defaults passed to
+                        `lcfit.transits.mandelagol_fit_magseries`,
+             'transitparams', 'param_bounds': these replace the defaults
+                        passed to `lcfit.transits.traptransit_fit_magseries`}
+
+        By default, the Mandel-Agol fit is for t0, Rp/Rstar, and a/Rstar with
+        the period fixed to `period`, a central transit on a circular orbit,
+        and quadratic limb-darkening coefficients of [0.3, 0.2]. If `period`
+        and `t0` aren't in the provided `fitparams` or `fixedparams`, they're
+        taken from the `period` and `epoch` args.
+
+    fitmethod : {'mandelagol', 'traptransit'}
+        The model to fit. 'mandelagol' uses
+        `lcfit.transits.mandelagol_fit_magseries` with its vectorized walker
+        MCMC mode, and needs flux light curves. 'traptransit' uses
+        `lcfit.transits.traptransit_fit_magseries`.
+
+    outdir : str or None
+        The directory to write the fit result pickles to. If None, this is the
+        directory that `lcfile` is in.
+
+    chainstore : str or None
+        The HDF5 file to keep the MCMC chains in. Each chain is kept in its own
+        group in this file, named `<objectid>-<magcol>-P<period>`. If the group
+        for a chain exists already, the chain is resumed until it has
+        `n_mcmc_steps` steps. If None, this is `transitfit-chains.h5` in
+        `outdir`.
+
+    lcformat : str
+        This is the `formatkey` associated with your light curve format, which
+        you previously passed in to the `lcproc.register_lcformat`
+        function. This will be used to look up how to find and read the light
+        curve file.
+
+    lcformatdir : str or None
+        If this is provided, gives the path to a directory when you've stored
+        your lcformat description JSONs, other than the usual directories lcproc
+        knows to search for them in. Use this along with `lcformat` to specify
+        an LC format JSON file that's not currently registered with lcproc.
+
+    timecols,magcols,errcols : lists of str
+        The keys in the lcdict produced by your light curve reader function that
+        correspond to the times, mags/fluxes, and associated measurement errors
+        that will be fit. If these are None, the default values for `timecols`,
+        `magcols`, and `errcols` for your light curve format will be used here.
+
+    sigclip : float or sequence of two floats or None
+        The sigma-clip to apply to the light curve before fitting.
+
+    n_walkers : int
+        The number of MCMC walkers to use.
+
+    n_mcmc_steps : int
+        The total number of MCMC steps for each chain.
+
+    burninpercent : float
+        The percent of MCMC samples to discard as burn-in.
+
+    exp_time_minutes : float
+        The exposure time used to smear the Mandel-Agol model.
+
+    overwriteexistingsamples : bool
+        If True, any existing chain for this candidate is erased and a new one
+        is started.
+
+    Returns
+    -------
+
+    list of dicts
+        One summary dict per magcol, with the keys: 'name', 'objectid',
+        'lcfile', 'magcol', 'fitmethod', 'period', 'epoch', 'status' ('ok' or
+        'failed'), 'resultpkl' (the pickle of the full fit result dict),
+        'params' (a dict of param name -> (median, +err, -err) tuples),
+        'acceptancefraction', 'autocorrtime', 'nsteps', and 'redchisq'.
+
+    '''
+
+    if fitmethod not in TRANSITFIT_METHODS:
+        LOGERROR('unknown fitmethod: %s, must be one of %s' %
+                 (fitmethod, repr(TRANSITFIT_METHODS)))
+        return None
+
+    if fitmethod == 'mandelagol' and not chainstore_dependencies:
+        LOGERROR('Mandel-Agol fits need emcee and h5py')
+        return None
+
+    try:
+        formatinfo = get_lcformat(lcformat,
+                                  use_lcformat_dir=lcformatdir)
+        if formatinfo:
+            (dfileglob, readerfunc,
+             dtimecols, dmagcols, derrcols,
+             magsarefluxes, normfunc) = formatinfo
+        else:
+            LOGERROR("can't figure out the light curve format")
+            return None
+    except Exception:
+        LOGEXCEPTION("can't figure out the light curve format")
+        return None
+
+    if fitmethod == 'mandelagol' and not magsarefluxes:
+        LOGERROR('Mandel-Agol fits need light curves with fluxes')
+        return None
+
+    # override the default timecols, magcols, and errcols
+    # using the ones provided to the function
+    if timecols is None:
+        timecols = dtimecols
+    if magcols is None:
+        magcols = dmagcols
+    if errcols is None:
+        errcols = derrcols
+
+    if outdir is None:
+        outdir = os.path.dirname(lcfile)
+    if not os.path.exists(outdir):
+        os.makedirs(outdir, exist_ok=True)
+
+    if chainstore is None:
+        chainstore = os.path.join(outdir, 'transitfit-chains.h5')
+
+    lcdict = _transitfit_read_lcdict(lcfile, readerfunc, normfunc)
+
+    fitkwargs = _transitfit_kwargs(fitmethod, period, epoch, priors,
+                                   magsarefluxes)
+
+    rows = []
+
+    for tcol, mcol, ecol in zip(timecols, magcols, errcols):
+
+        jobname = _transitfit_jobname(lcdict['objectid'], mcol, period)
+        resultpkl = os.path.join(outdir, 'transitfit-%s.pkl' % jobname)
+
+        row = {'name':jobname,
+               'objectid':lcdict['objectid'],
+               'lcfile':os.path.abspath(lcfile),
+               'magcol':mcol,
+               'fitmethod':fitmethod,
+               'period':period,
+               'epoch':epoch,
+               'status':'failed',
+               'resultpkl':None,
+               'params':{},
+               'acceptancefraction':np.nan,
+               'autocorrtime':np.nan,
+               'nsteps':0,
+               'redchisq':np.nan}
+
+        try:
+
+            times = np.array(_dict_get(lcdict, tcol.split('.')))
+            mags = np.array(_dict_get(lcdict, mcol.split('.')))
+            errs = np.array(_dict_get(lcdict, ecol.split('.')))
+
+            finind = np.isfinite(times) & np.isfinite(mags) & np.isfinite(errs)
+            times, mags, errs = times[finind], mags[finind], errs[finind]
+
+            # the Mandel-Agol model is for relative fluxes
+            if magsarefluxes:
+                medflux = np.median(mags)
+                mags, errs = mags/medflux, errs/medflux
+
+            if fitmethod == 'traptransit':
+
+                fitresult = traptransit_fit_magseries(
+                    times, mags, errs,
+                    fitkwargs['transitparams'],
+                    param_bounds=fitkwargs['param_bounds'],
+                    sigclip=sigclip,
+                    magsarefluxes=magsarefluxes,
+                    verbose=False
+                )
+
+            else:
+
+                fitresult = _transitfit_mandelagol(
+                    times, mags, errs,
+                    fitkwargs,
+                    jobname,
+                    chainstore,
+                    sigclip,
+                    n_walkers,
+                    n_mcmc_steps,
+                    burninpercent,
+                    exp_time_minutes,
+                    overwriteexistingsamples
+                )
+
+            fitrow = _transitfit_summary_row(fitresult, fitmethod)
+
+            with open(resultpkl, 'wb') as outfd:
+                pickle.dump(fitresult, outfd, pickle.HIGHEST_PROTOCOL)
+
+            row['resultpkl'] = resultpkl
+
+            if fitrow is not None:
+                row.update(fitrow)
+                row['status'] = 'ok'
+            else:
+                LOGERROR('%s fit failed for %s' % (fitmethod, jobname))
+
+        except Exception:
+            LOGEXCEPTION('%s fit failed for %s' % (fitmethod, jobname))
+
+        rows.append(row)
+
+    return rows
+
+
+######################################
+## PARALLEL TRANSITFIT FOR LC LISTS ##
+######################################
+
+def _transitfit_worker_init(chainlock):
+    '''
+    This sets the shared HDF5 chain store lock for a worker process.
+
+    '''
+
+    global _CHAINSTORE_LOCK
+    _CHAINSTORE_LOCK = chainlock
+
+
+def _transitfit_worker(task):
+    '''This is a parallel worker for `run_transitfit`.
+
+    task[0] = job index
+    task[1] = lcfile
+    task[2] = period
+    task[3] = epoch
+    task[4] = priors
+    task[5] = dict of kwargs for `run_transitfit`
+
+    '''
+
+    jobind, lcfile, period, epoch, priors, kwargs = task
+
+    try:
+        return jobind, run_transitfit(lcfile, period, epoch,
+                                      priors=priors,
+                                      **kwargs)
+    except Exception:
+        LOGEXCEPTION('transit fit failed for %s, period %s' % (lcfile, period))
+        return jobind, None
+
+
+def parallel_transitfit_lclist(jobs,
+                               outdir,
+                               fitmethod='mandelagol',
+                               chainstore=None,
+                               summaryfile='transitfit-summary.csv',
+                               nworkers=NCPUS,
+                               maxworkertasks=1000,
+                               **fitkwargs):
+    '''This runs transit model fits for many candidates in parallel.
+
+    All of the candidates are scheduled over one process pool, one candidate
+    per task. The MCMC chains are kept in a single shared HDF5 file, and a
+    chain that exists already is resumed until it has the requested number of
+    steps, so this function can simply be run again after an interruption.
+
+    Parameters
+    ----------
+
+    jobs : list of tuples
+        The candidates to fit, each a tuple of (lcfile, period, epoch, priors),
+        where `priors` is a dict or None. See :py:func:`.run_transitfit` for
+        the keys it can have. :py:func:`.transitfit_jobs_from_pfpickles` makes
+        this list from `lcproc.periodsearch` result pickles.
+
+    outdir : str
+        The directory to write the fit result pickles, the HDF5 chain store,
+        and the summary table to.
+
+    fitmethod : {'mandelagol', 'traptransit'}
+        The model to fit.
+
+    chainstore : str or None
+        The shared HDF5 file to keep the MCMC chains in. If None, this is
+        `transitfit-chains.h5` in `outdir`.
+
+    summaryfile : str
+        The name of the CSV file in `outdir` to write the summary table to.
+
+    nworkers : int
+        The number of parallel workers to launch.
+
+    maxworkertasks : int
+        The maximum number of tasks a parallel worker will complete before being
+        replaced to guard against memory leaks.
+
+    fitkwargs : additional keyword arguments
+        These are passed to :py:func:`.run_transitfit`, e.g. `lcformat`,
+        `lcformatdir`, `magcols`, `n_walkers`, and `n_mcmc_steps`.
+
+    Returns
+    -------
+
+    dict
+        This returns a dict with the keys: 'summaryfile' (the path to the CSV
+        summary table), 'chainstore' (the path to the HDF5 chain store),
+        'results' (the list of per-candidate and magcol summary dicts from
+        :py:func:`.run_transitfit`, in job order), and 'table' (a dict of the
+        summary table columns as np.arrays).
+
+    '''
+
+    if not os.path.exists(outdir):
+        os.makedirs(outdir, exist_ok=True)
+
+    if chainstore is None:
+        chainstore = os.path.join(outdir, 'transitfit-chains.h5')
+
+    fitkwargs.update({'fitmethod':fitmethod,
+                      'outdir':outdir,
+                      'chainstore':chainstore})
+
+    tasks = [(ind, lcf, period, epoch, priors, fitkwargs)
+             for ind, (lcf, period, epoch, priors) in enumerate(jobs)]
+
+    LOGINFO('fitting %s model to %s candidates using %s workers...' %
+            (fitmethod, len(tasks), nworkers))
+
+    chainlock = mp.RLock()
+
+    pool = mp.Pool(nworkers,
+                   initializer=_transitfit_worker_init,
+                   initargs=(chainlock,),
+                   maxtasksperchild=maxworkertasks)
+
+    # each task can take a very different amount of time, so hand them out
+    # one at a time
+    jobresults = [None]*len(tasks)
+    for jobind, rows in pool.imap_unordered(_transitfit_worker,
+                                            tasks,
+                                            chunksize=1):
+        jobresults[jobind] = rows
+
+    pool.close()
+    pool.join()
+
+    results = []
+    for (lcf, period, epoch, priors), rows in zip(jobs, jobresults):
+        if rows:
+            results.extend(rows)
+        else:
+            results.append({'name':'%s-P%.6f' % (os.path.basename(lcf),
+                                                 period),
+                            'objectid':None,
+                            'lcfile':os.path.abspath(lcf),
+                            'magcol':None,
+                            'fitmethod':fitmethod,
+                            'period':period,
+                            'epoch':epoch,
+                            'status':'failed',
+                            'resultpkl':None,
+                            'params':{},
+                            'acceptancefraction':np.nan,
+                            'autocorrtime':np.nan,
+                            'nsteps':0,
+                            'redchisq':np.nan})
+
+    summarypath = os.path.join(outdir, summaryfile)
+    table = _write_transitfit_summary(results, summarypath)
+
+    LOGINFO('done. %s/%s fits OK, summary table written to %s' %
+            (np.sum(table['status'] == 'ok'), len(results), summarypath))
+
+    return {'summaryfile':summarypath,
+            'chainstore':chainstore,
+            'results':results,
+            'table':table}
+
+
+def transitfit_jobs_from_pfpickles(pfpickles,
+                                   lcdir,
+                                   pfmethod='bls',
+                                   magcol=None,
+                                   nbestpeaks=1,
+                                   priors=None):
+    '''This makes transit fit jobs from `lcproc.periodsearch` result pickles.
+
+    The BLS results in the period-finding pickles must have been made with
+    `getblssnr=True` so they include the epochs, depths, and durations of the
+    best peaks.
+
+    Parameters
+    ----------
+
+    pfpickles : list of str
+        The period-finding result pickles from `lcproc.periodsearch.runpf` or
+        `lcproc.periodsearch.parallel_pf`.
+
+    lcdir : str
+        The directory containing the light curves the pickles are for.
+
+    pfmethod : str
+        The period-finder method whose results will be used. The first
+        results for this method in each pickle are used.
+
+    magcol : str or None
+        The magcol whose period-finder results will be used. If None, the first
+        magcol in each pickle is used.
+
+    nbestpeaks : int
+        The number of best peaks from each pickle to make jobs for.
+
+    priors : dict or None
+        Extra keys to add to the priors dict for each job. See
+        :py:func:`.run_transitfit`.
+
+    Returns
+    -------
+
+    list of tuples
+        The jobs to pass to :py:func:`.parallel_transitfit_lclist`.
+
+    '''
+
+    jobs = []
+
+    for pfpickle in pfpickles:
+
+        try:
+
+            if pfpickle.endswith('.gz'):
+                infd = gzip.open(pfpickle, 'rb')
+            else:
+                infd = open(pfpickle, 'rb')
+            pfresults = pickle.load(infd)
+            infd.close()
+
+            lcfile = os.path.join(lcdir, pfresults['lcfbasename'])
+
+            mcol = magcol
+            if mcol is None:
+                mcol = pfresults['kwargs']['magcols'][0]
+
+            pfmkey = [x for x in pfresults[mcol]['pfmethods']
+                      if x.endswith('-%s' % pfmethod)][0]
+            pfres = pfresults[mcol][pfmkey]
+
+            if 'epochs' not in pfres:
+                LOGERROR('no epochs for %s results in %s, '
+                         'rerun period-finding with getblssnr=True' %
+                         (pfmethod, pfpickle))
+                continue
+
+            for peakind in range(min(nbestpeaks,
+                                     len(pfres['nbestperiods']))):
+
+                period = pfres['nbestperiods'][peakind]
+                epoch = pfres['epochs'][peakind]
+
+                if not (np.isfinite(period) and np.isfinite(epoch)):
+                    continue
+
+                jobpriors = {
+                    'depth':pfres.get('transitdepth',
+                                      [np.nan]*(peakind+1))[peakind],
+                    'duration':pfres.get('transitduration',
+                                         [np.nan]*(peakind+1))[peakind],
+                }
+                if priors is not None:
+                    jobpriors.update(priors)
+
+                jobs.append((lcfile, period, epoch, jobpriors))
+
+        except Exception:
+            LOGEXCEPTION('could not get %s results from %s' %
+                         (pfmethod, pfpickle))
+
+    return jobs
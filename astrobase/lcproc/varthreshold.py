@@ -91,6 +91,94 @@ from astrobase.lcproc import get_lcformat
 DEFAULT_MAGBINS = np.arange(8.0,16.25,0.25)
 
 
+def _get_varthreshold_features(thisfeatures, magcol):
+    '''This gets the features used for variability thresholds for an object.
+
+    Parameters
+    ----------
+
+    thisfeatures : dict
+        The variability features dict for an object, from a pickle made by
+        :py:func:`astrobase.lcproc.lcvfeatures.parallel_varfeatures`.
+
+    magcol : str
+        The magcol to get the features for.
+
+    Returns
+    -------
+
+    tuple
+        Returns `(sdssr, lcmad, stetsonj, iqr, eta)`. Missing values are
+        np.nan.
+
+    '''
+
+    # the object magnitude
+    if ('info' in thisfeatures and
+        thisfeatures['info'] and
+        'sdssr' in thisfeatures['info']):
+
+        if (thisfeatures['info']['sdssr'] and
+            thisfeatures['info']['sdssr'] > 3.0):
+
+            sdssr = thisfeatures['info']['sdssr']
+
+        elif (magcol in thisfeatures and
+              thisfeatures[magcol] and
+              'median' in thisfeatures[magcol] and
+              thisfeatures[magcol]['median'] > 3.0):
+
+            sdssr = thisfeatures[magcol]['median']
+
+        elif (thisfeatures['info']['jmag'] and
+              thisfeatures['info']['hmag'] and
+              thisfeatures['info']['kmag']):
+
+            sdssr = jhk_to_sdssr(thisfeatures['info']['jmag'],
+                                 thisfeatures['info']['hmag'],
+                                 thisfeatures['info']['kmag'])
+
+        else:
+            sdssr = np.nan
+
+    else:
+        sdssr = np.nan
+
+    # the MAD of the light curve
+    if (magcol in thisfeatures and
+        thisfeatures[magcol] and
+        thisfeatures[magcol]['mad']):
+        lcmad = thisfeatures[magcol]['mad']
+    else:
+        lcmad = np.nan
+
+    # stetson index
+    if (magcol in thisfeatures and
+        thisfeatures[magcol] and
+        thisfeatures[magcol]['stetsonj']):
+        stetsonj = thisfeatures[magcol]['stetsonj']
+    else:
+        stetsonj = np.nan
+
+    # IQR
+    if (magcol in thisfeatures and
+        thisfeatures[magcol] and
+        thisfeatures[magcol]['mag_iqr']):
+        iqr = thisfeatures[magcol]['mag_iqr']
+    else:
+        iqr = np.nan
+
+    # eta
+    if (magcol in thisfeatures and
+        thisfeatures[magcol] and
+        thisfeatures[magcol]['eta_normal']):
+        eta = thisfeatures[magcol]['eta_normal']
+    else:
+        eta = np.nan
+
+    return sdssr, lcmad, stetsonj, iqr, eta
+
+
 def variability_threshold(featuresdir,
                           outfile,
                           magbins=DEFAULT_MAGBINS,
@@ -254,69 +342,9 @@ def variability_threshold(featuresdir,
                 thisfeatures = pickle.load(infd)
 
             objectid = thisfeatures['objectid']
-
-            # the object magnitude
-            if ('info' in thisfeatures and
-                thisfeatures['info'] and
-                'sdssr' in thisfeatures['info']):
-
-                if (thisfeatures['info']['sdssr'] and
-                    thisfeatures['info']['sdssr'] > 3.0):
-
-                    sdssr = thisfeatures['info']['sdssr']
-
-                elif (magcol in thisfeatures and
-                      thisfeatures[magcol] and
-                      'median' in thisfeatures[magcol] and
-                      thisfeatures[magcol]['median'] > 3.0):
-
-                    sdssr = thisfeatures[magcol]['median']
-
-                elif (thisfeatures['info']['jmag'] and
-                      thisfeatures['info']['hmag'] and
-                      thisfeatures['info']['kmag']):
-
-                    sdssr = jhk_to_sdssr(thisfeatures['info']['jmag'],
-                                         thisfeatures['info']['hmag'],
-                                         thisfeatures['info']['kmag'])
-
-                else:
-                    sdssr = np.nan
-
-            else:
-                sdssr = np.nan
-
-            # the MAD of the light curve
-            if (magcol in thisfeatures and
-                thisfeatures[magcol] and
-                thisfeatures[magcol]['mad']):
-                lcmad = thisfeatures[magcol]['mad']
-            else:
-                lcmad = np.nan
-
-            # stetson index
-            if (magcol in thisfeatures and
-                thisfeatures[magcol] and
-                thisfeatures[magcol]['stetsonj']):
-                stetsonj = thisfeatures[magcol]['stetsonj']
-            else:
-                stetsonj = np.nan
-
-            # IQR
-            if (magcol in thisfeatures and
-                thisfeatures[magcol] and
-                thisfeatures[magcol]['mag_iqr']):
-                iqr = thisfeatures[magcol]['mag_iqr']
-            else:
-                iqr = np.nan
-
-            # eta
-            if (magcol in thisfeatures and
-                thisfeatures[magcol] and
-                thisfeatures[magcol]['eta_normal']):
-                eta = thisfeatures[magcol]['eta_normal']
-            else:
-                eta = np.nan
+            sdssr, lcmad, stetsonj, iqr, eta = _get_varthreshold_features(
+                thisfeatures, magcol
+            )
 
             allobjects[magcol]['objectid'].append(objectid)
             allobjects[magcol]['sdssr'].append(sdssr)
@@ -54,7 +54,13 @@ import matplotlib.pyplot as plt
 ###################
 
 from ..periodbase.zgls import pgen_lsp
-from ..lcfit.sinusoidal import _fourier_func, fourier_fit_magseries
+from ..periodbase.utils import get_frequency_grid
+from ..lcfit.sinusoidal import (
+    _fourier_func,
+    _fourier_linear_design,
+    _fourier_linear_to_ampphase,
+    fourier_fit_magseries
+)
 from ..lcmath import sigclip_magseries, phase_magseries
 
 
@@ -322,6 +328,60 @@ def prewhiten_magseries(times, mags, errs,
     return returndict
 
 
+def _plot_prewhiten_round(nplots, plotind,
+                          periods, lspvals,
+                          times, mags,
+                          bestperiod, epoch,
+                          magsarefluxes):
+    '''This plots one row of the pre-whitening plot made by `gls_prewhiten`.
+
+    The row has the periodogram, the unphased LC, and the LC phased at the best
+    period at the start of round `plotind`.
+
+    '''
+
+    if plotind == 0:
+        whitened = 'before whitening'
+        powerlabel = 'GLS power'
+    else:
+        whitened = 'after whitening'
+        powerlabel = 'LSP power'
+
+    # periodogram
+    plt.subplot(nplots,3,1+plotind*3)
+    plt.plot(periods,lspvals)
+    plt.xlabel('period [days]')
+    plt.ylabel(powerlabel)
+    plt.xscale('log')
+    plt.title('round %s, best period = %.6f' % (plotind, bestperiod))
+
+    # unphased LC
+    plt.subplot(nplots,3,2+plotind*3)
+    plt.plot(times, mags,
+             linestyle='none', marker='o',ms=1.0,rasterized=True)
+    if not magsarefluxes:
+        plt.gca().invert_yaxis()
+        plt.ylabel('magnitude')
+    else:
+        plt.ylabel('flux')
+    plt.xlabel('JD')
+    plt.title('unphased LC %s' % whitened)
+
+    # phased LC
+    plt.subplot(nplots,3,3+plotind*3)
+    phased = phase_magseries(times, mags, bestperiod, epoch)
+
+    plt.plot(phased['phase'], phased['mags'],
+             linestyle='none', marker='o',ms=1.0,rasterized=True)
+    if not magsarefluxes:
+        plt.ylabel('magnitude')
+        plt.gca().invert_yaxis()
+    else:
+        plt.ylabel('flux')
+    plt.xlabel('phase')
+    plt.title('phased LC %s: P = %.6f' % (whitened, bestperiod))
+
+
 def gls_prewhiten(times, mags, errs,
                   fourierorder=3,  # 3rd order series to start with
                   initfparams=None,
@@ -333,13 +393,19 @@ def gls_prewhiten(times, mags, errs,
                   magsarefluxes=False,
                   nbestpeaks=5,
                   nworkers=4,
-                  plotfits=None):
+                  plotfits=None,
+                  method='sequential'):
     '''Iterative pre-whitening of a magnitude series using the L-S periodogram.
 
     This finds the best period, fits a fourier series with the best period, then
     whitens the time series with the best period, and repeats until `nbestpeaks`
     are done.
 
+    If `method` is 'joint', this uses :py:func:`.gls_prewhiten_incremental`
+    instead, which fits all of the periods found so far jointly to the original
+    time-series and updates the periodogram incrementally. This is much faster
+    for light curves with many periods.
+
     Parameters
     ----------
 
@@ -416,6 +482,15 @@ def gls_prewhiten(times, mags, errs,
         contain a row of plots indicating the before/after states of the light
         curves for each round of pre-whitening.
 
+    method : {'sequential','joint'}
+        If 'sequential', each round fits a Fourier series at the best period to
+        the whitened time-series from the previous round, whitens it, and
+        calculates a new periodogram using
+        :py:func:`astrobase.periodbase.zgls.pgen_lsp`. If 'joint', uses
+        :py:func:`.gls_prewhiten_incremental`. The `initfparams` and `nworkers`
+        kwargs are only used for the 'sequential' method, but the Fourier order
+        is taken from `initfparams` if it's provided.
+
     Returns
     -------
 
@@ -426,6 +501,64 @@ def gls_prewhiten(times, mags, errs,
 
     '''
 
+    if method == 'joint':
+
+        if initfparams is not None:
+            fourierorder = len(initfparams)//2
+
+        # the last round's best period is the next period after the last
+        # whitening, so find one more frequency than the number of rounds
+        incremental = gls_prewhiten_incremental(
+            times, mags, errs,
+            nfrequencies=nbestpeaks+1,
+            fourierorder=fourierorder,
+            startp_gls=startp_gls,
+            endp_gls=endp_gls,
+            stepsize=stepsize,
+            autofreq=autofreq,
+            sigclip=sigclip,
+            magsarefluxes=magsarefluxes,
+            keep_rounds=True
+        )
+
+        if incremental is None:
+            LOGERROR('pre-whitening failed')
+            return None
+
+        wperiods = list(incremental['periods'])
+
+        # use the same form of the best periods list as the sequential method
+        bestperiods = []
+        for wperiod, nextperiod in zip(wperiods[:-1], wperiods[1:]):
+            bestperiods.extend((wperiod, nextperiod))
+
+        if plotfits and isinstance(plotfits, str):
+
+            plt.figure(figsize=(20,6*nbestpeaks))
+
+            nplots = len(wperiods)
+            wtimes = incremental['wtimes']
+            gridperiods = 1.0/incremental['gridfrequencies']
+
+            for plotind, (wperiod, wround) in enumerate(
+                    zip(wperiods, incremental['rounds'])
+            ):
+
+                _plot_prewhiten_round(nplots, plotind,
+                                      gridperiods, wround['lspvals'],
+                                      wtimes, wround['mags'],
+                                      wperiod, wtimes.min(),
+                                      magsarefluxes)
+
+            plt.subplots_adjust(hspace=0.2,wspace=0.4)
+            plt.savefig(plotfits, bbox_inches='tight')
+            plt.close('all')
+            return bestperiods, os.path.abspath(plotfits)
+
+        else:
+
+            return bestperiods
+
     stimes, smags, serrs = sigclip_magseries(times, mags, errs,
                                              sigclip=sigclip,
                                              magsarefluxes=magsarefluxes)
@@ -448,40 +581,11 @@ def gls_prewhiten(times, mags, errs,
 
         nplots = nbestpeaks + 1
 
-        # periodogram
-        plt.subplot(nplots,3,1)
-        plt.plot(gls['periods'],gls['lspvals'])
-        plt.xlabel('period [days]')
-        plt.ylabel('GLS power')
-        plt.xscale('log')
-        plt.title('round 0, best period = %.6f' % gls['bestperiod'])
-
-        # unphased LC
-        plt.subplot(nplots,3,2)
-        plt.plot(stimes, smags,
-                 linestyle='none', marker='o',ms=1.0,rasterized=True)
-        if not magsarefluxes:
-            plt.gca().invert_yaxis()
-            plt.ylabel('magnitude')
-        else:
-            plt.ylabel('flux')
-        plt.xlabel('JD')
-        plt.title('unphased LC before whitening')
-
-        # phased LC
-        plt.subplot(nplots,3,3)
-        phased = phase_magseries(stimes, smags,
-                                 gls['bestperiod'], stimes.min())
-
-        plt.plot(phased['phase'], phased['mags'],
-                 linestyle='none', marker='o',ms=1.0,rasterized=True)
-        if not magsarefluxes:
-            plt.ylabel('magnitude')
-            plt.gca().invert_yaxis()
-        else:
-            plt.ylabel('flux')
-        plt.xlabel('phase')
-        plt.title('phased LC before whitening: P = %.6f' % gls['bestperiod'])
+        _plot_prewhiten_round(nplots, 0,
+                              gls['periods'], gls['lspvals'],
+                              stimes, smags,
+                              gls['bestperiod'], stimes.min(),
+                              magsarefluxes)
 
     # set up the initial times, mags, errs, period
     wtimes, wmags, werrs = stimes, smags, serrs
@@ -497,7 +601,8 @@ def gls_prewhiten(times, mags, errs,
                                          fourierorder=fourierorder,
                                          fourierparams=initfparams,
                                          magsarefluxes=magsarefluxes,
-                                         sigclip=sigclip)
+                                         sigclip=sigclip,
+                                         fitmethod='linear')
 
         wffitparams = wfseries['fitinfo']['finalparams']
 
@@ -530,41 +635,11 @@ def gls_prewhiten(times, mags, errs,
         # make plots if requested
         if plotfits and isinstance(plotfits, str):
 
-            # periodogram
-            plt.subplot(nplots,3,4+fitind*3)
-            plt.plot(wgls['periods'],wgls['lspvals'])
-            plt.xlabel('period [days]')
-            plt.ylabel('LSP power')
-            plt.xscale('log')
-            plt.title('round %s, best period = %.6f' % (fitind+1,
-                                                        wgls['bestperiod']))
-
-            # unphased LC
-            plt.subplot(nplots,3,5+fitind*3)
-            plt.plot(wtimes, wmags,
-                     linestyle='none', marker='o',ms=1.0,rasterized=True)
-            if not magsarefluxes:
-                plt.gca().invert_yaxis()
-                plt.ylabel('magnitude')
-            else:
-                plt.ylabel('flux')
-            plt.xlabel('JD')
-            plt.title('unphased LC after whitening')
-
-            # phased LC
-            plt.subplot(nplots,3,6+fitind*3)
-            wphased = phase_magseries(wtimes, wmags,
-                                      wperiod, stimes.min())
-
-            plt.plot(wphased['phase'], wphased['mags'],
-                     linestyle='none', marker='o',ms=1.0,rasterized=True)
-            if not magsarefluxes:
-                plt.ylabel('magnitude')
-                plt.gca().invert_yaxis()
-            else:
-                plt.ylabel('flux')
-            plt.xlabel('phase')
-            plt.title('phased LC after whitening: P = %.6f' % wperiod)
+            _plot_prewhiten_round(nplots, fitind+1,
+                                  wgls['periods'], wgls['lspvals'],
+                                  wtimes, wmags,
+                                  wperiod, stimes.min(),
+                                  magsarefluxes)
 
     # in the end, write out the plot
     if plotfits and isinstance(plotfits, str):
@@ -805,3 +880,436 @@ def mask_signal(times, mags, errs,
             returndict['fitplotfile'] = plotfit
 
     return returndict
+
+
+###################################################
+## INCREMENTAL MULTI-FREQUENCY GLS PREWHITENING ##
+###################################################
+
+def _gls_trig_sums(times, weights, startomega, domega, nomegas, columns,
+                   chunksize=None):
+    '''This calculates weighted trig sums of columns on a uniform omega grid.
+
+    For each angular frequency `omega_j = startomega + j*domega` and each
+    column `x_b` of `columns`, this calculates::
+
+        sum( w_i * x_b,i * exp(1j * omega_j * t_i) )
+
+    The real part is the cosine sum and the imaginary part is the sine
+    sum. Since the grid is uniform, `exp(1j*omega_j*t)` is built up by
+    repeated multiplication with `exp(1j*domega*t)` instead of evaluating the
+    trig functions at every frequency and time. The recurrence is restarted
+    with exact values at the start of every chunk of frequencies so rounding
+    errors don't accumulate, and the sums for each chunk are a single matrix
+    product.
+
+    Parameters
+    ----------
+
+    times,weights : np.array
+        The times and the normalized weights of the observations.
+
+    startomega,domega : float
+        The first angular frequency of the grid and the grid spacing.
+
+    nomegas : int
+        The number of angular frequencies in the grid.
+
+    columns : np.array
+        An array of shape (ntimes, ncolumns) containing the columns to
+        calculate the sums for.
+
+    chunksize : int or None
+        The number of frequencies to do at once. If None, this is chosen so
+        each chunk holds about 2 million complex exponentials.
+
+    Returns
+    -------
+
+    np.array
+        A complex array of shape (nomegas, ncolumns).
+
+    '''
+
+    if chunksize is None:
+        chunksize = max(1, int(2.0e6/times.size))
+
+    weighted_columns = (weights[:,None]*columns).astype(np.complex128)
+    stepfactor = np.exp(1j*domega*times)
+
+    sums = np.empty((nomegas, columns.shape[1]), dtype=np.complex128)
+
+    for chunkstart in range(0, nomegas, chunksize):
+
+        nchunk = min(chunksize, nomegas - chunkstart)
+
+        expfactors = np.empty((nchunk, times.size), dtype=np.complex128)
+        expfactors[0] = np.exp(1j*(startomega + chunkstart*domega)*times)
+        expfactors[1:] = stepfactor
+        np.cumprod(expfactors, axis=0, out=expfactors)
+
+        sums[chunkstart:chunkstart+nchunk] = expfactors.dot(weighted_columns)
+
+    return sums
+
+
+def _gls_power_from_sums(Y, YpY, yexpsums, C, S, CpC, CpS):
+    '''This calculates the generalized Lomb-Scargle power from the trig sums.
+
+    This uses the relations of Zechmeister & Kurster (2009) without the time
+    offset `tau`, which gives the same values as
+    :py:func:`astrobase.periodbase.zgls.generalized_lsp_value_withtau`::
+
+        P(w) = (SS*YC*YC + CC*YS*YS - 2*CS*YC*YS)/(YY*D)
+
+        where: D = CC*SS - CS*CS
+
+    See :py:func:`astrobase.periodbase.zgls.generalized_lsp_value` for the
+    definitions of the other terms.
+
+    '''
+
+    YY = YpY - Y*Y
+    YC = yexpsums.real - Y*C
+    YS = yexpsums.imag - Y*S
+
+    CC = CpC - C*C
+    SS = (1.0 - CpC) - S*S
+    CS = CpS - C*S
+
+    D = CC*SS - CS*CS
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        power = (SS*YC*YC + CC*YS*YS - 2.0*CS*YC*YS)/(YY*D)
+
+    return power
+
+
+def gls_prewhiten_incremental(times, mags, errs,
+                              nfrequencies=10,
+                              fourierorder=2,
+                              startp_gls=None,
+                              endp_gls=None,
+                              stepsize=1.0e-4,
+                              autofreq=True,
+                              sigclip=30.0,
+                              magsarefluxes=False,
+                              minfreqsep=None,
+                              refine_peaks=True,
+                              chunksize=None,
+                              keep_rounds=False,
+                              verbose=True):
+    '''Iterative pre-whitening of a mag series with a joint multi-sinusoid fit.
+
+    This is an engine for pre-whitening light curves with many frequencies,
+    like those of multi-periodic delta Scuti stars. Unlike `gls_prewhiten`,
+    which recalculates a full GLS periodogram, a Fourier fit, and a whitened
+    copy of the time-series for every frequency, this:
+
+    - sigma-clips the time-series and sets up the frequency grid once,
+
+    - calculates the parts of the GLS periodogram that only depend on the
+      times and errors once,
+
+    - fits all of the frequencies found so far jointly with one linear
+      least-squares fit to the original time-series, and keeps a running
+      residual buffer,
+
+    - keeps the periodogram sums for each sinusoid in the fit, so the
+      periodogram of the new residual is just the periodogram sums of the
+      data minus the contributions of the fit sinusoids. Only the sums for
+      the sinusoids of the newly found frequency are calculated in each
+      round.
+
+    The frequencies themselves are found from the periodogram peaks and aren't
+    refined by the fit.
+
+    Parameters
+    ----------
+
+    times,mags,errs : np.array
+        The input mag/flux time-series to iteratively pre-whiten.
+
+    nfrequencies : int
+        The number of frequencies to find and remove.
+
+    fourierorder : int
+        The Fourier order of the series fit at each frequency, in the same
+        convention as
+        :py:func:`astrobase.lcfit.sinusoidal.fourier_fit_magseries`: a series
+        of order X has a constant term and X - 1 harmonics. The constant term
+        is shared by all frequencies. The default of 2 fits a single sinusoid
+        at each frequency.
+
+    startp_gls, endp_gls : float or None
+        These set the minimum and maximum period to search for in the
+        time-series. If None, these are 0.1 and `times.max() - times.min()`.
+
+    stepsize : float
+        The step-size in frequency to use when constructing a frequency grid for
+        the period search if `autofreq` is False.
+
+    autofreq : bool
+        If this is True, the value of `stepsize` will be ignored and the
+        :py:func:`astrobase.periodbase.get_frequency_grid` function will be used
+        to generate a frequency grid based on `startp_gls`, and `endp_gls`.
+
+    sigclip : float or int or sequence of two floats/ints or None
+        If a single float or int, a symmetric sigma-clip will be performed using
+        the number provided as the sigma-multiplier to cut out from the input
+        time-series.
+
+        If a list of two ints/floats is provided, the function will perform an
+        'asymmetric' sigma-clip. The first element in this list is the sigma
+        value to use for fainter flux/mag values; the second element in this
+        list is the sigma value to use for brighter flux/mag values. For
+        example, `sigclip=[10., 3.]`, will sigclip out greater than 10-sigma
+        dimmings and greater than 3-sigma brightenings. Here the meaning of
+        "dimming" and "brightening" is set by *physics* (not the magnitude
+        system), which is why the `magsarefluxes` kwarg must be correctly set.
+
+        If `sigclip` is None, no sigma-clipping will be performed, and the
+        time-series (with non-finite elems removed) will be passed through to
+        the output.
+
+    magsarefluxes : bool
+        If the input measurement values in `mags` and `errs` are in fluxes, set
+        this to True.
+
+    minfreqsep : float or None
+        Frequencies closer than this to a frequency already found won't be
+        picked again. If None, this is the frequency resolution, `1/baseline`.
+
+    refine_peaks : bool
+        If True, the frequency of each periodogram peak is refined by fitting a
+        parabola to the peak and its two neighbors on the frequency grid. The
+        refined frequency is then used in the joint fit. If False, the
+        frequencies are the ones on the grid.
+
+    chunksize : int or None
+        The number of frequencies for which the periodogram sums are
+        calculated at once. If None, this is chosen automatically to limit
+        memory use.
+
+    keep_rounds : bool
+        If True, the periodogram and the whitened mags at the start of each
+        round will be returned in the 'rounds' key of the output dict.
+
+    verbose : bool
+        If True, will indicate progress.
+
+    Returns
+    -------
+
+    dict
+        Returns a dict of the form::
+
+            {'frequencies': the frequencies found in order,
+             'periods': the corresponding periods,
+             'bestlspvals': the periodogram peak value for each frequency in
+                            the round it was found,
+             'fourierparams': list of the amplitudes and phases for each
+                              frequency in the form used by
+                              lcfit.sinusoidal.fourier_fit_magseries, for
+                              phases calculated with epoch = 'fitepoch',
+             'zerolevel': the constant term of the joint fit,
+             'fitcoeffs': the linear coefficients of the joint fit,
+             'fitchisq': the chi-sq of the joint fit,
+             'fitredchisq': the reduced chi-sq of the joint fit,
+             'fitepoch': the epoch used for the phases (min of the times),
+             'gridfrequencies': the frequency grid,
+             'lspvals': the periodogram of the final whitened mag series,
+             'wtimes': times array after pre-whitening,
+             'wmags': mags array after pre-whitening,
+             'werrs': errs array after pre-whitening,
+             'rounds': if keep_rounds is True, a list of dicts with the
+                       periodogram 'lspvals' and the whitened 'mags' at the
+                       start of each round}
+
+        The `wmags` are the residuals of the joint fit plus its constant term.
+
+    '''
+
+    stimes, smags, serrs = sigclip_magseries(times, mags, errs,
+                                             sigclip=sigclip,
+                                             magsarefluxes=magsarefluxes)
+
+    # get rid of zero errs
+    nzind = np.nonzero(serrs)
+    stimes, smags, serrs = stimes[nzind], smags[nzind], serrs[nzind]
+
+    if stimes.size < 10:
+        LOGERROR('not enough points in the time-series to pre-whiten')
+        return None
+
+    # set up the frequency grid the same way as pgen_lsp
+    if startp_gls:
+        endf = 1.0/startp_gls
+    else:
+        endf = 1.0/0.1
+
+    baseline = stimes.max() - stimes.min()
+
+    if endp_gls:
+        startf = 1.0/endp_gls
+    else:
+        startf = 1.0/baseline
+
+    if not autofreq:
+        gridfreqs = np.arange(startf, endf, stepsize)
+    else:
+        gridfreqs = get_frequency_grid(stimes, minfreq=startf, maxfreq=endf)
+
+    if gridfreqs.size < 2:
+        LOGERROR('the frequency grid has fewer than two frequencies')
+        return None
+
+    startomega = 2.0*np.pi*gridfreqs[0]
+    domega = 2.0*np.pi*(gridfreqs[1] - gridfreqs[0])
+    nomegas = gridfreqs.size
+
+    if minfreqsep is None:
+        minfreqsep = 1.0/baseline
+
+    if verbose:
+        LOGINFO('pre-whitening %s frequencies using %s frequency points, '
+                'start P = %.3f, end P = %.3f' %
+                (nfrequencies, nomegas,
+                 1.0/gridfreqs.max(), 1.0/gridfreqs.min()))
+
+    # the periodogram is invariant to a shift in time, so use times relative to
+    # the first observation for numerical stability
+    fitepoch = stimes.min()
+    rtimes = stimes - fitepoch
+
+    weights = 1.0/(serrs*serrs)
+    weights = weights/np.sum(weights)
+
+    # the sums that only depend on the times and errors. the constant column
+    # also starts the design matrix of the joint fit
+    design = np.ones((stimes.size, 1))
+    designsums = _gls_trig_sums(rtimes, weights, startomega, domega, nomegas,
+                                design, chunksize=chunksize)
+    C, S = designsums[:,0].real, designsums[:,0].imag
+
+    # sum(w*cos^2) and sum(w*sin*cos) come from the sums at 2*omega
+    doublesums = _gls_trig_sums(rtimes, weights,
+                                2.0*startomega, 2.0*domega, nomegas,
+                                design, chunksize=chunksize)[:,0]
+    CpC = 0.5*(1.0 + doublesums.real)
+    CpS = 0.5*doublesums.imag
+
+    # the sums of the data
+    datasums = _gls_trig_sums(rtimes, weights, startomega, domega, nomegas,
+                              smags[:,None], chunksize=chunksize)[:,0]
+
+    # the running residual buffer and its periodogram
+    coeffs = np.array([np.sum(weights*smags)])
+    residual = smags - coeffs[0]
+    lspvals = _gls_power_from_sums(
+        np.sum(weights*residual), np.sum(weights*residual*residual),
+        datasums - designsums.dot(coeffs), C, S, CpC, CpS
+    )
+
+    frequencies, bestlspvals, rounds = [], [], []
+    excluded = np.zeros(nomegas, dtype=bool)
+
+    for fitind in range(nfrequencies):
+
+        searchvals = np.where(excluded | ~np.isfinite(lspvals),
+                              -np.inf, lspvals)
+        bestind = np.argmax(searchvals)
+
+        if not np.isfinite(searchvals[bestind]):
+            LOGWARNING('no more periodogram peaks to pre-whiten, '
+                       'stopping after %s frequencies' % fitind)
+            break
+
+        bestfreq = gridfreqs[bestind]
+
+        # refine the peak frequency with a parabola through the peak and its
+        # neighbors since the grid is usually coarser than the frequency errors
+        if refine_peaks and 0 < bestind < nomegas - 1:
+            left, peak, right = lspvals[bestind-1:bestind+2]
+            curvature = left - 2.0*peak + right
+            if curvature < 0.0:
+                bestfreq = bestfreq + (
+                    0.5*(left - right)/curvature *
+                    (gridfreqs[1] - gridfreqs[0])
+                )
+
+        frequencies.append(bestfreq)
+        bestlspvals.append(lspvals[bestind])
+        excluded = excluded | (np.abs(gridfreqs - bestfreq) < minfreqsep)
+
+        if verbose:
+            LOGINFO('round %s: period = %.6f, GLS power = %.5f' %
+                    (fitind + 1, 1.0/bestfreq, lspvals[bestind]))
+
+        # add the sinusoids at this frequency to the design matrix and get
+        # their periodogram sums. this is the only pass over the times that's
+        # needed in each round
+        newcolumns = _fourier_linear_design(rtimes*bestfreq,
+                                            fourierorder)[:,1:]
+        design = np.concatenate((design, newcolumns), axis=1)
+        designsums = np.concatenate(
+            (designsums,
+             _gls_trig_sums(rtimes, weights, startomega, domega, nomegas,
+                            newcolumns, chunksize=chunksize)),
+            axis=1
+        )
+
+        if keep_rounds:
+            rounds.append({'lspvals':lspvals,
+                           'mags':residual + coeffs[0]})
+
+        # fit all of the frequencies found so far jointly
+        coeffs = np.linalg.lstsq(design/serrs[:,None], smags/serrs,
+                                 rcond=None)[0]
+        residual = smags - design.dot(coeffs)
+
+        # the periodogram of the new residual is the data periodogram sums
+        # minus the contributions of all of the fit sinusoids
+        lspvals = _gls_power_from_sums(
+            np.sum(weights*residual), np.sum(weights*residual*residual),
+            datasums - designsums.dot(coeffs), C, S, CpC, CpS
+        )
+
+    frequencies = np.array(frequencies)
+
+    # convert the linear coefficients to the amplitudes and phases of each
+    # frequency. the constant term is shared so its amplitude is 0.0 here
+    ncolumns = 2*fourierorder - 2
+    fourierparams = []
+    for ind in range(frequencies.size):
+        freqcoeffs = np.concatenate(
+            ([0.0], coeffs[1 + ind*ncolumns:1 + (ind + 1)*ncolumns])
+        )
+        ampphase, _ = _fourier_linear_to_ampphase(
+            freqcoeffs[None,:],
+            np.zeros((1, freqcoeffs.size, freqcoeffs.size))
+        )
+        fourierparams.append(ampphase[0])
+
+    fitchisq = np.sum(residual*residual/(serrs*serrs))
+    fitredchisq = fitchisq/(stimes.size - coeffs.size)
+
+    returndict = {'frequencies':frequencies,
+                  'periods':1.0/frequencies,
+                  'bestlspvals':np.array(bestlspvals),
+                  'fourierparams':fourierparams,
+                  'zerolevel':coeffs[0],
+                  'fitcoeffs':coeffs,
+                  'fitchisq':fitchisq,
+                  'fitredchisq':fitredchisq,
+                  'fitepoch':fitepoch,
+                  'gridfrequencies':gridfreqs,
+                  'lspvals':lspvals,
+                  'wtimes':stimes,
+                  'wmags':residual + coeffs[0],
+                  'werrs':serrs}
+
+    if keep_rounds:
+        returndict['rounds'] = rounds
+
+    return returndict
@@ -58,6 +58,7 @@ from astropy.convolution import convolve, Gaussian1DKernel
 from sklearn.ensemble import RandomForestRegressor
 
 from ..lcmath import sigclip_magseries_with_extparams
+from ..lcfit.utils import iterative_fit_masked
 
 
 #########################
@@ -570,6 +571,355 @@ def epd_magseries(times, mags, errs,
         return None
 
 
+#############################################
+## LINEAR EXTERNAL PARAMETER DECORRELATION ##
+#############################################
+
+def _epd_design_matrix(fsv, fdv, fkv, xcc, ycc, bgv, bge, iha, izd):
+    '''
+    This makes the design matrix for the EPD function.
+
+    The columns are in the same order as the coefficients of `_epd_function`,
+    so `np.dot(design, coeffs)` is the same as `_epd_function(coeffs, ...)`.
+
+    '''
+
+    twopix = 2.0*pi_value*xcc
+    twopiy = 2.0*pi_value*ycc
+
+    return np.column_stack((
+        fsv*fsv,
+        fsv,
+        fdv*fdv,
+        fdv,
+        fkv*fkv,
+        fkv,
+        np.ones_like(fsv),
+        fsv*fdv,
+        fsv*fkv,
+        fdv*fkv,
+        np.sin(twopix),
+        np.cos(twopix),
+        np.sin(twopiy),
+        np.cos(twopiy),
+        np.sin(2.0*twopix),
+        np.cos(2.0*twopix),
+        np.sin(2.0*twopiy),
+        np.cos(2.0*twopiy),
+        bgv,
+        bge,
+        iha,
+        izd,
+    ))
+
+
+def _epd_linear_solve(design, targets, weights=None):
+    '''
+    This solves the linear least-squares problem `design . coeffs = targets`.
+
+    `targets` can be a 1D array or a 2D array with one column per series to
+    fit; in the latter case, all columns are solved for with a single call to
+    `numpy.linalg.lstsq` if there are no weights. `weights` (1/err) should have
+    the same shape as `targets` if provided.
+
+    Returns the tuple from `numpy.linalg.lstsq`.
+
+    '''
+
+    if weights is None:
+        return lstsq(design, targets, rcond=None)
+
+    if targets.ndim == 1:
+        return lstsq(design*weights[:,None], targets*weights, rcond=None)
+
+    # weighted fits need their own scaled design matrix for each column
+    fits = [lstsq(design*weights[:,x,None],
+                  targets[:,x]*weights[:,x],
+                  rcond=None) for x in range(targets.shape[1])]
+
+    return (np.column_stack([x[0] for x in fits]),
+            np.concatenate([x[1] for x in fits]),
+            np.array([x[2] for x in fits]),
+            np.column_stack([x[3] for x in fits]))
+
+
+def _epd_linear_fit(design,
+                    targets,
+                    weights=None,
+                    epdfit_sigclip=None,
+                    epdfit_maxiter=5):
+    '''
+    This fits the EPD function to a single series, optionally clipping outliers.
+
+    If `epdfit_sigclip` is not None, points with fit residuals larger than
+    `epdfit_sigclip` x the residual MAD-stdev are dropped and the fit redone,
+    until no more points are dropped or `epdfit_maxiter` fits are done.
+
+    Returns `(coeffs, fitinfo)`, where `fitinfo` is the `lstsq` tuple from the
+    final fit with the final boolean mask of the points used appended.
+
+    '''
+
+    fitmask = np.full(targets.size, True)
+
+    for _ in range(epdfit_maxiter if epdfit_sigclip else 1):
+
+        fitinfo = _epd_linear_solve(
+            design[fitmask],
+            targets[fitmask],
+            weights=weights[fitmask] if weights is not None else None
+        )
+
+        if not epdfit_sigclip:
+            break
+
+        residuals = targets - np.dot(design, fitinfo[0])
+        residual_stdev = npmedian(
+            npabs(residuals[fitmask] - npmedian(residuals[fitmask]))
+        )*1.483
+        newmask = npabs(residuals) < epdfit_sigclip*residual_stdev
+
+        if residual_stdev == 0.0 or np.all(newmask == fitmask):
+            break
+
+        # don't go below the number of points needed for the fit
+        if newmask.sum() <= design.shape[1]:
+            break
+
+        fitmask = newmask
+
+    return fitinfo[0], fitinfo + (fitmask,)
+
+
+def epd_magseries_batch(times, magslist, errslist,
+                        fsv, fdv, fkv, xcc, ycc, bgv, bge, iha, izd,
+                        magsarefluxes=False,
+                        epdsmooth_sigclip=3.0,
+                        epdsmooth_windowsize=21,
+                        epdsmooth_func=smooth_magseries_savgol,
+                        epdsmooth_extraparams=None,
+                        epdfit_weighted=False,
+                        epdfit_sigclip=None,
+                        epdfit_maxiter=5):
+    '''Detrends several mag series sharing external parameters using EPD.
+
+    This does the same thing as :py:func:`.epd_magseries`, but solves for the
+    EPD coefficients directly with linear least-squares (the EPD function is
+    linear in its coefficients) instead of iterating with
+    `scipy.optimize.leastsq`. The EPD design matrix is made only once for all
+    of the mag series in `magslist`. This is useful for e.g. all apertures of
+    a single object, which share the same times and external parameters. All
+    mag series that keep the same points after sigma-clipping are solved for
+    with a single `lstsq` call.
+
+    Parameters
+    ----------
+
+    times : np.array
+        The times shared by all of the mag series.
+
+    magslist,errslist : list of np.arrays
+        The mag/flux series and their errors to detrend. Each element should be
+        the same length as `times`.
+
+    fsv,fdv,fkv,xcc,ycc,bgv,bge,iha,izd : np.array
+        The external parameters, see :py:func:`.epd_magseries`.
+
+    magsarefluxes : bool
+        Set this to True if `mags` actually contains fluxes.
+
+    epdsmooth_sigclip : float or int or sequence of two floats/ints or None
+        This specifies how to sigma-clip the input LCs before fitting the EPD
+        function to them. See :py:func:`.epd_magseries`.
+
+    epdsmooth_windowsize : int
+        This is the number of LC points to smooth over to generate a smoothed
+        light curve that will be used to fit the EPD function.
+
+    epdsmooth_func : Python function
+        This sets the smoothing filter function to use. See
+        :py:func:`.epd_magseries`.
+
+    epdsmooth_extraparams : dict
+        This is a dict of any extra filter params to supply to the smoothing
+        function.
+
+    epdfit_weighted : bool
+        If True, the fit is weighted by 1/err^2 instead of being unweighted
+        like that in :py:func:`.epd_magseries`.
+
+    epdfit_sigclip : float or None
+        If this is not None, points with EPD fit residuals larger than this
+        many times the residual MAD-stdev are removed and the fit is redone, up
+        to `epdfit_maxiter` times.
+
+    epdfit_maxiter : int
+        The maximum number of fits to do if `epdfit_sigclip` is set.
+
+    Returns
+    -------
+
+    list of dicts
+        Returns a dict for each element of `magslist` of the same form as
+        that returned by :py:func:`.epd_magseries`, except that 'fitinfo' is
+        the tuple returned by `numpy.linalg.lstsq` with the boolean mask of the
+        sigma-clipped points used in the fit appended. None is returned in
+        place of the dict for any mag series where the fit failed.
+
+    '''
+
+    # the design matrix for all observations. everything else uses subsets of
+    # its rows
+    design = _epd_design_matrix(fsv, fdv, fkv, xcc, ycc, bgv, bge, iha, izd)
+    obsind = np.arange(times.size)
+
+    fitinputs = []
+
+    for mags, errs in zip(magslist, errslist):
+
+        # get the indices of the observations left after sigma-clipping by
+        # passing them through as an external parameter
+        stimes, smags, serrs, separams = sigclip_magseries_with_extparams(
+            times, mags, errs,
+            [obsind],
+            sigclip=epdsmooth_sigclip,
+            magsarefluxes=magsarefluxes
+        )
+        sind = separams[0]
+
+        # smooth the signal
+        if isinstance(epdsmooth_extraparams, dict):
+            smoothedmags = epdsmooth_func(smags,
+                                          epdsmooth_windowsize,
+                                          **epdsmooth_extraparams)
+        else:
+            smoothedmags = epdsmooth_func(smags, epdsmooth_windowsize)
+
+        fitinputs.append((sind, smoothedmags, serrs))
+
+    # fit the smoothed mags. series with the same sigma-clipped observations
+    # can be solved for together unless they each need their own weights or
+    # outlier clipping
+    fitresults = [None]*len(fitinputs)
+
+    if not epdfit_weighted and not epdfit_sigclip:
+
+        groups = {}
+        for seriesind, (sind, _, _) in enumerate(fitinputs):
+            groups.setdefault(sind.tobytes(), []).append(seriesind)
+
+        for seriesinds in groups.values():
+
+            sind = fitinputs[seriesinds[0]][0]
+
+            try:
+                coeffs, residuals, rank, singulars = _epd_linear_solve(
+                    design[sind],
+                    np.column_stack([fitinputs[x][1] for x in seriesinds])
+                )
+            except Exception:
+                LOGEXCEPTION('EPD linear fit failed')
+                continue
+
+            for colind, seriesind in enumerate(seriesinds):
+                fitresults[seriesind] = (
+                    coeffs[:,colind],
+                    (coeffs[:,colind],
+                     residuals[colind:colind+1],
+                     rank,
+                     singulars,
+                     np.full(sind.size, True))
+                )
+
+    else:
+
+        for seriesind, (sind, smoothedmags, serrs) in enumerate(fitinputs):
+
+            try:
+                fitresults[seriesind] = _epd_linear_fit(
+                    design[sind],
+                    smoothedmags,
+                    weights=1.0/serrs if epdfit_weighted else None,
+                    epdfit_sigclip=epdfit_sigclip,
+                    epdfit_maxiter=epdfit_maxiter
+                )
+            except Exception:
+                LOGEXCEPTION('EPD linear fit failed')
+
+    # apply the fits to get the EPD mags
+    outlist = []
+
+    for mags, errs, fitresult in zip(magslist, errslist, fitresults):
+
+        if fitresult is None or not np.all(np.isfinite(fitresult[0])):
+            LOGERROR('EPD fit did not converge')
+            outlist.append(None)
+            continue
+
+        fitcoeffs, fitinfo = fitresult
+
+        finind = np.isfinite(times) & np.isfinite(mags) & np.isfinite(errs)
+        ftimes, fmags, ferrs = times[finind], mags[finind], errs[finind]
+
+        epdfit = np.dot(design[finind], fitcoeffs)
+        epdmags = npmedian(fmags) + fmags - epdfit
+
+        outlist.append(
+            {'times':ftimes,
+             'mags':epdmags,
+             'errs':ferrs,
+             'fitcoeffs':fitcoeffs,
+             'fitinfo':fitinfo,
+             'fitmags':epdfit,
+             'mags_median':npmedian(epdmags),
+             'mags_mad':npmedian(npabs(epdmags - npmedian(epdmags)))}
+        )
+
+    return outlist
+
+
+def epd_magseries_linear(times, mags, errs,
+                         fsv, fdv, fkv, xcc, ycc, bgv, bge, iha, izd,
+                         magsarefluxes=False,
+                         epdsmooth_sigclip=3.0,
+                         epdsmooth_windowsize=21,
+                         epdsmooth_func=smooth_magseries_savgol,
+                         epdsmooth_extraparams=None,
+                         epdfit_weighted=False,
+                         epdfit_sigclip=None,
+                         epdfit_maxiter=5):
+    '''Detrends a magnitude series using linear least-squares EPD.
+
+    This is a drop-in replacement for :py:func:`.epd_magseries` that solves
+    for the EPD coefficients directly instead of iterating with
+    `scipy.optimize.leastsq`, and optionally weights the fit and clips
+    outliers from it. See :py:func:`.epd_magseries_batch` for details and
+    the kwargs.
+
+    Returns
+    -------
+
+    dict
+        Returns a dict of the same form as :py:func:`.epd_magseries`, except
+        that 'fitinfo' is the tuple from `numpy.linalg.lstsq` plus the mask of
+        points used in the fit. Returns None if the fit fails.
+
+    '''
+
+    return epd_magseries_batch(
+        times, [mags], [errs],
+        fsv, fdv, fkv, xcc, ycc, bgv, bge, iha, izd,
+        magsarefluxes=magsarefluxes,
+        epdsmooth_sigclip=epdsmooth_sigclip,
+        epdsmooth_windowsize=epdsmooth_windowsize,
+        epdsmooth_func=epdsmooth_func,
+        epdsmooth_extraparams=epdsmooth_extraparams,
+        epdfit_weighted=epdfit_weighted,
+        epdfit_sigclip=epdfit_sigclip,
+        epdfit_maxiter=epdfit_maxiter
+    )[0]
+
+
 ########################################
 ## EPD WITH ARBITRARY EXTERNAL PARAMS ##
 ########################################
@@ -589,6 +939,8 @@ def epd_magseries_extparams(
         objective_kwargs=None,
         optimizer_func=least_squares,
         optimizer_kwargs=None,
+        epdfit_iterations=1,
+        epdfit_reject_sigma=3.0,
 ):
     '''This does EPD on a mag-series with arbitrary external parameters.
 
@@ -687,6 +1039,19 @@ def epd_magseries_extparams(
     optimizer_kwargs : dict or None
         A dict of kwargs to pass into the `optimizer_func` function.
 
+    epdfit_iterations : int
+        If this is larger than 1, the EPD fit is repeated up to this many times
+        with :py:func:`astrobase.lcfit.utils.iterative_fit_masked`, rejecting
+        points with fit residuals larger than `epdfit_reject_sigma` x the
+        residual MAD-stdev after each fit. Each fit starts from the coefficients
+        of the previous one, and the fits stop early once no new points are
+        rejected. The `objective_func` must return an array of residuals for
+        this to work.
+
+    epdfit_reject_sigma : float
+        The sigma value used to reject outliers to the EPD fit if
+        `epdfit_iterations` > 1.
+
     Returns
     -------
 
@@ -701,6 +1066,12 @@ def epd_magseries_extparams(
              'mags_median': this is the median of the EPD mags,
              'mags_mad': this is the MAD of EPD mags}
 
+        If `epdfit_iterations` > 1, the dict also has an 'epdfit_iterations'
+        key containing the per iteration diagnostics from
+        :py:func:`astrobase.lcfit.utils.iterative_fit_masked` and an
+        'epdfit_mask' key containing the mask of the sigma-clipped LC points
+        used in the last fit.
+
     '''
 
     # get finite times, mags, errs
@@ -742,12 +1113,32 @@ def epd_magseries_extparams(
     if not optimizer_kwargs:
         optimizer_kwargs = {}
 
-    fit_info = optimizer_func(
-        obj_func,
-        initial_coeffs,
-        args=(stimes, smoothedmags, serrs, *eparams),
-        **optimizer_kwargs
-    )
+    if epdfit_iterations > 1:
+
+        iterfit = iterative_fit_masked(
+            stimes,
+            smoothedmags,
+            initial_coeffs,
+            objective_func,
+            objective_args=(serrs, *eparams),
+            objective_kwargs=objective_kwargs,
+            optimizer_func=optimizer_func,
+            optimizer_kwargs=optimizer_kwargs,
+            fit_iterations=epdfit_iterations,
+            fit_reject_sigma=epdfit_reject_sigma,
+            verbose=False
+        )
+        fit_info = iterfit['fitinfo']
+
+    else:
+
+        iterfit = None
+        fit_info = optimizer_func(
+            obj_func,
+            initial_coeffs,
+            args=(stimes, smoothedmags, serrs, *eparams),
+            **optimizer_kwargs
+        )
 
     if fit_info.success:
 
@@ -767,6 +1158,10 @@ def epd_magseries_extparams(
                    'mags_median':npmedian(epd_mags),
                    'mags_mad':npmedian(npabs(epd_mags - npmedian(epd_mags)))}
 
+        if iterfit is not None:
+            retdict['epdfit_iterations'] = iterfit['iterations']
+            retdict['epdfit_mask'] = iterfit['mask']
+
         return retdict
 
     # if the solution fails, return nothing
@@ -943,3 +1338,428 @@ def rfepd_magseries(times, mags, errs,
                                          npmedian(corrected_fmags)))}
 
     return retdict
+
+
+###################################
+## FIELD-LEVEL RANDOM FOREST EPD ##
+###################################
+
+def _rfepd_field_inputs(times, mags, errs,
+                        externalparam_arrs,
+                        magsarefluxes=False,
+                        epdsmooth=True,
+                        epdsmooth_sigclip=3.0,
+                        epdsmooth_windowsize=21,
+                        epdsmooth_func=smooth_magseries_savgol,
+                        epdsmooth_extraparams=None):
+    '''This gets the training features and targets for a single light curve.
+
+    The target is the smoothed, sigma-clipped light curve relative to its
+    median, so light curves of objects with different brightnesses can be
+    pooled together to train a single regressor. For magnitudes, this is the
+    difference from the median. For fluxes, this is the ratio to the median
+    minus 1.
+
+    '''
+
+    stimes, smags, serrs, eparams = sigclip_magseries_with_extparams(
+        times, mags, errs,
+        externalparam_arrs,
+        sigclip=epdsmooth_sigclip,
+        magsarefluxes=magsarefluxes
+    )
+
+    if smags.size == 0:
+        return None, None
+
+    if epdsmooth:
+        if isinstance(epdsmooth_extraparams, dict):
+            smoothedmags = epdsmooth_func(smags,
+                                          epdsmooth_windowsize,
+                                          **epdsmooth_extraparams)
+        else:
+            smoothedmags = epdsmooth_func(smags,
+                                          epdsmooth_windowsize)
+    else:
+        smoothedmags = smags
+
+    median_mag = npmedian(smags)
+
+    if magsarefluxes:
+        targets = smoothedmags/median_mag - 1.0
+    else:
+        targets = smoothedmags - median_mag
+
+    return np.column_stack(eparams), targets
+
+
+def rfepd_train_field_model(timeslist, magslist, errslist,
+                            externalparam_arrs_list,
+                            magsarefluxes=False,
+                            epdsmooth=True,
+                            epdsmooth_sigclip=3.0,
+                            epdsmooth_windowsize=21,
+                            epdsmooth_func=smooth_magseries_savgol,
+                            epdsmooth_extraparams=None,
+                            rf_subsample=0.2,
+                            rf_maxsamples=500000,
+                            rf_ntrees=300,
+                            rf_extraparams={'oob_score':False,
+                                            'n_jobs':-1},
+                            random_seed=None):
+    '''This trains a single `RandomForestRegressor` on the pooled light curves
+    of many objects in a field to model their shared systematics.
+
+    The systematics in light curves taken on the same frames are mostly driven
+    by the same external parameters (e.g. pointing jitter, background, focus).
+    This trains one random forest mapping the external parameters to the
+    systematics for all of the objects in a field (or a single CCD, etc.),
+    instead of training a random forest for each object like
+    :py:func:`.rfepd_magseries`. Use :py:func:`.rfepd_apply_field_model` to
+    correct light curves with the trained model.
+
+    Each light curve is sigma-clipped and smoothed like in
+    :py:func:`.rfepd_magseries`. The training target is the smoothed light
+    curve relative to its median: the difference from the median for
+    magnitudes and the ratio to the median minus 1 for fluxes. A random
+    `rf_subsample` fraction of the points from each light curve is used for
+    training, and the pooled training set is subsampled further to at most
+    `rf_maxsamples` points.
+
+    Parameters
+    ----------
+
+    timeslist,magslist,errslist : list of np.arrays
+        The input mag/flux time-series of the objects in the field.
+
+    externalparam_arrs_list : list of lists of np.arrays
+        For each object, this is a list of ndarrays of external parameters to
+        decorrelate against. These should all be the same size as the times,
+        mags, errs for that object, and be in the same order for all objects.
+
+    magsarefluxes : bool
+        Set this to True if the elements of `magslist` are actually fluxes.
+
+    epdsmooth : bool
+        If True, sets the training LC for the `RandomForestRegressor` to be a
+        smoothed version of each sigma-clipped light curve.
+
+    epdsmooth_sigclip : float or int or sequence of two floats/ints or None
+        This specifies how to sigma-clip each input LC before smoothing it. See
+        :py:func:`.rfepd_magseries`.
+
+    epdsmooth_windowsize : int
+        This is the number of LC points to smooth over.
+
+    epdsmooth_func : Python function
+        This sets the smoothing filter function to use. See
+        :py:func:`.rfepd_magseries`.
+
+    epdsmooth_extraparams : dict
+        This is a dict of any extra filter params to supply to the smoothing
+        function.
+
+    rf_subsample : float
+        Defines the fraction of the points in each light curve to use for
+        training the random forest regressor.
+
+    rf_maxsamples : int or None
+        The maximum number of pooled points to train on. If None, all of the
+        subsampled points are used.
+
+    rf_ntrees : int
+        This is the number of trees to use for the `RandomForestRegressor`.
+
+    rf_extraparams : dict
+        This is a dict of any extra kwargs to provide to the
+        `RandomForestRegressor` instance used. Set 'n_jobs' in here to control
+        how many cores are used for training and prediction.
+
+    random_seed : int or None
+        The random seed used to pick the training points and for the
+        `RandomForestRegressor`.
+
+    Returns
+    -------
+
+    dict or None
+        Returns a dict of the following form::
+
+            {'regressor': the trained RandomForestRegressor,
+             'feature_importances': the regressor's feature importances,
+             'ntraining': the number of points used for training,
+             'nobjects': the number of light curves used for training,
+             'magsarefluxes': the value of the magsarefluxes kwarg}
+
+        Returns None if none of the light curves had any usable points.
+
+    '''
+
+    rng = npr.RandomState(random_seed)
+
+    training_features, training_targets = [], []
+
+    for times, mags, errs, eparams in zip(timeslist,
+                                          magslist,
+                                          errslist,
+                                          externalparam_arrs_list):
+
+        features, targets = _rfepd_field_inputs(
+            times, mags, errs, eparams,
+            magsarefluxes=magsarefluxes,
+            epdsmooth=epdsmooth,
+            epdsmooth_sigclip=epdsmooth_sigclip,
+            epdsmooth_windowsize=epdsmooth_windowsize,
+            epdsmooth_func=epdsmooth_func,
+            epdsmooth_extraparams=epdsmooth_extraparams
+        )
+
+        if features is None:
+            continue
+
+        if rf_subsample < 1.0:
+            ntrain = max(int(rf_subsample*targets.size), 1)
+            training_indices = rng.choice(targets.size,
+                                          size=ntrain,
+                                          replace=False)
+            features = features[training_indices,:]
+            targets = targets[training_indices]
+
+        training_features.append(features)
+        training_targets.append(targets)
+
+    if len(training_targets) == 0:
+        LOGERROR('no light curves with usable points to train on')
+        return None
+
+    features = np.concatenate(training_features)
+    targets = np.concatenate(training_targets)
+
+    if rf_maxsamples is not None and targets.size > rf_maxsamples:
+        training_indices = rng.choice(targets.size,
+                                      size=rf_maxsamples,
+                                      replace=False)
+        features = features[training_indices,:]
+        targets = targets[training_indices]
+
+    if isinstance(rf_extraparams, dict):
+        RFR = RandomForestRegressor(n_estimators=rf_ntrees,
+                                    random_state=random_seed,
+                                    **rf_extraparams)
+    else:
+        RFR = RandomForestRegressor(n_estimators=rf_ntrees,
+                                    random_state=random_seed)
+
+    RFR.fit(features, targets)
+
+    return {'regressor':RFR,
+            'feature_importances':RFR.feature_importances_,
+            'ntraining':targets.size,
+            'nobjects':len(training_targets),
+            'magsarefluxes':magsarefluxes}
+
+
+def rfepd_apply_field_model(fieldmodel,
+                            timeslist, magslist, errslist,
+                            externalparam_arrs_list):
+    '''This applies a field-level random forest EPD model to many light curves.
+
+    The external parameters for all of the light curves are stacked and the
+    systematics for all of them are predicted with a single `predict` call,
+    which uses all the cores set by the regressor's `n_jobs`.
+
+    Parameters
+    ----------
+
+    fieldmodel : dict
+        The dict returned by :py:func:`.rfepd_train_field_model`.
+
+    timeslist,magslist,errslist : list of np.arrays
+        The input mag/flux time-series to correct.
+
+    externalparam_arrs_list : list of lists of np.arrays
+        For each object, this is a list of ndarrays of external parameters in
+        the same order as those used to train the `fieldmodel`.
+
+    Returns
+    -------
+
+    list of dicts
+        Returns a dict for each light curve with the decorrelated mags of the
+        same form as that returned by :py:func:`.rfepd_magseries`, except that
+        the 'regressor' key is not included, and there's a 'mags_corrections'
+        key with the predicted systematics (relative to the median mag or
+        flux). None is returned in place of the dict for light curves with no
+        finite points.
+
+    '''
+
+    magsarefluxes = fieldmodel['magsarefluxes']
+    RFR = fieldmodel['regressor']
+
+    finite_inputs = []
+    features = []
+
+    for times, mags, errs, eparams in zip(timeslist,
+                                          magslist,
+                                          errslist,
+                                          externalparam_arrs_list):
+
+        finind = np.isfinite(times) & np.isfinite(mags) & np.isfinite(errs)
+        for ep in eparams:
+            finind &= np.isfinite(ep)
+
+        finite_inputs.append((times[finind], mags[finind], errs[finind]))
+        features.append(np.column_stack([ep[finind] for ep in eparams]))
+
+    nfinite = [x[0].size for x in finite_inputs]
+
+    if sum(nfinite) > 0:
+        predicted = RFR.predict(np.concatenate(features))
+        corrections = np.split(predicted, np.cumsum(nfinite)[:-1])
+    else:
+        corrections = [None]*len(finite_inputs)
+
+    outlist = []
+
+    for (ftimes, fmags, ferrs), mags_corrections in zip(finite_inputs,
+                                                        corrections):
+
+        if ftimes.size == 0:
+            outlist.append(None)
+            continue
+
+        if magsarefluxes:
+            corrected_fmags = fmags/(1.0 + mags_corrections)
+        else:
+            corrected_fmags = fmags - mags_corrections
+
+        outlist.append(
+            {'times':ftimes,
+             'mags':corrected_fmags,
+             'errs':ferrs,
+             'mags_corrections':mags_corrections,
+             'feature_importances':fieldmodel['feature_importances'],
+             'mags_median':npmedian(corrected_fmags),
+             'mags_mad':npmedian(npabs(corrected_fmags -
+                                       npmedian(corrected_fmags)))}
+        )
+
+    return outlist
+
+
+def rfepd_field_magseries(timeslist, magslist, errslist,
+                          externalparam_arrs_list,
+                          fieldgroups=None,
+                          magsarefluxes=False,
+                          epdsmooth=True,
+                          epdsmooth_sigclip=3.0,
+                          epdsmooth_windowsize=21,
+                          epdsmooth_func=smooth_magseries_savgol,
+                          epdsmooth_extraparams=None,
+                          rf_subsample=0.2,
+                          rf_maxsamples=500000,
+                          rf_ntrees=300,
+                          rf_extraparams={'oob_score':False,
+                                          'n_jobs':-1},
+                          random_seed=None):
+    '''This does random forest EPD for all light curves in a field with one
+    random forest per field group.
+
+    This trains a model with :py:func:`.rfepd_train_field_model` for each
+    distinct value in `fieldgroups` (e.g. the CCD or camera each object is on)
+    using the light curves in that group, then applies it to those light
+    curves with :py:func:`.rfepd_apply_field_model`. This is much faster than
+    running :py:func:`.rfepd_magseries` for each light curve, since only a few
+    random forests need to be trained.
+
+    Parameters
+    ----------
+
+    timeslist,magslist,errslist : list of np.arrays
+        The input mag/flux time-series of the objects in the field.
+
+    externalparam_arrs_list : list of lists of np.arrays
+        For each object, this is a list of ndarrays of external parameters to
+        decorrelate against, in the same order for all objects.
+
+    fieldgroups : list or np.array or None
+        The group label (e.g. CCD ID) for each light curve. A separate random
+        forest is trained for each group. If None, all light curves are in the
+        same group.
+
+    magsarefluxes,epdsmooth,epdsmooth_sigclip,epdsmooth_windowsize : various
+        See :py:func:`.rfepd_train_field_model`.
+
+    epdsmooth_func,epdsmooth_extraparams : various
+        See :py:func:`.rfepd_train_field_model`.
+
+    rf_subsample,rf_maxsamples,rf_ntrees,rf_extraparams,random_seed : various
+        See :py:func:`.rfepd_train_field_model`.
+
+    Returns
+    -------
+
+    list of dicts
+        Returns a dict for each light curve in the same form as
+        :py:func:`.rfepd_apply_field_model`, with an extra 'fieldgroup' key
+        for the group the light curve was in.
+
+    '''
+
+    if fieldgroups is None:
+        fieldgroups = np.zeros(len(magslist), dtype=np.int64)
+    else:
+        fieldgroups = np.asarray(fieldgroups)
+
+    outlist = [None]*len(magslist)
+
+    for group in np.unique(fieldgroups):
+
+        groupind = np.flatnonzero(fieldgroups == group)
+
+        grouptimes = [timeslist[x] for x in groupind]
+        groupmags = [magslist[x] for x in groupind]
+        grouperrs = [errslist[x] for x in groupind]
+        groupeparams = [externalparam_arrs_list[x] for x in groupind]
+
+        fieldmodel = rfepd_train_field_model(
+            grouptimes, groupmags, grouperrs, groupeparams,
+            magsarefluxes=magsarefluxes,
+            epdsmooth=epdsmooth,
+            epdsmooth_sigclip=epdsmooth_sigclip,
+            epdsmooth_windowsize=epdsmooth_windowsize,
+            epdsmooth_func=epdsmooth_func,
+            epdsmooth_extraparams=epdsmooth_extraparams,
+            rf_subsample=rf_subsample,
+            rf_maxsamples=rf_maxsamples,
+            rf_ntrees=rf_ntrees,
+            rf_extraparams=rf_extraparams,
+            random_seed=random_seed
+        )
+
+        if fieldmodel is None:
+            LOGERROR('could not train a RF EPD model for field group: %s' %
+                     group)
+            continue
+
+        LOGINFO('trained RF EPD model for field group: %s with %s points '
+                'from %s objects' % (group,
+                                     fieldmodel['ntraining'],
+                                     fieldmodel['nobjects']))
+
+        groupresults = rfepd_apply_field_model(fieldmodel,
+                                               grouptimes,
+                                               groupmags,
+                                               grouperrs,
+                                               groupeparams)
+
+        for ind, result in zip(groupind, groupresults):
+            if result is not None:
+                result['fieldgroup'] = group
+            outlist[ind] = result
+
+        # remove the random forest to save RAM
+        del fieldmodel
+
+    return outlist
@@ -69,6 +69,7 @@ def lcfit_features(times, mags, errs, period,
                    sigclip=10.0,
                    magsarefluxes=False,
                    fitfailure_means_featurenan=False,
+                   fourier_fitmethod='curve_fit',
                    verbose=True):
     '''This calculates various features related to fitting models to light
     curves.
@@ -138,6 +139,12 @@ def lcfit_features(times, mags, errs, period,
         `fitfailure_means_featurenan` is True, then the output features for
         these fits will be set to nan.
 
+    fourier_fitmethod : {'curve_fit', 'linear'}
+        The method to use for the Fourier fit. 'linear' uses the fast linear
+        least-squares fit at the fixed `period`. See
+        :py:func:`astrobase.lcfit.sinusoidal.fourier_fit_magseries` for
+        details.
+
     verbose : bool
         If True, will indicate progress while working.
 
@@ -175,6 +182,7 @@ def lcfit_features(times, mags, errs, period,
                                        fourierorder=fourierorder,
                                        sigclip=sigclip,
                                        magsarefluxes=magsarefluxes,
+                                       fitmethod=fourier_fitmethod,
                                        verbose=verbose)
 
     # get the coeffs and redchisq
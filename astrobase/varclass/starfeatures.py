@@ -1160,7 +1160,8 @@ def neighbor_gaia_features(objectinfo,
         of all objects in the same field as this object. It is similar to that
         produced by :py:func:`astrobase.lcproc.catalogs.make_lclist`, and is
         used to carry out the spatial search required to find neighbors for this
-        object.
+        object. A :py:class:`astrobase.coordutils.ZoneIndex` from an mmap light
+        curve catalog can also be used here.
 
     neighbor_radius_arcsec : float
         The maximum radius in arcseconds around this object to search for
@@ -1212,7 +1213,8 @@ def neighbor_gaia_features(objectinfo,
     if ('ra' in objectinfo and 'decl' in objectinfo and
         objectinfo['ra'] is not None and objectinfo['decl'] is not None and
         (isinstance(lclist_kdtree, cKDTree) or
-         isinstance(lclist_kdtree, KDTree))):
+         isinstance(lclist_kdtree, KDTree) or
+         isinstance(lclist_kdtree, coordutils.ZoneIndex))):
 
         ra, decl = objectinfo['ra'], objectinfo['decl']
 
@@ -0,0 +1,373 @@
+'''test_catalogs.py - License: MIT - see the LICENSE file for details.
+
+This tests the following:
+
+- generates a fake light curve catalog with random object positions
+- checks that cone-searches on a `coordutils.ZoneIndex` match those on a
+  `cKDTree`
+- writes the catalog in the mmap format and reads it back in, including
+  columns with None and nan values
+
+'''
+
+import os.path
+import pickle
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from astrobase import coordutils
+from astrobase.lcproc import catalogs
+
+
+############
+## CONFIG ##
+############
+
+NOBJECTS = 5000
+
+
+def make_fake_lclist(nobjects=NOBJECTS, seed=42):
+    '''
+    This makes a fake lclistdict like that produced by `make_lclist`.
+
+    '''
+
+    rng = np.random.RandomState(seed)
+
+    ra = rng.uniform(100.0, 110.0, size=nobjects)
+    decl = rng.uniform(-30.0, -20.0, size=nobjects)
+
+    # put a few objects across the RA = 0.0 wrap and near the pole
+    ra[:50] = rng.uniform(359.95, 360.0, size=50)
+    decl[:50] = rng.uniform(-0.05, 0.05, size=50)
+    decl[50:100] = rng.uniform(89.9, 90.0, size=50)
+
+    objectids = np.array(['OBJ-%07i' % x for x in range(nobjects)])
+    lcfnames = np.array(['/lcs/%s.pkl' % x for x in objectids])
+
+    lclistdict = {
+        'basedir':'/lcs',
+        'lcformat':'fake',
+        'fileglob':'*.pkl',
+        'recursive':True,
+        'columns':('objectid', 'objectinfo.ra', 'objectinfo.decl',
+                   'objectinfo.sdssr'),
+        'makecoordindex':('objectinfo.ra', 'objectinfo.decl'),
+        'nfiles':nobjects,
+        'objects':{
+            'objectid':objectids,
+            'lcfname':lcfnames,
+            'ra':ra,
+            'decl':decl,
+            'sdssr':rng.uniform(8.0, 16.0, size=nobjects),
+        },
+        'kdtree':coordutils.make_kdtree(ra, decl),
+    }
+
+    return lclistdict
+
+
+###########
+## TESTS ##
+###########
+
+def test_zoneindex_matches_kdtree():
+    '''
+    Tests coordutils.ZoneIndex queries against a cKDTree.
+
+    '''
+
+    lclist = make_fake_lclist()
+    ra, decl = lclist['objects']['ra'], lclist['objects']['decl']
+
+    kdt = lclist['kdtree']
+    zoneindex = coordutils.make_zoneindex(ra, decl, zone_height=0.1)
+
+    assert_allclose(zoneindex.data, kdt.data)
+
+    for objind, radius_deg in ((0, 0.02), (75, 0.1), (500, 0.5), (900, 2.0)):
+
+        xyzdist = 2.0*np.sin(np.radians(radius_deg)/2.0)
+        point = kdt.data[objind]
+
+        assert (sorted(zoneindex.query_ball_point(point, xyzdist)) ==
+                sorted(kdt.query_ball_point(point, xyzdist)))
+
+        zdists, zinds = zoneindex.query(point,
+                                        k=5,
+                                        distance_upper_bound=xyzdist)
+        kdists, kinds = kdt.query(point, k=5, distance_upper_bound=xyzdist)
+
+        assert_allclose(zdists, kdists)
+        assert np.all(zinds == kinds)
+
+
+def test_mmap_lclist_roundtrip(tmpdir):
+    '''
+    Tests catalogs.write_mmap_lclist and catalogs.read_lclist.
+
+    '''
+
+    lclist = make_fake_lclist()
+    catdir = os.path.join(str(tmpdir), 'fake-catalog')
+
+    catalogs.write_mmap_lclist(lclist, catdir)
+    mmaplist = catalogs.read_lclist(catdir)
+
+    assert mmaplist['lcformat'] == 'fake'
+    assert isinstance(mmaplist['kdtree'], coordutils.ZoneIndex)
+
+    for col in lclist['objects']:
+        assert isinstance(mmaplist['objects'][col], np.memmap)
+        assert np.all(mmaplist['objects'][col] == lclist['objects'][col])
+
+    # the zone index should pickle as a reference to its directory
+    zoneindex = mmaplist['kdtree']
+    assert len(pickle.dumps(zoneindex)) < 1000
+
+    unpickled = pickle.loads(pickle.dumps(zoneindex))
+    assert_allclose(unpickled.data, lclist['kdtree'].data)
+
+
+def test_mmap_lclist_missing_values(tmpdir):
+    '''
+    Tests that None and nan values in object columns survive the mmap format.
+
+    '''
+
+    lclist = make_fake_lclist(nobjects=200)
+    lclist['objects']['vartag'] = np.array(
+        ['rrlyr', None, 'ecl', np.nan, 'None', 'nan']*40, dtype=object
+    )
+    lclist['objects']['period'] = np.array(
+        [1.5, None, np.nan, 2, 3.25, None]*40, dtype=object
+    )
+
+    catdir = os.path.join(str(tmpdir), 'fake-catalog')
+    catalogs.write_mmap_lclist(lclist, catdir)
+    mmaplist = catalogs.read_lclist(catdir)
+
+    assert sorted(mmaplist['missingcols']) == ['period', 'vartag']
+
+    vartag = mmaplist['objects']['vartag']
+    assert vartag[1] is None
+    assert np.isnan(vartag[3])
+    assert list(vartag[[0, 2, 4, 5]]) == ['rrlyr', 'ecl', 'None', 'nan']
+
+    period = mmaplist['objects']['period']
+    assert period[1] is None and period[5] is None
+    assert np.isnan(period[2])
+    assert_allclose(period[[0, 3, 4]].astype(float), [1.5, 2.0, 3.25])
+
+    # the other columns are still memory-mapped
+    assert isinstance(mmaplist['objects']['sdssr'], np.memmap)
+
+    # rewriting a column without missing values removes its mask
+    lclist['objects']['period'] = np.arange(200.0)
+    lclist['missingcols'] = mmaplist['missingcols']
+    catalogs.write_mmap_lclist(lclist, catdir, objectcols=['period'])
+    mmaplist = catalogs.read_lclist(catdir)
+
+    assert mmaplist['missingcols'] == ['vartag']
+    assert isinstance(mmaplist['objects']['period'], np.memmap)
+    assert mmaplist['objects']['vartag'][1] is None
+
+
+def test_filter_lclist_indices(tmpdir):
+    '''
+    Tests catalogs.filter_lclist_indices and catalogs.filter_lclist.
+
+    '''
+
+    lclist = make_fake_lclist()
+    objects = lclist['objects']
+
+    catdir = os.path.join(str(tmpdir), 'fake-catalog')
+    catalogs.write_mmap_lclist(lclist, catdir)
+    catpkl = os.path.join(str(tmpdir), 'fake-catalog.pkl')
+    with open(catpkl, 'wb') as outfd:
+        pickle.dump(lclist, outfd)
+
+    conesearch = [105.0, -25.0, 1.0]
+    columnfilters = ['sdssr|lt|12.0', 'sdssr|ge|9']
+
+    # brute-force version of the selection
+    dist = coordutils.great_circle_dist(objects['ra'], objects['decl'],
+                                        105.0, -25.0)
+    expected = np.flatnonzero((dist <= 3600.0) &
+                              (objects['sdssr'] < 12.0) &
+                              (objects['sdssr'] >= 9.0))
+
+    compiled = catalogs.compile_lclist_filters(columnfilters)
+    assert len(compiled) == 2
+
+    for cat in (catpkl, catdir):
+
+        loaded = catalogs.read_lclist(cat)
+        indices, extmatches = catalogs.filter_lclist_indices(
+            loaded,
+            conesearch=conesearch,
+            columnfilters=compiled
+        )
+        assert np.all(indices == expected)
+        assert extmatches == []
+
+        lcfnames, objectids = catalogs.filter_lclist(
+            cat,
+            conesearch=conesearch,
+            columnfilters=columnfilters
+        )
+        assert np.all(objectids == objects['objectid'][expected])
+        assert np.all(lcfnames == objects['lcfname'][expected])
+
+    # string-valued filters
+    indices, _ = catalogs.filter_lclist_indices(
+        lclist,
+        columnfilters=["objectid|eq|'OBJ-0000042'"]
+    )
+    assert np.all(indices == np.array([42]))
+
+
+def test_filter_lclist_bad_filters(tmpdir):
+    '''
+    Tests that broken column filters and empty cone-searches are handled.
+
+    '''
+
+    lclist = make_fake_lclist()
+    objects = lclist['objects']
+
+    catdir = os.path.join(str(tmpdir), 'fake-catalog')
+    catalogs.write_mmap_lclist(lclist, catdir)
+    loaded = catalogs.read_lclist(catdir)
+
+    expected = np.flatnonzero(objects['sdssr'] < 12.0)
+
+    # a missing column and a string operand for a float column are skipped
+    indices, _ = catalogs.filter_lclist_indices(
+        loaded,
+        columnfilters=['nosuchcol|lt|12.0',
+                       "sdssr|lt|'bright'",
+                       'sdssr|lt|12.0']
+    )
+    assert np.all(indices == expected)
+
+    # the cone-search is checked before the column filters are applied and
+    # the failure return value has the same length as the success one
+    emptycone = catalogs.filter_lclist(
+        catdir,
+        conesearch=[200.0, 45.0, 0.5],
+        columnfilters=['sdssr|lt|12.0']
+    )
+    assert emptycone == (None, None)
+
+    lcfnames, objectids = catalogs.filter_lclist(
+        catdir,
+        columnfilters=['nosuchcol|lt|12.0', 'sdssr|lt|12.0']
+    )
+    assert np.all(objectids == objects['objectid'][expected])
+
+
+def test_add_cpinfo_to_mmap_lclist(tmpdir):
+    '''
+    Tests catalogs.add_cpinfo_to_lclist with a checkplot key index.
+
+    '''
+
+    lclist = make_fake_lclist(nobjects=200)
+    objectids = lclist['objects']['objectid']
+
+    catdir = os.path.join(str(tmpdir), 'fake-catalog')
+    catalogs.write_mmap_lclist(lclist, catdir)
+    catpkl = os.path.join(str(tmpdir), 'fake-catalog.pkl')
+    with open(catpkl, 'wb') as outfd:
+        pickle.dump(lclist, outfd)
+
+    # make fake checkplots for every other object
+    cpdir = os.path.join(str(tmpdir), 'checkplots')
+    os.makedirs(cpdir)
+
+    for objind in range(0, objectids.size, 2):
+        cpd = {'objectid':str(objectids[objind]),
+               'objectinfo':{'sdssr':float(objind),
+                             'objecttags':'tag-%s' % objind},
+               'varinfo':{'features':{'stetsonj':objind*0.5}}}
+        with open(os.path.join(cpdir,
+                               'checkplot-%s.pkl' % objectids[objind]),
+                  'wb') as outfd:
+            pickle.dump(cpd, outfd)
+
+    infokeys = [
+        ('objectinfo.objecttags', np.str_, True, True, '', ''),
+        ('objectinfo.sdssr', np.float64, True, True, np.nan, np.nan),
+        ('varinfo.features.stetsonj', np.float64, False, True,
+         np.nan, np.nan),
+    ]
+
+    keyindex = os.path.join(str(tmpdir), 'cpkeyindex.json')
+
+    outpkl = catalogs.add_cpinfo_to_lclist(
+        cpdir, catpkl, 'aep_000',
+        os.path.join(str(tmpdir), 'augmented.pkl'),
+        infokeys=infokeys,
+        nworkers=2
+    )
+    outdir = catalogs.add_cpinfo_to_lclist(
+        cpdir, catdir, 'aep_000',
+        os.path.join(str(tmpdir), 'augmented-catalog'),
+        infokeys=infokeys,
+        nworkers=2,
+        cpkeyindex=keyindex
+    )
+    assert os.path.exists(keyindex)
+
+    pklcat = catalogs.read_lclist(outpkl)
+    mmapcat = catalogs.read_lclist(outdir)
+
+    for col in ('objecttags', 'sdssr', 'aep_000.stetsonj'):
+        assert np.all(pklcat['objects'][col].astype(str) ==
+                      mmapcat['objects'][col].astype(str))
+
+    assert_allclose(mmapcat['objects']['sdssr'][::2],
+                    np.arange(0, objectids.size, 2))
+    assert np.all(np.isnan(mmapcat['objects']['sdssr'][1::2]))
+    assert mmapcat['magcols'] == ['aep_000']
+
+    # the original columns are still there, and are hardlinks to the input
+    # catalog's files
+    assert np.all(mmapcat['objects']['objectid'] == objectids)
+    assert os.path.samefile(os.path.join(catdir, 'objects', 'objectid.npy'),
+                            os.path.join(outdir, 'objects', 'objectid.npy'))
+
+    # a second run should come entirely from the key index
+    outdir2 = catalogs.add_cpinfo_to_lclist(
+        cpdir, outdir, 'aep_001', outdir,
+        infokeys=infokeys,
+        nworkers=2,
+        cpkeyindex=keyindex
+    )
+    mmapcat = catalogs.read_lclist(outdir2)
+    assert mmapcat['magcols'] == ['aep_000', 'aep_001']
+    assert_allclose(mmapcat['objects']['aep_001.stetsonj'][::2],
+                    np.arange(0, objectids.size, 2)*0.5)
+
+    # the input catalog isn't changed through the hardlinks
+    incat = catalogs.read_lclist(catdir)
+    assert sorted(incat['objects'].keys()) == sorted(lclist['objects'].keys())
+    assert incat['columns'] == list(lclist['columns'])
+
+    # re-running into an existing output catalog replaces it
+    outdir3 = catalogs.add_cpinfo_to_lclist(
+        cpdir, catdir, 'aep_000',
+        os.path.join(str(tmpdir), 'augmented-catalog'),
+        infokeys=infokeys,
+        nworkers=2,
+        cpkeyindex=keyindex
+    )
+    mmapcat = catalogs.read_lclist(outdir3)
+    assert outdir3 == outdir
+    assert mmapcat['magcols'] == ['aep_000']
+    assert 'aep_001.stetsonj' not in mmapcat['objects']
+    assert_allclose(mmapcat['objects']['sdssr'][::2],
+                    np.arange(0, objectids.size, 2))
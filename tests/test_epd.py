@@ -0,0 +1,455 @@
+'''test_epd.py - License: MIT - see the LICENSE file for details.
+
+This tests the following:
+
+- generates a fake light curve with trends driven by HAT-like external
+  parameters
+- checks that the linear least-squares EPD in varbase.trends gives the same
+  results as the scipy.optimize.leastsq EPD, both for single and batched mag
+  series
+- checks the weighted and outlier-clipped linear EPD fits
+- checks the masked iterative fitter in lcfit.utils and the iterative
+  external parameter EPD fit that uses it
+- runs the field-level random forest EPD for light curves sharing systematics
+- runs lcproc.epd.parallel_epd_lclist with both EPD fit methods
+
+NOTE: the benchmark test in this module is only run if the environmental
+variable RUN_LONG_TESTS=1 is set before running pytest, like so:
+``RUN_LONG_TESTS=1 pytest -s test_epd.py``.
+
+'''
+
+import os
+import os.path
+import pickle
+import time
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from scipy.optimize import minimize
+
+from astrobase.varbase import trends
+from astrobase.lcfit.utils import iterative_fit, iterative_fit_masked
+from astrobase.lcproc import register_lcformat, _read_pklc
+from astrobase.lcproc import epd as lcproc_epd
+
+
+############
+## CONFIG ##
+############
+
+NPOINTS = 3000
+
+
+def make_fake_epd_lc(npoints=NPOINTS, naps=3, seed=42):
+    '''
+    This makes a fake LC with several apertures and its external parameters.
+
+    '''
+
+    rng = np.random.RandomState(seed)
+
+    times = np.sort(rng.uniform(0.0, 30.0, size=npoints))
+
+    # the external parameters vary smoothly over each night
+    phase = 2.0*np.pi*times
+
+    extparams = {
+        'fsv':5.0 + 0.3*np.sin(phase) + rng.normal(0.0, 0.01, size=npoints),
+        'fdv':0.1*np.cos(phase) + rng.normal(0.0, 0.005, size=npoints),
+        'fkv':0.1*np.sin(0.5*phase) + rng.normal(0.0, 0.005, size=npoints),
+        'xcc':1024.0 + 0.8*np.sin(phase/3.1),
+        'ycc':1024.0 + 0.8*np.cos(phase/2.3),
+        'bgv':100.0 + 10.0*np.sin(phase + 1.0),
+        'bge':1.0 + 0.1*np.cos(phase + 0.5),
+        'iha':3.0*np.sin(phase),
+        'izd':35.0 + 20.0*np.cos(phase),
+    }
+    epvals = [extparams[x] for x in ('fsv','fdv','fkv','xcc','ycc',
+                                     'bgv','bge','iha','izd')]
+
+    magslist, errslist = [], []
+
+    for ap in range(naps):
+
+        coeffs = rng.normal(0.0, 0.01, size=22)
+        trend = trends._epd_function(coeffs, *epvals)
+
+        mags = (12.0 + ap*0.1 + trend +
+                rng.normal(0.0, 0.005*(ap + 1), size=npoints))
+        errs = np.full(npoints, 0.005*(ap + 1))
+
+        magslist.append(mags)
+        errslist.append(errs)
+
+    # a few bad points in the first aperture
+    magslist[0][::97] = np.nan
+
+    return times, magslist, errslist, epvals
+
+
+###########
+## TESTS ##
+###########
+
+def test_epd_linear_matches_leastsq():
+    '''
+    Tests trends.epd_magseries_linear and epd_magseries_batch against
+    trends.epd_magseries.
+
+    '''
+
+    times, magslist, errslist, epvals = make_fake_epd_lc()
+
+    batched = trends.epd_magseries_batch(times, magslist, errslist, *epvals)
+    assert len(batched) == len(magslist)
+
+    for mags, errs, batch_epd in zip(magslist, errslist, batched):
+
+        leastsq_epd = trends.epd_magseries(times, mags, errs, *epvals)
+        linear_epd = trends.epd_magseries_linear(times, mags, errs, *epvals)
+
+        assert sorted(linear_epd.keys()) == sorted(leastsq_epd.keys())
+
+        for epd in (linear_epd, batch_epd):
+            assert_allclose(epd['times'], leastsq_epd['times'])
+            assert_allclose(epd['errs'], leastsq_epd['errs'])
+            assert_allclose(epd['fitmags'], leastsq_epd['fitmags'],
+                            atol=1.0e-6)
+            assert_allclose(epd['mags'], leastsq_epd['mags'], atol=1.0e-6)
+            assert_allclose(epd['mags_mad'], leastsq_epd['mags_mad'],
+                            rtol=1.0e-4)
+
+        # the EPD should take out most of the trends
+        assert linear_epd['mags_mad'] < 1.5*np.median(errs)
+
+
+def test_epd_linear_weighted_and_clipped():
+    '''
+    Tests the weighted and outlier-clipped versions of the linear EPD.
+
+    '''
+
+    times, magslist, errslist, epvals = make_fake_epd_lc(naps=1)
+    mags, errs = magslist[0], errslist[0]
+
+    # the weighted fit with equal errors is the same as the unweighted one
+    unweighted = trends.epd_magseries_linear(times, mags, errs, *epvals)
+    weighted = trends.epd_magseries_linear(times, mags, errs, *epvals,
+                                           epdfit_weighted=True)
+    assert_allclose(weighted['fitmags'], unweighted['fitmags'], atol=1.0e-8)
+
+    # add some outliers to the smoothed LC that get past the initial sigclip
+    # and check that the clipped fit ignores them
+    badmags = mags.copy()
+    badmags[200:230] += 0.05
+
+    clipped = trends.epd_magseries_linear(times, badmags, errs, *epvals,
+                                          epdsmooth_sigclip=None,
+                                          epdsmooth_windowsize=5,
+                                          epdfit_sigclip=3.0)
+    notclipped = trends.epd_magseries_linear(times, badmags, errs, *epvals,
+                                             epdsmooth_sigclip=None,
+                                             epdsmooth_windowsize=5)
+    clean = trends.epd_magseries_linear(times, mags, errs, *epvals,
+                                        epdsmooth_sigclip=None,
+                                        epdsmooth_windowsize=5)
+    fitmask = clipped['fitinfo'][-1]
+
+    assert not np.all(fitmask)
+    assert np.all(~fitmask[205:225])
+    assert (np.std(clipped['fitmags'] - clean['fitmags']) <
+            np.std(notclipped['fitmags'] - clean['fitmags']))
+
+
+def _line_residuals(coeffs, x, y, errs):
+    '''
+    This is the objective function for the iterative fit tests.
+
+    '''
+    return (y - coeffs[0] - coeffs[1]*x)/errs
+
+
+def _line_chisq(coeffs, x, y, errs):
+    '''
+    This is the scalar objective function for the iterative fit tests.
+
+    '''
+    return np.sum(_line_residuals(coeffs, x, y, errs)**2)
+
+
+def test_iterative_fit_masked():
+    '''
+    Tests lcfit.utils.iterative_fit_masked and iterative_fit.
+
+    '''
+
+    rng = np.random.RandomState(42)
+    x = np.linspace(0.0, 10.0, 2000)
+    errs = np.full(x.size, 0.1)
+    y = 1.5 + 0.3*x + rng.normal(0.0, 0.1, x.size)
+
+    outliers = np.zeros(x.size, dtype=np.bool_)
+    outliers[::50] = True
+    y[outliers] += rng.uniform(1.0, 3.0, outliers.sum())
+    yinput = y.copy()
+
+    fit = iterative_fit_masked(x, y, [1.0, 0.0], _line_residuals,
+                               objective_args=(errs,),
+                               fit_iterations=10,
+                               verbose=False)
+
+    # the inputs aren't changed, the outliers are clipped, and the fits stop
+    # once nothing new is clipped
+    assert_allclose(y, yinput)
+    assert np.all(~fit['mask'][outliers])
+    assert fit['converged']
+    assert fit['niterations'] < 10
+    assert fit['iterations'][-1]['nrejected'] == 0
+    assert (sum(x['nrejected'] for x in fit['iterations']) ==
+            (~fit['mask']).sum())
+    assert all(x['time'] >= 0.0 for x in fit['iterations'])
+
+    # the warm-started later iterations hardly move the coefficients
+    assert fit['iterations'][-1]['coeffs_change'] < 1.0e-3
+
+    # the final fit is the same as a fit to the unmasked points only
+    expected = np.polyfit(x[fit['mask']], y[fit['mask']], 1)[::-1]
+    assert_allclose(fit['coeffs'], expected, rtol=1.0e-6)
+    assert_allclose(fit['coeffs'], [1.5, 0.3], atol=0.02)
+
+    # the scalar objective version with scipy.optimize.minimize gets the same
+    # clip mask
+    scalarfit = iterative_fit_masked(
+        x, y, [1.0, 0.0], _line_chisq,
+        objective_args=(errs,),
+        optimizer_func=minimize,
+        optimizer_needs_scalar=True,
+        objective_residualarr_func=_line_residuals,
+        fit_iterations=10,
+        verbose=False
+    )
+    assert np.all(scalarfit['mask'] == fit['mask'])
+    assert_allclose(scalarfit['coeffs'], fit['coeffs'], rtol=1.0e-4)
+
+    # the old interface
+    coeffs, fitinfo = iterative_fit(x, y, [1.0, 0.0], _line_residuals,
+                                    objective_args=(errs,),
+                                    fit_iterations=10,
+                                    verbose=False,
+                                    full_output=True)
+    assert_allclose(coeffs, fit['coeffs'])
+    assert fitinfo.success
+
+
+def test_epd_extparams_iterative():
+    '''
+    Tests trends.epd_magseries_extparams with iterative outlier rejection.
+
+    '''
+
+    times, magslist, errslist, epvals = make_fake_epd_lc(naps=1)
+    mags, errs = magslist[0], errslist[0]
+    finind = np.isfinite(mags)
+    times, mags, errs = times[finind], mags[finind], errs[finind]
+    epvals = [x[finind] for x in epvals]
+
+    badmags = mags.copy()
+    badmags[200:230] += 0.05
+
+    kwargs = {'epdsmooth_sigclip':None,
+              'epdsmooth_windowsize':5}
+    initcoeffs = np.zeros(22)
+
+    clean = trends.epd_magseries_extparams(times, mags, errs, epvals,
+                                           initcoeffs, **kwargs)
+    notclipped = trends.epd_magseries_extparams(times, badmags, errs, epvals,
+                                                initcoeffs, **kwargs)
+    clipped = trends.epd_magseries_extparams(times, badmags, errs, epvals,
+                                             initcoeffs,
+                                             epdfit_iterations=5,
+                                             **kwargs)
+
+    assert 'epdfit_iterations' not in notclipped
+    assert len(clipped['epdfit_iterations']) <= 5
+    assert clipped['epdfit_iterations'][-1]['nrejected'] == 0
+    assert np.all(~clipped['epdfit_mask'][205:225])
+    assert clipped['fitinfo'].cost < clean['fitinfo'].cost
+    assert clipped['mags'].size == notclipped['mags'].size
+
+
+def make_fake_rfepd_field(nobjects=12, npoints=1500, seed=42):
+    '''
+    This makes fake LCs for objects on two CCDs with shared systematics.
+
+    '''
+
+    rng = np.random.RandomState(seed)
+    times = np.linspace(0.0, 20.0, npoints)
+
+    timeslist, magslist, errslist, eparamslist, ccds = [], [], [], [], []
+
+    for ccd in range(2):
+
+        # the pointing jitter and background are the same for all objects on
+        # the CCD, and the systematics are a non-linear function of these
+        xjitter = 0.5*np.sin(2.0*np.pi*times/1.3) + rng.normal(0.0, 0.05,
+                                                               npoints)
+        yjitter = 0.5*np.cos(2.0*np.pi*times/2.9) + rng.normal(0.0, 0.05,
+                                                               npoints)
+        background = 100.0 + 20.0*np.sin(2.0*np.pi*times/5.1)
+
+        systematics = (0.02*np.tanh(3.0*xjitter*yjitter) +
+                       0.0005*(background - 100.0) +
+                       0.01*(ccd + 1)*xjitter**2)
+
+        for obj in range(nobjects//2):
+
+            mags = (10.0 + rng.uniform(0.0, 4.0) + systematics +
+                    rng.normal(0.0, 0.002, npoints))
+            errs = np.full(npoints, 0.002)
+
+            timeslist.append(times)
+            magslist.append(mags)
+            errslist.append(errs)
+            eparamslist.append([xjitter, yjitter, background])
+            ccds.append(ccd)
+
+    return timeslist, magslist, errslist, eparamslist, ccds
+
+
+def test_rfepd_field_magseries():
+    '''
+    Tests trends.rfepd_field_magseries and the field-level RF EPD functions.
+
+    '''
+
+    timeslist, magslist, errslist, eparamslist, ccds = make_fake_rfepd_field()
+
+    rfepd = trends.rfepd_field_magseries(timeslist, magslist, errslist,
+                                         eparamslist,
+                                         fieldgroups=ccds,
+                                         rf_ntrees=50,
+                                         rf_extraparams={'n_jobs':2},
+                                         random_seed=42)
+    assert len(rfepd) == len(magslist)
+
+    for mags, ccd, epd in zip(magslist, ccds, rfepd):
+
+        assert epd['fieldgroup'] == ccd
+        assert epd['mags'].size == mags.size
+
+        # the systematics are mostly removed and the median is kept
+        rawmad = np.median(np.abs(mags - np.median(mags)))
+        assert epd['mags_mad'] < 0.25*rawmad
+        assert_allclose(epd['mags_median'], np.median(mags), atol=0.005)
+
+    # the same model works for fluxes
+    fluxeslist = [10.0**(-0.4*(x - 12.0)) for x in magslist]
+    ferrslist = [0.002*x for x in fluxeslist]
+
+    fluxmodel = trends.rfepd_train_field_model(
+        timeslist[:6], fluxeslist[:6], ferrslist[:6], eparamslist[:6],
+        magsarefluxes=True,
+        rf_ntrees=50,
+        random_seed=42
+    )
+    assert fluxmodel['nobjects'] == 6
+    assert fluxmodel['ntraining'] <= 6*0.2*timeslist[0].size
+
+    fluxepd = trends.rfepd_apply_field_model(fluxmodel,
+                                             timeslist[:6],
+                                             fluxeslist[:6],
+                                             ferrslist[:6],
+                                             eparamslist[:6])
+
+    for fluxes, epd in zip(fluxeslist, fluxepd):
+        rawmad = np.median(np.abs(fluxes - np.median(fluxes)))
+        assert epd['mags_mad'] < 0.25*rawmad
+
+
+def test_parallel_epd_lclist_methods(tmpdir):
+    '''
+    Tests lcproc.epd.parallel_epd_lclist with the leastsq and linear fits.
+
+    '''
+
+    outdir = str(tmpdir)
+    formatdir = os.path.join(outdir, 'lcformats')
+    register_lcformat('fake-epd-pkl', 'fake-*.pkl',
+                      ['rjd', 'rjd'], ['ap1', 'ap2'], ['err1', 'err2'],
+                      'astrobase.lcproc', '_read_pklc',
+                      lcformat_dir=formatdir)
+
+    lcfiles = []
+    for seed in range(3):
+        times, magslist, errslist, epvals = make_fake_epd_lc(naps=2,
+                                                             seed=seed)
+        lcdict = {'objectid':'FAKE-%s' % seed,
+                  'rjd':times,
+                  'ap1':magslist[0],
+                  'ap2':magslist[1],
+                  'err1':errslist[0],
+                  'err2':errslist[1]}
+        lcdict.update(zip(lcproc_epd.EPD_EXTERNALPARAMS, epvals))
+
+        lcf = os.path.join(outdir, 'fake-%s.pkl' % seed)
+        with open(lcf,'wb') as outfd:
+            pickle.dump(lcdict, outfd)
+        lcfiles.append(lcf)
+
+    results = {}
+    for method in ('leastsq', 'linear'):
+        results[method] = lcproc_epd.parallel_epd_lclist(
+            lcfiles, None,
+            lcformat='fake-epd-pkl',
+            lcformatdir=formatdir,
+            epdfit_method=method,
+            nworkers=2
+        )
+        # read these now since both methods write to the same files
+        results[method] = {
+            m:[_read_pklc(x)['epd'] for x in results[method][m]]
+            for m in ('ap1', 'ap2')
+        }
+
+    for m in ('ap1', 'ap2'):
+        for leastsq_epd, linear_epd in zip(results['leastsq'][m],
+                                           results['linear'][m]):
+            assert_allclose(linear_epd['mags'], leastsq_epd['mags'],
+                            atol=1.0e-6)
+
+
+if os.environ.get('RUN_LONG_TESTS'):
+
+    def test_epd_linear_benchmark():
+        '''
+        Compares the run time of the linear and scipy.optimize.leastsq EPD.
+
+        '''
+
+        times, magslist, errslist, epvals = make_fake_epd_lc(npoints=20000,
+                                                             naps=3)
+
+        start = time.time()
+        for mags, errs in zip(magslist, errslist):
+            trends.epd_magseries(times, mags, errs, *epvals)
+        leastsq_time = time.time() - start
+
+        start = time.time()
+        for mags, errs in zip(magslist, errslist):
+            trends.epd_magseries_linear(times, mags, errs, *epvals)
+        linear_time = time.time() - start
+
+        start = time.time()
+        trends.epd_magseries_batch(times, magslist, errslist, *epvals)
+        batch_time = time.time() - start
+
+        print('EPD for %s apertures x %s points: leastsq = %.3f s, '
+              'linear = %.3f s, linear batch = %.3f s' %
+              (len(magslist), times.size,
+               leastsq_time, linear_time, batch_time))
+
+        assert linear_time < leastsq_time
+        assert batch_time < leastsq_time
@@ -0,0 +1,514 @@
+'''test_fakelcs.py - License: MIT - see the LICENSE file for details.
+
+This tests the following:
+
+- writes a fake simulation directory with variability features for fake
+  variable and non-variable objects
+- checks the vectorized variability index grid search in fakelcs.recovery
+  against fakelcs.recovery.get_recovered_variables_for_magbin
+- checks the batch variability models in fakelcs.generation against the
+  lcmodels functions
+- checks that seeded fake LC collections and batch variability are the same
+  for any number of workers and batch size
+- checks the vectorized fakelcs.recovery.check_periodrec_alias_array against
+  fakelcs.recovery.check_periodrec_alias
+- runs the streaming injection-recovery in fakelcs.recovery, resumes it from
+  its checkpoint, and checks it against the on-disk recovery stages
+
+'''
+
+import os
+import os.path
+import pickle
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from astrobase.fakelcs import generation, recovery
+from astrobase.lcmodels import transits, eclipses, flares, sinusoidal
+from astrobase.lcmath import normalize_magseries
+from astrobase.lcproc import register_lcformat, _read_pklc, periodsearch
+from astrobase.varclass import varfeatures
+from astrobase.lcproc.varthreshold import DEFAULT_MAGBINS
+
+
+############
+## CONFIG ##
+############
+
+MAGCOLS = ['aep_000', 'aep_001']
+
+
+def make_fake_input_lcdir(outdir, nobjects=12, seed=42):
+    '''
+    This writes fake input LCs with different time bases for a simulation.
+
+    '''
+
+    rng = np.random.RandomState(seed)
+    lcfiles = []
+
+    for x in range(nobjects):
+
+        times = np.sort(rng.uniform(0.0, 30.0, size=rng.randint(300, 500)))
+        lcdict = {'objectid':'INPUT-%03i' % x,
+                  'objectinfo':{'objectid':'INPUT-%03i' % x,
+                                'ra':rng.uniform(0.0, 360.0),
+                                'decl':rng.uniform(-90.0, 90.0)},
+                  'times':times,
+                  'mag':rng.normal(12.0, 0.01, size=times.size),
+                  'err':np.full(times.size, 0.01)}
+
+        lcf = os.path.join(outdir, 'fake-input-%03i.pkl' % x)
+        with open(lcf, 'wb') as outfd:
+            pickle.dump(lcdict, outfd)
+        lcfiles.append(lcf)
+
+    return lcfiles
+
+
+def make_fake_varfeatures_simbasedir(simbasedir, nobjects=600, seed=42):
+    '''
+    This writes a fake simulation info pickle and varfeatures pickles.
+
+    '''
+
+    rng = np.random.RandomState(seed)
+
+    objectids = np.array(['FAKE-%04i' % x for x in range(nobjects)])
+    isvariable = rng.uniform(size=nobjects) < 0.25
+    sdssr = rng.uniform(8.0, 10.0, size=nobjects)
+
+    magbinmedians = (DEFAULT_MAGBINS[:-1] + DEFAULT_MAGBINS[1:])/2.0
+    magbinmedians = magbinmedians[magbinmedians < 10.0]
+
+    siminfo = {'objectid':objectids,
+               'isvariable':isvariable,
+               'sdssr':sdssr,
+               'timecols':['rjd']*len(MAGCOLS),
+               'magcols':MAGCOLS,
+               'errcols':['%s_err' % x for x in MAGCOLS],
+               'lcformat':'hat-sql',
+               'magsarefluxes':False,
+               'magrms':{x:{'binned_sdssr_median':magbinmedians}
+                         for x in MAGCOLS}}
+
+    with open(os.path.join(simbasedir, 'fakelcs-info.pkl'),'wb') as outfd:
+        pickle.dump(siminfo, outfd, pickle.HIGHEST_PROTOCOL)
+
+    featuredir = os.path.join(simbasedir, 'varfeatures')
+    os.makedirs(featuredir)
+
+    for ind, (objectid, isvar) in enumerate(zip(objectids, isvariable)):
+
+        # skip some objects to test objects without features
+        if ind % 37 == 0:
+            continue
+
+        features = {'objectid':objectid,
+                    'info':{'sdssr':sdssr[ind] + rng.normal(0.0, 0.01)}}
+
+        for magcol in MAGCOLS:
+
+            boost = 3.0 if isvar else 0.0
+            features[magcol] = {
+                'median':sdssr[ind],
+                'mad':0.01,
+                'stetsonj':rng.normal(1.0 + boost, 1.0),
+                'mag_iqr':rng.lognormal(-4.0 + 0.3*boost, 0.5),
+                'eta_normal':1.0/rng.lognormal(0.5*boost, 0.5),
+            }
+
+        # some objects have missing features
+        if ind % 53 == 0:
+            features[MAGCOLS[1]]['stetsonj'] = None
+
+        with open(os.path.join(featuredir,
+                               'varfeatures-%s.pkl' % objectid),'wb') as outfd:
+            pickle.dump(features, outfd, pickle.HIGHEST_PROTOCOL)
+
+    return magbinmedians
+
+
+###########
+## TESTS ##
+###########
+
+def test_varind_gridsearch_vectorized(tmpdir):
+    '''
+    Tests the vectorized variability index grid search against the per-point
+    recovery stats.
+
+    '''
+
+    simbasedir = str(tmpdir)
+    magbinmedians = make_fake_varfeatures_simbasedir(simbasedir)
+
+    gridresults = recovery.variable_index_gridsearch_magbin(
+        simbasedir,
+        stetson_stdev_range=(0.5, 4.0),
+        inveta_stdev_range=(0.5, 4.0),
+        iqr_stdev_range=(0.5, 4.0),
+        ngridpoints=6,
+    )
+    recarrays = gridresults['recovery_arrays']
+
+    assert gridresults['recovery'] is None
+    assert os.path.exists(os.path.join(simbasedir,
+                                       'fakevar-recovery-per-magbin.pkl'))
+
+    stetson_grid = gridresults['stetson_grid']
+    inveta_grid = gridresults['inveta_grid']
+    iqr_grid = gridresults['iqr_grid']
+
+    for magcol in MAGCOLS:
+        assert recarrays[magcol]['stet_mcc'].shape == (magbinmedians.size, 6)
+        assert recarrays[magcol]['stet_missed_iqr_found'].shape == (
+            magbinmedians.size, 6, 6
+        )
+        assert np.all(recarrays[magcol]['magbinind'] >= 0)
+
+    # check some grid points in some magbins against the per-point function
+    for binind in (0, 3, magbinmedians.size - 1):
+        for stetind, invetaind, iqrind in ((0, 0, 0), (1, 4, 2), (5, 2, 3)):
+
+            pointrec = recovery.get_recovered_variables_for_magbin(
+                simbasedir,
+                magbinmedians[binind],
+                stetson_stdev_min=stetson_grid[stetind],
+                inveta_stdev_min=inveta_grid[invetaind],
+                iqr_stdev_min=iqr_grid[iqrind],
+                statsonly=True
+            )
+            gridinds = {'stet':stetind, 'inveta':invetaind, 'iqr':iqrind}
+
+            for magcol in MAGCOLS:
+
+                recarr = recarrays[magcol]
+
+                for key, val in pointrec[magcol].items():
+
+                    if key in ('actual_variables', 'actual_nonvariables',
+                               'all_objectids', 'magbinind'):
+                        assert recarr[key][binind] == val
+                        continue
+
+                    name = key.split('_')[0]
+                    if '_missed_' in key:
+                        found = key.split('_')[2]
+                        gridval = recarr[key][binind,
+                                              gridinds[name],
+                                              gridinds[found]]
+                    else:
+                        gridval = recarr[key][binind, gridinds[name]]
+
+                    assert_allclose(gridval, val, equal_nan=True,
+                                    err_msg='%s %s' % (magcol, key))
+
+
+def test_variability_model_batch():
+    '''
+    Tests fakelcs.generation.variability_model_batch against lcmodels.
+
+    '''
+
+    times = np.linspace(0.0, 30.0, 3000)
+    zeros = np.zeros_like(times)
+
+    for vartype in ('planet', 'EB', 'flare', 'RRab', 'LPV'):
+
+        varparams = generation.draw_variability_params(vartype, 6,
+                                                       timemin=times.min(),
+                                                       timemax=times.max(),
+                                                       seed=7)
+        models = generation.variability_model_batch(times, varparams)
+        assert models.shape == (6, times.size)
+
+        # the same params for the same seed
+        redrawn = generation.draw_variability_params(vartype, 6,
+                                                     timemin=times.min(),
+                                                     timemax=times.max(),
+                                                     seed=7)
+        assert_allclose(
+            generation.variability_model_batch(times, redrawn), models
+        )
+
+        for objectind in range(6):
+
+            params, varperiod, varamplitude = (
+                generation._get_object_variability_params(varparams,
+                                                          objectind)
+            )
+
+            if vartype == 'flare':
+                expected = zeros
+                for flareind in range(params['nflares']):
+                    flareparams = params[flareind]
+                    expected = flares.flare_model(
+                        [flareparams['amplitude'], flareparams['peaktime'],
+                         flareparams['risestdev'], flareparams['decayconst']],
+                        times, expected, zeros
+                    )[0]
+                assert_allclose(models[objectind], expected, atol=1.0e-12)
+                continue
+
+            if vartype == 'planet':
+                assert varamplitude < 0.0
+                modelmags, phase, ptimes, pmags, perrs = (
+                    transits.trapezoid_transit_func(
+                        [params[x] for x in ('transitperiod',
+                                             'transitepoch',
+                                             'transitdepth',
+                                             'transitduration',
+                                             'ingressduration')],
+                        times, zeros, zeros
+                    )
+                )
+            elif vartype == 'EB':
+                modelmags, phase, ptimes, pmags, perrs = (
+                    eclipses.invgauss_eclipses_func(
+                        [params[x] for x in ('period', 'epoch', 'pdepth',
+                                             'pduration', 'depthratio',
+                                             'secphase')],
+                        times, zeros, zeros
+                    )
+                )
+            else:
+                assert len(params['fourieramps']) == params['fourierorder']
+                modelmags, phase, ptimes, pmags, perrs = (
+                    sinusoidal.sine_series_sum(
+                        [params['period'], params['epoch'],
+                         params['fourieramps'], params['fourierphases']],
+                        times, zeros, zeros
+                    )
+                )
+
+            timeind = np.argsort(ptimes)
+            assert_allclose(models[objectind], modelmags[timeind],
+                            atol=1.0e-12)
+
+
+def test_fakelc_collection_batch_reproducible(tmpdir):
+    '''
+    Tests seeded fakelcs.generation functions with different nworkers.
+
+    '''
+
+    outdir = str(tmpdir)
+    formatdir = os.path.join(outdir, 'lcformats')
+    register_lcformat('fake-input-pkl', 'fake-input-*.pkl',
+                      ['times'], ['mag'], ['err'],
+                      'astrobase.lcproc', '_read_pklc',
+                      lcformat_dir=formatdir)
+
+    lcfiles = make_fake_input_lcdir(outdir)
+    magbins = np.arange(8.0, 16.5, 0.5)
+    magrms = {'mag':{'binned_sdssr_median':magbins,
+                     'binned_lcmad_median':0.001*np.exp(0.3*(magbins - 8.0)),
+                     'binned_count':np.arange(magbins.size) + 10}}
+
+    results = []
+
+    for nworkers, batchsize in ((1, 3), (3, 5)):
+
+        simbasedir = os.path.join(outdir, 'sim-%s' % nworkers)
+        generation.make_fakelc_collection(lcfiles, simbasedir, magrms,
+                                          maxlcs=len(lcfiles),
+                                          maxvars=8,
+                                          vartypes=('EB', 'planet', 'flare',
+                                                    'RRc'),
+                                          lcformat='fake-input-pkl',
+                                          lcformatdir=formatdir,
+                                          seed=7,
+                                          nworkers=nworkers)
+        lcinfo = generation.add_variability_to_fakelc_collection_batch(
+            simbasedir,
+            seed=7,
+            batchsize=batchsize,
+            nworkers=nworkers
+        )
+        assert len(lcinfo['varinfo']) == len(lcfiles)
+
+        lcdicts = {}
+        for lcf in lcinfo['lcfpath']:
+            lcdict = _read_pklc(lcf)
+            lcdicts[lcdict['objectid']] = lcdict
+        results.append((lcinfo, lcdicts))
+
+    (lcinfo1, lcdicts1), (lcinfo2, lcdicts2) = results
+
+    assert_allclose(lcinfo1['sdssr'], lcinfo2['sdssr'])
+    assert sorted(lcdicts1.keys()) == sorted(lcdicts2.keys())
+    assert np.sum(lcinfo1['isvariable']) > 0
+
+    for objectid, lcdict in lcdicts1.items():
+
+        other = lcdicts2[objectid]
+        assert lcdict['actual_vartype'] == other['actual_vartype']
+        assert lcdict['actual_varparams'] == other['actual_varparams']
+        assert lcinfo1['varinfo'][objectid] == lcinfo2['varinfo'][objectid]
+        assert_allclose(lcdict['mag'], other['mag'])
+        assert_allclose(lcdict['err'], other['err'])
+        assert_allclose(np.median(lcdict['mag']),
+                        lcdict['moments']['mag']['median'], atol=1.0)
+
+        # the epochs are in the time-range of each LC
+        if lcdict['actual_vartype'] in ('EB', 'RRc'):
+            assert (lcdict['times'].min() <=
+                    lcdict['actual_varparams']['epoch'] <=
+                    lcdict['times'].max())
+
+
+def test_check_periodrec_alias_array():
+    '''
+    Tests fakelcs.recovery.check_periodrec_alias_array.
+
+    '''
+
+    rng = np.random.RandomState(42)
+    actual = rng.uniform(0.1, 20.0, size=200)
+    actual[:3] = [0.5, 1.0, np.nan]
+
+    # some recovered periods are aliases, some are a bit off, and some are
+    # random
+    aliases = recovery.get_periodrec_alias_matches(actual, actual)
+    assert aliases.shape == (200, len(recovery.ALIAS_TYPES))
+
+    recovered = np.column_stack((
+        actual,
+        2.0*actual + rng.normal(0.0, 5.0e-4, size=200),
+        actual/(1.0 + actual),
+        actual/(actual - 1.0),
+        0.5*actual + 0.01,
+        rng.uniform(0.1, 20.0, size=200),
+    ))
+    recovered[5, 2] = np.inf
+    tolerance = np.where(np.arange(200) % 2 == 0, 1.0e-3, 1.0e-2)[:,None]
+
+    statuses = recovery.check_periodrec_alias_array(actual[:,None],
+                                                    recovered,
+                                                    tolerance=tolerance)
+    assert statuses.shape == recovered.shape
+
+    for i in range(recovered.shape[0]):
+        for j in range(recovered.shape[1]):
+            assert statuses[i,j] == recovery.check_periodrec_alias(
+                actual[i], recovered[i,j], tolerance=tolerance[i,0]
+            )
+
+    assert all('actual' in x.split(',') for x in statuses[3:,0])
+    assert statuses[2,0] == 'unknown'
+
+    # scalars work too
+    assert recovery.check_periodrec_alias_array(2.0, 4.0) == 'twice'
+
+
+def test_injection_recovery_streaming(tmpdir):
+    '''
+    Tests fakelcs.recovery.run_injection_recovery against the on-disk stages.
+
+    '''
+
+    outdir = str(tmpdir)
+    formatdir = os.path.join(outdir, 'lcformats')
+    register_lcformat('fake-input-pkl', 'fake-input-*.pkl',
+                      ['times'], ['mag'], ['err'],
+                      'astrobase.lcproc', '_read_pklc',
+                      lcformat_dir=formatdir)
+
+    lcfiles = make_fake_input_lcdir(outdir, nobjects=8)
+    magbins = np.arange(8.0, 16.5, 0.5)
+    magrms = {'mag':{'binned_sdssr_median':magbins,
+                     'binned_lcmad_median':0.001*np.exp(0.3*(magbins - 8.0)),
+                     'binned_count':np.arange(magbins.size) + 10}}
+
+    simkwargs = {'maxlcs':len(lcfiles),
+                 'maxvars':5,
+                 'vartypes':('EB', 'RRc'),
+                 'lcformat':'fake-input-pkl',
+                 'lcformatdir':formatdir}
+    pfkwargs = {'startp':0.1, 'endp':10.0}
+
+    injrecdir = os.path.join(outdir, 'injrec')
+    streamed = recovery.run_injection_recovery(lcfiles, injrecdir, magrms,
+                                               mindet=100,
+                                               pfmethods=('gls',),
+                                               pfkwargs=(pfkwargs,),
+                                               seed=7,
+                                               checkpoint_every=3,
+                                               nworkers=2,
+                                               **simkwargs)
+    assert len(streamed['objectids']) == len(lcfiles)
+    assert streamed['actual_periodicvars'].size > 0
+
+    # resume after dropping some of the objects from the checkpoint
+    with open(streamed['checkpoint'], 'rb') as infd:
+        checkpoint = pickle.load(infd)
+    for objectind in (1, 4, 6):
+        del checkpoint['rows'][objectind]
+    with open(streamed['checkpoint'], 'wb') as outfd:
+        pickle.dump(checkpoint, outfd)
+
+    resumed = recovery.run_injection_recovery(lcfiles, injrecdir, magrms,
+                                              mindet=100,
+                                              pfmethods=('gls',),
+                                              pfkwargs=(pfkwargs,),
+                                              seed=7,
+                                              nworkers=2,
+                                              **simkwargs)
+    assert resumed['objectids'] == streamed['objectids']
+    for objectid in streamed['objectids']:
+        assert_allclose(resumed['details'][objectid]['recovery_periods'],
+                        streamed['details'][objectid]['recovery_periods'])
+
+    # a different simulation can't use the same checkpoint
+    assert recovery.run_injection_recovery(lcfiles, injrecdir, magrms,
+                                           mindet=100,
+                                           pfmethods=('gls',),
+                                           pfkwargs=(pfkwargs,),
+                                           seed=8,
+                                           nworkers=2,
+                                           **simkwargs) is None
+
+    # the same simulation with the on-disk stages
+    simbasedir = os.path.join(outdir, 'sim')
+    generation.make_fakelc_collection(lcfiles, simbasedir, magrms,
+                                      seed=7, nworkers=2, **simkwargs)
+    lcinfo = generation.add_variability_to_fakelc_collection_batch(
+        simbasedir, seed=7, nworkers=2
+    )
+
+    register_lcformat('fake-fake-input-pkl', '*-fakelc.pkl',
+                      ['times'], ['mag'], ['err'],
+                      'astrobase.lcproc', '_read_pklc',
+                      lcformat_dir=formatdir)
+    pfdir = os.path.join(simbasedir, 'periodfinding')
+    os.makedirs(pfdir)
+
+    for lcf in lcinfo['lcfpath']:
+
+        lcdict = _read_pklc(lcf)
+        row = streamed['details'][lcdict['objectid']]
+
+        assert row['actual_vartype'] == lcdict['actual_vartype']
+        assert row['actual_varparams'] == lcdict['actual_varparams']
+
+        ntimes, nmags = normalize_magseries(lcdict['times'], lcdict['mag'])
+        features = varfeatures.all_nonperiodic_features(ntimes, nmags,
+                                                        lcdict['err'])
+        assert_allclose(row['varfeatures']['mag']['stetsonj'],
+                        features['stetsonj'])
+
+        pfpkl = periodsearch.runpf(lcf, pfdir,
+                                   lcformat='fake-fake-input-pkl',
+                                   lcformatdir=formatdir,
+                                   pfmethods=('gls',),
+                                   pfkwargs=(dict(pfkwargs),),
+                                   sigclip=5.0,
+                                   minobservations=100,
+                                   nworkers=1)
+        ondisk = recovery.periodicvar_recovery(pfpkl, simbasedir)
+
+        assert_allclose(row['recovery_periods'], ondisk['recovery_periods'])
+        assert (row['recovery_status'].tolist() ==
+                ondisk['recovery_status'].tolist())
@@ -0,0 +1,314 @@
+'''test_fitslcs.py - License: MIT - see the LICENSE file for details.
+
+This tests the following:
+
+- makes fake Kepler and TESS light curve FITS files for several quarters and
+  sectors with different aperture sizes
+- consolidates them with astrokep.consolidate_kepler_fitslc and
+  astrotess.consolidate_tess_fitslc and checks the results against the
+  single file readers
+- writes the fake TESS light curves of several objects to an LC archive and
+  reads them back with astrobase.lcarchive and the lcproc tess-lca LC format
+
+'''
+
+import os.path
+
+import numpy as np
+from numpy.testing import assert_array_equal, assert_allclose
+from astropy.io import fits as pyfits
+
+from astrobase import astrokep, astrotess, lcarchive
+from astrobase.lcproc import get_lcformat
+from astrobase.lcproc.periodsearch import parallel_pf, parallel_pf_lcdir
+
+
+############
+## CONFIG ##
+############
+
+KEPLERID = 1234567
+
+
+def make_fake_fitslc(lcfile, datakeys, fluxkeys, tophdr, lchdr,
+                     ndet=500, tstart=0.0, apshape=(5, 6), seed=42):
+    '''
+    This writes a fake Kepler or TESS LC FITS file.
+
+    '''
+
+    rng = np.random.RandomState(seed)
+
+    # the times are shuffled a bit so the consolidated LC has to be sorted
+    times = tstart + np.sort(rng.uniform(0.0, 80.0, ndet))
+    times[ndet//2:ndet//2 + 5] = times[ndet//2:ndet//2 + 5][::-1]
+
+    columns = [pyfits.Column(name='TIME', format='D', array=times)]
+    for key in datakeys:
+        if key == 'TIME':
+            continue
+        elif key in ('CADENCENO', 'SAP_QUALITY', 'QUALITY'):
+            columns.append(pyfits.Column(name=key, format='J',
+                                         array=rng.randint(0, 5, ndet)))
+        else:
+            columns.append(pyfits.Column(name=key, format='E',
+                                         array=rng.normal(size=ndet)))
+    for key in fluxkeys:
+        columns.append(pyfits.Column(
+            name=key, format='E',
+            array=rng.normal(1000.0 + 100.0*seed, 10.0, ndet)
+        ))
+
+    lchdu = pyfits.BinTableHDU.from_columns(columns)
+    lchdu.header.update(lchdr)
+
+    aphdu = pyfits.ImageHDU(np.full(apshape, 3, dtype=np.int32))
+    aphdu.header.update({'NPIXSAP':8, 'NPIXMISS':0,
+                         'CDELT1':-0.0011, 'CDELT2':0.0011})
+
+    pyfits.HDUList([pyfits.PrimaryHDU(header=pyfits.Header(tophdr)),
+                    lchdu,
+                    aphdu]).writeto(lcfile)
+
+    return lcfile
+
+
+def read_columns(lcdict, columns):
+    '''
+    This gets the column arrays out of an lcdict.
+
+    '''
+
+    return [lcdict[x.split('.')[0]][x.split('.')[1]] if '.' in x
+            else lcdict[x] for x in columns]
+
+
+def read_columns_all(lcdicts, col):
+    '''
+    This gets a column out of several lcdicts.
+
+    '''
+
+    return [read_columns(x, [col])[0] for x in lcdicts]
+
+
+###########
+## TESTS ##
+###########
+
+def test_consolidate_kepler_fitslc(tmpdir):
+    '''
+    Tests consolidating Kepler light curve FITS files.
+
+    '''
+
+    lcfitsdir = str(tmpdir)
+
+    lcfiles = []
+    for quarter, (ndet, apshape) in enumerate(((500, (5, 6)),
+                                               (300, (6, 6)),
+                                               (400, (5, 7)))):
+        lcfiles.append(make_fake_fitslc(
+            os.path.join(lcfitsdir, 'kplr%09i-%s_llc.fits' % (KEPLERID,
+                                                              quarter)),
+            astrokep.LCDATAKEYS,
+            astrokep.LCSAPKEYS + astrokep.LCPDCKEYS,
+            {'QUARTER':3 - quarter, 'SEASON':quarter, 'CHANNEL':10,
+             'SKYGROUP':5, 'MODULE':2, 'OUTPUT':1, 'KEPMAG':12.0},
+            {'OBJECT':'KIC %s' % KEPLERID, 'KEPLERID':KEPLERID,
+             'BJDREFI':2454833, 'BJDREFF':0.0, 'EXPOSURE':0.02,
+             'CDPP3_0':30.0 + quarter},
+            ndet=ndet, tstart=100.0*(3 - quarter), apshape=apshape,
+            seed=quarter
+        ))
+
+    single = [astrokep.read_kepler_fitslc(x, normalize=True) for x in lcfiles]
+    consolidated = astrokep.consolidate_kepler_fitslc(KEPLERID, lcfitsdir)
+
+    # every file is read once
+    assert consolidated['time'].size == 1200
+    assert consolidated['lcinfo']['ndet'] == [400, 300, 500]
+    assert consolidated['quarter'] == [1, 2, 3]
+    assert consolidated['varinfo']['cdpp3_0'] == [32.0, 31.0, 30.0]
+    assert [x.shape for x in consolidated['lcinfo']['lcaperture']] == [
+        (5, 7), (6, 6), (5, 6)
+    ]
+
+    # the columns are the same as the single file ones sorted by time
+    sortind = np.argsort(np.concatenate([x['time'] for x in single]))
+    for col, arr in zip(consolidated['columns'] + ['lc_campaign'],
+                        read_columns(consolidated,
+                                     consolidated['columns'] +
+                                     ['lc_campaign'])):
+        expected = np.concatenate(read_columns_all(single, col))[sortind]
+        assert arr.dtype.isnative
+        assert_array_equal(arr, expected)
+
+    assert np.all(np.diff(consolidated['time']) > 0.0)
+    assert_allclose(np.nanmedian(consolidated['pdc']['pdcsap_flux']), 1.0,
+                    rtol=0.01)
+
+    # the single file reader only reads the requested columns
+    lcdict = astrokep.read_kepler_fitslc(lcfiles[0],
+                                         datakeys=['TIME', 'CADENCENO'],
+                                         sapkeys=['SAP_FLUX'],
+                                         pdckeys=[])
+    assert 'mom_centr1' not in lcdict
+    assert lcdict['pdc'] == {}
+    assert lcdict['cadenceno'].dtype == np.int32
+    assert lcdict['cadenceno'].dtype.isnative
+
+
+def test_consolidate_tess_fitslc(tmpdir):
+    '''
+    Tests consolidating TESS light curve FITS files.
+
+    '''
+
+    lcfitsdir = str(tmpdir)
+
+    lcfiles = []
+    for sector, (ndet, apshape) in enumerate(((500, (11, 11)),
+                                              (300, (10, 11)),
+                                              (400, (11, 12))), start=1):
+        lcfiles.append(make_fake_fitslc(
+            os.path.join(lcfitsdir,
+                         'tess-s%04i-0000000012345678_lc.fits' % sector),
+            astrotess.LCDATAKEYS,
+            astrotess.LCSAPKEYS + astrotess.LCPDCKEYS,
+            {'OBJECT':'TIC 12345678', 'TICID':12345678, 'SECTOR':sector,
+             'CAMERA':1, 'CCD':2, 'PXTABLE':100 + sector, 'ORIGIN':'NASA',
+             'DATE-OBS':'2019-01-0%s' % sector, 'DATE-END':'2019-01-28',
+             'PROCVER':'spoc-4.0', 'DATA_REL':sector + 10, 'TESSMAG':10.0},
+            {'BJDREFI':2457000, 'BJDREFF':0.0, 'EXPOSURE':0.0013,
+             'TIMESYS':'TDB', 'CDPP0_5':100.0 + sector},
+            ndet=ndet, tstart=100.0*sector, apshape=apshape, seed=sector
+        ))
+
+    single = [astrotess.read_tess_fitslc(x, normalize=True) for x in lcfiles]
+    consolidated = astrotess.consolidate_tess_fitslc(
+        os.path.join(lcfitsdir, 'tess-*_lc.fits')
+    )
+
+    assert consolidated['time'].size == 1200
+    assert consolidated['objectinfo']['ndet'] == 1200
+    assert consolidated['lcinfo']['sector'] == [1, 2, 3]
+    assert consolidated['lcinfo']['ndet'] == [500, 300, 400]
+    assert consolidated['varinfo']['cdpp0_5'] == [101.0, 102.0, 103.0]
+
+    sortind = np.argsort(np.concatenate([x['time'] for x in single]))
+    for col, arr in zip(consolidated['columns'],
+                        read_columns(consolidated, consolidated['columns'])):
+        expected = np.concatenate(read_columns_all(single, col))[sortind]
+        assert arr.dtype == expected.dtype
+        assert_array_equal(arr, expected)
+
+    assert_array_equal(np.unique(consolidated['pixel_table_id']),
+                       [101, 102, 103])
+
+    # filtering is still done at the end
+    filtered = astrotess.consolidate_tess_fitslc(lcfiles,
+                                                 filterqualityflags=True)
+    assert filtered['time'].size == np.sum(consolidated['quality'] == 0)
+
+
+def test_tess_lcarchive(tmpdir):
+    '''
+    Tests writing and reading an LC archive of TESS light curves.
+
+    '''
+
+    lcfitsdir = str(tmpdir)
+
+    lcfiles = []
+    for ind, (ticid, ndet) in enumerate(((300000003, 500),
+                                         (100000001, 300),
+                                         (200000002, 400))):
+        lcfiles.append(make_fake_fitslc(
+            os.path.join(lcfitsdir, 'tess-s0001-%016i_lc.fits' % ticid),
+            astrotess.LCDATAKEYS,
+            astrotess.LCSAPKEYS + astrotess.LCPDCKEYS,
+            {'OBJECT':'TIC %s' % ticid, 'TICID':ticid, 'SECTOR':1,
+             'CAMERA':1, 'CCD':2, 'PXTABLE':101, 'ORIGIN':'NASA',
+             'DATE-OBS':'2019-01-01', 'DATE-END':'2019-01-28',
+             'PROCVER':'spoc-4.0', 'DATA_REL':11, 'TESSMAG':10.0},
+            {'BJDREFI':2457000, 'BJDREFF':0.0, 'EXPOSURE':0.0013,
+             'TIMESYS':'TDB', 'CDPP0_5':100.0 + ind},
+            ndet=ndet, tstart=100.0, seed=ind + 1
+        ))
+
+    single = [astrotess.read_tess_fitslc(x) for x in lcfiles]
+
+    # the archive can be written from FITS files and lcdicts
+    archive = astrotess.tess_lcdicts_to_archive(
+        lcfiles[:2] + [single[2], single[0]],
+        os.path.join(lcfitsdir, 'sector1-tesslc.lca'),
+        archiveinfo={'sector':1}
+    )
+
+    info = lcarchive.read_lcarchive_info(archive)
+    assert info['archiveinfo'] == {'sector':1}
+    assert info['nobjects'] == 3
+    assert info['ndet'] == 1200
+    assert info['objectids'] == ['TIC 100000001', 'TIC 200000002',
+                                 'TIC 300000003']
+
+    lcrefs = lcarchive.list_lcarchive(archive)
+    assert lcrefs[0] == '%s::TIC 100000001' % archive
+
+    readerfunc = get_lcformat('tess-lca', use_lcformat_dir=None)[1]
+
+    for lcdict in single:
+
+        lcref = '%s::%s' % (archive, lcdict['objectid'])
+        assert lcarchive.lcfile_exists(lcref)
+
+        fromarchive = readerfunc(lcref)
+        assert sorted(fromarchive.keys()) == sorted(lcdict.keys())
+        assert fromarchive['objectinfo'] == lcdict['objectinfo']
+        assert_array_equal(fromarchive['lcinfo']['lcaperture'][0],
+                           lcdict['lcinfo']['lcaperture'][0])
+
+        for col, arr in zip(lcdict['columns'],
+                            read_columns(fromarchive, lcdict['columns'])):
+            expected = read_columns(lcdict, [col])[0]
+            assert arr.dtype == expected.dtype
+            assert arr.flags.writeable
+            assert_array_equal(arr, expected)
+
+    assert not lcarchive.lcfile_exists('%s::TIC 1' % archive)
+    assert not lcarchive.lcfile_exists(
+        os.path.join(lcfitsdir, 'nope-tesslc.lca::TIC 100000001')
+    )
+
+    # lcproc can use the archive references as light curve files
+    pfdir = os.path.join(lcfitsdir, 'periodfinding')
+    results = parallel_pf(lcrefs, pfdir,
+                          lcformat='tess-lca',
+                          pfmethods=('gls',),
+                          pfkwargs=({},),
+                          nperiodworkers=1,
+                          ncontrolworkers=1,
+                          minobservations=100)
+    assert len(results) == 3
+    assert all(x is not None and os.path.exists(x) for x in results)
+
+    # archives are expanded into their objects' references, other files are
+    # left alone
+    assert lcarchive.expand_lcarchives([lcfiles[0], archive]) == (
+        [lcfiles[0]] + lcrefs
+    )
+
+    # the lcdir drivers find the archive in the LC directory and run on all of
+    # the objects in it
+    lcdirpfdir = os.path.join(lcfitsdir, 'periodfinding-lcdir')
+    lcdirresults = parallel_pf_lcdir(lcfitsdir, lcdirpfdir,
+                                     lcformat='tess-lca',
+                                     pfmethods=('gls',),
+                                     pfkwargs=({},),
+                                     nperiodworkers=1,
+                                     ncontrolworkers=1,
+                                     minobservations=100)
+    assert sorted(os.path.basename(x) for x in lcdirresults) == sorted(
+        os.path.basename(x) for x in results
+    )
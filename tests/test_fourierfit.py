@@ -0,0 +1,140 @@
+'''test_fourierfit.py - License: MIT - see the LICENSE file for details.
+
+This tests the following:
+
+- generates a fake multi-harmonic sinusoidal light curve
+- checks that the linear least-squares Fourier fit in lcfit.sinusoidal gives
+  the same model, chi-sq, and parameter errors as the curve_fit Fourier fit
+- checks the batched multi-period Fourier fit against single period fits
+
+'''
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from astrobase.lcfit import sinusoidal
+
+
+############
+## CONFIG ##
+############
+
+PERIOD = 1.2345
+
+
+def make_fake_sinusoidal_lc(npoints=2000, seed=42):
+    '''
+    This makes a fake sinusoidal LC with three harmonics.
+
+    '''
+
+    rng = np.random.RandomState(seed)
+
+    times = np.sort(rng.uniform(0.0, 50.0, size=npoints))
+    phase = 2.0*np.pi*times/PERIOD
+
+    mags = (12.0 +
+            0.1*np.cos(phase + 0.3) +
+            0.04*np.cos(2.0*phase + 1.0) +
+            0.01*np.cos(3.0*phase - 2.0) +
+            rng.normal(0.0, 0.01, size=npoints))
+    errs = np.full(npoints, 0.01)
+
+    return times, mags, errs
+
+
+###########
+## TESTS ##
+###########
+
+def test_fourierfit_linear_matches_curvefit():
+    '''
+    Tests the linear fourier_fit_magseries against the curve_fit version.
+
+    '''
+
+    times, mags, errs = make_fake_sinusoidal_lc()
+
+    curvefit = sinusoidal.fourier_fit_magseries(times, mags, errs, PERIOD,
+                                                fourierorder=4,
+                                                verbose=False)
+    linear = sinusoidal.fourier_fit_magseries(times, mags, errs, PERIOD,
+                                              fourierorder=4,
+                                              fitmethod='linear',
+                                              verbose=False)
+
+    assert linear['fitinfo']['fitmethod'] == 'linear'
+    assert sorted(curvefit['magseries'].keys()) == sorted(
+        linear['magseries'].keys()
+    )
+    assert_allclose(linear['fitinfo']['fitmags'],
+                    curvefit['fitinfo']['fitmags'],
+                    atol=1.0e-6)
+    assert_allclose(linear['fitchisq'], curvefit['fitchisq'], rtol=1.0e-6)
+    assert_allclose(linear['fitredchisq'], curvefit['fitredchisq'],
+                    rtol=1.0e-6)
+    assert_allclose(linear['fitinfo']['fitepoch'],
+                    curvefit['fitinfo']['fitepoch'])
+
+    # the amplitudes are positive and the phases match the input LC after
+    # shifting them to the fit epoch
+    linparams = linear['fitinfo']['finalparams']
+    assert_allclose(linparams[1:4], [0.1, 0.04, 0.01], atol=2.0e-3)
+
+    harmonics = np.arange(1, 4)
+    fitepoch = linear['fitinfo']['fitepoch']
+    expected_phases = (np.array([0.3, 1.0, -2.0]) +
+                       2.0*np.pi*harmonics*fitepoch/PERIOD)
+    phase_diffs = np.angle(np.exp(1j*(linparams[5:8] - expected_phases)))
+    assert_allclose(phase_diffs, 0.0, atol=0.2)
+
+    # the errors on the harmonic amplitudes and phases are the same
+    assert_allclose(linear['fitinfo']['finalparamerrs'][2:5],
+                    curvefit['fitinfo']['finalparamerrs'][2:5],
+                    rtol=1.0e-3)
+    assert_allclose(linear['fitinfo']['finalparamerrs'][6:],
+                    curvefit['fitinfo']['finalparamerrs'][6:],
+                    rtol=1.0e-3)
+
+    # the chi-sq of the highest order from the QR is the one for the fit
+    chisq_by_order = linear['fitinfo']['fitchisq_by_order']
+    assert chisq_by_order.size == 4
+    assert np.all(np.diff(chisq_by_order) < 0.0)
+    assert_allclose(chisq_by_order[-1], linear['fitchisq'], rtol=1.0e-8)
+
+
+def test_fourierfit_periods_batch():
+    '''
+    Tests lcfit.sinusoidal.fourier_fit_magseries_periods.
+
+    '''
+
+    times, mags, errs = make_fake_sinusoidal_lc()
+    periods = [PERIOD, PERIOD*1.01, 0.5*PERIOD, 2.0*PERIOD]
+
+    batched = sinusoidal.fourier_fit_magseries_periods(times, mags, errs,
+                                                       periods,
+                                                       fourierorder=3,
+                                                       verbose=False)
+    assert len(batched) == len(periods)
+
+    for period, batchfit in zip(periods, batched):
+
+        single = sinusoidal.fourier_fit_magseries(times, mags, errs, period,
+                                                  fourierorder=3,
+                                                  fitmethod='linear',
+                                                  verbose=False)
+        assert batchfit['fitinfo']['fitperiod'] == period
+        assert_allclose(batchfit['fitinfo']['finalparams'],
+                        single['fitinfo']['finalparams'])
+        assert_allclose(batchfit['fitchisq'], single['fitchisq'])
+
+    # the true period should have the best fit
+    assert np.argmin([x['fitchisq'] for x in batched]) == 0
+
+    # too few observations to fit
+    failed = sinusoidal.fourier_fit_magseries_periods(times[:5], mags[:5],
+                                                      errs[:5], periods,
+                                                      fourierorder=3,
+                                                      verbose=False)
+    assert all(x['fitinfo']['finalparams'] is None for x in failed)
@@ -0,0 +1,564 @@
+'''test_hatlc.py - License: MIT - see the LICENSE file for details.
+
+This tests the following:
+
+- makes a fake gzipped HAT sqlitecurve
+- reads it with hatsurveys.hatlc.read_and_filter_sqlitecurve, decompressing it
+  in memory and on disk, and checks that both give the same lcdict and that
+  the in-memory read doesn't write anything next to the sqlitecurve
+- makes fake HAT CSV LCs and reads them together with sqlitecurves using
+  hatsurveys.hatlc.read_hatlc_batch
+- checks the vectorized CSV LC parsing in hatsurveys.hatlc.read_csvlc,
+  hatsurveys.hatlc.read_lcc_csvlc, and hatsurveys.k2hat.read_csv_lightcurve
+  against casting each value separately
+- makes fake HATPI text LCs and concatenates, deduplicates, and bins them with
+  hatsurveys.hplc.concatenate_textlcs and hatsurveys.hplc.parallel_concat_lcdir,
+  and merges their apertures with hatsurveys.hplc.merge_hatpi_textlc_apertures
+
+'''
+
+import glob
+import gzip
+import json
+import os
+import os.path
+import shutil
+import sqlite3
+import sys
+
+import numpy as np
+from numpy.testing import assert_array_equal, assert_allclose
+
+from astrobase.hatsurveys import hatlc, hplc, k2hat
+
+
+############
+## CONFIG ##
+############
+
+LCCOLUMNS = ['rjd', 'net', 'stf', 'cfn', 'aim_000', 'aep_000', 'aiq_000']
+
+
+def make_fake_sqlitecurve(outdir, ndet=500, seed=42):
+    '''
+    This makes a fake gzipped sqlitecurve and returns its path.
+
+    '''
+
+    rng = np.random.RandomState(seed)
+
+    sqlitecurve = os.path.join(outdir, 'HAT-999-0000001-V0-DR0-hatlc.sqlite')
+    db = sqlite3.connect(sqlitecurve)
+    cur = db.cursor()
+
+    cur.execute('create table objectinfo (hatid text, ndet integer, '
+                'ra real, decl real)')
+    cur.execute('insert into objectinfo values (?, ?, ?, ?)',
+                ('HAT-999-0000001', ndet, 120.0, -30.0))
+
+    cur.execute('create table lcinfo (version integer, datarelease integer, '
+                'columnlist text, sortcol text, apertures text, '
+                'bestaperture text, objectinfocols text, objectidcol text, '
+                'unixtime real, gitrev text, comment text)')
+    cur.execute('insert into lcinfo values (?,?,?,?,?,?,?,?,?,?,?)',
+                (1, 0, ','.join(LCCOLUMNS), 'rjd',
+                 json.dumps({'000':1.5}), json.dumps({'ap':'000'}),
+                 'hatid,ndet,ra,decl', 'hatid', 1.0e9, 'abcdef', 'fake'))
+
+    cur.execute('create table filters (filterid integer, filtername text)')
+    cur.execute('insert into filters values (1, "r")')
+
+    cur.execute('create table lightcurve (rjd real, net text, stf integer, '
+                'cfn integer, aim_000 real, aep_000 real, aiq_000 text)')
+
+    rjd = np.sort(rng.uniform(55000.0, 55100.0, ndet))
+    aim = rng.normal(12.0, 0.01, ndet)
+    aep = aim + 0.01
+    stf = rng.randint(5, 10, ndet)
+    rows = [(float(rjd[x]), 'HN', int(stf[x]), 1000 + x,
+             None if x % 17 == 0 else float(aim[x]),
+             float(aep[x]),
+             None if x % 23 == 0 else 'G')
+            for x in rng.permutation(ndet)]
+    cur.executemany('insert into lightcurve values (?,?,?,?,?,?,?)', rows)
+
+    db.commit()
+    db.close()
+
+    with open(sqlitecurve, 'rb') as infd:
+        with gzip.open('%s.gz' % sqlitecurve, 'wb') as outfd:
+            shutil.copyfileobj(infd, outfd)
+    os.remove(sqlitecurve)
+
+    return '%s.gz' % sqlitecurve
+
+
+def make_fake_csvlc(outdir, objectid, ndet=300, seed=42, badrow=None):
+    '''
+    This makes a fake gzipped HAT data server CSV LC and returns its path.
+
+    '''
+
+    rng = np.random.RandomState(seed)
+
+    header = [
+        '# OBJECT',
+        '# objectid = %s; ra = 120.0; decl = -30.0' % objectid,
+        '# ndet = %s' % ndet,
+        '#',
+        '# METADATA',
+        '# lcversion = 1; datarelease = 0; lastupdated = 1000000000.0',
+        '#',
+        '# CAMFILTERS',
+        '# 1 - r - Sloan r',
+        '#',
+        '# PHOTAPERTURES',
+        '# 000 - 1.50 px',
+        '#',
+        '# COLUMNS',
+    ]
+    header.extend('# %s - %s - column %s' % (x, col, x)
+                  for x, col in enumerate(LCCOLUMNS))
+    header.extend(['#', '# LIGHTCURVE'])
+
+    rjd = np.sort(rng.uniform(55000.0, 55100.0, ndet))
+    aim = rng.normal(12.0, 0.01, ndet)
+    stf = rng.randint(5, 10, ndet)
+
+    rows = ['%.7f,HN,%i,%i,%.5f,%.5f,G' %
+            (rjd[x], stf[x], 1000 + x, aim[x], aim[x] + 0.01)
+            for x in range(ndet)]
+    if badrow is not None:
+        rows[badrow] = '%.7f,HN,%i,%i,,%.5f,G' % (
+            rjd[badrow], stf[badrow], 1000 + badrow, aim[badrow] + 0.01
+        )
+
+    lcfile = os.path.join(outdir, '%s-V0-DR0.hatlc.csv.gz' % objectid)
+    with gzip.open(lcfile, 'wb') as outfd:
+        outfd.write(('\n'.join(header + rows) + '\n').encode())
+
+    return lcfile
+
+
+def make_fake_lcc_csvlc(outdir, ndet=300, seed=42):
+    '''
+    This makes a fake gzipped LCC-Server CSV LC and returns its path.
+
+    '''
+
+    rng = np.random.RandomState(seed)
+
+    metadata = {'objectid':{'val':'HAT-999-0000010'},
+                'ra':{'val':120.0},
+                'decl':{'val':-30.0}}
+    columns = {'rjd':{'colnum':0, 'dtype':'f8'},
+               'stf':{'colnum':1, 'dtype':'i8'},
+               'aep_000':{'colnum':2, 'dtype':'f8'},
+               'aiq_000':{'colnum':3, 'dtype':'U1'}}
+
+    header = ['LCC-CSVLC-V1', '#', ',',
+              '# OBJECT METADATA', '# %s' % json.dumps(metadata), '#',
+              '# COLUMN DEFINITIONS', '# %s' % json.dumps(columns), '#',
+              '# LIGHTCURVE']
+
+    rjd = np.sort(rng.uniform(55000.0, 55100.0, ndet))
+    aep = rng.normal(12.0, 0.01, ndet)
+    rows = ['%.7f,%i,%.5f,G' % (rjd[x], 5 + x % 3, aep[x])
+            for x in range(ndet)]
+
+    lcfile = os.path.join(outdir, 'HAT-999-0000010-csvlc.gz')
+    with gzip.open(lcfile, 'wb') as outfd:
+        outfd.write(('\n'.join(header + rows) + '\n').encode())
+
+    return lcfile
+
+
+def make_fake_k2lc(outdir, ndet=300, seed=42):
+    '''
+    This makes a fake gzipped K2 HAT CSV LC and returns its path.
+
+    '''
+
+    rng = np.random.RandomState(seed)
+
+    header = [
+        '# METADATA',
+        '# objectid = UCAC4-000-000000, kepid = 201000000, '
+        'ucac4id = UCAC4-000-000000, kepmag = 12.5',
+        '# ra = 120.0, decl = -30.0, ndet = %s, k2campaign = 1' % ndet,
+        '# fovccd = 1, fovchannel = 2, fovmodule = 3',
+        '# qualflag = 0, bjdoffset = 2454833.0, napertures = 1',
+        '# aperpixradius = 1.5',
+        '#',
+        '# COLUMNS',
+        '# 0 - BJD - time',
+        '# 1 - FRN - cadence',
+        '# 2 - IM00 - mag',
+        '# 3 - IQ00 - flag',
+        '#',
+        '# LIGHTCURVE',
+    ]
+
+    bjd = np.sort(rng.uniform(2000.0, 2080.0, ndet))
+    mag = rng.normal(12.0, 0.01, ndet)
+    rows = ['%.7f,%i,%.5f,%s' % (bjd[x], x, mag[x], 'GB'[x % 2])
+            for x in range(ndet)]
+
+    lcfile = os.path.join(outdir, 'UCAC4-000-000000-k2lc.csv.gz')
+    with gzip.open(lcfile, 'wb') as outfd:
+        outfd.write(('\n'.join(header + rows) + '\n').encode())
+
+    return lcfile
+
+
+def read_csvlc_columns(lcfile, casters):
+    '''
+    This casts each value in the data section of a CSV LC separately.
+
+    '''
+
+    with gzip.open(lcfile, 'rt') as infd:
+        lctext = infd.read()
+
+    lcrows = lctext.split('LIGHTCURVE\n')[1].split('\n')
+    lccols = list(zip(*[x.split(',') for x in lcrows if len(x) > 0]))
+
+    return [np.array([hatlc._smartcast(x, caster) for x in col])
+            for col, caster in zip(lccols, casters)]
+
+
+def make_fake_hatpi_textlc(outdir, aperture='TF1', ndet=300, seed=42,
+                           station=8, startframe=1000):
+    '''
+    This makes a fake gzipped HATPI text LC and returns its path.
+
+    '''
+
+    rng = np.random.RandomState(seed)
+
+    lcfile = os.path.join(outdir, 'HAT-999-0000020-%s-%s.tfalc.%s.gz' %
+                          (station, startframe, aperture))
+
+    lines = ['# fake HATPI text LC']
+    for x in range(ndet):
+        line = ['%.6f' % (56000.0 + startframe/1000.0 + x*0.0035),
+                '%s-%06ia_%s' % (station, startframe + x, station - 5),
+                'HAT-999-0000020']
+        line.extend('%.3f' % y for y in rng.normal(100.0, 1.0, 9))
+        for ap in range(3):
+            line.extend(['%.3f' % rng.normal(5000.0, 50.0), '20.0',
+                         '%.5f' % rng.normal(10.0, 0.01), '0.001', 'G'])
+        line.extend('%.5f' % y for y in rng.normal(10.0 + seed, 0.01, 4))
+        lines.append(' '.join(line))
+
+    with gzip.open(lcfile, 'wb') as outfd:
+        outfd.write(('\n'.join(lines) + '\n').encode())
+
+    return lcfile
+
+
+###########
+## TESTS ##
+###########
+
+def test_read_sqlitecurve_inmemory(tmpdir):
+    '''
+    Tests reading a gzipped sqlitecurve in memory and on disk.
+
+    '''
+
+    outdir = str(tmpdir)
+    lcfile = make_fake_sqlitecurve(outdir)
+
+    ondisk, ondisk_msg = hatlc.read_and_filter_sqlitecurve(lcfile,
+                                                           inmemory=False,
+                                                           raiseonfail=True)
+    assert os.listdir(outdir) == [os.path.basename(lcfile)]
+
+    with open(lcfile, 'rb') as infd:
+        lcbytes = infd.read()
+
+    inmemory, inmemory_msg = hatlc.read_and_filter_sqlitecurve(
+        lcfile,
+        raiseonfail=True
+    )
+
+    # the sqlitecurve wasn't touched if it was read in memory
+    assert os.listdir(outdir) == [os.path.basename(lcfile)]
+    if hasattr(sqlite3.Connection, 'deserialize'):
+        with open(lcfile, 'rb') as infd:
+            assert infd.read() == lcbytes
+
+    assert inmemory_msg == ondisk_msg == 'no SQL filters, LC OK'
+    assert inmemory['objectid'] == 'HAT-999-0000001'
+    assert inmemory['objectinfo']['ndet'] == 500
+    assert inmemory['columns'] == LCCOLUMNS
+    assert inmemory['lcapertures'] == {'000':1.5}
+
+    for col in LCCOLUMNS:
+        assert inmemory[col].dtype == ondisk[col].dtype
+        assert_array_equal(inmemory[col], ondisk[col])
+
+    assert np.all(np.diff(inmemory['rjd']) > 0.0)
+    assert_array_equal(np.where(np.isnan(inmemory['aim_000']))[0],
+                       np.arange(0, 500, 17))
+    assert inmemory['stf'].dtype.kind == 'i'
+    assert inmemory['aiq_000'].dtype.kind == 'U'
+
+    # filtered reads and the list output
+    filtered, msg = hatlc.read_and_filter_sqlitecurve(
+        lcfile,
+        columns=['rjd', 'aep_000', 'stf'],
+        sqlfilters='stf = 7 and aep_000 > 12.0',
+        raiseonfail=True
+    )
+    assert msg == 'SQL filters OK, LC OK'
+    assert np.all(filtered['stf'] == 7)
+    assert np.all(filtered['aep_000'] > 12.0)
+    assert filtered['objectinfo']['ndet'] == filtered['rjd'].size
+
+    aslists, msg = hatlc.read_and_filter_sqlitecurve(lcfile,
+                                                     returnarrays=False,
+                                                     raiseonfail=True)
+    assert len(aslists['aim_000']) == 500
+    assert aslists['aim_000'].count(None) == 30
+
+    # no rows after filtering
+    empty, msg = hatlc.read_and_filter_sqlitecurve(lcfile,
+                                                   sqlfilters='stf > 100',
+                                                   raiseonfail=True)
+    assert msg == 'LC retrieval failed'
+    assert empty['rjd'].size == 0
+
+    # an uncompressed sqlitecurve is opened read-only
+    uncompressed = hatlc._uncompress_sqlitecurve(lcfile)
+    plain, msg = hatlc.read_and_filter_sqlitecurve(uncompressed,
+                                                   raiseonfail=True)
+    assert_array_equal(plain['aep_000'], inmemory['aep_000'])
+
+    db, lcf = hatlc._open_sqlitecurve(uncompressed)
+    try:
+        db.execute('delete from lightcurve')
+        readonly = False
+    except sqlite3.OperationalError:
+        readonly = True
+    db.close()
+    assert readonly and lcf is None
+
+    if sys.version_info >= (3, 11):
+        db, lcf = hatlc._open_sqlitecurve(lcfile)
+        assert lcf is None
+        db.close()
+
+
+def test_read_hatlc_batch(tmpdir):
+    '''
+    Tests reading sqlitecurves and CSV LCs with read_hatlc_batch.
+
+    '''
+
+    outdir = str(tmpdir)
+
+    lcfiles = [make_fake_sqlitecurve(outdir)]
+    lcfiles.extend(make_fake_csvlc(outdir, 'HAT-999-%07i' % x, seed=x,
+                                   badrow=(10 if x == 3 else None))
+                   for x in range(2, 9))
+    lcfiles.append(os.path.join(outdir, 'missing.hatlc.csv.gz'))
+
+    results = list(hatlc.read_hatlc_batch(lcfiles, nworkers=3))
+
+    assert [x[0] for x in results] == lcfiles
+    assert results[-1][1] is None
+
+    sqlitelc = hatlc.read_and_filter_sqlitecurve(lcfiles[0])[0]
+    for col in LCCOLUMNS:
+        assert_array_equal(results[0][1][col], sqlitelc[col])
+
+    for lcfile, lcdict in results[1:-1]:
+
+        single = hatlc.read_csvlc(lcfile)
+        assert lcdict['objectid'] == single['objectid']
+        assert lcdict['columns'] == LCCOLUMNS
+
+        for col in LCCOLUMNS:
+            assert lcdict[col].dtype == single[col].dtype
+            assert_array_equal(lcdict[col], single[col])
+
+        assert lcdict['rjd'].dtype == np.float64
+        assert lcdict['stf'].dtype.kind == 'i'
+        assert lcdict['aiq_000'].dtype.kind == 'U'
+
+    # the bad value falls back to casting one value at a time
+    badlc = results[2][1]
+    assert np.isnan(badlc['aim_000'][10])
+    assert np.sum(np.isnan(badlc['aim_000'])) == 1
+    assert np.all(np.isfinite(results[1][1]['aim_000']))
+
+    # the column casters are only looked up once for these LCs
+    assert tuple(LCCOLUMNS) in hatlc._CSVLC_SCHEMAS
+
+    # only the requested columns
+    subset = list(hatlc.read_hatlc_batch(lcfiles[:3],
+                                         columns=['rjd', 'aep_000'],
+                                         nworkers=2))
+    for lcfile, lcdict in subset:
+        assert lcdict['columns'] == ['rjd', 'aep_000']
+        assert 'aim_000' not in lcdict
+        assert lcdict['aep_000'].size == lcdict['rjd'].size
+
+
+def test_read_csvlc_vectorized(tmpdir):
+    '''
+    Tests the vectorized CSV LC readers against casting each value.
+
+    '''
+
+    outdir = str(tmpdir)
+
+    # the HAT data server CSV LCs with and without a missing value
+    casters = [float, str, int, int, float, float, str]
+
+    for badrow in (None, 25):
+
+        lcfile = make_fake_csvlc(outdir, 'HAT-999-0000002', badrow=badrow)
+        lcdict = hatlc.read_csvlc(lcfile)
+        expected = read_csvlc_columns(lcfile, casters)
+
+        for col, expcol in zip(LCCOLUMNS, expected):
+            assert lcdict[col].dtype == expcol.dtype
+            assert_array_equal(lcdict[col], expcol)
+
+        assert lcdict['objectid'] == 'HAT-999-0000002'
+        assert lcdict['objectinfo']['ndet'] == 300
+        assert lcdict['lcapertures'] == {'000':1.5}
+        assert np.sum(np.isnan(lcdict['aim_000'])) == (badrow is not None)
+
+    # the LCC-Server CSV LCs, also through read_csvlc
+    lcfile = make_fake_lcc_csvlc(outdir)
+    expected = read_csvlc_columns(lcfile, [float, int, float, str])
+
+    for lcdict in (hatlc.read_lcc_csvlc(lcfile), hatlc.read_csvlc(lcfile)):
+
+        assert lcdict['objectid'] == 'HAT-999-0000010'
+        assert lcdict['columns'] == ['rjd', 'stf', 'aep_000', 'aiq_000']
+
+        for col, expcol in zip(lcdict['columns'], expected):
+            assert lcdict[col].dtype.kind == expcol.dtype.kind
+            assert_array_equal(lcdict[col], expcol)
+
+    # the K2 CSV LCs
+    lcfile = make_fake_k2lc(outdir)
+    lcdict = k2hat.read_csv_lightcurve(lcfile)
+    expected = read_csvlc_columns(lcfile, [float, int, float, str])
+
+    assert lcdict['columns'] == ['bjd', 'frn', 'im00', 'iq00']
+    assert lcdict['objectinfo']['ndet'] == 300
+
+    for col, expcol in zip(lcdict['columns'], expected):
+        assert lcdict[col].dtype == expcol.dtype
+        assert_array_equal(lcdict[col], expcol)
+
+
+def test_concatenate_hatpi_textlcs(tmpdir):
+    '''
+    Tests concatenating and binning HATPI text LCs.
+
+    '''
+
+    outdir = str(tmpdir)
+
+    # the second and third LCs overlap by 100 frames
+    lcfiles = [
+        make_fake_hatpi_textlc(outdir, station=8, startframe=1000, seed=1),
+        make_fake_hatpi_textlc(outdir, station=9, startframe=2000, seed=2),
+        make_fake_hatpi_textlc(outdir, station=9, startframe=2200, seed=3),
+    ]
+
+    lcdict = hplc.read_hatpi_textlc(lcfiles[0])
+    assert lcdict['objectinfo']['ndet'] == 300
+    assert lcdict['frk'][0] == '8-001000a_3'
+    assert lcdict['cfn'].dtype == np.int64
+    assert_array_equal(lcdict['cfn'], np.arange(1000, 1300))
+    assert lcdict['cfs'].dtype == np.dtype('U1')
+    assert_array_equal(np.unique(lcdict['irq1']), ['G'])
+
+    concat = hplc.concatenate_textlcs(lcfiles)
+    assert concat['objectinfo']['ndet'] == 900
+    assert concat['nconcatenated'] == 3
+    assert concat['objectinfo']['stations'] == ['HP8', 'HP9']
+    assert np.all(np.diff(concat['rjd']) >= 0.0)
+    for lcn in range(3):
+        assert abs(np.nanmedian(concat['itf1'][concat['lcn'] == lcn])) < 1e-3
+
+    deduped = hplc.concatenate_textlcs(lcfiles,
+                                       dedupe=True,
+                                       timebinsec=3600.0,
+                                       minbinelems=5)
+    assert deduped['objectinfo']['ndet'] == 800
+    assert np.unique(deduped['frk']).size == 800
+    assert np.all(np.diff(deduped['rjd']) >= 0.0)
+
+    # the first LC with a frame is kept
+    overlap = np.isin(deduped['cfn'], np.arange(2200, 2300))
+    assert_array_equal(deduped['lcn'][overlap], 1.0)
+
+    # check the binned LC against binning one bin at a time
+    binned = deduped['binned']['itf1']
+    assert binned['timebinsec'] == 3600.0
+    assert binned['nbins'] == binned['mags'].size
+
+    binind = np.floor((deduped['rjd'] - deduped['rjd'].min()) /
+                      (3600.0/86400.0))
+    expected = []
+    for x in np.unique(binind):
+        binmags = deduped['itf1'][binind == x]
+        if binmags.size >= 5:
+            binmad = np.median(np.abs(binmags - np.median(binmags)))
+            expected.append((np.median(deduped['rjd'][binind == x]),
+                             np.median(binmags),
+                             1.483*binmad/np.sqrt(binmags.size)))
+    assert_array_equal(binned['times'], [x[0] for x in expected])
+    assert_array_equal(binned['mags'], [x[1] for x in expected])
+    assert_allclose(binned['errs'], [x[2] for x in expected])
+    assert np.all(binned['errs'] > 0.0)
+
+
+def test_hatpi_textlc_dir(tmpdir):
+    '''
+    Tests concatenating a directory of HATPI text LCs and merging apertures.
+
+    '''
+
+    lcdir = str(tmpdir.mkdir('textlcs'))
+    outdir = os.path.join(str(tmpdir), 'pklcs')
+
+    for aperture in ('TF1', 'TF2'):
+        make_fake_hatpi_textlc(lcdir, aperture=aperture, startframe=1000)
+    make_fake_hatpi_textlc(lcdir, aperture='TF1', startframe=1100)
+
+    results = hplc.parallel_concat_lcdir(lcdir, None,
+                                         outdir=outdir,
+                                         dedupe=True,
+                                         timebinsec=600.0,
+                                         nworkers=2)
+
+    assert list(results.keys()) == ['HAT-999-0000020']
+    lcdict = hplc.read_hatpi_pklc(results['HAT-999-0000020'])
+    assert lcdict['objectinfo']['ndet'] == 400
+    assert lcdict['nconcatenated'] == 2
+    assert 'itf1' in lcdict['binned']
+
+    # merge the apertures for the first set of frames
+    merged = hplc.merge_hatpi_textlc_apertures(
+        sorted(glob.glob(os.path.join(lcdir, '*-1000.tfalc.TF*.gz'))) +
+        [os.path.join(lcdir, 'HAT-999-0000020-8-1100.tfalc.TF1.gz')]
+    )
+    assert merged['columns'][-2:] == ['itf1', 'itf2']
+    assert merged['objectinfo']['ndet'] == 400
+    assert_array_equal(merged['frk'], np.unique(merged['frk']))
+
+    # TF1 is the later LC, TF2 is the earlier one
+    assert np.sum(np.isfinite(merged['itf1'])) == 300
+    assert np.sum(np.isfinite(merged['itf2'])) == 300
+    assert np.sum(np.isfinite(merged['itf1']) &
+                  np.isfinite(merged['itf2'])) == 200
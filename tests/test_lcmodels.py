@@ -0,0 +1,396 @@
+'''test_lcmodels.py - License: MIT - see the LICENSE file for details.
+
+This tests the following:
+
+- checks that the cached phase-folded models in lcmodels give the same results
+  as the lcmodels curve_fit functions, and that their analytic Jacobians match
+  finite difference derivatives
+- checks that the trapezoid transit and inverted gaussian eclipse fits with a
+  fixed period and epoch, which use the cached phase-folded models, match the
+  fits done by the general curve_fit path
+- checks the analytic Jacobians of the lcmodels curve_fit functions and the
+  flare model against finite difference derivatives, and that the fits using
+  them match the fits using finite difference Jacobians
+
+'''
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from astrobase.lcmodels import transits, eclipses, sinusoidal, flares
+from astrobase.lcfit.transits import traptransit_fit_magseries
+from astrobase.lcfit.eclipses import gaussianeb_fit_magseries
+from astrobase.lcfit.sinusoidal import fourier_fit_magseries
+
+
+############
+## CONFIG ##
+############
+
+PERIOD = 2.3456
+EPOCH = 1.2345
+
+TRAPPARAMS = [PERIOD, EPOCH, 0.01, 0.08, 0.02]
+EBPARAMS = [PERIOD, EPOCH, 0.2, 0.12, 0.4, 0.47]
+
+
+def make_fake_model_lc(curvefit_func, params, npoints=3000, noise=1.0e-3,
+                       seed=42):
+    '''
+    This makes a fake LC from one of the lcmodels curve_fit functions.
+
+    '''
+
+    rng = np.random.RandomState(seed)
+
+    times = np.sort(rng.uniform(0.0, 30.0, size=npoints))
+    mags = (curvefit_func(times, *params, zerolevel=1.0) +
+            rng.normal(0.0, noise, size=npoints))
+    errs = np.full(npoints, noise)
+
+    return times, mags, errs
+
+
+def _numerical_jacobian(func, params, step=1.0e-6):
+    '''
+    This returns central finite difference derivatives of func wrt params.
+
+    '''
+
+    params = np.asarray(params, dtype=np.float64)
+    jac = []
+
+    for ind in range(params.size):
+        dparams = np.zeros_like(params)
+        dparams[ind] = step
+        jac.append((func(*(params + dparams)) - func(*(params - dparams))) /
+                   (2.0*step))
+
+    return np.column_stack(jac)
+
+
+def make_jacobian_test_times(breakpoints, ncycles=10, seed=7):
+    '''
+    This makes times whose phases aren't close to any of the model breakpoints.
+
+    '''
+
+    rng = np.random.RandomState(seed)
+
+    phase = rng.uniform(0.0, 1.0, size=3000)
+    near_breakpoint = np.any(
+        np.abs(phase[:,None] - np.array(breakpoints)[None,:]) < 1.0e-4,
+        axis=1
+    )
+    phase = phase[~near_breakpoint]
+
+    cycles = rng.randint(0, ncycles, size=phase.size)
+    return np.sort(EPOCH + PERIOD*(cycles + phase))
+
+
+###########
+## TESTS ##
+###########
+
+def test_folded_models():
+    '''
+    Tests the cached phase-folded models against the curve_fit functions.
+
+    '''
+
+    rng = np.random.RandomState(1)
+    times = np.sort(rng.uniform(0.0, 30.0, size=2000))
+    mags = rng.normal(1.0, 0.01, size=2000)
+    errs = np.full(2000, 0.01)
+
+    # use phases away from the model breakpoints for the derivatives
+    testphase = np.linspace(0.0013, 0.9987, 500)
+
+    trapmodel = transits.TrapezoidTransitModel(times, mags, errs,
+                                               PERIOD, EPOCH, zerolevel=1.0)
+    assert np.all(np.diff(trapmodel.phase) >= 0.0)
+    assert_allclose(trapmodel.times, times[trapmodel.sortind])
+    assert_allclose(
+        trapmodel.model(TRAPPARAMS[2:]),
+        transits.trapezoid_transit_curvefit_func(
+            trapmodel.times, *TRAPPARAMS, zerolevel=1.0
+        )
+    )
+    assert_allclose(
+        trapmodel.curvefit_jacobian(testphase, *TRAPPARAMS[2:]),
+        _numerical_jacobian(
+            lambda *p: trapmodel.curvefit_func(testphase, *p),
+            TRAPPARAMS[2:]
+        ),
+        atol=1.0e-6
+    )
+
+    ebmodel = eclipses.InvGaussEclipsesModel(times, mags, errs,
+                                             PERIOD, EPOCH, zerolevel=1.0)
+    assert_allclose(
+        ebmodel.model(EBPARAMS[2:]),
+        eclipses.invgauss_eclipses_curvefit_func(
+            ebmodel.times, *EBPARAMS, zerolevel=1.0
+        )
+    )
+    assert_allclose(
+        ebmodel.curvefit_jacobian(testphase, *EBPARAMS[2:]),
+        _numerical_jacobian(
+            lambda *p: ebmodel.curvefit_func(testphase, *p),
+            EBPARAMS[2:]
+        ),
+        atol=1.0e-6
+    )
+
+    fourierparams = [0.1, 0.05, 0.02, 0.3, -1.0, 2.0]
+    fouriermodel = sinusoidal.FourierSinusoidalModel(times, mags, errs,
+                                                     PERIOD, EPOCH, 3,
+                                                     zerolevel=1.0)
+    assert_allclose(
+        fouriermodel.model(fourierparams),
+        sinusoidal.fourier_curvefit_func(
+            fouriermodel.times, PERIOD, *fourierparams,
+            zerolevel=1.0, epoch=EPOCH
+        )
+    )
+
+    # the cached harmonics and uncached ones give the same model
+    assert_allclose(
+        fouriermodel.curvefit_func(fouriermodel.phase.copy(), *fourierparams),
+        fouriermodel.model(fourierparams)
+    )
+    assert_allclose(
+        fouriermodel.residual_jacobian(fourierparams),
+        _numerical_jacobian(lambda *p: fouriermodel.residual(p),
+                            fourierparams),
+        atol=1.0e-4
+    )
+
+
+def test_fixed_fold_fits():
+    '''
+    Tests the fixed period and epoch fits against the general curve_fit ones.
+
+    '''
+
+    # this uses the cached phase-folded model
+    fixed_bounds = {'period':'fixed', 'epoch':'fixed'}
+
+    # this uses the general curve_fit function with the period and epoch
+    # clamped to the same values
+    clamped_bounds = {'period':(PERIOD - 1.0e-7, PERIOD + 1.0e-7),
+                      'epoch':(EPOCH - 1.0e-7, EPOCH + 1.0e-7)}
+
+    times, fluxes, errs = make_fake_model_lc(
+        transits.trapezoid_transit_curvefit_func, TRAPPARAMS
+    )
+    initparams = [PERIOD, EPOCH, 0.008, 0.07, 0.015]
+
+    fixedfit = traptransit_fit_magseries(times, fluxes, errs,
+                                         list(initparams),
+                                         param_bounds=fixed_bounds,
+                                         magsarefluxes=True,
+                                         sigclip=None,
+                                         verbose=False)
+    clampedfit = traptransit_fit_magseries(times, fluxes, errs,
+                                           list(initparams),
+                                           param_bounds=clamped_bounds,
+                                           magsarefluxes=True,
+                                           sigclip=None,
+                                           verbose=False)
+
+    assert_allclose(fixedfit['fitinfo']['finalparams'][:2], [PERIOD, EPOCH])
+    assert_allclose(fixedfit['fitinfo']['finalparamerrs'][:2], 0.0)
+    assert_allclose(fixedfit['fitinfo']['finalparams'],
+                    clampedfit['fitinfo']['finalparams'],
+                    rtol=1.0e-4)
+    assert_allclose(fixedfit['fitinfo']['finalparamerrs'][2:],
+                    clampedfit['fitinfo']['finalparamerrs'][2:],
+                    rtol=0.05)
+    assert_allclose(fixedfit['fitinfo']['finalparams'][2:], TRAPPARAMS[2:],
+                    rtol=0.1)
+    assert_allclose(fixedfit['fitchisq'], clampedfit['fitchisq'], rtol=1.0e-5)
+
+    times, fluxes, errs = make_fake_model_lc(
+        eclipses.invgauss_eclipses_curvefit_func, EBPARAMS
+    )
+    initparams = [PERIOD, EPOCH, 0.18, 0.1, 0.45, 0.48]
+
+    fixedfit = gaussianeb_fit_magseries(times, fluxes, errs,
+                                        list(initparams),
+                                        param_bounds=fixed_bounds,
+                                        magsarefluxes=True,
+                                        sigclip=None,
+                                        verbose=False)
+    clampedfit = gaussianeb_fit_magseries(times, fluxes, errs,
+                                          list(initparams),
+                                          param_bounds=clamped_bounds,
+                                          magsarefluxes=True,
+                                          sigclip=None,
+                                          verbose=False)
+
+    assert_allclose(fixedfit['fitinfo']['finalparams'],
+                    clampedfit['fitinfo']['finalparams'],
+                    rtol=1.0e-4)
+    assert_allclose(fixedfit['fitinfo']['finalparams'][2:], EBPARAMS[2:],
+                    rtol=0.05)
+    assert_allclose(fixedfit['fitchisq'], clampedfit['fitchisq'], rtol=1.0e-5)
+
+
+def test_curvefit_jacobians():
+    '''
+    Tests the analytic Jacobians of the curve_fit functions.
+
+    '''
+
+    # the trapezoid contact points are at 1 - T/2, 1 - T/2 + I, T/2 - I, T/2
+    times = make_jacobian_test_times([0.0, 0.96, 0.98, 0.02, 0.04, 1.0])
+
+    for fixed_params in (None, {'epoch':EPOCH, 'ingressduration':0.02}):
+
+        jac = transits.trapezoid_transit_curvefit_jacobian(
+            times, *TRAPPARAMS, zerolevel=1.0, fixed_params=fixed_params
+        )
+        numjac = _numerical_jacobian(
+            lambda *p: transits.trapezoid_transit_curvefit_func(
+                times, *p, zerolevel=1.0, fixed_params=fixed_params
+            ),
+            TRAPPARAMS,
+            step=1.0e-8
+        )
+        assert jac.shape == (times.size, 5)
+        assert_allclose(jac, numjac, rtol=1.0e-5, atol=1.0e-5)
+
+    # the eclipse windows are at 0 +/- D/2, 1 - D/2, and S +/- D/2
+    times = make_jacobian_test_times([0.0, 0.06, 0.94, 1.0, 0.41, 0.53])
+
+    for fixed_params in (None, {'period':PERIOD, 'psdepthratio':0.4}):
+
+        jac = eclipses.invgauss_eclipses_curvefit_jacobian(
+            times, *EBPARAMS, zerolevel=1.0, fixed_params=fixed_params
+        )
+        numjac = _numerical_jacobian(
+            lambda *p: eclipses.invgauss_eclipses_curvefit_func(
+                times, *p, zerolevel=1.0, fixed_params=fixed_params
+            ),
+            EBPARAMS,
+            step=1.0e-8
+        )
+        assert jac.shape == (times.size, 6)
+        assert_allclose(jac, numjac, rtol=1.0e-5, atol=1.0e-4)
+
+    fourierparams = [PERIOD, 0.1, 0.05, 0.02, 0.3, -1.0, 2.0]
+
+    for fixed_period in (None, PERIOD):
+
+        jac = sinusoidal.fourier_curvefit_jacobian(
+            times, *fourierparams,
+            zerolevel=1.0, epoch=EPOCH, fixed_period=fixed_period
+        )
+        numjac = _numerical_jacobian(
+            lambda *p: sinusoidal.fourier_curvefit_func(
+                times, *p,
+                zerolevel=1.0, epoch=EPOCH, fixed_period=fixed_period
+            ),
+            fourierparams,
+            step=1.0e-8
+        )
+        assert jac.shape == (times.size, 7)
+        assert_allclose(jac, numjac, rtol=1.0e-5, atol=1.0e-5)
+
+
+def test_flare_model_jacobian():
+    '''
+    Tests the analytic Jacobian of lcmodels.flares.flare_model.
+
+    '''
+
+    flareparams = [0.5, 10.0, 0.05, 0.2]
+
+    times = np.linspace(9.0, 12.0, 3001)
+    times = times[np.abs(times - flareparams[1]) > 1.0e-4]
+    mags = np.full(times.size, 1.0)
+    errs = np.full(times.size, 0.01)
+
+    jac = flares.flare_model_jacobian(flareparams, times, mags, errs)
+    numjac = _numerical_jacobian(
+        lambda *p: flares.flare_model(p, times, mags, errs)[0],
+        flareparams,
+        step=1.0e-8
+    )
+    assert_allclose(jac, numjac, rtol=1.0e-5, atol=1.0e-4)
+
+    assert_allclose(
+        flares.flare_model_residual_jacobian(flareparams, times, mags, errs),
+        -jac/errs[:,None]
+    )
+
+
+def test_analytic_jacobian_fits():
+    '''
+    Tests the fits with analytic Jacobians against finite difference ones.
+
+    '''
+
+    # passing jac in curve_fit_kwargs overrides the analytic Jacobian
+    finitediff = {'jac':'2-point'}
+
+    times, fluxes, errs = make_fake_model_lc(
+        transits.trapezoid_transit_curvefit_func, TRAPPARAMS
+    )
+    initparams = [PERIOD, EPOCH + 0.001, 0.008, 0.07, 0.015]
+
+    fits = [traptransit_fit_magseries(times, fluxes, errs,
+                                      list(initparams),
+                                      magsarefluxes=True,
+                                      sigclip=None,
+                                      verbose=False,
+                                      curve_fit_kwargs=x)
+            for x in (None, finitediff)]
+
+    assert_allclose(fits[0]['fitinfo']['finalparams'],
+                    fits[1]['fitinfo']['finalparams'],
+                    rtol=1.0e-6)
+    assert_allclose(fits[0]['fitinfo']['finalparamerrs'],
+                    fits[1]['fitinfo']['finalparamerrs'],
+                    rtol=1.0e-3)
+    assert_allclose(fits[0]['fitredchisq'], fits[1]['fitredchisq'])
+
+    times, fluxes, errs = make_fake_model_lc(
+        eclipses.invgauss_eclipses_curvefit_func, EBPARAMS
+    )
+    initparams = [PERIOD, EPOCH + 0.001, 0.18, 0.1, 0.45, 0.48]
+
+    fits = [gaussianeb_fit_magseries(times, fluxes, errs,
+                                     list(initparams),
+                                     magsarefluxes=True,
+                                     sigclip=None,
+                                     verbose=False,
+                                     curve_fit_kwargs=x)
+            for x in (None, finitediff)]
+
+    assert_allclose(fits[0]['fitinfo']['finalparams'],
+                    fits[1]['fitinfo']['finalparams'],
+                    rtol=1.0e-6)
+    assert_allclose(fits[0]['fitredchisq'], fits[1]['fitredchisq'])
+
+    times, mags, errs = make_fake_model_lc(
+        sinusoidal.fourier_curvefit_func,
+        [PERIOD, 0.1, 0.03, 0.3, 1.0],
+        noise=0.01
+    )
+
+    fits = [fourier_fit_magseries(times, mags, errs, PERIOD,
+                                  fourierorder=3,
+                                  fix_period=False,
+                                  verbose=False,
+                                  curve_fit_kwargs=x)
+            for x in (None, finitediff)]
+
+    assert_allclose(fits[0]['fitinfo']['fitperiod'],
+                    fits[1]['fitinfo']['fitperiod'],
+                    rtol=1.0e-8)
+    assert_allclose(fits[0]['fitinfo']['fitmags'],
+                    fits[1]['fitinfo']['fitmags'],
+                    atol=1.0e-6)
+    assert_allclose(fits[0]['fitredchisq'], fits[1]['fitredchisq'])
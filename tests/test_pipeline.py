@@ -0,0 +1,265 @@
+'''test_pipeline.py - License: MIT - see the LICENSE file for details.
+
+This tests the following:
+
+- generates fake light curves with two apertures, EPD external parameters,
+  and a common trend, and a TFA templateinfo dict for them
+- runs lcproc.pipeline.run_lc_pipeline and parallel_lc_pipeline and checks
+  the results against the separate lcproc.epd, lcproc.tfa, and lcproc.lcbin
+  functions
+
+'''
+
+import os.path
+import pickle
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from astrobase import coordutils
+from astrobase.lcmath import normalize_magseries, time_bin_magseries_with_errs
+from astrobase.lcproc import register_lcformat, _read_pklc
+from astrobase.lcproc import epd, tfa, pipeline
+
+
+############
+## CONFIG ##
+############
+
+NTEMPLATES = 30
+NTARGETS = 4
+NPOINTS = 2000
+
+
+def make_fake_pipeline_field(outdir, seed=42):
+    '''
+    This makes fake LCs with two apertures and a TFA templateinfo dict.
+
+    '''
+
+    rng = np.random.RandomState(seed)
+
+    times = np.linspace(0.0, 20.0, NPOINTS)
+    phase = 2.0*np.pi*times
+
+    # the TFA trends shared by all objects
+    trends = np.array([np.sin(2.0*np.pi*times/p) for p in (3.3, 7.1)])
+
+    def fake_lc(objectid, ra, decl):
+
+        lcdict = {'objectid':objectid,
+                  'objectinfo':{'objectid':objectid, 'ra':ra, 'decl':decl},
+                  'rjd':times}
+
+        lcdict.update({
+            'fsv':5.0 + 0.3*np.sin(phase) + rng.normal(0.0, 0.01, NPOINTS),
+            'fdv':0.1*np.cos(phase) + rng.normal(0.0, 0.005, NPOINTS),
+            'fkv':0.1*np.sin(0.5*phase) + rng.normal(0.0, 0.005, NPOINTS),
+            'xcc':1024.0 + 0.8*np.sin(phase/3.1),
+            'ycc':1024.0 + 0.8*np.cos(phase/2.3),
+            'bgv':100.0 + 10.0*np.sin(phase + 1.0),
+            'bge':1.0 + 0.1*np.cos(phase + 0.5),
+            'iha':3.0*np.sin(phase),
+            'izd':35.0 + 20.0*np.cos(phase),
+        })
+
+        for ap in ('ap1', 'ap2'):
+            lcdict[ap] = (12.0 +
+                          0.02*lcdict['fsv'] +
+                          np.dot(rng.uniform(-0.05, 0.05, size=2), trends) +
+                          rng.normal(0.0, 0.005, NPOINTS))
+            lcdict[ap][::101] += 1.0
+            lcdict['%s_err' % ap] = np.full(NPOINTS, 0.005)
+
+        return lcdict
+
+    template_ra = rng.uniform(10.0, 12.0, size=NTEMPLATES)
+    template_decl = rng.uniform(-1.0, 1.0, size=NTEMPLATES)
+    templates = [fake_lc('TMPL-%03i' % x, ra, decl) for x, (ra, decl) in
+                 enumerate(zip(template_ra, template_decl))]
+
+    lcfiles = []
+    for x in range(NTARGETS):
+        lcd = fake_lc('TGT-%03i' % x, 20.0 + x, 20.0)
+        lcf = os.path.join(outdir, 'fake-%s.pkl' % lcd['objectid'])
+        with open(lcf, 'wb') as outfd:
+            pickle.dump(lcd, outfd)
+        lcfiles.append(lcf)
+
+    templateinfo = {'timecols':['rjd', 'rjd'],
+                    'magcols':['ap1', 'ap2'],
+                    'errcols':['ap1_err', 'ap2_err']}
+
+    for ap in ('ap1', 'ap2'):
+
+        template_magseries = np.array([
+            tfa._reform_magseries_for_tfa(
+                lcd['rjd'], lcd[ap], lcd['%s_err' % ap],
+                times, 'nearest', 5.0
+            )['mags'] for lcd in templates
+        ])
+
+        templateinfo[ap] = {
+            'timebase':times,
+            'template_objects':np.array([x['objectid'] for x in templates]),
+            'template_ra':template_ra,
+            'template_decl':template_decl,
+            'template_magseries':template_magseries,
+            'template_radecl_kdtree':coordutils.make_kdtree(template_ra,
+                                                            template_decl),
+        }
+
+    return lcfiles, templateinfo
+
+
+###########
+## TESTS ##
+###########
+
+def test_run_lc_pipeline(tmpdir):
+    '''
+    Tests lcproc.pipeline.run_lc_pipeline against the separate lcproc stages.
+
+    '''
+
+    outdir = str(tmpdir)
+    formatdir = os.path.join(outdir, 'lcformats')
+    register_lcformat('fake-pipeline-pkl', 'fake-*.pkl',
+                      ['rjd', 'rjd'], ['ap1', 'ap2'], ['ap1_err', 'ap2_err'],
+                      'astrobase.lcproc', '_read_pklc',
+                      lcformat_dir=formatdir)
+
+    lcfiles, templateinfo = make_fake_pipeline_field(outdir)
+    lcf = lcfiles[0]
+    lcdict = _read_pklc(lcf)
+
+    # EPD only should give the same result as lcproc.epd
+    epdonly = _read_pklc(
+        pipeline.run_lc_pipeline(lcf,
+                                 stages=('epd',),
+                                 lcformat='fake-pipeline-pkl',
+                                 lcformatdir=formatdir)
+    )['pipeline']
+    assert epdonly['stages'] == ['epd']
+
+    for ap, err in (('ap1', 'ap1_err'), ('ap2', 'ap2_err')):
+        epdlc = _read_pklc(
+            epd.apply_epd_magseries(lcf, 'rjd', ap, err, None,
+                                    lcformat='fake-pipeline-pkl',
+                                    lcformatdir=formatdir,
+                                    epdfit_method='linear')
+        )['epd']
+        assert_allclose(epdonly[ap]['mags'], epdlc['mags'])
+        assert_allclose(epdonly[ap]['epd']['fitcoeffs'], epdlc['fitcoeffs'])
+
+    # normalize + TFA should give the same result as lcproc.tfa
+    tfaonly = _read_pklc(
+        pipeline.run_lc_pipeline(lcf,
+                                 stages=('tfa', 'normalize'),
+                                 lcformat='fake-pipeline-pkl',
+                                 lcformatdir=formatdir,
+                                 templateinfo=templateinfo)
+    )['pipeline']
+    assert tfaonly['stages'] == ['normalize', 'tfa']
+
+    tfalc = _read_pklc(
+        tfa.apply_tfa_magseries(lcf, 'rjd', 'ap1', 'ap1_err',
+                                templateinfo,
+                                lcformat='fake-pipeline-pkl',
+                                lcformatdir=formatdir)
+    )['tfa']
+    assert_allclose(tfaonly['ap1']['mags'], tfalc['mags'])
+
+    # normalize + bin
+    binonly = _read_pklc(
+        pipeline.run_lc_pipeline(lcf,
+                                 stages=('normalize', 'bin'),
+                                 lcformat='fake-pipeline-pkl',
+                                 lcformatdir=formatdir,
+                                 binsizesec=3600.0)
+    )['pipeline']
+    ntimes, nmags = normalize_magseries(lcdict['rjd'], lcdict['ap2'])
+    binned = time_bin_magseries_with_errs(ntimes, nmags, lcdict['ap2_err'],
+                                          binsize=3600.0)
+    assert_allclose(binonly['ap2']['mags'], binned['binnedmags'])
+    assert binonly['ap2']['binned']['nbins'] == binned['nbins']
+
+    # all of the stages
+    full = _read_pklc(
+        pipeline.run_lc_pipeline(lcf,
+                                 stages=pipeline.PIPELINE_STAGES,
+                                 lcformat='fake-pipeline-pkl',
+                                 lcformatdir=formatdir,
+                                 templateinfo=templateinfo,
+                                 binsizesec=10800.0,
+                                 mindet=100)
+    )['pipeline']
+
+    for ap in ('ap1', 'ap2'):
+        assert sorted(full[ap].keys()) == sorted(
+            ['times', 'mags', 'errs', 'epd', 'tfa', 'binned', 'features']
+        )
+        assert full[ap]['features']['ndet'] == full[ap]['mags'].size
+        assert full[ap]['features']['mad'] < 0.005
+    assert full['bestmagcol'] in ('ap1', 'ap2')
+
+    # missing requirements for stages
+    assert pipeline.run_lc_pipeline(lcf,
+                                    stages=('tfa',),
+                                    lcformat='fake-pipeline-pkl',
+                                    lcformatdir=formatdir) is None
+    assert pipeline.run_lc_pipeline(lcf,
+                                    stages=('nope',),
+                                    lcformat='fake-pipeline-pkl',
+                                    lcformatdir=formatdir) is None
+
+
+def test_parallel_lc_pipeline(tmpdir):
+    '''
+    Tests lcproc.pipeline.parallel_lc_pipeline with a TFA templateinfo pickle.
+
+    '''
+
+    outdir = str(tmpdir)
+    formatdir = os.path.join(outdir, 'lcformats')
+    register_lcformat('fake-pipeline-pkl', 'fake-*.pkl',
+                      ['rjd', 'rjd'], ['ap1', 'ap2'], ['ap1_err', 'ap2_err'],
+                      'astrobase.lcproc', '_read_pklc',
+                      lcformat_dir=formatdir)
+
+    lcfiles, templateinfo = make_fake_pipeline_field(outdir)
+    templateinfo_pkl = os.path.join(outdir, 'tfa-templates.pkl')
+    tfa._write_tfa_templateinfo(templateinfo, templateinfo_pkl)
+
+    resultdir = os.path.join(outdir, 'pipeline-results')
+    results = pipeline.parallel_lc_pipeline(
+        lcfiles,
+        stages=('sigclip', 'epd', 'tfa', 'features'),
+        outdir=resultdir,
+        lcformat='fake-pipeline-pkl',
+        lcformatdir=formatdir,
+        templateinfo=templateinfo_pkl,
+        mindet=100,
+        nworkers=2
+    )
+
+    assert len(results) == len(lcfiles)
+
+    for lcf in lcfiles:
+
+        outf = results[os.path.basename(lcf)]
+        assert os.path.dirname(outf) == resultdir
+
+        single = _read_pklc(
+            pipeline.run_lc_pipeline(lcf,
+                                     stages=('sigclip', 'epd', 'tfa',
+                                             'features'),
+                                     lcformat='fake-pipeline-pkl',
+                                     lcformatdir=formatdir,
+                                     templateinfo=templateinfo,
+                                     mindet=100)
+        )['pipeline']
+
+        parallel = _read_pklc(outf)['pipeline']
+        for ap in ('ap1', 'ap2'):
+            assert_allclose(parallel[ap]['mags'], single[ap]['mags'])
@@ -0,0 +1,121 @@
+'''test_signals.py - License: MIT - see the LICENSE file for details.
+
+This tests the following:
+
+- generates a fake multi-periodic light curve
+- checks that the periodogram from varbase.signals.gls_prewhiten_incremental is
+  the same as the one from periodbase.zgls.pgen_lsp
+- checks that the incremental pre-whitening recovers all of the input
+  frequencies and amplitudes with the refined periodogram peaks, and that the
+  periodograms after each round are the same as the ones for the whitened
+  time-series
+- checks the joint method of varbase.signals.gls_prewhiten
+
+'''
+
+import os.path
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from astrobase.periodbase.zgls import pgen_lsp
+from astrobase.varbase import signals
+
+
+############
+## CONFIG ##
+############
+
+FREQUENCIES = np.array([2.1345, 3.7712, 5.0423, 1.1871, 7.6543, 4.3211])
+AMPLITUDES = np.array([0.05, 0.03, 0.02, 0.015, 0.01, 0.008])
+
+
+def make_fake_multiperiodic_lc(npoints=1500, seed=42):
+    '''
+    This makes a fake multi-periodic LC with several sinusoids.
+
+    '''
+
+    rng = np.random.RandomState(seed)
+
+    times = np.sort(rng.uniform(0.0, 30.0, size=npoints))
+    phases = rng.uniform(0.0, 2.0*np.pi, size=FREQUENCIES.size)
+
+    mags = 12.0 + rng.normal(0.0, 0.002, size=npoints)
+    for freq, amp, phase in zip(FREQUENCIES, AMPLITUDES, phases):
+        mags = mags + amp*np.cos(2.0*np.pi*freq*times + phase)
+
+    errs = rng.uniform(0.0015, 0.0025, size=npoints)
+
+    return times, mags, errs
+
+
+###########
+## TESTS ##
+###########
+
+def test_gls_prewhiten_incremental():
+    '''
+    Tests varbase.signals.gls_prewhiten_incremental.
+
+    '''
+
+    times, mags, errs = make_fake_multiperiodic_lc()
+
+    whitened = signals.gls_prewhiten_incremental(
+        times, mags, errs,
+        nfrequencies=FREQUENCIES.size,
+        startp_gls=0.1,
+        sigclip=None,
+        keep_rounds=True,
+        verbose=False
+    )
+
+    # the first periodogram is the same as the one from pgen_lsp
+    gls = pgen_lsp(times, mags, errs,
+                   startp=0.1, sigclip=None, nworkers=1, verbose=False)
+    assert_allclose(whitened['gridfrequencies'], 1.0/gls['periods'],
+                    rtol=1.0e-10)
+    assert_allclose(whitened['rounds'][0]['lspvals'], gls['lspvals'],
+                    atol=1.0e-7)
+
+    # all of the frequencies and amplitudes are recovered in order
+    assert_allclose(whitened['frequencies'], FREQUENCIES, atol=1.0e-3)
+    amps = np.array([x[1] for x in whitened['fourierparams']])
+    assert_allclose(amps, AMPLITUDES, atol=5.0e-4)
+    assert_allclose(whitened['zerolevel'], 12.0, atol=1.0e-3)
+    assert whitened['fitredchisq'] < 1.5
+
+    # the incrementally updated periodograms are those of the whitened mags
+    for wround in whitened['rounds'][1:3]:
+        wgls = pgen_lsp(times, wround['mags'], errs,
+                        startp=0.1, sigclip=None, nworkers=1, verbose=False)
+        assert_allclose(wround['lspvals'], wgls['lspvals'], atol=1.0e-7)
+
+    finalgls = pgen_lsp(times, whitened['wmags'], errs,
+                        startp=0.1, sigclip=None, nworkers=1, verbose=False)
+    assert_allclose(whitened['lspvals'], finalgls['lspvals'], atol=1.0e-7)
+
+
+def test_gls_prewhiten_joint(tmpdir):
+    '''
+    Tests varbase.signals.gls_prewhiten with the joint method.
+
+    '''
+
+    times, mags, errs = make_fake_multiperiodic_lc()
+    plotfile = os.path.join(str(tmpdir), 'prewhiten.png')
+
+    bestperiods, outplot = signals.gls_prewhiten(times, mags, errs,
+                                                 fourierorder=2,
+                                                 startp_gls=0.1,
+                                                 sigclip=None,
+                                                 nbestpeaks=3,
+                                                 plotfits=plotfile,
+                                                 method='joint')
+
+    assert os.path.exists(outplot)
+    assert len(bestperiods) == 6
+    assert_allclose(bestperiods[1::2], bestperiods[2::2] + [bestperiods[-1]])
+    assert_allclose(1.0/np.array(bestperiods[::2]), FREQUENCIES[:3],
+                    atol=1.0e-3)
@@ -0,0 +1,259 @@
+'''test_tfa.py - License: MIT - see the LICENSE file for details.
+
+This tests the following:
+
+- generates fake light curves sharing a common trend and writes them as
+  pickles readable with an lcformat registered for this test
+- applies TFA to these with lcproc.tfa.apply_tfa_magseries and
+  lcproc.tfa.apply_tfa_magseries_batch and checks that the results agree with
+  each other and with a direct pseudo-inverse solution
+- writes the templateinfo with memory-mapped template matrices and runs
+  lcproc.tfa.parallel_tfa_lclist with it and a reformed LC cache
+
+'''
+
+import os
+import os.path
+import pickle
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from astrobase import coordutils
+from astrobase.lcproc import register_lcformat, _read_pklc
+from astrobase.lcproc import tfa
+
+
+############
+## CONFIG ##
+############
+
+NTEMPLATES = 40
+NTARGETS = 12
+NPOINTS = 500
+
+
+def make_fake_tfa_field(outdir, seed=42):
+    '''
+    This makes fake template and target LCs and a templateinfo dict for them.
+
+    '''
+
+    rng = np.random.RandomState(seed)
+
+    times = np.linspace(0.0, 30.0, NPOINTS)
+
+    # a few common trends that TFA should remove
+    trends = np.array([np.sin(2.0*np.pi*times/p) for p in (3.3, 7.1, 13.7)])
+
+    def fake_lc(objectid, ra, decl):
+        mags = (12.0 +
+                np.dot(rng.uniform(-0.05, 0.05, size=3), trends) +
+                rng.normal(0.0, 0.005, size=NPOINTS))
+        return {'objectid':objectid,
+                'objectinfo':{'objectid':objectid, 'ra':ra, 'decl':decl},
+                'rjd':times,
+                'mag':mags,
+                'err':np.full(NPOINTS, 0.005)}
+
+    template_ra = rng.uniform(10.0, 12.0, size=NTEMPLATES)
+    template_decl = rng.uniform(-1.0, 1.0, size=NTEMPLATES)
+    templates = [fake_lc('TMPL-%03i' % x, ra, decl) for x, (ra, decl) in
+                 enumerate(zip(template_ra, template_decl))]
+
+    # targets: some far from everything, some close to templates, and one that
+    # is a template itself
+    lcfiles = []
+    for x in range(NTARGETS):
+        if x % 3 == 0:
+            ra, decl = template_ra[x] + 0.01, template_decl[x]
+        else:
+            ra, decl = 20.0 + x, 20.0
+        lcd = fake_lc('TGT-%03i' % x, ra, decl)
+        if x == NTARGETS - 1:
+            lcd = templates[5]
+        lcf = os.path.join(outdir, 'fake-%s.pkl' % lcd['objectid'])
+        with open(lcf, 'wb') as outfd:
+            pickle.dump(lcd, outfd)
+        lcfiles.append(lcf)
+
+    template_magseries = []
+    for lcd in templates:
+        reformed = tfa._reform_magseries_for_tfa(lcd['rjd'], lcd['mag'],
+                                                 lcd['err'], times,
+                                                 'nearest', 5.0)
+        template_magseries.append(reformed['mags'])
+    template_magseries = np.array(template_magseries)
+
+    templateinfo = {
+        'timecols':['rjd'],
+        'magcols':['mag'],
+        'errcols':['err'],
+        'mag':{
+            'timebase':times,
+            'template_objects':np.array([x['objectid'] for x in templates]),
+            'template_ra':template_ra,
+            'template_decl':template_decl,
+            'template_magseries':template_magseries,
+            'template_radecl_kdtree':coordutils.make_kdtree(template_ra,
+                                                            template_decl),
+        }
+    }
+
+    return lcfiles, templateinfo
+
+
+###########
+## TESTS ##
+###########
+
+def test_tfa_batch_matches_single(tmpdir):
+    '''
+    Tests lcproc.tfa.apply_tfa_magseries_batch against the single LC version.
+
+    '''
+
+    outdir = str(tmpdir)
+    formatdir = os.path.join(outdir, 'lcformats')
+    register_lcformat('fake-tfa-pkl', 'fake-*.pkl',
+                      ['rjd'], ['mag'], ['err'],
+                      'astrobase.lcproc', '_read_pklc',
+                      lcformat_dir=formatdir)
+
+    lcfiles, templateinfo = make_fake_tfa_field(outdir)
+
+    single = []
+    for lcf in lcfiles:
+        outf = tfa.apply_tfa_magseries(lcf, 'rjd', 'mag', 'err',
+                                       templateinfo,
+                                       lcformat='fake-tfa-pkl',
+                                       lcformatdir=formatdir,
+                                       mintemplatedist_arcmin=2.0)
+        single.append(_read_pklc(outf)['tfa'])
+
+    batched = tfa.apply_tfa_magseries_batch(lcfiles, 'rjd', 'mag', 'err',
+                                            templateinfo,
+                                            lcformat='fake-tfa-pkl',
+                                            lcformatdir=formatdir,
+                                            mintemplatedist_arcmin=2.0)
+    assert None not in batched
+
+    for lcf, single_tfa, batch_outf in zip(lcfiles, single, batched):
+
+        batch_tfa = _read_pklc(batch_outf)['tfa']
+        assert_allclose(batch_tfa['mags'], single_tfa['mags'], atol=1.0e-8)
+
+        # check against a direct pseudo-inverse for the templates used
+        tmagseries = single_tfa['work']['tmagseries']
+        reformed = single_tfa['work']['reformed_targetlc']
+        direct_inverse = np.linalg.pinv(np.dot(tmagseries, tmagseries.T))
+        direct_mags = reformed['origmags'] - np.dot(
+            tmagseries.T,
+            np.dot(direct_inverse, np.dot(tmagseries, reformed['mags']))
+        )
+        assert_allclose(single_tfa['mags'], direct_mags, atol=1.0e-8)
+
+        # the common trends should be mostly gone
+        assert single_tfa['mags_mad'] < 0.01
+
+    # the target that's also a template should have had it removed, and the
+    # targets close to templates should have lost those
+    assert single[-1]['work']['tmagseries'].shape[0] == NTEMPLATES - 1
+    assert single[0]['work']['tmagseries'].shape[0] == NTEMPLATES - 1
+    assert single[1]['work']['tmagseries'].shape[0] == NTEMPLATES
+
+
+def test_tfa_template_matrices_and_reformcache(tmpdir):
+    '''
+    Tests lcproc.tfa.read_tfa_templateinfo and the reformed LC cache.
+
+    '''
+
+    outdir = str(tmpdir)
+    formatdir = os.path.join(outdir, 'lcformats')
+    register_lcformat('fake-tfa-pkl', 'fake-*.pkl',
+                      ['rjd'], ['mag'], ['err'],
+                      'astrobase.lcproc', '_read_pklc',
+                      lcformat_dir=formatdir)
+
+    lcfiles, templateinfo = make_fake_tfa_field(outdir)
+    tfa._tfa_get_factorization(templateinfo, 'mag')
+
+    # by default, the template arrays stay in the pickle
+    plain_pkl = os.path.join(outdir, 'tfa-templates-plain.pkl')
+    tfa._write_tfa_templateinfo(templateinfo, plain_pkl)
+    with open(plain_pkl,'rb') as infd:
+        pickled = pickle.load(infd)
+    assert_allclose(pickled['mag']['template_magseries'],
+                    templateinfo['mag']['template_magseries'])
+    assert not os.path.exists(tfa._tfa_template_matrix_dir(plain_pkl))
+
+    templateinfo_pkl = os.path.join(outdir, 'tfa-templates.pkl')
+    tfa._write_tfa_templateinfo(templateinfo, templateinfo_pkl,
+                                write_template_matrices=True)
+
+    # the pickle shouldn't have the template arrays in it
+    with open(templateinfo_pkl,'rb') as infd:
+        pickled = pickle.load(infd)
+    for key in tfa.TFA_TEMPLATE_MATRIX_KEYS:
+        assert pickled['mag'].get(key, None) is None
+
+    readback = tfa.read_tfa_templateinfo(templateinfo_pkl)
+    assert isinstance(readback['mag']['template_magseries'], np.memmap)
+    assert_allclose(readback['mag']['template_magseries'],
+                    templateinfo['mag']['template_magseries'])
+    assert_allclose(readback['mag']['template_normal_matrix_inverse'],
+                    templateinfo['mag']['template_normal_matrix_inverse'])
+    assert tfa.read_tfa_templateinfo(templateinfo_pkl) is readback
+
+    # a plain pickle.load of this pickle can't be used directly
+    try:
+        tfa._tfa_get_factorization(pickled, 'mag')
+        raised = False
+    except ValueError:
+        raised = True
+    assert raised
+
+    # changing only a template matrix file invalidates the cached copy
+    matrixf = os.path.join(tfa._tfa_template_matrix_dir(templateinfo_pkl),
+                           'mag-template_magseries.npy')
+    np.save(matrixf, templateinfo['mag']['template_magseries']*2.0)
+    matrixstat = os.stat(matrixf)
+    os.utime(matrixf, ns=(matrixstat.st_atime_ns,
+                          matrixstat.st_mtime_ns + 10**9))
+
+    reread = tfa.read_tfa_templateinfo(templateinfo_pkl)
+    assert reread is not readback
+    assert_allclose(reread['mag']['template_magseries'],
+                    templateinfo['mag']['template_magseries']*2.0)
+    np.save(matrixf, templateinfo['mag']['template_magseries'])
+
+    expected = [
+        _read_pklc(
+            tfa.apply_tfa_magseries(lcf, 'rjd', 'mag', 'err',
+                                    templateinfo,
+                                    lcformat='fake-tfa-pkl',
+                                    lcformatdir=formatdir,
+                                    mintemplatedist_arcmin=2.0)
+        )['tfa']['mags'] for lcf in lcfiles
+    ]
+
+    reformcache = os.path.join(outdir, 'reformcache')
+
+    # run twice, the second time with everything coming from the cache
+    for batchsize in (None, 5):
+
+        results = tfa.parallel_tfa_lclist(lcfiles,
+                                          templateinfo_pkl,
+                                          lcformat='fake-tfa-pkl',
+                                          lcformatdir=formatdir,
+                                          mintemplatedist_arcmin=2.0,
+                                          nworkers=2,
+                                          batchsize=batchsize,
+                                          reformcache=reformcache)
+
+        assert len(os.listdir(reformcache)) == len(lcfiles)
+
+        for outf, expected_mags in zip(results['mag'], expected):
+            assert_allclose(_read_pklc(outf)['tfa']['mags'], expected_mags,
+                            atol=1.0e-8)
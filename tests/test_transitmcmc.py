@@ -0,0 +1,349 @@
+'''test_transitmcmc.py - License: MIT - see the LICENSE file for details.
+
+This tests the following:
+
+- generates a fake transit light curve with BATMAN
+- checks that the vectorized log-posterior functions in lcfit.transits give
+  the same results as the single walker versions
+- runs a short vectorized MCMC fit with lcfit.transits.mandelagol_fit_magseries
+- checks that several processes can write their MCMC chains to the same HDF5
+  file with lcproc.transitfit.LockedHDFBackend
+- runs the lcproc.transitfit batch fitter for several fake transit LCs with the
+  trapezoid and Mandel-Agol models, and resumes the Mandel-Agol chains
+
+The Mandel-Agol tests need BATMAN, emcee >= 3, corner, and h5py and are skipped
+if these are not available.
+
+'''
+
+import os.path
+import pickle
+import multiprocessing as mp
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+import emcee
+
+from astrobase.lcmodels.transits import trapezoid_transit_func
+from astrobase.lcproc import register_lcformat
+from astrobase.lcproc import transitfit
+
+try:
+    from astrobase.lcfit import transits
+    test_ok = transits.mandel_agol_dependencies
+except Exception:
+    test_ok = False
+
+
+############
+## CONFIG ##
+############
+
+TRUEPARAMS = {'t0':1.05, 'period':3.0, 'rp':0.1, 'sma':10.0, 'incl':89.0,
+              'ecc':0.0, 'omega':90.0, 'u':[0.3, 0.2],
+              'limb_dark':'quadratic'}
+
+
+def make_fake_transit_lc(npoints=1500, noise=5.0e-4, seed=42):
+    '''
+    This makes a fake transit LC.
+
+    '''
+
+    rng = np.random.RandomState(seed)
+
+    times = np.linspace(0.0, 9.0, npoints)
+
+    params, model = transits._transit_model(
+        times, TRUEPARAMS['t0'], TRUEPARAMS['period'], TRUEPARAMS['rp'],
+        TRUEPARAMS['sma'], TRUEPARAMS['incl'], TRUEPARAMS['ecc'],
+        TRUEPARAMS['omega'], TRUEPARAMS['u'], TRUEPARAMS['limb_dark'],
+        exp_time_minutes=2
+    )
+    fluxes = model.light_curve(params) + rng.normal(0.0, noise, npoints)
+    errs = np.full(npoints, noise)
+
+    return times, fluxes, errs
+
+
+def make_fake_transit_lcdir(outdir, ncands=4, seed=42):
+    '''
+    This writes fake trapezoid transit LCs and returns transit fit jobs.
+
+    '''
+
+    rng = np.random.RandomState(seed)
+    times = np.linspace(0.0, 27.0, 3000)
+
+    jobs = []
+
+    for x in range(ncands):
+
+        period = rng.uniform(2.0, 4.0)
+        epoch = rng.uniform(1.0, 2.0)
+        depth = rng.uniform(0.005, 0.01)
+        fluxes = trapezoid_transit_func(
+            [period, epoch, depth, 0.04, 0.008],
+            times, np.ones_like(times), np.ones_like(times)
+        )[0]
+
+        # put the model back in time order
+        phase = (times - epoch)/period
+        phaseind = np.argsort(phase - np.floor(phase))
+        tfluxes = np.empty_like(fluxes)
+        tfluxes[phaseind] = fluxes
+        tfluxes = 1000.0*(tfluxes + rng.normal(0.0, 5.0e-4, times.size))
+
+        lcdict = {'objectid':'FAKE-%s' % x,
+                  'times':times,
+                  'flux':tfluxes,
+                  'flux_err':np.full(times.size, 0.5)}
+
+        lcf = os.path.join(outdir, 'fake-transit-%s.pkl' % x)
+        with open(lcf, 'wb') as outfd:
+            pickle.dump(lcdict, outfd)
+
+        jobs.append((lcf, period, epoch + 0.002,
+                     {'depth':depth, 'duration':0.04}))
+
+    return jobs
+
+
+def _gaussian_log_prob(theta):
+    '''
+    This is a log-probability for the chain store test.
+
+    '''
+    return -0.5*np.sum(theta*theta)
+
+
+def _run_chain(task):
+    '''
+    This runs an MCMC chain into the shared HDF5 chain store.
+
+    '''
+
+    chainstore, name, nsteps, seed = task
+    backend = transitfit.LockedHDFBackend(chainstore,
+                                          name=name,
+                                          lock=transitfit._CHAINSTORE_LOCK)
+    rng = np.random.RandomState(seed)
+
+    sampler = emcee.EnsembleSampler(8, 2, _gaussian_log_prob, backend=backend)
+
+    if backend.iteration > 0:
+        sampler.run_mcmc(None, nsteps - backend.iteration)
+    else:
+        sampler.run_mcmc(rng.normal(size=(8, 2)), nsteps)
+
+    return name, backend.iteration
+
+
+###########
+## TESTS ##
+###########
+
+def test_locked_hdfbackend_shared_store(tmpdir):
+    '''
+    Tests several processes writing chains to one HDF5 file.
+
+    '''
+
+    chainstore = os.path.join(str(tmpdir), 'chains.h5')
+    names = ['chain-%s' % x for x in range(6)]
+
+    for nsteps in (50, 80):
+
+        pool = mp.Pool(3,
+                       initializer=transitfit._transitfit_worker_init,
+                       initargs=(mp.RLock(),))
+        results = pool.map(_run_chain,
+                           [(chainstore, x, nsteps, ind)
+                            for ind, x in enumerate(names)])
+        pool.close()
+        pool.join()
+
+        assert sorted(results) == [(x, nsteps) for x in names]
+
+    # the chains were resumed and not restarted
+    for name in names:
+        reader = emcee.backends.HDFBackend(chainstore, name=name,
+                                           read_only=True)
+        assert reader.get_chain().shape == (80, 8, 2)
+        assert np.all(np.isfinite(reader.get_log_prob()))
+
+
+def test_parallel_transitfit_traptransit(tmpdir):
+    '''
+    Tests lcproc.transitfit.parallel_transitfit_lclist with trapezoid fits.
+
+    '''
+
+    outdir = str(tmpdir)
+    formatdir = os.path.join(outdir, 'lcformats')
+    register_lcformat('fake-transit-pkl', 'fake-transit-*.pkl',
+                      ['times'], ['flux'], ['flux_err'],
+                      'astrobase.lcproc', '_read_pklc',
+                      magsarefluxes=True,
+                      lcformat_dir=formatdir)
+
+    jobs = make_fake_transit_lcdir(outdir)
+    resultdir = os.path.join(outdir, 'transitfits')
+
+    fits = transitfit.parallel_transitfit_lclist(
+        jobs, resultdir,
+        fitmethod='traptransit',
+        lcformat='fake-transit-pkl',
+        lcformatdir=formatdir,
+        nworkers=2
+    )
+
+    assert os.path.exists(fits['summaryfile'])
+    assert len(fits['results']) == len(jobs)
+
+    table = fits['table']
+    assert np.all(table['status'] == 'ok')
+    assert_allclose(table['period'], [x[1] for x in jobs], rtol=1.0e-4)
+    assert_allclose(table['depth'], [x[3]['depth'] for x in jobs],
+                    rtol=0.2)
+
+    # the CSV has the same columns
+    with open(fits['summaryfile']) as infd:
+        header = infd.readline().strip().split(',')
+        nrows = len(infd.readlines())
+    assert header == table['columns']
+    assert nrows == len(jobs)
+
+    for row in fits['results']:
+        assert os.path.exists(row['resultpkl'])
+
+
+if test_ok:
+
+    def test_parallel_transitfit_mandelagol_resume(tmpdir):
+        '''
+        Tests Mandel-Agol fits with lcproc.transitfit and resuming the chains.
+
+        '''
+
+        outdir = str(tmpdir)
+        formatdir = os.path.join(outdir, 'lcformats')
+        register_lcformat('fake-transit-pkl', 'fake-transit-*.pkl',
+                          ['times'], ['flux'], ['flux_err'],
+                          'astrobase.lcproc', '_read_pklc',
+                          magsarefluxes=True,
+                          lcformat_dir=formatdir)
+
+        jobs = make_fake_transit_lcdir(outdir, ncands=3)
+        resultdir = os.path.join(outdir, 'transitfits')
+
+        for nsteps in (100, 150):
+
+            fits = transitfit.parallel_transitfit_lclist(
+                jobs, resultdir,
+                fitmethod='mandelagol',
+                lcformat='fake-transit-pkl',
+                lcformatdir=formatdir,
+                n_walkers=16,
+                n_mcmc_steps=nsteps,
+                nworkers=3
+            )
+
+            table = fits['table']
+            assert np.all(table['status'] == 'ok')
+            assert np.all(table['nsteps'] == nsteps)
+
+        assert_allclose(table['rp'],
+                        [np.sqrt(x[3]['depth']) for x in jobs],
+                        rtol=0.3)
+
+
+if test_ok:
+
+    def test_vectorized_log_posterior():
+        '''
+        Tests the vectorized log-posteriors against the single walker ones.
+
+        '''
+
+        times, fluxes, errs = make_fake_transit_lc()
+        rng = np.random.RandomState(1)
+
+        params, model = transits._transit_model(
+            times, TRUEPARAMS['t0'], TRUEPARAMS['period'], TRUEPARAMS['rp'],
+            TRUEPARAMS['sma'], TRUEPARAMS['incl'], TRUEPARAMS['ecc'],
+            TRUEPARAMS['omega'], TRUEPARAMS['u'], TRUEPARAMS['limb_dark'],
+        )
+
+        # some walkers are outside the prior bounds
+        priorbounds = {'rp':(0.05, 0.15), 't0':(1.0, 1.1), 'sma':(5.0, 15.0),
+                       'u_linear':(0.0, 1.0), 'u_quad':(0.0, 1.0)}
+        thetas = np.column_stack((
+            rng.uniform(0.04, 0.16, 30),
+            rng.uniform(0.0, 1.0, 30),
+            rng.uniform(0.0, 1.0, 30),
+            rng.uniform(6.0, 14.0, 30),
+            rng.uniform(1.02, 1.08, 30),
+        ))
+
+        vectorized = transits.log_posterior_transit_vectorized(
+            thetas, params, model, times, fluxes, errs, priorbounds
+        )
+        single = np.array([
+            transits.log_posterior_transit(x, params, model, times,
+                                           fluxes, errs, priorbounds)
+            for x in thetas
+        ])
+
+        assert np.any(np.isinf(single))
+        assert_allclose(vectorized, single)
+
+        # the transit plus line model
+        priorbounds.update({'poly_order0':(-0.01, 0.01),
+                            'poly_order1':(-0.01, 0.01)})
+        thetas = np.column_stack((rng.uniform(-0.005, 0.005, 30),
+                                  rng.uniform(-0.005, 0.005, 30),
+                                  thetas))
+
+        vectorized = transits.log_posterior_transit_plus_line_vectorized(
+            thetas, params, model, times, fluxes, errs, priorbounds
+        )
+        single = np.array([
+            transits.log_posterior_transit_plus_line(x, params, model, times,
+                                                     fluxes, errs,
+                                                     priorbounds)
+            for x in thetas
+        ])
+        assert_allclose(vectorized, single)
+
+    def test_mandelagol_fit_vectorized(tmpdir):
+        '''
+        Tests a short vectorized MCMC run of mandelagol_fit_magseries.
+
+        '''
+
+        times, fluxes, errs = make_fake_transit_lc()
+
+        fitparams = {'t0':1.051, 'rp':0.095, 'sma':10.2}
+        fixedparams = {'period':3.0, 'incl':89.0, 'ecc':0.0, 'omega':90.0,
+                       'u':[0.3, 0.2], 'limb_dark':'quadratic'}
+        priorbounds = {'rp':(0.05, 0.15), 't0':(1.0, 1.1), 'sma':(7.0, 13.0)}
+
+        fit = transits.mandelagol_fit_magseries(
+            times, fluxes, errs,
+            fitparams, priorbounds, fixedparams,
+            samplesavpath=os.path.join(str(tmpdir), 'chain.h5'),
+            n_walkers=20,
+            n_mcmc_steps=300,
+            magsarefluxes=True,
+            sigclip=None,
+            vectorize=True,
+            verbose=False
+        )
+
+        assert fit['fitinfo']['acceptancefraction'] > 0.1
+        assert_allclose(fit['fitinfo']['finalparams']['rp'],
+                        TRUEPARAMS['rp'], atol=0.01)
+        assert_allclose(fit['fitinfo']['finalparams']['t0'],
+                        TRUEPARAMS['t0'], atol=0.005)